@@ -27,6 +27,10 @@ DAG_ID = os.path.basename(__file__).replace(".py", "")
 ENV = Variable.get("environment")
 PROJECT_NAME = "wallet-and-risky-features-data-pipeline"
 MEMORY_RESERVATION = 8192
+# The raw task runs every chunk of blocks in its own process, its reservation grows with the number of chunks up to
+# the memory of the task definition.
+RAW_MEMORY_RESERVATION_BY_BLOCK_CHUNK = 3072
+MAX_MEMORY_RESERVATION = 16384
 STACK_NAME = PROJECT_NAME
 
 
@@ -187,98 +191,62 @@ with DAG(
 
         with TaskGroup(group_id="Raw_Layer") as raw_layer_tg:
 
-            for chunk in blocks_chunks:
-
-                start_block = str(chunk[0])
-                end_block = str(chunk[-1])
-
-                task_ecs_raw = ECSOperator(
-                    task_id=f"fetch_and_save_wallet_transactions_raw_data_from_block_{start_block}_to_block_{end_block}",
-                    execution_timeout=timedelta(minutes=60),
-                    **ecs_task_template(
-                        command_list=[
-                            "python",
-                            "main.py",
-                            "--start-block",
-                            start_block,
-                            "--end-block",
-                            end_block,
-                            "--data-lake-layer",
-                            "raw",
-                        ],
-                        stack_name=f"{PROJECT_NAME}-{ENV}",
-                        project=PROJECT_NAME,
-                        stream_log_prefix=PROJECT_NAME,
-                        memory_reservation=MEMORY_RESERVATION,
-                    ),
-                )
-
-        stage_tables = [
-            "ethereum_logs",
-            "ethereum_transactions",
-            "ethereum_blocks",
-            "ethereum_token_transfers",
-            "ethereum_traces",
-            "ethereum_contracts",
-            "ethereum_tokens",
-            "ethereum_tokens_metadata",
-        ]
+            # A single task processes every chunk of blocks concurrently, each chunk with its own scratch directory.
+            start_block = str(blocks_chunks[0][0])
+            end_block = str(blocks_chunks[-1][-1])
+            raw_memory_reservation = min(
+                max(MEMORY_RESERVATION, RAW_MEMORY_RESERVATION_BY_BLOCK_CHUNK * len(blocks_chunks)),
+                MAX_MEMORY_RESERVATION,
+            )
+
+            task_ecs_raw = ECSOperator(
+                task_id=f"fetch_and_save_wallet_transactions_raw_data_from_block_{start_block}_to_block_{end_block}",
+                execution_timeout=timedelta(minutes=60),
+                **ecs_task_template(
+                    command_list=[
+                        "python",
+                        "main.py",
+                        "--start-block",
+                        start_block,
+                        "--end-block",
+                        end_block,
+                        "--block-chunks",
+                        str(len(blocks_chunks)),
+                        "--data-lake-layer",
+                        "raw",
+                    ],
+                    stack_name=f"{PROJECT_NAME}-{ENV}",
+                    project=PROJECT_NAME,
+                    stream_log_prefix=PROJECT_NAME,
+                    memory_reservation=raw_memory_reservation,
+                ),
+            )
 
         task_start_stage_layer = DummyOperator(task_id="start_stage_layer")
 
-        with TaskGroup(group_id="Stage_Layer") as stage_layer_tg:
-
-            for table in stage_tables:
-
-                task_ecs_stage = ECSOperator(
-                    task_id=f"apply_transformation_and_save_stage_data_{table}",
-                    execution_timeout=timedelta(minutes=60),
-                    **ecs_task_template(
-                        command_list=["python", "main.py", "--table-name", table, "--data-lake-layer", "stage"],
-                        stack_name=f"{PROJECT_NAME}-{ENV}",
-                        project=PROJECT_NAME,
-                        stream_log_prefix=PROJECT_NAME,
-                        memory_reservation=MEMORY_RESERVATION,
-                    ),
-                )
-
-        analytics_tables = [
-            "ethereum_erc20_transactions",
-            "ethereum_normal_transactions",
-            "ethereum_internal_transactions",
-        ]
+        # A single task loads every stage table, the independent tables concurrently, and the selector index once the
+        # stage ethereum_contracts table is loaded.
+        task_ecs_stage = ECSOperator(
+            task_id="apply_transformation_and_save_stage_data_all_tables",
+            execution_timeout=timedelta(minutes=120),
+            **ecs_task_template(
+                command_list=["python", "main.py", "--table-name", "all", "--data-lake-layer", "stage"],
+                stack_name=f"{PROJECT_NAME}-{ENV}",
+                project=PROJECT_NAME,
+                stream_log_prefix=PROJECT_NAME,
+                memory_reservation=MEMORY_RESERVATION,
+            ),
+        )
 
         task_start_analytics_layer = DummyOperator(task_id="start_analytics_layer")
 
-        with TaskGroup(group_id="Analytics_Layer") as analytics_layer_tg:
-
-            for table in analytics_tables:
-
-                task_ecs_analytics = ECSOperator(
-                    task_id=f"apply_transformation_and_save_analytics_data_{table}",
-                    execution_timeout=timedelta(minutes=60),
-                    **ecs_task_template(
-                        command_list=["python", "main.py", "--table-name", table, "--data-lake-layer", "analytics"],
-                        stack_name=f"{PROJECT_NAME}-{ENV}",
-                        project=PROJECT_NAME,
-                        stream_log_prefix=PROJECT_NAME,
-                        memory_reservation=MEMORY_RESERVATION,
-                    ),
-                )
-
-        # Task to merge erc20, normal and internal transactions to create wallet transactions table
-        task_ecs_wallet_transactions = ECSOperator(
-            task_id="apply_transformation_and_save_analytics_data_ethereum_wallet_transactions",
-            execution_timeout=timedelta(minutes=60),
+        # A single task loads the erc20, normal and internal transactions concurrently, then merges them into the
+        # wallet transactions table.
+        task_ecs_analytics = ECSOperator(
+            task_id="apply_transformation_and_save_analytics_data_all_tables",
+            execution_timeout=timedelta(minutes=120),
             **ecs_task_template(
-                command_list=[
-                    "python",
-                    "main.py",
-                    "--table-name",
-                    "ethereum_wallet_transactions",
-                    "--data-lake-layer",
-                    "analytics",
-                ],
+                command_list=["python", "main.py", "--table-name", "all", "--data-lake-layer", "analytics"],
                 stack_name=f"{PROJECT_NAME}-{ENV}",
                 project=PROJECT_NAME,
                 stream_log_prefix=PROJECT_NAME,
@@ -330,10 +298,9 @@ with DAG(
             >> task_execute_data_ingestion_pipeline
             >> raw_layer_tg
             >> task_start_stage_layer
-            >> stage_layer_tg
+            >> task_ecs_stage
             >> task_start_analytics_layer
-            >> analytics_layer_tg
-            >> task_ecs_wallet_transactions
+            >> task_ecs_analytics
             >> features_layer_tg
             >> task_wallet_features_dq
             >> task_delete_blocks_variables
@@ -0,0 +1,55 @@
+import os
+from datetime import datetime, timedelta
+
+from airflow.models import Variable
+from airflow.models.dag import DAG
+from airflow.operators.dummy import DummyOperator
+from airflow.providers.amazon.aws.operators.ecs import ECSOperator
+
+from helper_dag import ecs_task_template, slack_alert
+
+ARGS = {
+    "owner": "Spectral",
+    "description": "Dag to compact the fragmented partitions of the Iceberg tables of the Data Lakehouse",
+    "retry": 1,
+    "retry_delay": timedelta(minutes=5),
+    "start_date": datetime(2023, 1, 10),
+    "depend_on_past": False,
+    "on_failure_callback": slack_alert,
+}
+
+DAG_ID = os.path.basename(__file__).replace(".py", "")
+ENV = Variable.get("environment")
+PROJECT_NAME = "wallet-and-risky-features-data-pipeline"
+MEMORY_RESERVATION = 2048
+
+
+with DAG(
+    dag_id=DAG_ID,
+    default_args=ARGS,
+    # Daily between the 00:00 and 05:00 runs of the wallet transactions DAG ("0 */5 * * *"): the 00:00 run gets 2h30
+    # to finish, and the compaction (at most 2 hours, its execution timeout) ends before the 05:00 run starts.
+    schedule_interval="30 2 * * *",
+    tags=["DATA_LAKEHOUSE", "ICEBERG", "MAINTENANCE"],
+    catchup=False,
+    max_active_runs=1,
+) as dag:
+
+    task_start = DummyOperator(task_id="start")
+    task_teardown = DummyOperator(task_id="teardown")
+
+    # The compaction stops starting new partitions once its time budget is spent, the execution timeout leaves room
+    # for the last OPTIMIZE and the VACUUM of the tables.
+    task_ecs_iceberg_compaction = ECSOperator(
+        task_id="compact_iceberg_tables",
+        execution_timeout=timedelta(minutes=120),
+        **ecs_task_template(
+            command_list=["python", "main.py", "--table-name", "all", "--data-lake-layer", "iceberg_compaction"],
+            stack_name=f"{PROJECT_NAME}-{ENV}",
+            project=PROJECT_NAME,
+            stream_log_prefix=PROJECT_NAME,
+            memory_reservation=MEMORY_RESERVATION,
+        ),
+    )
+
+    task_start >> task_ecs_iceberg_compaction >> task_teardown
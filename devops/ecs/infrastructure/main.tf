@@ -31,6 +31,18 @@ resource "null_resource" "build_and_docker_image" {
   }
 }
 
+# Create the watermark store of the pipeline tables (table -> last block or timestamp inserted)
+resource "aws_dynamodb_table" "watermarks" {
+  name         = "data-lakehouse-watermarks-${local.env}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "watermark_key"
+
+  attribute {
+    name = "watermark_key"
+    type = "S"
+  }
+}
+
 # Create ECS cluster
 resource "aws_ecs_cluster" "this" {
   name = "${local.project}-${local.env}-fargate-cluster"
@@ -153,11 +165,25 @@ data "aws_iam_policy_document" "ecs_task_execution_role" {
       "athena:StopQueryExecution",
       "athena:GetQueryExecution",
       "athena:ListQueryExecutions",
+      "athena:CreatePreparedStatement",
+      "athena:GetPreparedStatement",
+      "athena:ListPreparedStatements",
+      "athena:UpdatePreparedStatement",
     ]
     effect    = "Allow"
     resources = ["*"]
   }
 
+  statement {
+    sid = "DynamoDBWatermarksAccess"
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:PutItem"
+    ]
+    effect    = "Allow"
+    resources = [aws_dynamodb_table.watermarks.arn]
+  }
+
   statement {
     sid = "S3Access"
     actions = [
@@ -1,7 +1,10 @@
 import importlib
+import os
 from argparse import ArgumentParser
 from spectral_data_lib.log_manager import Logger
 
+from config import settings
+
 logger = Logger(logger_name=f"Ethereum - Wallets Transactions Data Pipeline Logger")
 
 
@@ -11,62 +14,171 @@ def main():
     parser = ArgumentParser(description="This script is used to the Ethereum Wallets Transactions Data Pipeline.")
     parser.add_argument("--start-block", type=int, required=False)
     parser.add_argument("--end-block", type=int, required=False)
-    parser.add_argument("--table-name", type=str, help="Table Name", required=False)
+    parser.add_argument(
+        "--table-name",
+        type=str,
+        help="Table Name (all: every table of the stage, analytics or iceberg_compaction layer)",
+        required=False,
+    )
     parser.add_argument("--data-lake-layer", type=str, help="Data Lake Layer", required=True)
+    parser.add_argument(
+        "--block-chunks",
+        type=int,
+        help="Number of chunks of blocks processed concurrently (raw layer)",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--execution-backend",
+        type=str,
+        choices=["athena", "duckdb"],
+        help="Backend running the SQL of the stage and analytics layers (duckdb runs over a local Parquet lakehouse)",
+        required=False,
+    )
 
     args = parser.parse_args()
 
-    if args.data_lake_layer == "raw":
+    if args.execution_backend:
+        settings.set("EXECUTION_BACKEND", args.execution_backend)
+
+    if settings.EXECUTION_BACKEND == "duckdb":
+
+        if args.data_lake_layer not in ("stage", "analytics"):
+            raise Exception(f"The DuckDB backend only runs the stage and analytics layers, not {args.data_lake_layer}")
+
+        # Local runs: no prepared statements, and the watermarks are kept next to the local lakehouse, so they never
+        # move the watermarks of the Athena tables.
+        settings.set("ATHENA_USE_PREPARED_STATEMENTS", False)
+        settings.set("WATERMARK_STORE_BACKEND", "sqlite")
+        settings.set("WATERMARK_STORE_SQLITE_PATH", os.path.join(settings.DUCKDB_LAKEHOUSE_PATH, "watermarks.sqlite"))
+
+    if args.data_lake_layer != "raw":
+
+        # Compile every SQL template before running the pipeline, so an invalid placeholder fails at startup.
+        importlib.import_module("src.helpers.sql_templates").get_sql_template_registry()
+
+    try:
+
+        if args.data_lake_layer == "raw":
+
+            # This module will be imported just in case the data lake layer is raw, otherwise it will not be imported.
+            # This is necessary because this main.py file is used to run all the pipelines, and when we are using this module in EMR Serverless (Spark),
+            # it will try to import all the modules, even if they are not necessary.
+            raw_pipeline_module = importlib.import_module(f"src.pipelines.raw.raw_data_ingestion_pipeline")
+
+            last_block_data_lakehouse = args.start_block
+            last_block_ethereum_node = args.end_block
+
+            if args.block_chunks > 1:
+
+                # Each chunk of blocks runs in its own process and scratch directory.
+                raw_pipeline_module.run_by_block_chunks(
+                    last_block_data_lakehouse=last_block_data_lakehouse,
+                    last_block_ethereum_node=last_block_ethereum_node,
+                    number_of_chunks=args.block_chunks,
+                )
+
+            else:
+
+                raw_pipeline = raw_pipeline_module.RawPipeline()
+
+                raw_pipeline.run(
+                    last_block_data_lakehouse=last_block_data_lakehouse,
+                    last_block_ethereum_node=last_block_ethereum_node,
+                )
+
+        elif args.data_lake_layer == "stage":
+
+            stage_pipeline_module = importlib.import_module(f"src.pipelines.stage.stage_data_ingestion_pipeline")
+
+            if args.table_name == "all":
+
+                # Every stage table runs from this process, the independent tables concurrently.
+                stage_pipeline_module.run_all_tables()
+
+            else:
+
+                stage_pipeline = stage_pipeline_module.StagePipeline(table_name=args.table_name)
+
+                stage_pipeline.run()
+
+        elif args.data_lake_layer == "analytics":
+
+            analytics_pipeline_module = importlib.import_module(
+                "src.pipelines.analytics.analytics_data_ingestion_pipeline"
+            )
+
+            if args.table_name == "all":
+
+                analytics_pipeline_module.run_all_tables()
+
+            else:
+
+                analytics_pipeline = analytics_pipeline_module.AnalyticsPipeline(table_name=args.table_name)
+
+                analytics_pipeline.run()
+
+        elif args.data_lake_layer == "features":
+            features_module = importlib.import_module("src.pipelines.analytics.features.features_pipeline")
+
+            features_pipeline = features_module.FeaturesPipeline(table_name=args.table_name)
+
+            features_pipeline.run()
+
+        elif args.data_lake_layer == "features_data_quality":
+
+            features_data_quality_module = importlib.import_module(
+                "src.pipelines.analytics.features.features_data_quality_pipeline"
+            )
+
+            features_data_quality_pipeline = features_data_quality_module.FeatureDataQualityPipeline(
+                table_name=args.table_name
+            )
 
-        # This module will be imported just in case the data lake layer is raw, otherwise it will not be imported.
-        # This is necessary because this main.py file is used to run all the pipelines, and when we are using this module in EMR Serverless (Spark),
-        # it will try to import all the modules, even if they are not necessary.
-        raw_pipeline_module = importlib.import_module(f"src.pipelines.raw.raw_data_ingestion_pipeline")
+            features_data_quality_pipeline.run()
 
-        raw_pipeline = raw_pipeline_module.RawPipeline()
+        elif args.data_lake_layer == "stage_iceberg_migration":
 
-        last_block_data_lakehouse = args.start_block
-        last_block_ethereum_node = args.end_block
+            stage_iceberg_migration_module = importlib.import_module("src.pipelines.stage.stage_iceberg_migration")
 
-        raw_pipeline.run(
-            last_block_data_lakehouse=last_block_data_lakehouse,
-            last_block_ethereum_node=last_block_ethereum_node,
-        )
+            stage_iceberg_migration = stage_iceberg_migration_module.StageIcebergMigration(table_name=args.table_name)
 
-    elif args.data_lake_layer == "stage":
+            stage_iceberg_migration.run()
 
-        stage_pipeline_module = importlib.import_module(f"src.pipelines.stage.stage_data_ingestion_pipeline")
+        elif args.data_lake_layer == "iceberg_compaction":
 
-        stage_pipeline = stage_pipeline_module.StagePipeline(table_name=args.table_name)
+            iceberg_compaction_module = importlib.import_module("src.pipelines.maintenance.iceberg_compaction_pipeline")
 
-        stage_pipeline.run()
+            if args.table_name == "all":
 
-    elif args.data_lake_layer == "analytics":
+                # Every Iceberg table is compacted within the same time budget.
+                iceberg_compaction_module.run_all_tables()
 
-        analytics_pipeline_module = importlib.import_module("src.pipelines.analytics.analytics_data_ingestion_pipeline")
+            else:
 
-        analytics_pipeline = analytics_pipeline_module.AnalyticsPipeline(table_name=args.table_name)
+                iceberg_compaction_pipeline = iceberg_compaction_module.IcebergCompactionPipeline(
+                    table_name=args.table_name
+                )
 
-        analytics_pipeline.run()
+                iceberg_compaction_pipeline.run()
 
-    elif args.data_lake_layer == "features":
-        features_module = importlib.import_module("src.pipelines.analytics.features.features_pipeline")
+    finally:
 
-        features_pipeline = features_module.FeaturesPipeline(table_name=args.table_name)
+        # The reports are logged and saved even when the pipeline fails, so the queries of a failed run show up too.
+        # A failing report is only logged, the exception of the pipeline is the one raised.
+        if args.data_lake_layer != "raw":
 
-        features_pipeline.run()
+            try:
 
-    elif args.data_lake_layer == "features_data_quality":
+                importlib.import_module("src.helpers.query_cache").get_query_cache().log_report()
 
-        features_data_quality_module = importlib.import_module(
-            "src.pipelines.analytics.features.features_data_quality_pipeline"
-        )
+                execution_backend = importlib.import_module("src.helpers.execution_backend").get_execution_backend()
+                execution_backend.log_report()
+                execution_backend.save_report()
 
-        features_data_quality_pipeline = features_data_quality_module.FeatureDataQualityPipeline(
-            table_name=args.table_name
-        )
+            except Exception:
 
-        features_data_quality_pipeline.run()
+                logger.exception("Failed to log or save the query reports")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import hashlib
+import os
+from typing import Dict, List
+
+import awswrangler as wr
+import pandas as pd
+from spectral_data_lib.config import settings as sdl_settings
+from spectral_data_lib.data_lakehouse import DataLakehouse
+from spectral_data_lib.log_manager import Logger
+
+ABI_CACHE_COLUMNS = ["address", "bytecode_hash", "abi"]
+
+
+def normalize_bytecode(bytecode: str) -> str:
+    """Function to normalize a runtime bytecode before hashing it.
+    The solc metadata trailer (CBOR encoded, its length is stored in the last 2 bytes) is removed, so contracts
+    compiled from the same source with a different metadata hash share the same normalized bytecode.
+
+    Args:
+        bytecode (str): Runtime bytecode in hexadecimal.
+
+    Returns:
+        str: Normalized bytecode, or None when the bytecode is empty.
+    """
+
+    if not isinstance(bytecode, str):
+        return None
+
+    bytecode = bytecode.lower()
+    bytecode = bytecode[2:] if bytecode.startswith("0x") else bytecode
+
+    if not bytecode:
+        return None
+
+    if len(bytecode) >= 4:
+        metadata_length = (int(bytecode[-4:], 16) + 2) * 2
+        # The trailer is a CBOR map, which starts with 0xa1 or 0xa2 (map with 1 or 2 entries).
+        if metadata_length < len(bytecode) and bytecode[-metadata_length : -metadata_length + 2] in ("a1", "a2"):
+            bytecode = bytecode[:-metadata_length]
+
+    return bytecode
+
+
+def hash_bytecode(bytecode: str) -> str:
+    """Function to get the hash of a normalized runtime bytecode.
+
+    Args:
+        bytecode (str): Runtime bytecode in hexadecimal.
+
+    Returns:
+        str: SHA-256 of the normalized bytecode, or None when the bytecode is empty.
+    """
+
+    normalized_bytecode = normalize_bytecode(bytecode)
+
+    return hashlib.sha256(normalized_bytecode.encode()).hexdigest() if normalized_bytecode else None
+
+
+class AbiCache(object):
+    """Class to manage a persistent ABI cache keyed by contract address and by normalized bytecode hash.
+    Clones and minimal proxies share the same bytecode, so the ABI of one of them resolves all the others.
+    """
+
+    def __init__(self, local_path: str, s3_path: str = None, contracts_batch_size: int = 1000) -> None:
+        """Constructor for the class
+
+        Args:
+            local_path (str): Path of the local parquet file.
+            s3_path (str): S3 path of the parquet file mirrored from the local one.
+            contracts_batch_size (int): Number of addresses by query when reading the contracts bytecode.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name="ABI Cache Logger")
+        self.local_path = local_path
+        self.s3_path = s3_path
+        self.contracts_batch_size = contracts_batch_size
+        self.abi_by_address: Dict[str, str] = None
+        self.abi_by_bytecode_hash: Dict[str, str] = None
+        self.bytecode_hash_by_address: Dict[str, str] = {}
+        self.is_dirty = False  # whether ABIs were added since the cache was loaded or saved
+        self.stats = {"lookups": 0, "address_hits": 0, "bytecode_hits": 0, "deduplicated": 0, "requests": 0}
+
+    def load(self) -> None:
+        """Load the cache, downloading it from S3 when there is no local copy.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        if self.abi_by_address is not None:
+            return
+
+        if not os.path.exists(self.local_path) and self.s3_path and wr.s3.does_object_exist(self.s3_path):
+            os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+            wr.s3.download(path=self.s3_path, local_file=self.local_path)
+
+        if os.path.exists(self.local_path):
+            data = pd.read_parquet(self.local_path)
+        else:
+            data = pd.DataFrame(columns=ABI_CACHE_COLUMNS)
+
+        hashed_data = data[data["bytecode_hash"].notna()]
+
+        self.abi_by_address = dict(zip(data["address"], data["abi"]))
+        self.abi_by_bytecode_hash = dict(zip(hashed_data["bytecode_hash"], hashed_data["abi"]))
+        self.bytecode_hash_by_address.update(zip(hashed_data["address"], hashed_data["bytecode_hash"]))
+
+        self.logger.info(
+            f"ABI cache loaded - {len(self.abi_by_address)} addresses - {len(self.abi_by_bytecode_hash)} bytecodes"
+        )
+
+    def seed_bytecode_hashes(self, addresses: List[str]) -> None:
+        """Read the bytecode of the addresses from the stage ethereum_contracts table and keep their hashes.
+
+        Args:
+            addresses (List[str]): Contract addresses.
+
+        Returns:
+            None
+        """
+
+        addresses = [address for address in addresses if address not in self.bytecode_hash_by_address]
+
+        data_lakehouse_connection = DataLakehouse()
+
+        for start in range(0, len(addresses), self.contracts_batch_size):
+            batch = addresses[start : start + self.contracts_batch_size]
+            addresses_filter = ", ".join(f"'{address}'" for address in batch)
+
+            query = f"""
+                SELECT address, arbitrary(bytecode) AS bytecode
+                FROM {sdl_settings.DATA_LAKE_STAGE_DATABASE}.ethereum_contracts
+                WHERE address IN ({addresses_filter})
+                GROUP BY address
+            """
+
+            contracts = data_lakehouse_connection.read_sql_query(
+                query=query, database_name=sdl_settings.DATA_LAKE_STAGE_DATABASE
+            )
+
+            self.bytecode_hash_by_address.update(zip(contracts["address"], contracts["bytecode"].map(hash_bytecode)))
+
+    def lookup(self, addresses: List[str]) -> Dict[str, str]:
+        """Get the cached ABI of the addresses, first by address and then by bytecode hash.
+
+        Args:
+            addresses (List[str]): Contract addresses (lowercase).
+
+        Returns:
+            Dict[str, str]: ABI by address, for the addresses found in the cache.
+        """
+
+        self.load()
+        self.seed_bytecode_hashes([address for address in addresses if address not in self.abi_by_address])
+
+        abis = {}
+
+        for address in addresses:
+            if address in self.abi_by_address:
+                abis[address] = self.abi_by_address[address]
+                self.stats["address_hits"] += 1
+            elif self.bytecode_hash_by_address.get(address) in self.abi_by_bytecode_hash:
+                abis[address] = self.abi_by_bytecode_hash[self.bytecode_hash_by_address[address]]
+                self.stats["bytecode_hits"] += 1
+
+        self.stats["lookups"] += len(addresses)
+
+        return abis
+
+    def group_by_bytecode(self, addresses: List[str]) -> Dict[str, List[str]]:
+        """Group the addresses sharing the same bytecode, so only one of them is requested to Etherscan.
+
+        Args:
+            addresses (List[str]): Contract addresses.
+
+        Returns:
+            Dict[str, List[str]]: Addresses by representative address (the first address of each bytecode).
+        """
+
+        representative_by_bytecode_hash = {}
+        groups = {}
+
+        for address in addresses:
+            bytecode_hash = self.bytecode_hash_by_address.get(address)
+            representative = address
+
+            if bytecode_hash:
+                representative = representative_by_bytecode_hash.setdefault(bytecode_hash, address)
+
+            groups.setdefault(representative, []).append(address)
+
+        self.stats["deduplicated"] += len(addresses) - len(groups)
+        self.stats["requests"] += len(groups)
+
+        return groups
+
+    def update(self, abis: Dict[str, str]) -> None:
+        """Add verified ABIs to the cache. Unverified contracts are not cached, they can be verified later.
+        The cache is flagged as dirty when an ABI is new or changed, so it is only saved when needed.
+
+        Args:
+            abis (Dict[str, str]): ABI by address.
+
+        Returns:
+            None
+        """
+
+        self.load()
+
+        for address, abi in abis.items():
+            if not isinstance(abi, str) or not abi.startswith("[") or self.abi_by_address.get(address) == abi:
+                continue
+
+            self.abi_by_address[address] = abi
+            self.is_dirty = True
+
+            bytecode_hash = self.bytecode_hash_by_address.get(address)
+            if bytecode_hash:
+                self.abi_by_bytecode_hash.setdefault(bytecode_hash, abi)
+
+    def save(self) -> None:
+        """Persist the cache to the local parquet file and mirror it to S3, only when ABIs were added since the cache
+        was loaded or last saved.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        self.load()
+
+        if not self.is_dirty:
+            self.logger.info("ABI cache unchanged, not saved")
+            return
+
+        data = pd.DataFrame(
+            {
+                "address": list(self.abi_by_address.keys()),
+                "bytecode_hash": [self.bytecode_hash_by_address.get(address) for address in self.abi_by_address],
+                "abi": list(self.abi_by_address.values()),
+            }
+        )
+
+        os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+        data.to_parquet(self.local_path, index=False)
+
+        if self.s3_path:
+            wr.s3.upload(local_file=self.local_path, path=self.s3_path)
+
+        self.is_dirty = False
+        self.logger.info(f"ABI cache saved - {self.local_path}")
+
+    def log_report(self) -> None:
+        """Log the hit rate of the cache and the number of Etherscan requests saved in the run.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        hits = self.stats["address_hits"] + self.stats["bytecode_hits"]
+        hit_rate = hits / self.stats["lookups"] if self.stats["lookups"] else 0
+
+        self.logger.info(
+            f"ABI cache report - Hit rate: {hit_rate:.1%} ({self.stats['address_hits']} by address, "
+            f"{self.stats['bytecode_hits']} by bytecode) - Requests saved: {hits + self.stats['deduplicated']} "
+            f"- Requests sent: {self.stats['requests']}"
+        )
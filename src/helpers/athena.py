@@ -1,6 +1,13 @@
 import awswrangler as wr
+import boto3
 import pandas as pd
-from typing import Iterator
+from functools import lru_cache
+from typing import Dict, Iterator, List
+
+from config import settings
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.query_cache import get_query_cache
+from src.helpers.sql_templates import SqlTemplate
 
 # wr configs
 wr.config.max_cache_seconds = 900
@@ -9,26 +16,97 @@ wr.config.max_remote_cache_entries = 50
 wr.config.max_local_cache_entries = 100
 
 
-def _split_query(sql_query: str) -> list:
-    """Splits templated sql query into table creation and data insertion.
+@lru_cache(maxsize=1)
+def get_athena_client():
+    """Function to get the boto3 Athena client of the process, created on the first call.
+
+    Args:
+        None
+
+    Returns:
+        Athena client.
+    """
+
+    return boto3.client("athena")
+
+
+def prepare_statement(statement_name: str, statement: str, workgroup: str) -> None:
+    """Create an Athena prepared statement, unless it already exists in the workgroup.
+    The workgroup is checked every time, so statements created by previous runs (or other processes) are reused
+    and a statement deleted since is created again.
+
+    Args:
+        statement_name (str): Prepared statement name
+        statement (str): Statement with ? parameters
+        workgroup (str): Athena workgroup
+
+    Returns:
+        None
+    """
+
+    athena_client = get_athena_client()
+
+    try:
+        athena_client.get_prepared_statement(StatementName=statement_name, WorkGroup=workgroup)
+        return
+    except athena_client.exceptions.ResourceNotFoundException:
+        pass
+
+    # A statement created by another process in the meantime is the same one (its name hashes the statement), the
+    # default update mode simply overwrites it.
+    wr.athena.create_prepared_statement(sql=statement, statement_name=statement_name, workgroup=workgroup)
+
+
+def is_preparable(statement: str) -> bool:
+    """Check if a statement can be run as an Athena prepared statement.
+    Only INSERT INTO statements are prepared, MERGE and CTAS statements are run as they are rendered.
+
+    Args:
+        statement (str): SQL statement
+
+    Returns:
+        bool: True if the statement can be prepared
+    """
+
+    lines = [line for line in statement.strip().splitlines() if line.strip() and not line.strip().startswith("--")]
+
+    return bool(lines) and lines[0].strip().upper().startswith("INSERT INTO")
+
+
+def get_sql_template_query(
+    sql_template: SqlTemplate, section: str, use_prepared_statement: bool = False, **params
+) -> str:
+    """Render a section of a SQL template into the query to run in Athena.
+    With prepared statements, the statement is planned once and every run only sends its scalar parameters.
 
     Args:
-        sql_query (str): Query to be executed
+        sql_template (SqlTemplate): Compiled SQL template
+        section (str): Section of the template (query, full_load or incremental_load)
+        use_prepared_statement (bool): Run the section as a prepared statement when it is possible
+        **params: Parameters of the template
 
     Returns:
-        list: List obj with 2 items containing the table creation and data insertion queries
+        str: SQL query, or EXECUTE statement of the prepared statement
     """
-    return sql_query.split("-- incremental load")
+
+    sql_query = sql_template.render(section, **params)
+
+    if use_prepared_statement and is_preparable(sql_query):
+        statement_name, statement, values = sql_template.render_prepared(section, **params)
+        prepare_statement(statement_name=statement_name, statement=statement, workgroup=settings.ATHENA_WORKGROUP)
+        sql_query = f"EXECUTE {statement_name}" + (f" USING {', '.join(values)}" if values else "")
+
+    return sql_query
 
 
 def iterate_over_last_updated_items(
-    sql_query: str, last_inserted_timestamp: int, database: str = "db_analytics_prod"
+    sql_template: SqlTemplate, last_inserted_timestamp: int, database: str = "db_analytics_prod"
 ) -> Iterator[pd.DataFrame]:
     """Gets the latest updated items from table.
     Memory efficient way to iterate over the results of a query. No fixed row limit for each chunk.
 
     Args:
-        sql_query (str): Query to be executed
+        sql_template (SqlTemplate): Compiled SQL template of the query to be executed
         last_inserted_timestamp (int): Last inserted timestamp
         database (str, optional): Athena database name. Defaults to 'db_analytics_prod'.
 
@@ -36,13 +114,13 @@ def iterate_over_last_updated_items(
         Iterator[pd.DataFrame]: Iterator over the query results
     """
 
-    sql_query = sql_query.replace("last_inserted_timestamp", str(last_inserted_timestamp))
+    sql_query = sql_template.render(last_inserted_timestamp=last_inserted_timestamp)
 
     return wr.athena.read_sql_query(sql=sql_query, database=database, chunksize=True)
 
 
-def write_data_into_datalake_using_ctas(
-    sql_query: str,
+def get_ctas_query(
+    sql_template: SqlTemplate,
     filter_value: str,
     env: str,
     data_lake_layer: str,
@@ -51,11 +129,15 @@ def write_data_into_datalake_using_ctas(
     data_lake_bucket,
     data_source,
     source_database: str = None,
-) -> None:
-    """Function to write data into data lake using CTAS (Create Table As Select)
+    chunk: tuple = None,
+    table_exists: bool = None,
+    min_date_partition: str = None,
+) -> str:
+    """Function to get the query writing data into data lake using CTAS (Create Table As Select), the full load
+    when the target table does not exist yet and the incremental load otherwise.
 
     Args:
-        sql_query (str): Query to be executed
+        sql_template (SqlTemplate): Compiled SQL template with a full load and an incremental load
         filter_value (str): Filter value
         env (str): Environment name
         data_lake_layer (str): Layer name
@@ -63,50 +145,120 @@ def write_data_into_datalake_using_ctas(
         target_table_name (str): Table name
         data_lake_bucket (str): Data lake bucket name
         data_source (str): Data source name
+        source_database (str): Source database name. Defaults to the database of the previous layer.
+        chunk (tuple): Chunk to be processed
+        table_exists (bool): Whether the target table exists, read from the catalog when it is not known
+        min_date_partition (str): First date partition of the new rows, bounding the partitions read by a MERGE
 
     Returns:
-        None
+        str: SQL query
     """
 
-    sql_query = _split_query(sql_query=sql_query)
-
     if data_lake_layer == "stage" and source_database is None:
         source_database = f"db_raw_{env}"
     elif data_lake_layer == "analytics" and source_database is None:
         source_database = f"db_stage_{env}"
 
-    if wr.catalog.does_table_exist(database=target_database, table=target_table_name):
-        sql_query = sql_query[-1]  # Get the incremental load part
-        sql_query = (
-            sql_query.replace("filter_value", str(filter_value))
-            .replace("source_database", source_database)
-            .replace("target_database", target_database)
-            .replace("table_name", target_table_name)
-            .replace("bucket_name", data_lake_bucket)
-            .replace("layer", data_lake_layer)
-            .replace("data_source", data_source)
-        )
+    if table_exists is None:
+        table_exists = get_execution_backend().does_table_exist(database=target_database, table=target_table_name)
 
+    if table_exists:
+        section = "incremental_load"
     else:
-        sql_query = sql_query[0]  # Get the full load part
-        sql_query = (
-            sql_query.replace("filter_value", str(filter_value))
-            .replace("source_database", source_database)
-            .replace("target_database", target_database)
-            .replace("table_name", target_table_name)
-            .replace("bucket_name", data_lake_bucket)
-            .replace("layer", data_lake_layer)
-            .replace("data_source", data_source)
-        )
+        section = "full_load"
+
+    return get_sql_template_query(
+        sql_template=sql_template,
+        section=section,
+        use_prepared_statement=settings.ATHENA_USE_PREPARED_STATEMENTS and section == "incremental_load",
+        filter_value=filter_value,
+        chunk=chunk,
+        source_database=source_database,
+        target_database=target_database,
+        table_name=target_table_name,
+        bucket_name=data_lake_bucket,
+        layer=data_lake_layer,
+        data_source=data_source,
+        **({"min_date_partition": min_date_partition} if min_date_partition else {}),
+    )
+
+
+def get_query_tags(pipeline: str, table_name: str, chunk: tuple = None) -> dict:
+    """Function to get the tags of a query, recorded with its statistics in the Athena report.
+
+    Args:
+        pipeline (str): Pipeline (layer) name
+        table_name (str): Table name
+        chunk (tuple): Chunk processed by the query
+
+    Returns:
+        dict: Query tags.
+    """
+
+    return {"pipeline": pipeline, "table": table_name, "chunk": f"{chunk[0]}..{chunk[-1]}" if chunk else None}
+
+
+def write_data_into_datalake_using_ctas(
+    sql_template: SqlTemplate,
+    filter_value: str,
+    env: str,
+    data_lake_layer: str,
+    target_database: str,
+    target_table_name: str,
+    data_lake_bucket,
+    data_source,
+    source_database: str = None,
+    chunk: tuple = None,
+    table_exists: bool = None,
+    min_date_partition: str = None,
+) -> None:
+    """Function to write data into data lake using CTAS (Create Table As Select)
+
+    Args:
+        sql_template (SqlTemplate): Compiled SQL template with a full load and an incremental load
+        filter_value (str): Filter value
+        env (str): Environment name
+        data_lake_layer (str): Layer name
+        target_database (str): Target database name
+        target_table_name (str): Table name
+        data_lake_bucket (str): Data lake bucket name
+        data_source (str): Data source name
+        source_database (str): Source database name. Defaults to the database of the previous layer.
+        chunk (tuple): Chunk to be processed
+        table_exists (bool): Whether the target table exists, read from the catalog when it is not known
+        min_date_partition (str): First date partition of the new rows, bounding the partitions read by a MERGE
+
+    Returns:
+        None
+    """
 
     try:
-        wr.athena.start_query_execution(sql=sql_query, database=target_database, wait=True)
+        sql_query = get_ctas_query(
+            sql_template=sql_template,
+            filter_value=filter_value,
+            env=env,
+            data_lake_layer=data_lake_layer,
+            target_database=target_database,
+            target_table_name=target_table_name,
+            data_lake_bucket=data_lake_bucket,
+            data_source=data_source,
+            source_database=source_database,
+            chunk=chunk,
+            table_exists=table_exists,
+            min_date_partition=min_date_partition,
+        )
+        get_query_cache().invalidate(target_table_name)
+        get_execution_backend().run_query(
+            sql=sql_query,
+            database=target_database,
+            tags=get_query_tags(pipeline=data_lake_layer, table_name=target_table_name, chunk=chunk),
+        )
     except Exception as e:
         raise Exception(f"Error while executing the query to write data into the data lakehouse: {e}")
 
 
 def write_data_into_datalake_using_ctas_by_chunks(
-    sql_query: str,
+    sql_template: SqlTemplate,
     chunk: tuple,
     filter_value: str,
     env: str,
@@ -116,11 +268,12 @@ def write_data_into_datalake_using_ctas_by_chunks(
     data_lake_bucket,
     data_source,
     source_database: str = None,
+    table_exists: bool = None,
 ) -> None:
     """Write data into data lake using CTAS (Create Table As Select) by chunks
 
     Args:
-        sql_query (str): Query to be executed
+        sql_template (SqlTemplate): Compiled SQL template with a full load and an incremental load
         chunk (tuple): Chunk to be processed
         filter_value (str): Filter value
         env (str): Environment name
@@ -129,57 +282,101 @@ def write_data_into_datalake_using_ctas_by_chunks(
         target_table_name (str): Table name
         data_lake_bucket (str): Data lake bucket name
         data_source (str): Data source name
+        table_exists (bool): Whether the target table exists, read from the catalog when it is not known
 
     Returns:
         None
     """
 
-    sql_query = _split_query(sql_query=sql_query)
-
-    if data_lake_layer == "stage" and source_database is None:
-        source_database = f"db_raw_{env}"
-    elif data_lake_layer == "analytics" and source_database is None:
-        source_database = f"db_stage_{env}"
+    write_data_into_datalake_using_ctas(
+        sql_template=sql_template,
+        filter_value=filter_value,
+        env=env,
+        data_lake_layer=data_lake_layer,
+        target_database=target_database,
+        target_table_name=target_table_name,
+        data_lake_bucket=data_lake_bucket,
+        data_source=data_source,
+        source_database=source_database,
+        chunk=chunk,
+        table_exists=table_exists,
+    )
+
+
+def write_data_into_datalake_using_ctas_by_chunks_concurrently(
+    sql_template: SqlTemplate,
+    chunks: List[tuple],
+    filter_value: str,
+    env: str,
+    data_lake_layer: str,
+    target_database: str,
+    target_table_name: str,
+    data_lake_bucket,
+    data_source,
+    source_database: str = None,
+    table_exists: bool = None,
+    filter_values_by_chunk: Dict[tuple, str] = None,
+    max_concurrent_queries: int = None,
+) -> None:
+    """Write data into data lake using CTAS (Create Table As Select), running the query of every chunk concurrently.
+    The chunks must write disjoint partitions. For Iceberg tables, the queries whose commit conflicts with another
+    chunk are run again by the multiplexer. The table must exist, except when every chunk writes a Hive table.
 
-    if wr.catalog.does_table_exist(database=target_database, table=target_table_name):
-        sql_query = sql_query[-1]  # Get the incremental load part
-        sql_query = (
-            sql_query.replace("filter_value", str(filter_value))
-            .replace("chunk", str(chunk))
-            .replace("source_database", source_database)
-            .replace("target_database", target_database)
-            .replace("table_name", target_table_name)
-            .replace("bucket_name", data_lake_bucket)
-            .replace("layer", data_lake_layer)
-            .replace("data_source", data_source)
-        )
+    Args:
+        sql_template (SqlTemplate): Compiled SQL template with a full load and an incremental load
+        chunks (List[tuple]): Chunks to be processed
+        filter_value (str): Filter value
+        env (str): Environment name
+        data_lake_layer (str): Layer name
+        target_database (str): Target database name
+        target_table_name (str): Table name
+        data_lake_bucket (str): Data lake bucket name
+        data_source (str): Data source name
+        table_exists (bool): Whether the target table exists, read from the catalog when it is not known
+        filter_values_by_chunk (Dict[tuple, str]): Filter value of each chunk, instead of filter_value
+        max_concurrent_queries (int): Maximum number of chunks written at the same time
 
-    else:
-        sql_query = sql_query[0]  # Get the full load part
-        sql_query = (
-            sql_query.replace("filter_value", str(filter_value))
-            .replace("chunk", str(chunk))
-            .replace("source_database", source_database)
-            .replace("target_database", target_database)
-            .replace("table_name", target_table_name)
-            .replace("bucket_name", data_lake_bucket)
-            .replace("layer", data_lake_layer)
-            .replace("data_source", data_source)
-        )
+    Returns:
+        None
+    """
 
     try:
-        wr.athena.start_query_execution(sql=sql_query, database=target_database, wait=True)
+        queries = [
+            (
+                get_ctas_query(
+                    sql_template=sql_template,
+                    filter_value=filter_values_by_chunk[chunk] if filter_values_by_chunk else filter_value,
+                    env=env,
+                    data_lake_layer=data_lake_layer,
+                    target_database=target_database,
+                    target_table_name=target_table_name,
+                    data_lake_bucket=data_lake_bucket,
+                    data_source=data_source,
+                    source_database=source_database,
+                    chunk=chunk,
+                    table_exists=table_exists,
+                ),
+                target_database,
+                get_query_tags(pipeline=data_lake_layer, table_name=target_table_name, chunk=chunk),
+            )
+            for chunk in chunks
+        ]
+        get_query_cache().invalidate(target_table_name)
+        get_execution_backend().run_queries(queries, max_concurrent_queries=max_concurrent_queries)
     except Exception as e:
         raise Exception(f"Error while executing the query to write data into the data lakehouse: {e}")
 
 
-def optimize_iceberg_table(target_database: str, table_name: str, chunk: tuple = None) -> None:
+def optimize_iceberg_table(
+    target_database: str, table_name: str, chunk: tuple = None, partition_column: str = "address_partition"
+) -> None:
     """Optimize iceberg table using bin pack to rewrite data in the table by chunks and avoid small files.
 
     Args:
         target_database (str): Target database name
         table_name (str): Iceberg table name
-        chunk (tuple): Chunk to be processed
+        chunk (tuple): Chunk of partitions to be processed
+        partition_column (str): Partition column of the chunk
 
     Returns:
         None
@@ -187,16 +384,39 @@ def optimize_iceberg_table(target_database: str, table_name: str, chunk: tuple =
 
     # If chunk is None, it will optimize the entire table
     # If chunk is not None, it will optimize the table by chunks
-    query_filter = f"WHERE address_partition in {chunk}" if chunk else ""
+    partitions = ", ".join(f"'{partition}'" for partition in chunk) if chunk else ""
+    query_filter = f"WHERE {partition_column} IN ({partitions})" if chunk else ""
 
     query_optimize = f"""
     OPTIMIZE {target_database}.{table_name} REWRITE DATA USING BIN_PACK {query_filter}
     """
 
-    query_vaccum = f"VACUUM {target_database}.{table_name}"
+    tags = get_query_tags(pipeline="optimize", table_name=table_name, chunk=chunk)
 
     try:
-        wr.athena.start_query_execution(sql=query_optimize, database=target_database, wait=True)
-        wr.athena.start_query_execution(sql=query_vaccum, database=target_database, wait=True)
+        get_query_cache().invalidate(table_name)
+        get_execution_backend().run_query(sql=query_optimize, database=target_database, tags=tags)
     except Exception as e:
         raise Exception(f"Error while executing the query to optimize the iceberg table: {e}")
+
+
+def vacuum_iceberg_table(target_database: str, table_name: str) -> None:
+    """Vacuum iceberg table: expire the snapshots older than vacuum_max_snapshot_age_seconds and delete the files
+    they no longer reference (e.g. the small files rewritten by OPTIMIZE).
+
+    Args:
+        target_database (str): Target database name
+        table_name (str): Iceberg table name
+
+    Returns:
+        None
+    """
+
+    query_vaccum = f"VACUUM {target_database}.{table_name}"
+
+    tags = get_query_tags(pipeline="optimize", table_name=table_name)
+
+    try:
+        get_execution_backend().run_query(sql=query_vaccum, database=target_database, tags=tags)
+    except Exception as e:
+        raise Exception(f"Error while executing the query to vacuum the iceberg table: {e}")
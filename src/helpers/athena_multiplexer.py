@@ -0,0 +1,567 @@
+import asyncio
+import random
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import List, Tuple
+
+import awswrangler as wr
+import boto3
+import pandas as pd
+from spectral_data_lib.config import settings as sdl_settings
+from spectral_data_lib.log_manager import Logger
+
+from config import settings
+
+# Errors returned by StartQueryExecution when the workgroup has too many queries in flight.
+THROTTLING_ERRORS = ("TooManyRequestsException", "ThrottlingException")
+FINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED")
+# Error of a write to an Iceberg table whose commit conflicted with the commit of another query. Nothing was written,
+# so the query can be run again.
+COMMIT_CONFLICT_ERRORS = ("ICEBERG_COMMIT_ERROR",)
+# Athena bills the data scanned, with a minimum of 10 MB by query (DDL and failed queries are not billed).
+ATHENA_PRICE_PER_TB_USD = 5
+ATHENA_MINIMUM_BILLED_BYTES = 10 * 1024**2
+
+
+class AthenaQueryMultiplexer(object):
+    """Class to run many Athena queries from a single event loop.
+    Queries are submitted without waiting, and their status is polled with an exponential backoff. The number of
+    queries in flight is capped to the DML concurrency quota of the workgroup, so queries wait in the process instead
+    of being throttled (or queued) by Athena.
+
+    The queries of every caller, whatever its thread (e.g. the tables run together by the table scheduler), run on the
+    same long-lived event loop thread and share the same slots, so the cap holds for the whole process.
+
+    The statistics of every query are recorded with its tags (pipeline, table, chunk), and each query has a scan
+    budget: a query scanning more than its budget (e.g. when partition pruning stops working) is logged, or stopped.
+
+    Concurrent writes to the same Iceberg table only conflict when they commit: a query failing with a commit conflict
+    is run again after a backoff with jitter, so the queries of disjoint partitions can run together.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_queries: int = 20,
+        workgroup: str = "primary",
+        poll_interval: float = 1,
+        max_poll_interval: float = 20,
+        submit_retries: int = 5,
+        commit_retries: int = 5,
+        scan_budgets_gb: dict = None,
+        scan_budget_action: str = "warn",
+        logger_name: str = "Athena Multiplexer Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            max_concurrent_queries (int): Maximum number of queries in flight (DML concurrency quota of the workgroup).
+            workgroup (str): Athena workgroup.
+            poll_interval (float): First interval between two status checks of a query, in seconds.
+            max_poll_interval (float): Maximum interval between two status checks of a query, in seconds.
+            submit_retries (int): Number of retries when the query submission is throttled.
+            commit_retries (int): Number of retries when the commit of a query conflicts with another one (Iceberg).
+            scan_budgets_gb (dict): Scan budget of the queries by table name, in GB, with a "default" budget.
+            scan_budget_action (str): Action when a query goes over its budget, "warn" or "abort".
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.max_concurrent_queries = max_concurrent_queries
+        self.workgroup = workgroup
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.submit_retries = submit_retries
+        self.commit_retries = commit_retries
+        self.stats = {
+            "queries": 0,
+            "failed": 0,
+            "throttled": 0,
+            "commit_conflicts": 0,
+            "reused": 0,
+            "data_scanned_bytes": 0,
+            "queued_ms": 0,
+        }
+        self.scan_budgets_gb = scan_budgets_gb or {}
+        self.scan_budget_action = scan_budget_action
+        self.query_stats = []
+        self.stats_lock = threading.Lock()
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        self.slots = None
+        self.athena_client = None
+        self.s3_output = None
+
+    def start_query_execution(self, sql: str, database: str, result_reuse_max_age_minutes: int = 0) -> str:
+        """Start a query, asking Athena to reuse the result of an identical query run in the last minutes.
+        awswrangler does not expose the result reuse configuration, so those queries are started with boto3.
+
+        Args:
+            sql (str): SQL query.
+            database (str): Athena database name.
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the query.
+
+        Returns:
+            str: Query execution id.
+        """
+
+        if not result_reuse_max_age_minutes:
+            return wr.athena.start_query_execution(sql=sql, database=database, workgroup=self.workgroup, wait=False)
+
+        if self.athena_client is None:
+            self.athena_client = boto3.client("athena")
+            self.s3_output = wr.athena.create_athena_bucket()
+
+        response = self.athena_client.start_query_execution(
+            QueryString=sql,
+            QueryExecutionContext={"Database": database},
+            WorkGroup=self.workgroup,
+            ResultConfiguration={"OutputLocation": self.s3_output},
+            ResultReuseConfiguration={
+                "ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": result_reuse_max_age_minutes}
+            },
+        )
+
+        return response["QueryExecutionId"]
+
+    async def submit(self, sql: str, database: str, result_reuse_max_age_minutes: int = 0) -> str:
+        """Submit a query without waiting for it, retrying with a backoff when the submission is throttled.
+
+        Args:
+            sql (str): SQL query.
+            database (str): Athena database name.
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the query.
+
+        Returns:
+            str: Query execution id.
+        """
+
+        delay = self.poll_interval
+
+        for attempt in range(self.submit_retries + 1):
+            try:
+                return await asyncio.to_thread(
+                    self.start_query_execution,
+                    sql=sql,
+                    database=database,
+                    result_reuse_max_age_minutes=result_reuse_max_age_minutes,
+                )
+            except Exception as e:
+                if attempt == self.submit_retries or not any(error in str(e) for error in THROTTLING_ERRORS):
+                    raise
+
+                with self.stats_lock:
+                    self.stats["throttled"] += 1
+                self.logger.debug(f"Athena query submission throttled, retrying in {delay} seconds - {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    def get_scan_budget_bytes(self, tags: dict) -> int:
+        """Get the scan budget of a query from the budget of its table, or the default budget.
+
+        Args:
+            tags (dict): Query tags.
+
+        Returns:
+            int: Scan budget in bytes, or None when the query has no budget.
+        """
+
+        scan_budget_gb = self.scan_budgets_gb.get(tags.get("table"), self.scan_budgets_gb.get("default"))
+
+        return int(scan_budget_gb * 1024**3) if scan_budget_gb else None
+
+    def record_query_stats(self, query_execution: dict, tags: dict, over_budget: bool) -> None:
+        """Record the statistics of a finished query with its tags.
+
+        Args:
+            query_execution (dict): Query execution of the finished query.
+            tags (dict): Query tags.
+            over_budget (bool): Whether the query went over its scan budget.
+
+        Returns:
+            None
+        """
+
+        statistics = query_execution.get("Statistics", {})
+        state = query_execution["Status"]["State"]
+        data_scanned_bytes = statistics.get("DataScannedInBytes", 0)
+        billed_bytes = max(data_scanned_bytes, ATHENA_MINIMUM_BILLED_BYTES) if data_scanned_bytes else 0
+
+        query_stats = {
+            "query_execution_id": query_execution.get("QueryExecutionId"),
+            "pipeline": tags.get("pipeline"),
+            "table": tags.get("table"),
+            "chunk": tags.get("chunk"),
+            "statement_type": query_execution.get("StatementType"),
+            "state": state,
+            "data_scanned_bytes": data_scanned_bytes,
+            "engine_execution_ms": statistics.get("EngineExecutionTimeInMillis", 0),
+            "queue_ms": statistics.get("QueryQueueTimeInMillis", 0),
+            "total_execution_ms": statistics.get("TotalExecutionTimeInMillis", 0),
+            "reused": statistics.get("ResultReuseInformation", {}).get("ReusedPreviousResult", False),
+            "over_budget": over_budget,
+            "estimated_cost_usd": billed_bytes / 1024**4 * ATHENA_PRICE_PER_TB_USD,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+        with self.stats_lock:
+            self.query_stats.append(query_stats)
+
+    async def wait(self, query_execution_id: str, tags: dict = None) -> dict:
+        """Poll the status of a query until it is finished, with an exponential backoff.
+        The data scanned is checked against the scan budget of the query at every poll.
+
+        Args:
+            query_execution_id (str): Query execution id.
+            tags (dict): Query tags (pipeline, table, chunk).
+
+        Returns:
+            dict: Query execution of the succeeded query.
+        """
+
+        tags = tags or {}
+        scan_budget_bytes = self.get_scan_budget_bytes(tags)
+        over_budget = False
+        aborted = False
+        delay = self.poll_interval
+
+        while True:
+            query_execution = await asyncio.to_thread(
+                wr.athena.get_query_execution, query_execution_id=query_execution_id
+            )
+            state = query_execution["Status"]["State"]
+            data_scanned_bytes = query_execution.get("Statistics", {}).get("DataScannedInBytes", 0)
+
+            if scan_budget_bytes and data_scanned_bytes > scan_budget_bytes and not over_budget:
+                over_budget = True
+                self.logger.warning(
+                    f"Athena query {query_execution_id} over its scan budget - {tags} - "
+                    f"{data_scanned_bytes / 1024 ** 3:.2f} GB scanned, {scan_budget_bytes / 1024 ** 3:.2f} GB budget"
+                )
+
+                if self.scan_budget_action == "abort" and state not in FINAL_STATES:
+                    await asyncio.to_thread(wr.athena.stop_query_execution, query_execution_id=query_execution_id)
+                    aborted = True
+
+            if state in FINAL_STATES:
+                break
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+        self.record_query_stats(query_execution, tags=tags, over_budget=over_budget)
+
+        statistics = query_execution.get("Statistics", {})
+
+        with self.stats_lock:
+            self.stats["queries"] += 1
+            self.stats["data_scanned_bytes"] += statistics.get("DataScannedInBytes", 0)
+            self.stats["queued_ms"] += statistics.get("QueryQueueTimeInMillis", 0)
+            self.stats["reused"] += int(statistics.get("ResultReuseInformation", {}).get("ReusedPreviousResult", False))
+            self.stats["failed"] += int(aborted or state != "SUCCEEDED")
+
+        if aborted:
+            raise Exception(f"Athena query {query_execution_id} aborted, over its scan budget - {tags}")
+
+        if state != "SUCCEEDED":
+            reason = query_execution["Status"].get("StateChangeReason")
+            raise Exception(f"Athena query {query_execution_id} {state.lower()}: {reason}")
+
+        return query_execution
+
+    async def execute(
+        self,
+        semaphore: asyncio.Semaphore,
+        sql: str,
+        database: str,
+        tags: dict = None,
+        result_reuse_max_age_minutes: int = 0,
+    ) -> dict:
+        """Run a query once a slot of the concurrency quota is free, running it again when its commit conflicts with
+        the commit of another query.
+
+        Args:
+            semaphore (asyncio.Semaphore): Semaphore limiting the number of queries in flight of the caller, the
+                queries of every caller also share the slots of the concurrency quota.
+            sql (str): SQL query.
+            database (str): Athena database name.
+            tags (dict): Query tags (pipeline, table, chunk).
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the query.
+
+        Returns:
+            dict: Query execution of the succeeded query.
+        """
+
+        delay = self.poll_interval
+
+        for attempt in range(self.commit_retries + 1):
+            try:
+                async with semaphore, self.slots:
+                    query_execution_id = await self.submit(
+                        sql=sql, database=database, result_reuse_max_age_minutes=result_reuse_max_age_minutes
+                    )
+                    return await self.wait(query_execution_id, tags=tags)
+            except Exception as e:
+                if attempt == self.commit_retries or not any(error in str(e) for error in COMMIT_CONFLICT_ERRORS):
+                    raise
+
+                # The slot is released during the backoff, and the jitter spreads the next commits of the queries
+                # which conflicted together.
+                with self.stats_lock:
+                    self.stats["commit_conflicts"] += 1
+                self.logger.info(f"Athena query commit conflicted, retrying in about {delay} seconds - {tags} - {e}")
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, self.max_poll_interval)
+
+    async def execute_all(
+        self,
+        queries: List[Tuple[str, str, dict]],
+        result_reuse_max_age_minutes: int = 0,
+        max_concurrent_queries: int = None,
+    ) -> List[dict]:
+        """Run queries concurrently. Every query is waited for before the first error is raised, so no query is
+        left running when the caller gets the error.
+
+        Args:
+            queries (List[Tuple[str, str, dict]]): List of (SQL query, database name, tags) tuples.
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the queries.
+            max_concurrent_queries (int): Maximum number of these queries in flight, below the concurrency quota.
+
+        Returns:
+            List[dict]: Query executions, in the same order as the queries.
+        """
+
+        if self.slots is None:
+            # Created on the loop of the multiplexer, which runs the queries of every caller
+            self.slots = asyncio.Semaphore(self.max_concurrent_queries)
+
+        semaphore = asyncio.Semaphore(
+            min(max_concurrent_queries or self.max_concurrent_queries, self.max_concurrent_queries)
+        )
+
+        results = await asyncio.gather(
+            *[
+                self.execute(semaphore, sql, database, tags, result_reuse_max_age_minutes)
+                for sql, database, tags in queries
+            ],
+            return_exceptions=True,
+        )
+
+        errors = [result for result in results if isinstance(result, Exception)]
+
+        if errors:
+            raise Exception(f"{len(errors)} of {len(queries)} Athena queries failed: {errors[0]}")
+
+        return results
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the event loop running the queries, started in a daemon thread on the first call.
+
+        Args:
+            None
+
+        Returns:
+            asyncio.AbstractEventLoop: Event loop of the multiplexer.
+        """
+
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="athena-multiplexer", daemon=True).start()
+
+        return self.loop
+
+    def run_queries(
+        self,
+        queries: List[Tuple[str, str, dict]],
+        result_reuse_max_age_minutes: int = 0,
+        max_concurrent_queries: int = None,
+    ) -> List[dict]:
+        """Run queries concurrently and wait for all of them. The queries run on the event loop of the multiplexer,
+        so the callers of every thread share the concurrency quota.
+
+        Args:
+            queries (List[Tuple[str, str, dict]]): List of (SQL query, database name, tags) tuples.
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the queries.
+            max_concurrent_queries (int): Maximum number of these queries in flight, below the concurrency quota.
+
+        Returns:
+            List[dict]: Query executions, in the same order as the queries.
+        """
+
+        query_executions = asyncio.run_coroutine_threadsafe(
+            self.execute_all(queries, result_reuse_max_age_minutes, max_concurrent_queries), self.get_loop()
+        ).result()
+
+        self.logger.info(
+            f"Athena queries finished - {len(queries)} queries - "
+            f"{self.stats['data_scanned_bytes'] / 1024 ** 3:.2f} GB scanned in total - "
+            f"{self.stats['queued_ms'] / 1000:.1f} s queued in total - "
+            f"{self.stats['throttled']} throttled submissions - {self.stats['commit_conflicts']} commit conflicts - "
+            f"{self.stats['reused']} reused results"
+        )
+
+        return query_executions
+
+    def run_query(self, sql: str, database: str, tags: dict = None, result_reuse_max_age_minutes: int = 0) -> dict:
+        """Run a single query and wait for it.
+
+        Args:
+            sql (str): SQL query.
+            database (str): Athena database name.
+            tags (dict): Query tags (pipeline, table, chunk).
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the query.
+
+        Returns:
+            dict: Query execution of the succeeded query.
+        """
+
+        return self.run_queries([(sql, database, tags)], result_reuse_max_age_minutes)[0]
+
+    def read_query(
+        self, sql: str, database: str, tags: dict = None, result_reuse_max_age_minutes: int = 0
+    ) -> pd.DataFrame:
+        """Run a query and read its results.
+
+        Args:
+            sql (str): SQL query.
+            database (str): Athena database name.
+            tags (dict): Query tags (pipeline, table, chunk).
+            result_reuse_max_age_minutes (int): Maximum age of a reused result, 0 to always run the query.
+
+        Returns:
+            pd.DataFrame: Query results.
+        """
+
+        query_execution = self.run_query(
+            sql=sql, database=database, tags=tags, result_reuse_max_age_minutes=result_reuse_max_age_minutes
+        )
+
+        return self.get_query_results(query_execution)
+
+    def get_query_results(self, query_execution: dict) -> pd.DataFrame:
+        """Read the results of a succeeded query.
+
+        Args:
+            query_execution (dict): Query execution of the succeeded query.
+
+        Returns:
+            pd.DataFrame: Query results.
+        """
+
+        return wr.athena.get_query_results(query_execution_id=query_execution["QueryExecutionId"])
+
+    def does_table_exist(self, database: str, table: str) -> bool:
+        """Check if a table exists in the Glue catalog.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            bool: True if the table exists
+        """
+
+        return wr.catalog.does_table_exist(database=database, table=table)
+
+    def is_iceberg_table(self, database: str, table: str) -> bool:
+        """Check if a table of the Glue catalog is an Iceberg table.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            bool: True if the table is an Iceberg table
+        """
+
+        table_parameters = wr.catalog.get_table_parameters(database=database, table=table)
+
+        return table_parameters.get("table_type", "").upper() == "ICEBERG"
+
+    def log_report(self) -> None:
+        """Log the data scanned and the estimated cost of the queries of the run, by pipeline and table.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        with self.stats_lock:
+            query_stats = pd.DataFrame(self.query_stats)
+
+        if query_stats.empty:
+            return
+
+        query_stats = query_stats.fillna({"pipeline": "-", "table": "-"})
+        report = query_stats.groupby(["pipeline", "table"]).agg(
+            queries=("query_execution_id", "count"),
+            data_scanned_bytes=("data_scanned_bytes", "sum"),
+            engine_execution_ms=("engine_execution_ms", "sum"),
+            queue_ms=("queue_ms", "sum"),
+            estimated_cost_usd=("estimated_cost_usd", "sum"),
+            over_budget=("over_budget", "sum"),
+        )
+
+        for (pipeline, table), row in report.iterrows():
+            self.logger.info(
+                f"Athena report - Pipeline: {pipeline} - Table: {table} - {row['queries']} queries - "
+                f"{row['data_scanned_bytes'] / 1024 ** 3:.2f} GB scanned - ${row['estimated_cost_usd']:.4f} - "
+                f"Engine: {row['engine_execution_ms'] / 1000:.1f} s - Queue: {row['queue_ms'] / 1000:.1f} s - "
+                f"{row['over_budget']} over budget"
+            )
+
+        self.logger.info(
+            f"Athena report - Total - {query_stats.shape[0]} queries - "
+            f"{query_stats['data_scanned_bytes'].sum() / 1024 ** 3:.2f} GB scanned - "
+            f"${query_stats['estimated_cost_usd'].sum():.4f}"
+        )
+
+    def save_report(self, s3_path: str = None) -> None:
+        """Append the statistics of the queries of the run to a parquet dataset partitioned by date.
+
+        Args:
+            s3_path (str): S3 path of the dataset. Defaults to the ATHENA_QUERY_STATS_S3_KEY of the data lake bucket.
+
+        Returns:
+            None
+        """
+
+        with self.stats_lock:
+            query_stats = pd.DataFrame(self.query_stats)
+
+        if query_stats.empty or not (s3_path or settings.ATHENA_QUERY_STATS_S3_KEY):
+            return
+
+        s3_path = s3_path or f"{sdl_settings.DATA_LAKE_BUCKET_S3}/{settings.ATHENA_QUERY_STATS_S3_KEY}"
+
+        query_stats["date_partition"] = query_stats["finished_at"].str[:10]
+
+        wr.s3.to_parquet(df=query_stats, path=s3_path, dataset=True, mode="append", partition_cols=["date_partition"])
+
+
+@lru_cache(maxsize=1)
+def get_athena_multiplexer() -> AthenaQueryMultiplexer:
+    """Function to get the Athena multiplexer of the process: every pipeline, in every thread, runs its queries on the
+    event loop of this multiplexer, so they all share the concurrency quota.
+
+    Args:
+        None
+
+    Returns:
+        AthenaQueryMultiplexer: Athena multiplexer.
+    """
+
+    return AthenaQueryMultiplexer(
+        max_concurrent_queries=settings.ATHENA_MAX_CONCURRENT_QUERIES,
+        workgroup=settings.ATHENA_WORKGROUP,
+        poll_interval=settings.ATHENA_POLL_INTERVAL_SECONDS,
+        max_poll_interval=settings.ATHENA_MAX_POLL_INTERVAL_SECONDS,
+        scan_budgets_gb=settings.ATHENA_SCAN_BUDGETS_GB,
+        scan_budget_action=settings.ATHENA_SCAN_BUDGET_ACTION,
+        commit_retries=settings.ATHENA_ICEBERG_COMMIT_RETRIES,
+    )
@@ -0,0 +1,115 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.helpers.data_transformations import split_nested_arrays
+
+# Fields of the features db documents holding the content hashes of the document fields, and of each entry of its
+# nested field (e.g. each contract of a wallet), as they were last written
+FEATURES_HASH_FIELD = "features_hash"
+NESTED_HASHES_FIELD_SUFFIX = "_hashes"
+
+
+def get_canonical_column(column: pd.Series) -> pd.Series:
+    """Function to cast a column to the fixed type it is hashed with: float64 for numbers (whether they were read as
+    integers, floats, nullable integers or objects), strings otherwise, so the hash does not depend on the dtype
+    inferred for a batch.
+
+    Args:
+        column (pd.Series): Column.
+
+    Returns:
+        pd.Series: Column as float64, or as strings (missing values kept as None).
+    """
+
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype("float64")
+
+    try:
+        return pd.to_numeric(column).astype("float64")
+    except (ValueError, TypeError):
+        return column.astype(str).where(column.notna(), None).astype(object)
+
+
+def hash_rows(data: pd.DataFrame) -> List[int]:
+    """Function to compute a content hash of each row of a dataframe, vectorized over the whole dataframe. The
+    columns are cast to a fixed type first (see get_canonical_column), so the hash only depends on the values of the
+    row, and is the same from one run (or batch) to the next.
+
+    Args:
+        data (pd.DataFrame): Dataframe.
+
+    Returns:
+        List[int]: Hash of each row, as signed 64 bits integers (stored as is by the features db).
+    """
+
+    canonical_data = pd.DataFrame(
+        {position: get_canonical_column(data.iloc[:, position]) for position in range(data.shape[1])},
+        index=data.index,
+    )
+
+    return pd.util.hash_pandas_object(canonical_data, index=False).to_numpy().view(np.int64).tolist()
+
+
+def hash_nested_values(keys: pd.Series, values: pd.Series, width: int) -> List[Dict[str, int]]:
+    """Function to compute a content hash of each entry of a map of maps returned by the query as two array columns
+    (see split_nested_arrays): the entries of the whole batch are hashed at once.
+
+    Args:
+        keys (pd.Series): Array of the keys of the map of each row.
+        values (pd.Series): Array of the values of the inner maps of each row, width values by key.
+        width (int): Number of values of each inner map.
+
+    Returns:
+        List[Dict[str, int]]: A dictionary by row, with the keys of its map as key and the hash of their values.
+    """
+
+    flat_keys, flat_values, offsets = split_nested_arrays(keys=keys, values=values, width=width)
+    flat_hashes = hash_rows(pd.DataFrame(flat_values)) if flat_keys else []
+
+    return [dict(zip(flat_keys[start:end], flat_hashes[start:end])) for start, end in offsets]
+
+
+def get_document_changes(document: dict, written_hashes: dict, key_field: str, nested_field: str) -> dict:
+    """Function to get the update of a document of the features db from the hashes of its last written version:
+    the fields of the document when they changed, and only the changed entries of its nested field, as dotted paths
+    (e.g. contracts.<address>), so the other entries are not written again.
+
+    Args:
+        document (dict): Document, with its features_hash and {nested_field}_hashes fields.
+        written_hashes (dict): features_hash and {nested_field}_hashes fields of the document in the features db,
+            None when the document is not in the features db yet.
+        key_field (str): Field identifying the document.
+        nested_field (str): Nested field whose entries are compared one by one.
+
+    Returns:
+        dict: Fields to set, None when the document did not change.
+    """
+
+    nested_hashes_field = f"{nested_field}{NESTED_HASHES_FIELD_SUFFIX}"
+
+    if not written_hashes or FEATURES_HASH_FIELD not in written_hashes:
+        return document  # not written yet, or written before the hashes: the whole document is set
+
+    changes = {}
+
+    if document[FEATURES_HASH_FIELD] != written_hashes[FEATURES_HASH_FIELD]:
+        changes.update(
+            {field: value for field, value in document.items() if field not in (nested_field, nested_hashes_field)}
+        )
+
+    written_nested_hashes = written_hashes.get(nested_hashes_field) or {}
+
+    for nested_key, nested_hash in document[nested_hashes_field].items():
+
+        if written_nested_hashes.get(nested_key) != nested_hash:
+            changes[f"{nested_field}.{nested_key}"] = document[nested_field][nested_key]
+            changes[f"{nested_hashes_field}.{nested_key}"] = nested_hash
+
+    if not changes:
+        return None
+
+    changes[key_field] = document[key_field]
+
+    return changes
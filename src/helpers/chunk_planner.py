@@ -0,0 +1,157 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+from itertools import product
+from typing import Dict, List, Tuple
+
+from spectral_data_lib.log_manager import Logger
+
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.watermark_store import get_watermark_key, get_watermark_store
+
+# Every possible address partition: the first two hex characters of the hash of the address (256)
+ADDRESS_PARTITIONS = list(map("".join, product("0123456789abcdef", repeat=2)))
+
+
+def pack_partitions(partitions: List[str], partition_sizes: Dict[str, int], number_of_chunks: int) -> List[Tuple]:
+    """Function to bin-pack partitions into chunks of roughly equal size: the largest partitions are placed first,
+    each one into the smallest chunk so far (then the chunk with the fewest partitions, so partitions without size
+    are spread evenly).
+
+    Args:
+        partitions (List[str]): Partitions to pack.
+        partition_sizes (Dict[str, int]): Size of the partitions, partitions without size count as empty.
+        number_of_chunks (int): Number of chunks.
+
+    Returns:
+        List[Tuple]: Chunks of sorted partitions, largest chunk first.
+    """
+
+    number_of_chunks = max(1, min(number_of_chunks, len(partitions)))
+    chunks = [(0, 0, index, []) for index in range(number_of_chunks)]  # (size, number of partitions, index, partitions)
+
+    for partition in sorted(partitions, key=lambda partition: (-partition_sizes.get(partition, 0), partition)):
+        size, number_of_partitions, index, chunk_partitions = heapq.heappop(chunks)
+        chunk_partitions.append(partition)
+        heapq.heappush(
+            chunks, (size + partition_sizes.get(partition, 0), number_of_partitions + 1, index, chunk_partitions)
+        )
+
+    return [tuple(sorted(chunk[3])) for chunk in sorted(chunks, key=lambda chunk: (-chunk[0], chunk[2]))]
+
+
+class ChunkPlanner(object):
+    """Class to plan the chunks of address partitions written by query, balanced by the number of rows of each
+    partition in the table read by the queries, instead of the same number of partitions in every chunk (the
+    partitions of exchanges and contracts have far more rows, and one chunk used to dominate the runtime).
+
+    The row counts are kept in the watermark store and scanned again every refresh_days, so the plan is the same
+    from one run to the next.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        table_name: str,
+        refresh_days: int = 7,
+        partition_column: str = "address_partition",
+        logger_name: str = "Chunk Planner Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            database (str): Database of the table read by the chunks.
+            table_name (str): Table read by the chunks.
+            refresh_days (int): Age of the row counts after which they are scanned again.
+            partition_column (str): Partition column of the table.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.database = database
+        self.table_name = table_name
+        self.refresh_days = refresh_days
+        self.partition_column = partition_column
+        self.watermark_store = get_watermark_store()
+        self.partition_sizes_key = f"{get_watermark_key(database=database, table_name=table_name)}:partition_sizes"
+
+    def scan_partition_sizes(self) -> Dict[str, int]:
+        """Scan the number of rows of every partition of the table (read from the Parquet footers).
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, int]: Number of rows by partition, empty when the table does not exist
+        """
+
+        if not get_execution_backend().does_table_exist(database=self.database, table=self.table_name):
+            return {}
+
+        partition_sizes = get_execution_backend().read_query(
+            sql=f"""
+            SELECT {self.partition_column} AS partition_value, COUNT(*) AS row_count
+            FROM {self.database}.{self.table_name}
+            GROUP BY {self.partition_column}
+            """,
+            database=self.database,
+            tags={"pipeline": "chunk_planner", "table": self.table_name},
+        )
+
+        return {
+            str(partition): int(row_count)
+            for partition, row_count in zip(partition_sizes["partition_value"], partition_sizes["row_count"])
+        }
+
+    def get_partition_sizes(self) -> Dict[str, int]:
+        """Get the number of rows of every partition of the table from the watermark store, scanning the table when
+        they are missing or older than refresh_days.
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, int]: Number of rows by partition
+        """
+
+        partition_sizes = self.watermark_store.get(self.partition_sizes_key)
+
+        if partition_sizes is not None:
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(partition_sizes["updated_at"])
+
+            if age < timedelta(days=self.refresh_days):
+                return partition_sizes["watermark"]
+
+        self.logger.info(f"Scanning the size of the partitions of {self.table_name} to plan the chunks.")
+
+        partition_sizes = self.scan_partition_sizes()
+
+        if partition_sizes:
+            self.watermark_store.set(self.partition_sizes_key, partition_sizes)
+
+        return partition_sizes
+
+    def get_chunks(self, number_of_chunks: int, partitions: List[str] = ADDRESS_PARTITIONS) -> List[Tuple]:
+        """Get the chunks of partitions, balanced by number of rows. Partitions are split evenly when the table
+        does not exist yet.
+
+        Args:
+            number_of_chunks (int): Number of chunks.
+            partitions (List[str]): Partitions to split into chunks.
+
+        Returns:
+            List[Tuple]: Chunks of partitions, largest chunk first.
+        """
+
+        partition_sizes = self.get_partition_sizes()
+        chunks = pack_partitions(partitions, partition_sizes, number_of_chunks)
+
+        if partition_sizes:
+            chunk_sizes = [sum(partition_sizes.get(partition, 0) for partition in chunk) for chunk in chunks]
+            self.logger.info(
+                f"{len(chunks)} chunks of {self.table_name} partitions - Largest chunk: {max(chunk_sizes)} rows - "
+                f"Smallest chunk: {min(chunk_sizes)} rows"
+            )
+
+        return chunks
@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import List, Tuple
+import numpy as np
 import pandas as pd
 import re
 import ast
@@ -8,22 +10,57 @@ from spectral_data_lib.log_manager import Logger
 logger = Logger(logger_name="Data Transformations Helper")
 
 
-def convert_string_to_dict(cell: str) -> dict:
-    """Converts a cell containing a list of tuples into a dictionary.
+def split_nested_arrays(
+    keys: pd.Series, values: pd.Series, width: int
+) -> Tuple[List[str], np.ndarray, List[Tuple[int, int]]]:
+    """Splits a map of maps returned by the query as two array columns: the keys of the map of each row, and the
+    values of its inner maps flattened, width values by key.
 
-    This function is designed to transform a cell from a pandas DataFrame column
-    where each cell is expected to be a list of tuples. Each tuple should have two elements:
-    the first being a key and the second a list of tuples, which will be converted into
-    a dictionary.
+    The arrays of the whole batch are concatenated and split with numpy, instead of converting the map of each row in
+    Python.
 
     Args:
-        cell (list of tuples): A cell from a DataFrame, where each element is a tuple.
+        keys (pd.Series): Array of the keys of the map of each row.
+        values (pd.Series): Array of the values of the inner maps of each row, width values by key.
+        width (int): Number of values of each inner map.
 
     Returns:
-        dict: A dictionary with the first element of each tuple as key and the second as value.
+        Tuple[List[str], np.ndarray, List[Tuple[int, int]]]: Keys of the whole batch, their values (a row of width
+            values by key), and the (start, end) offsets of the keys of each row.
     """
 
-    return {item[0]: dict(item[1]) for item in cell}
+    lengths = keys.map(len).to_numpy()
+
+    if not lengths.sum():
+        return [], np.empty((0, width)), [(0, 0) for _ in lengths]
+
+    flat_keys = np.concatenate(keys.to_numpy()).tolist()
+    flat_values = np.concatenate(values.to_numpy()).reshape(-1, width)
+
+    ends = np.cumsum(lengths).tolist()
+    starts = [0] + ends[:-1]
+
+    return flat_keys, flat_values, list(zip(starts, ends))
+
+
+def build_nested_documents(keys: pd.Series, values: pd.Series, value_names: List[str]) -> List[dict]:
+    """Builds the nested documents of a map of maps returned by the query as two array columns: the keys of the map
+    of each row, and the values of its inner maps flattened in the order of value_names (see split_nested_arrays), so
+    the only work left per document is building its dictionary.
+
+    Args:
+        keys (pd.Series): Array of the keys of the map of each row.
+        values (pd.Series): Array of the values of the inner maps of each row, len(value_names) values by key.
+        value_names (List[str]): Keys of the inner maps.
+
+    Returns:
+        List[dict]: A dictionary by row, with the keys of its map as key and a dictionary of value_names as value.
+    """
+
+    flat_keys, flat_values, offsets = split_nested_arrays(keys=keys, values=values, width=len(value_names))
+    inner_documents = [dict(zip(value_names, inner_values)) for inner_values in flat_values.tolist()]
+
+    return [dict(zip(flat_keys[start:end], inner_documents[start:end])) for start, end in offsets]
 
 
 def add_partition_column(data: pd.DataFrame, column: str = None) -> pd.DataFrame:
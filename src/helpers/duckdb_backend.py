@@ -0,0 +1,546 @@
+import glob
+import os
+import re
+import time
+import uuid
+from typing import List, Tuple
+
+import duckdb
+import pandas as pd
+from spectral_data_lib.log_manager import Logger
+
+# Trino functions renamed in DuckDB, applied on the rendered SQL. date_diff, uuid, split, try_cast, substr and
+# array_agg have the same name and arguments in both engines.
+FUNCTION_TRANSLATIONS = [
+    (re.compile(r"\bfrom_unixtime\s*\(", re.IGNORECASE), "to_timestamp("),
+    (re.compile(r"\bto_unixtime\s*\(", re.IGNORECASE), "epoch("),
+    (re.compile(r"\barray_join\s*\(", re.IGNORECASE), "array_to_string("),
+    (re.compile(r"\barray_sort\s*\(", re.IGNORECASE), "list_sort("),
+    (re.compile(r"\barray_distinct\s*\(", re.IGNORECASE), "list_distinct("),
+    (re.compile(r"\bfilter\s*\(", re.IGNORECASE), "list_filter("),
+    (re.compile(r"\bcardinality\s*\(", re.IGNORECASE), "len("),
+    (re.compile(r"\bdate_format\s*\(", re.IGNORECASE), "strftime("),
+    (re.compile(r"\bapprox_distinct\s*\(", re.IGNORECASE), "approx_count_distinct("),
+    (re.compile(r"\bregexp_like\s*\(", re.IGNORECASE), "regexp_matches("),
+    (re.compile(r"\bjson_extract_scalar\s*\(", re.IGNORECASE), "json_extract_string("),
+    (re.compile(r"\bdate\s*\(", re.IGNORECASE), "trino_date("),
+    (re.compile(r"\bINTERVAL\s+'(\d+)'\s+(\w+)", re.IGNORECASE), r"INTERVAL \1 \2"),
+]
+# Trino functions without a DuckDB equivalent, defined as macros on every connection.
+MACROS = ["CREATE OR REPLACE MACRO trino_date(value) AS CAST(value AS DATE)"]
+
+TABLE_NAME_PATTERN = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\.([A-Za-z_][A-Za-z0-9_]*)\b")
+CTAS_PATTERN = re.compile(r"^CREATE\s+TABLE\s+(\w+)\.(\w+)\s*", re.IGNORECASE)
+INSERT_PATTERN = re.compile(r"^INSERT\s+INTO\s+(\w+)\.(\w+)\s+", re.IGNORECASE)
+MERGE_PATTERN = re.compile(r"^MERGE\s+INTO\s+(\w+)\.(\w+)\s+AS\s+(\w+)\s+USING\s*", re.IGNORECASE)
+INSERT_ONLY_MERGE_PATTERN = re.compile(
+    r"^AS\s+(\w+)\s+ON\s+(.*?)\s+WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((.*?)\)\s*VALUES\s*\((.*)\)$",
+    re.IGNORECASE | re.DOTALL,
+)
+PARTITION_PROPERTY_PATTERN = re.compile(r"\b(?:partitioned_by|partitioning)\s*=\s*array\s*\[([^\]]*)\]", re.IGNORECASE)
+# Table maintenance statements, no-ops on Parquet files written once.
+MAINTENANCE_STATEMENTS = ("OPTIMIZE", "VACUUM", "ANALYZE")
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def strip_comments(sql: str) -> str:
+    """Function to remove the line comments and the trailing semicolon of a SQL statement.
+
+    Args:
+        sql (str): SQL statement.
+
+    Returns:
+        str: SQL statement without comments.
+    """
+
+    return re.sub(r"--[^\n]*", "", sql).strip().rstrip(";").strip()
+
+
+def translate_trino_to_duckdb(sql: str) -> str:
+    """Function to translate the Trino functions of a SQL query into their DuckDB equivalent.
+
+    Args:
+        sql (str): Trino SQL query.
+
+    Returns:
+        str: DuckDB SQL query.
+    """
+
+    for pattern, replacement in FUNCTION_TRANSLATIONS:
+        sql = pattern.sub(replacement, sql)
+
+    return sql
+
+
+def split_parenthesized(sql: str) -> Tuple[str, str]:
+    """Function to split a SQL text starting with a parenthesis into the text inside the parentheses and the rest.
+
+    Args:
+        sql (str): SQL text starting with a parenthesis.
+
+    Returns:
+        Tuple[str, str]: Text inside the parentheses and text after them.
+    """
+
+    depth = 0
+
+    for position, character in enumerate(sql):
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        if depth == 0:
+            return sql[1:position], sql[position + 1 :].lstrip()
+
+    raise Exception(f"Unbalanced parentheses: {sql[:100]}")
+
+
+def split_top_level(sql: str) -> List[str]:
+    """Function to split a comma separated list of SQL expressions, ignoring the commas inside parentheses.
+
+    Args:
+        sql (str): Comma separated SQL expressions.
+
+    Returns:
+        List[str]: SQL expressions.
+    """
+
+    expressions = [""]
+    depth = 0
+
+    for character in sql:
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        if character == "," and depth == 0:
+            expressions.append("")
+        else:
+            expressions[-1] += character
+
+    return [expression.strip() for expression in expressions]
+
+
+def split_table_properties(sql: str) -> Tuple[str, str]:
+    """Function to split the WITH (...) table properties of a CTAS statement from its query.
+
+    Args:
+        sql (str): End of the CTAS statement, after the table name.
+
+    Returns:
+        Tuple[str, str]: Table properties (empty without properties) and query.
+    """
+
+    properties = ""
+
+    if sql.upper().startswith("WITH") and sql[4:].lstrip().startswith("("):
+        properties, sql = split_parenthesized(sql[4:].lstrip())
+
+    if not sql.upper().startswith("AS"):
+        raise Exception(f"Unsupported CREATE TABLE statement: {sql[:100]}")
+
+    return properties, sql[2:].strip()
+
+
+def get_partition_columns(properties: str) -> List[str]:
+    """Function to get the partition columns of a CTAS statement from its table properties.
+    Iceberg partition transforms (bucket, day, ...) are not kept, the table is only partitioned by plain columns.
+
+    Args:
+        properties (str): Table properties.
+
+    Returns:
+        List[str]: Partition columns.
+    """
+
+    match = PARTITION_PROPERTY_PATTERN.search(properties)
+
+    if not match:
+        return []
+
+    columns = [column.strip().strip("'\"") for column in match.group(1).split(",")]
+
+    return [column for column in columns if re.match(r"^\w+$", column)]
+
+
+def get_insert_only_merge_query(statement: str) -> Tuple[str, str, str]:
+    """Function to rewrite a MERGE statement with only a WHEN NOT MATCHED THEN INSERT clause as the query selecting
+    the source rows without a match in the target table.
+
+    Args:
+        statement (str): MERGE statement.
+
+    Returns:
+        Tuple[str, str, str]: Target database, target table and query of the rows to insert.
+    """
+
+    merge_match = MERGE_PATTERN.match(statement)
+    source = statement[merge_match.end() :] if merge_match else ""
+
+    if source.startswith("("):
+        source_query, source = split_parenthesized(source)
+    else:
+        source_query, source = None, ""
+
+    insert_match = INSERT_ONLY_MERGE_PATTERN.match(source)
+
+    if not insert_match or re.search(r"\bWHEN\s+MATCHED\b", source, re.IGNORECASE):
+        raise Exception("Only MERGE statements with a single WHEN NOT MATCHED THEN INSERT clause are supported")
+
+    database, table, target_alias = merge_match.groups()
+    source_alias, condition, columns, values = insert_match.groups()
+    select_list = ", ".join(
+        f"{value} AS {column}" for column, value in zip(split_top_level(columns), split_top_level(values))
+    )
+
+    query = f"""
+    SELECT {select_list}
+    FROM ({source_query}) AS {source_alias}
+    WHERE NOT EXISTS (SELECT 1 FROM {database}.{table} AS {target_alias} WHERE {condition})
+    """
+
+    return database, table, query
+
+
+class DuckDBBackend(object):
+    """Class to run the SQL of the pipelines with DuckDB over a local Parquet lakehouse, instead of Athena.
+    Tables are read from (and written to) {lakehouse_path}/{database}/{table}/, with Hive partition directories, so
+    backfills and large reprocessing can run on a single host, and the SQL can be tested offline.
+
+    It has the interface of the Athena multiplexer. Queries run one after the other, each query using every core.
+    """
+
+    def __init__(self, lakehouse_path: str, logger_name: str = "DuckDB Backend Logger") -> None:
+        """Constructor for the class
+
+        Args:
+            lakehouse_path (str): Root directory of the local lakehouse.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.lakehouse_path = lakehouse_path
+        self.connection = duckdb.connect(database=":memory:")
+        self.results = {}
+        self.query_stats = []
+
+        for macro in MACROS:
+            self.connection.execute(macro)
+
+    def get_table_path(self, database: str, table: str) -> str:
+        """Get the directory of a table in the local lakehouse.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            str: Table directory.
+        """
+
+        return os.path.join(self.lakehouse_path, database, table)
+
+    def get_table_files(self, database: str, table: str) -> List[str]:
+        """Get the Parquet files of a table.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            List[str]: Parquet files of the table.
+        """
+
+        return sorted(glob.glob(os.path.join(self.get_table_path(database, table), "**", "*.parquet"), recursive=True))
+
+    def does_table_exist(self, database: str, table: str) -> bool:
+        """Check if a table exists (has Parquet files) in the local lakehouse.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            bool: True if the table exists
+        """
+
+        return bool(self.get_table_files(database, table))
+
+    def is_iceberg_table(self, database: str, table: str) -> bool:
+        """Check if a table is an Iceberg table. Tables of the local lakehouse are plain Parquet files.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            bool: False
+        """
+
+        return False
+
+    def get_table_partition_columns(self, database: str, table: str) -> List[str]:
+        """Get the partition columns of an existing table, from the Hive directories of its first file.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+
+        Returns:
+            List[str]: Partition columns.
+        """
+
+        table_files = self.get_table_files(database, table)
+
+        if not table_files:
+            return []
+
+        relative_path = os.path.relpath(os.path.dirname(table_files[0]), self.get_table_path(database, table))
+
+        return [part.split("=", 1)[0] for part in relative_path.split(os.sep) if "=" in part]
+
+    def register_tables(self, sql: str) -> None:
+        """Register the tables read by a query as views over their Parquet files.
+
+        Args:
+            sql (str): SQL query.
+
+        Returns:
+            None
+        """
+
+        for database, table in set(TABLE_NAME_PATTERN.findall(sql)):
+            if not self.does_table_exist(database, table):
+                continue
+
+            files_pattern = os.path.join(self.get_table_path(database, table), "**", "*.parquet")
+            self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {database}")
+            self.connection.execute(
+                f"CREATE OR REPLACE VIEW {database}.{table} AS "
+                f"SELECT * FROM read_parquet('{files_pattern}', hive_partitioning = true, union_by_name = true)"
+            )
+
+    def write_table(self, database: str, table: str, sql: str, partition_columns: List[str]) -> int:
+        """Write the results of a query as new Parquet files of a table, one file by partition.
+
+        Args:
+            database (str): Database name.
+            table (str): Table name.
+            sql (str): SQL query.
+            partition_columns (List[str]): Partition columns.
+
+        Returns:
+            int: Number of rows written.
+        """
+
+        self.connection.execute(f"CREATE OR REPLACE TEMP TABLE query_result AS {sql}")
+        rows = self.connection.execute("SELECT COUNT(*) FROM query_result").fetchone()[0]
+        file_name = f"part-{uuid.uuid4()}.parquet"
+        columns = f"* EXCLUDE ({', '.join(partition_columns)})" if partition_columns else "*"
+        partitions = [()]
+
+        if partition_columns:
+            partitions = self.connection.execute(
+                f"SELECT DISTINCT {', '.join(partition_columns)} FROM query_result"
+            ).fetchall()
+
+        for partition in partitions if rows else []:
+            directories = []
+            conditions = ["true"]
+
+            for column, value in zip(partition_columns, partition):
+                if value is None:
+                    directories.append(f"{column}={HIVE_DEFAULT_PARTITION}")
+                    conditions.append(f"{column} IS NULL")
+                else:
+                    escaped_value = str(value).replace("'", "''")
+                    directories.append(f"{column}={value}")
+                    conditions.append(f"CAST({column} AS VARCHAR) = '{escaped_value}'")
+
+            partition_path = os.path.join(self.get_table_path(database, table), *directories)
+            os.makedirs(partition_path, exist_ok=True)
+
+            self.connection.execute(
+                f"COPY (SELECT {columns} FROM query_result WHERE {' AND '.join(conditions)}) "
+                f"TO '{os.path.join(partition_path, file_name)}' (FORMAT PARQUET, COMPRESSION SNAPPY)"
+            )
+
+        self.connection.execute("DROP TABLE query_result")
+
+        return rows
+
+    def execute_statement(self, sql: str) -> Tuple[str, int, pd.DataFrame]:
+        """Execute a translated statement: CTAS, INSERT INTO and insert-only MERGE statements write Parquet files,
+        maintenance statements are skipped and the other statements are read.
+
+        Args:
+            sql (str): DuckDB SQL statement.
+
+        Returns:
+            Tuple[str, int, pd.DataFrame]: Statement type, rows written and query results.
+        """
+
+        statement = strip_comments(sql)
+        ctas_match = CTAS_PATTERN.match(statement)
+        insert_match = INSERT_PATTERN.match(statement)
+
+        if ctas_match:
+            database, table = ctas_match.groups()
+
+            if self.does_table_exist(database, table):
+                raise Exception(f"Table {database}.{table} already exists")
+
+            properties, query = split_table_properties(statement[ctas_match.end() :])
+            rows = self.write_table(database, table, query, get_partition_columns(properties))
+            return "DDL", rows, None
+
+        elif insert_match:
+            database, table = insert_match.groups()
+            query = statement[insert_match.end() :]
+
+            if query.startswith("("):
+                raise Exception(f"INSERT INTO statements with a column list are not supported: {database}.{table}")
+
+            rows = self.write_table(database, table, query, self.get_table_partition_columns(database, table))
+            return "DML", rows, None
+
+        elif statement.upper().startswith(MAINTENANCE_STATEMENTS):
+            self.logger.info(f"Maintenance statement skipped: {statement[:100]}")
+            return "UTILITY", 0, None
+
+        elif statement.upper().startswith("MERGE"):
+            database, table, query = get_insert_only_merge_query(statement)
+            rows = self.write_table(database, table, query, self.get_table_partition_columns(database, table))
+            return "DML", rows, None
+
+        return "DML", 0, self.connection.execute(statement).df()
+
+    def run_query(self, sql: str, database: str, tags: dict = None, result_reuse_max_age_minutes: int = 0) -> dict:
+        """Run a Trino query with DuckDB.
+
+        Args:
+            sql (str): Trino SQL query.
+            database (str): Database name, the tables of the queries are always qualified by their database.
+            tags (dict): Query tags (pipeline, table, chunk).
+            result_reuse_max_age_minutes (int): Ignored, results are never reused.
+
+        Returns:
+            dict: Query execution, with the fields of an Athena query execution.
+        """
+
+        tags = tags or {}
+        query_execution_id = str(uuid.uuid4())
+        sql = translate_trino_to_duckdb(sql)
+        start = time.monotonic()
+
+        try:
+            self.register_tables(sql)
+            statement_type, rows, data_frame = self.execute_statement(sql)
+        except Exception as e:
+            raise Exception(f"DuckDB query {query_execution_id} failed - {tags}: {e}")
+
+        engine_execution_ms = int((time.monotonic() - start) * 1000)
+
+        if data_frame is not None:
+            self.results[query_execution_id] = data_frame
+
+        self.query_stats.append(
+            {
+                "query_execution_id": query_execution_id,
+                "pipeline": tags.get("pipeline"),
+                "table": tags.get("table"),
+                "chunk": tags.get("chunk"),
+                "statement_type": statement_type,
+                "rows_written": rows,
+                "engine_execution_ms": engine_execution_ms,
+            }
+        )
+
+        return {
+            "QueryExecutionId": query_execution_id,
+            "StatementType": statement_type,
+            "Status": {"State": "SUCCEEDED"},
+            "Statistics": {"DataScannedInBytes": 0, "EngineExecutionTimeInMillis": engine_execution_ms},
+        }
+
+    def run_queries(
+        self,
+        queries: List[Tuple[str, str, dict]],
+        result_reuse_max_age_minutes: int = 0,
+        max_concurrent_queries: int = None,
+    ) -> List[dict]:
+        """Run queries one after the other.
+
+        Args:
+            queries (List[Tuple[str, str, dict]]): List of (SQL query, database name, tags) tuples.
+            result_reuse_max_age_minutes (int): Ignored, results are never reused.
+            max_concurrent_queries (int): Ignored, queries run one after the other.
+
+        Returns:
+            List[dict]: Query executions, in the same order as the queries.
+        """
+
+        return [self.run_query(sql=sql, database=database, tags=tags) for sql, database, tags in queries]
+
+    def read_query(
+        self, sql: str, database: str, tags: dict = None, result_reuse_max_age_minutes: int = 0
+    ) -> pd.DataFrame:
+        """Run a query and read its results.
+
+        Args:
+            sql (str): Trino SQL query.
+            database (str): Database name.
+            tags (dict): Query tags (pipeline, table, chunk).
+            result_reuse_max_age_minutes (int): Ignored, results are never reused.
+
+        Returns:
+            pd.DataFrame: Query results.
+        """
+
+        return self.get_query_results(self.run_query(sql=sql, database=database, tags=tags))
+
+    def get_query_results(self, query_execution: dict) -> pd.DataFrame:
+        """Read the results of a query run by the backend.
+
+        Args:
+            query_execution (dict): Query execution.
+
+        Returns:
+            pd.DataFrame: Query results.
+        """
+
+        return self.results.pop(query_execution["QueryExecutionId"])
+
+    def log_report(self) -> None:
+        """Log the rows written and the execution time of the queries of the run, by pipeline and table.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        if not self.query_stats:
+            return
+
+        query_stats = pd.DataFrame(self.query_stats).fillna({"pipeline": "-", "table": "-"})
+        report = query_stats.groupby(["pipeline", "table"]).agg(
+            queries=("query_execution_id", "count"),
+            rows_written=("rows_written", "sum"),
+            engine_execution_ms=("engine_execution_ms", "sum"),
+        )
+
+        for (pipeline, table), row in report.iterrows():
+            self.logger.info(
+                f"DuckDB report - Pipeline: {pipeline} - Table: {table} - {row['queries']} queries - "
+                f"{row['rows_written']} rows written - Engine: {row['engine_execution_ms'] / 1000:.1f} s"
+            )
+
+    def save_report(self, s3_path: str = None) -> None:
+        """Nothing is billed by the DuckDB backend, the statistics of the queries are only logged.
+
+        Args:
+            s3_path (str): Ignored.
+
+        Returns:
+            None
+        """
+
+        return None
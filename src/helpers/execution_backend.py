@@ -0,0 +1,25 @@
+from functools import lru_cache
+from typing import Union
+
+from config import settings
+from src.helpers.athena_multiplexer import AthenaQueryMultiplexer, get_athena_multiplexer
+from src.helpers.duckdb_backend import DuckDBBackend
+
+
+@lru_cache(maxsize=1)
+def get_execution_backend() -> Union[AthenaQueryMultiplexer, DuckDBBackend]:
+    """Function to get the backend running the SQL of the pipelines, set in the settings (athena or duckdb).
+
+    Args:
+        None
+
+    Returns:
+        Union[AthenaQueryMultiplexer, DuckDBBackend]: Execution backend.
+    """
+
+    if settings.EXECUTION_BACKEND == "athena":
+        return get_athena_multiplexer()
+    elif settings.EXECUTION_BACKEND == "duckdb":
+        return DuckDBBackend(lakehouse_path=settings.DUCKDB_LAKEHOUSE_PATH)
+
+    raise Exception(f"Unknown execution backend: {settings.EXECUTION_BACKEND}")
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Tuple
+
+from spectral_data_lib.log_manager import Logger
+
+
+class FeaturesDbSync(object):
+    """Class to write batches of documents into the features db while the next batches are read.
+
+    The batches are put into a bounded queue by the reader (e.g. the Athena result chunks) and written by writer
+    threads, so the next chunk is read while the previous ones are written, and the reader waits when the writers are
+    behind (the queue is full) instead of holding every batch in memory. The documents acknowledged by the features db
+    are counted, and the first error of a writer stops the sync and is raised to the caller.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[dict]], int],
+        max_writers: int = 8,
+        max_queued_batches: int = 16,
+        logger_name: str = "Features DB Sync Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            write_batch (Callable[[List[dict]], int]): Function writing a batch of documents, returning the number of
+                documents acknowledged.
+            max_writers (int): Number of writer threads.
+            max_queued_batches (int): Number of batches waiting to be written, after which the reader waits.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.write_batch = write_batch
+        self.max_writers = max(1, max_writers)
+        self.batches = queue.Queue(maxsize=max(1, max_queued_batches))
+        self.lock = threading.Lock()
+        self.failed = threading.Event()
+        self.errors: List[Exception] = []
+        self.stats = {"batches": 0, "documents": 0, "acknowledged_batches": 0, "acknowledged": 0}
+        self.last_acknowledged_timestamp = None
+
+    def run_writer(self) -> None:
+        """Write the batches of the queue until the end of the sync (None), or until a writer fails.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        while True:
+            batch = self.batches.get()
+
+            if batch is None:
+                return
+
+            documents, last_timestamp = batch
+
+            if self.failed.is_set():
+                continue  # the sync failed, the batches left are dropped so the reader is not blocked
+
+            try:
+                acknowledged = self.write_batch(documents)
+            except Exception as e:
+                with self.lock:
+                    self.errors.append(e)
+                self.failed.set()
+                continue
+
+            with self.lock:
+                self.stats["acknowledged_batches"] += 1
+                self.stats["acknowledged"] += acknowledged
+
+                if self.last_acknowledged_timestamp is None or last_timestamp > self.last_acknowledged_timestamp:
+                    self.last_acknowledged_timestamp = last_timestamp
+
+    def put(self, batch: Tuple[List[dict], int]) -> None:
+        """Put a batch into the queue, waiting while the queue is full.
+
+        Args:
+            batch (Tuple[List[dict], int]): Documents, and the last timestamp of the documents.
+
+        Returns:
+            None
+        """
+
+        while not self.failed.is_set():
+            try:
+                self.batches.put(batch, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self, batches: Iterable[Tuple[List[dict], int]]) -> dict:
+        """Write every batch into the features db.
+
+        Args:
+            batches (Iterable[Tuple[List[dict], int]]): Batches of documents, with the last timestamp of each batch.
+
+        Returns:
+            dict: Number of batches and documents sent and acknowledged, and the last timestamp of the acknowledged
+                documents (last_timestamp).
+        """
+
+        started_at = time.monotonic()
+        writers = [threading.Thread(target=self.run_writer, daemon=True) for _ in range(self.max_writers)]
+
+        for writer in writers:
+            writer.start()
+
+        try:
+            for documents, last_timestamp in batches:
+
+                if self.failed.is_set():
+                    break
+
+                self.stats["batches"] += 1
+                self.stats["documents"] += len(documents)
+                self.put((documents, last_timestamp))
+        finally:
+            for _ in writers:
+                self.batches.put(None)
+
+            for writer in writers:
+                writer.join()
+
+        if self.errors:
+            raise Exception(f"Error while writing the documents into the features db: {self.errors[0]}")
+
+        if self.stats["acknowledged"] != self.stats["documents"]:
+            raise Exception(
+                f"Documents not acknowledged by the features db: {self.stats['acknowledged']} of "
+                f"{self.stats['documents']}"
+            )
+
+        self.logger.info(
+            f"{self.stats['acknowledged']} documents acknowledged in {self.stats['acknowledged_batches']} batches - "
+            f"{time.monotonic() - started_at:.1f}s"
+        )
+
+        return {**self.stats, "last_timestamp": self.last_acknowledged_timestamp}
@@ -1,118 +1,172 @@
 from spectral_data_lib.helpers.get_secrets import get_secret
+from spectral_data_lib.config import settings as sdl_settings
+from config import settings
 import pandas as pd
-import numpy as np
 from spectral_data_lib.log_manager import Logger
 import asyncio
 from aiohttp import ClientError
 import aiohttp
-from collections import deque
+from typing import List
+
+from src.helpers.abi_cache import AbiCache
+from src.helpers.rate_limit import KeyScheduler
 
 
 class EtherscanABI:
     API_RATE_LIMIT = 3  # number of requests allowed per second
+    API_ENDPOINT = "https://api.etherscan.io/api"
+    RATE_LIMIT_COOLDOWN = 1  # seconds a key is left aside after reaching its rate limit
 
     def __init__(self, logger_name: str = "get_abi_etherscan") -> None:
         self.logger = Logger(logger_name=logger_name)
         self.etherscan_api_keys = get_secret("prod/etherscan_api/keys")["keys"]
-        self.api_key_queue = deque(self.etherscan_api_keys)
-        self.semaphores_by_api_key = {k: asyncio.Semaphore(self.API_RATE_LIMIT) for k in self.etherscan_api_keys}
+        self.scheduler = KeyScheduler(api_keys=self.etherscan_api_keys, rate=self.API_RATE_LIMIT)
+        self.abi_cache = AbiCache(
+            local_path=settings.ABI_CACHE_LOCAL_PATH,
+            s3_path=f"{sdl_settings.DATA_LAKE_BUCKET_S3}/{settings.ABI_CACHE_S3_KEY}",
+        )
 
-    async def get_abi(self, session: aiohttp.ClientSession, token_address: str, retries=10) -> str:
-        """This function retrieves the ABI for a given token address using the Etherscan API
+    async def get_abi(self, session: aiohttp.ClientSession, token_address: str) -> tuple:
+        """This function retrieves the ABI for a given token address using the Etherscan API.
+        The request is sent with the first API key with capacity, failed requests are not retried here.
 
         Args:
             session (aiohttp.ClientSession): aiohttp session object
             token_address (str): address of the token
-            retries (int, optional): number of retries. Defaults to 6.
 
         Returns:
-            str: ABI of the token
+            tuple: (ABI of the token, False) on success, (None, True) when the request should be retried.
 
         """
 
-        api_endpoint = "https://api.etherscan.io/api"
-        semaphore = self.semaphores_by_api_key[self.api_key_queue[0]]
+        api_key = await self.scheduler.acquire()
 
-        params = {"module": "contract", "action": "getabi", "address": token_address, "apikey": self.api_key_queue[0]}
+        params = {"module": "contract", "action": "getabi", "address": token_address, "apikey": api_key}
 
         try:
-            async with semaphore:  # use semaphore to limit the rate of requests
-                async with session.get(api_endpoint, params=params, timeout=60) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if (
-                            data is not None
-                            and "result" in data
-                            and data["result"] != "Max rate limit reached"
-                            and data["result"] != ""
-                        ):
-                            self.logger.info(f"ABI retrieved for {token_address}")
-                            await asyncio.sleep(1 / self.API_RATE_LIMIT)
-                            return data["result"]
-                        else:
-                            self.logger.error(f"Error on retrieving ABI for {token_address}. Retrying...")
-                            self.api_key_queue.rotate(-1)  # rotate the list of API keys
-                            if (
-                                retries > 0 and self.api_key_queue[0] != self.etherscan_api_keys[0]
-                            ):  # make sure we haven't already tried all keys
-                                return await self.get_abi(session, token_address, retries=retries - 1)
-                            else:
-                                self.logger.error(f"Failed to retrieve ABI for {token_address} after all retries.")
-                    else:
-                        self.logger.error(f"Error on retrieving ABI for {token_address}. Retrying...")
-                        return await self.get_abi(session, token_address, retries=retries - 1)
+            async with session.get(self.API_ENDPOINT, params=params, timeout=60) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data is not None and "result" in data and data["result"] not in ("Max rate limit reached", ""):
+                        self.logger.info(f"ABI retrieved for {token_address}")
+                        return data["result"], False
+
+                    if data is not None and data.get("result") == "Max rate limit reached":
+                        self.scheduler.cooldown(api_key, self.RATE_LIMIT_COOLDOWN)
+
+                self.logger.error(f"Error on retrieving ABI for {token_address}. Retrying...")
+
         except (asyncio.TimeoutError, ClientError) as e:
-            if retries > 0:
-                self.logger.error(f"Timeout error on retrieving ABI for {token_address}. Retrying...")
-                self.api_key_queue.rotate(-1)  # rotate the list of API keys
-                if self.api_key_queue[0] != self.etherscan_api_keys[0]:  # make sure we haven't already tried all keys
-                    return await self.get_abi(session, token_address, retries=retries - 1)
-                else:
-                    self.logger.error(f"Failed to retrieve ABI for {token_address} after all retries with all keys.")
-            else:
-                raise Exception(f"Failed to retrieve ABI for {token_address} after all retries.")
+            self.logger.error(f"Timeout error on retrieving ABI for {token_address} - {e}. Retrying...")
+
+        return None, True
 
-    async def process_chunk(self, session: aiohttp.ClientSession, chunk: pd.DataFrame) -> pd.DataFrame:
-        """This function processes a chunk of the token list
+    async def worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue, abis: list, retries: int) -> None:
+        """Worker consuming the queue of token addresses. Failed requests go back to the queue until the retries
+        are exhausted.
 
         Args:
             session (aiohttp.ClientSession): aiohttp session object
-            chunk (pd.DataFrame): chunk of the token list
+            queue (asyncio.Queue): queue of (position, token address, attempt) items
+            abis (list): list of ABIs, filled by position
+            retries (int): number of retries of each token address
 
         Returns:
-            pd.DataFrame: chunk of the token list with the ABI column populated
+            None
 
         """
 
-        tasks = []
-        for i, row in chunk.iterrows():
-            tasks.append(self.get_abi(session, row["token_address"]))
+        while True:
+            position, token_address, attempt = await queue.get()
 
-        abis = await asyncio.gather(*tasks, return_exceptions=True)
-        chunk["abi"] = abis
+            try:
+                try:
+                    abi, retry = await self.get_abi(session, token_address)
+                except Exception as e:  # keep the worker alive, the address is retried like any failed request
+                    self.logger.error(f"Error on retrieving ABI for {token_address} - {e}")
+                    abi, retry = None, True
 
-        return chunk
+                if not retry:
+                    abis[position] = abi
+                elif attempt < retries:
+                    queue.put_nowait((position, token_address, attempt + 1))
+                else:
+                    self.logger.error(f"Failed to retrieve ABI for {token_address} after all retries.")
+            finally:
+                queue.task_done()
 
-    async def get_abis(self, token_list: pd.DataFrame) -> pd.DataFrame:
-        """Fetches the ABI for each token in the token list using the Etherscan API
+    async def fetch_abis(self, token_addresses: List[str], retries: int = 10) -> List[str]:
+        """Fetches the ABI of each token address using the Etherscan API.
+        The number of workers is sized to the total quota of the API keys.
+
+        Args:
+            token_addresses (List[str]): token addresses
+            retries (int, optional): number of retries of each token address. Defaults to 10.
+
+        Returns:
+            List[str]: ABIs, in the same order as the token addresses (None when the ABI could not be retrieved)
+
+        """
+
+        abis = [None] * len(token_addresses)
+
+        if not token_addresses:
+            return abis
+
+        queue = asyncio.Queue()
+        for position, token_address in enumerate(token_addresses):
+            queue.put_nowait((position, token_address, 0))
+
+        number_of_workers = min(len(token_addresses), len(self.etherscan_api_keys) * self.API_RATE_LIMIT)
+
+        async with aiohttp.ClientSession() as session:
+            workers = [
+                asyncio.create_task(self.worker(session, queue, abis, retries)) for _ in range(number_of_workers)
+            ]
+            self.logger.info(f"Workers: {len(workers)} - Token addresses: {len(token_addresses)}")
+
+            await queue.join()
+
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        self.logger.info(f"Requests by API key: {list(self.scheduler.requests_by_key.values())}")
+
+        return abis
+
+    async def get_abis(self, token_list: pd.DataFrame, retries: int = 10, use_abi_cache: bool = True) -> pd.DataFrame:
+        """Fetches the ABI for each token in the token list using the Etherscan API.
+        With the ABI cache, cached addresses and addresses sharing the bytecode of a cached contract skip Etherscan,
+        and only one address of each bytecode is requested.
 
         Args:
             token_list (pd.DataFrame): A dataframe containing the token list
+            retries (int, optional): number of retries of each token address. Defaults to 10.
+            use_abi_cache (bool, optional): use the ABI cache. Defaults to True.
 
         Returns:
             pd.DataFrame: A dataframe containing the token list with the ABI column populated
 
         """
 
-        chunks = np.array_split(token_list, 100) if len(token_list) > 100 else np.array_split(token_list, 10)
+        token_addresses = token_list["token_address"].str.lower().tolist()
+        unique_token_addresses = list(dict.fromkeys(token_addresses))
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for chunk in chunks:
-                tasks.append(asyncio.create_task(self.process_chunk(session, chunk)))
-                self.logger.info(f"Tasks: {len(tasks)}")
+        if not use_abi_cache:
+            abi_by_address = dict(zip(unique_token_addresses, await self.fetch_abis(unique_token_addresses, retries)))
+        else:
+            abi_cache = self.abi_cache
+            abi_by_address = abi_cache.lookup(unique_token_addresses)
+
+            groups = abi_cache.group_by_bytecode([a for a in unique_token_addresses if a not in abi_by_address])
+            representatives = list(groups.keys())
+
+            for representative, abi in zip(representatives, await self.fetch_abis(representatives, retries)):
+                abi_by_address.update({address: abi for address in groups[representative]})
 
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            df_with_abis = pd.concat(results, ignore_index=True)
+            abi_cache.update(abi_by_address)
+            abi_cache.save()
+            abi_cache.log_report()
 
-        return df_with_abis
+        return token_list.assign(abi=[abi_by_address.get(address) for address in token_addresses])
@@ -1,15 +1,17 @@
-from typing import List
+import asyncio
+import json
+from typing import Dict
 import pandas as pd
 import numpy as np
-from web3 import Web3, contract
-from web3.exceptions import BadFunctionCallOutput
-from eth_abi.exceptions import InsufficientDataBytes
 from spectral_data_lib.log_manager import Logger
-from multiprocessing.pool import ThreadPool
-from multiprocessing import cpu_count
 
 from spectral_data_lib.helpers.get_secrets import get_secret
 
+from config import settings
+from src.helpers.multicall import MulticallTokenReader
+from src.helpers.token_classifier import classify_token_selectors
+from src.helpers.token_dimension import TokenDimension
+
 
 class TokenMetadata:
     """This class retrieves the metadata for a given token address"""
@@ -17,216 +19,202 @@ class TokenMetadata:
     def __init__(self, node_rpc_urls, logger_name: str = "get_token_metadata") -> None:
         self.logger = Logger(logger_name=logger_name)
         self.node_rpc_urls = node_rpc_urls
-        self.retry = len(node_rpc_urls)
+        self.multicall_reader = MulticallTokenReader(
+            node_rpc_urls=node_rpc_urls,
+            batch_size=settings.MULTICALL_BATCH_SIZE,
+            concurrency=settings.MULTICALL_CONCURRENCY,
+            logger_name=logger_name,
+        )
 
-    def check_token_type(self, token_address: str, abi: str, node_rpc_urls: List[str], retries: int = 5):
-        """This function checks if a given token is ERC20 or ERC721
+    @staticmethod
+    def get_token_type_from_abi(abi: str) -> tuple:
+        """This function checks if a given token is ERC20 or ERC721 from the functions of its ABI
 
         Args:
-            token_address (str): address of the token
             abi (str): ABI of the token
-            retries (int, optional): number of retries. Defaults to 5.
-            node_rpc_urls (List[str]): list of node rpc urls
 
         Returns:
-            str: type of the token
+            tuple: type of the token (ERC20, ERC721 or Unknown) and whether the token can be destroyed
         """
 
-        web3 = Web3(Web3.HTTPProvider(node_rpc_urls[0]))
-
-        token_address = web3.toChecksumAddress(token_address)
-
         try:
+            function_names = {item.get("name") for item in json.loads(abi) if item.get("type") == "function"}
+        except (TypeError, ValueError, AttributeError):
+            return "Unknown", False
 
-            # create a contract object
-            contract = web3.eth.contract(address=token_address, abi=abi)
+        # check if the contract is ERC20
+        is_erc20 = "balanceOf" in function_names and "totalSupply" in function_names and "ownerOf" not in function_names
 
-            # check if the contract is ERC20
-            is_erc20 = (
-                hasattr(contract.functions, "balanceOf")
-                and hasattr(contract.functions, "totalSupply")
-                and not hasattr(contract.functions, "ownerOf")
-            )
+        # check if the contract is ERC721
+        is_erc721 = {"setApprovalForAll", "safeTransferFrom", "tokenURI"} <= function_names
 
-            # check if the contract is ERC721
-            is_erc721 = (
-                hasattr(contract.functions, "setApprovalForAll")
-                and hasattr(contract.functions, "safeTransferFrom")
-                and hasattr(contract.functions, "tokenURI")
-            )
+        is_destroyable = "selfDestruct" in function_names or "destroy" in function_names
 
-            # print the result
-            if is_erc20:
-                return "ERC20", contract
-            elif is_erc721:
-                return "ERC721", contract
-            else:
-                return "Unknown", None
-        except Exception as e:
-            self.logger.debug(f"Error on checking token type for {token_address} - {e}")
-            self.logger.info(f"Retrying {retries} more times")
-            if retries > 0:
-                return self.check_token_type(
-                    token_address=token_address, abi=abi, node_rpc_urls=node_rpc_urls[1:], retries=retries - 1
-                )
-            else:
-                self.logger.info(f"Could not get token type for {token_address}")
-                return "Unknown", None
-
-    def get_token_metadata(self, contract: contract, token_type: str) -> tuple:
-        """Function to get the token metadata for a given contract.
+        if is_erc20:
+            return "ERC20", is_destroyable
+        elif is_erc721:
+            return "ERC721", is_destroyable
+        else:
+            return "Unknown", False
+
+    def get_token_types(self, abis: np.ndarray = None, function_sighashes: np.ndarray = None) -> tuple:
+        """Function to get the type and destroyable status of an array of tokens.
+        The function selectors are used when they are given, only the ambiguous contracts are checked with the ABI.
 
         Args:
-            contract (contract): Contract object.
-            token_type (str): Token type.
+            abis (np.ndarray, optional): Array of ABIs. Defaults to None.
+            function_sighashes (np.ndarray, optional): Array of function selectors. Defaults to None.
 
         Returns:
-            tuple: Tuple with the token name, token symbol, and token decimals.
+            tuple: Arrays of types and destroyable statuses.
         """
 
-        default_name = "Unknown"
-        default_symbol = "Unknown"
-        default_decimals = 18
+        number_of_tokens = len(function_sighashes) if function_sighashes is not None else len(abis)
 
-        try:
-            token_name = contract.functions.name().call() if hasattr(contract.functions, "name") else default_name
-            token_symbol = (
-                contract.functions.symbol().call() if hasattr(contract.functions, "symbol") else default_symbol
-            )
-            token_decimals = (
-                contract.functions.decimals().call()
-                if (hasattr(contract.functions, "decimals") and token_type == "ERC20")
-                else default_decimals
-            )
+        if function_sighashes is not None:
+            classification = classify_token_selectors(pd.Series(function_sighashes, dtype=object))
+            types = classification["type"].to_numpy(dtype=object)
+            is_destroyable = classification["is_destroyable"].to_numpy(dtype=bool)
+            use_abi = classification["is_ambiguous"].to_numpy(dtype=bool)
+        else:
+            types = np.full(number_of_tokens, "Unknown", dtype=object)
+            is_destroyable = np.zeros(number_of_tokens, dtype=bool)
+            use_abi = np.ones(number_of_tokens, dtype=bool)
+
+        if abis is not None:
+            for position in np.flatnonzero(use_abi):
+                types[position], is_destroyable[position] = self.get_token_type_from_abi(abis[position])
 
-            return token_name, token_symbol, token_decimals
+        self.logger.info(f"Token type resolved from the ABI for {int(use_abi.sum())} of {number_of_tokens} tokens")
 
-        except (Exception, BadFunctionCallOutput, InsufficientDataBytes) as e:
-            self.logger.info(f"Error to get token metadata for - {e}")
-            return default_name, default_symbol, default_decimals
+        return types, is_destroyable
 
-    def set_token_metadata_by_row(self, row: pd.Series, retries: int = 5) -> pd.Series:
-        """Function to get the token metadata for a given token address.
+    async def get_tokens_metadata_columns(
+        self, token_addresses: np.ndarray, abis: np.ndarray = None, function_sighashes: np.ndarray = None
+    ) -> Dict[str, np.ndarray]:
+        """Function to get the token metadata of an array of token addresses as columnar arrays.
+        The token type is read from the function selectors or the ABI, and the name, symbol and decimals of the active
+        tokens are read from the node with concurrent Multicall3 batches. The active tokens that could not be read from
+        any node are flagged as not read (is_read), instead of being given default metadata.
 
         Args:
-            row (pd.Series): Pandas series with the token address.
-            retries (int, optional): Number of retries. Defaults to 3.
+            token_addresses (np.ndarray): Array of token addresses.
+            abis (np.ndarray, optional): Array of ABIs, in the same order as the token addresses. Defaults to None.
+            function_sighashes (np.ndarray, optional): Array of function selectors, in the same order as the token
+                addresses. Defaults to None.
 
         Returns:
-            pd.Series: Pandas series with the token metadata.
+            Dict[str, np.ndarray]: Arrays name, symbol, decimals, type, status and is_read, in the same order as the
+            addresses.
         """
 
-        token_address = row["token_address"]
-
-        try:
-
-            if row["abi"] != "Contract source code not verified" and row["abi"] != "Invalid Address format":
-
-                token_type, contract = self.check_token_type(
-                    token_address=token_address, abi=row["abi"], node_rpc_urls=self.node_rpc_urls, retries=retries
-                )
+        default_name = "Unknown"
+        default_symbol = "Unknown"
+        default_decimals = 18
 
-                if token_type == "Unknown":
-                    self.logger.info(f"Unknown token type for {token_address}")
-                    row["name"] = "Unknown"
-                    row["symbol"] = "Unknown"
-                    row["decimals"] = 18
-                    row["type"] = "Unknown"
-                    row["status"] = "Unknown"
+        types, is_destroyable = self.get_token_types(abis=abis, function_sighashes=function_sighashes)
+        statuses = np.select([types == "Unknown", is_destroyable], ["Unknown", "Destroyed"], default="Active")
 
-                    return row
+        names = np.full(len(token_addresses), default_name, dtype=object)
+        symbols = np.full(len(token_addresses), default_symbol, dtype=object)
+        decimals = np.full(len(token_addresses), default_decimals, dtype="int64")
+        is_read = np.ones(len(token_addresses), dtype=bool)
 
-                else:
+        is_active = statuses == "Active"
 
-                    if hasattr(contract.functions, "selfDestruct") or hasattr(contract.functions, "destroy"):
+        if is_active.any():
+            tokens_metadata = await self.multicall_reader.read(list(token_addresses[is_active]))
 
-                        row["name"] = "Unknown"
-                        row["symbol"] = "Unknown"
-                        row["decimals"] = 18
-                        row["type"] = token_type
-                        row["status"] = "Destroyed"
+            active_decimals = pd.Series(tokens_metadata["decimals"], dtype="float64")
+            active_decimals = active_decimals.where((active_decimals <= 255) & (types[is_active] == "ERC20"))
 
-                        return row
+            names[is_active] = pd.Series(tokens_metadata["name"], dtype=object).fillna(default_name).to_numpy()
+            symbols[is_active] = pd.Series(tokens_metadata["symbol"], dtype=object).fillna(default_symbol).to_numpy()
+            decimals[is_active] = active_decimals.fillna(default_decimals).astype("int64").to_numpy()
+            is_read[is_active] = tokens_metadata["is_read"]
 
-                    else:
+        self.logger.info(
+            f"Token metadata found for {int((is_active & is_read).sum())} of {len(token_addresses)} tokens - "
+            f"{int((~is_read).sum())} tokens not read"
+        )
 
-                        token_name, token_symbol, token_decimals = self.get_token_metadata(contract, token_type)
+        return {
+            "name": names,
+            "symbol": symbols,
+            "decimals": decimals,
+            "type": types,
+            "status": statuses,
+            "is_read": is_read,
+        }
 
-                        self.logger.info(f"Token metadata found for {token_address}")
+    @staticmethod
+    def get_tokens_metadata_from_dimension(token_list: pd.DataFrame, token_dimension: TokenDimension) -> pd.DataFrame:
+        """Function to fill the token metadata of the tokens already present in the token dimension.
 
-                        row["name"] = token_name
-                        row["symbol"] = token_symbol
-                        row["decimals"] = token_decimals
-                        row["type"] = token_type
-                        row["status"] = "Active"
+        Args:
+            token_list (pd.DataFrame): Pandas dataframe with the token list.
+            token_dimension (TokenDimension): Token dimension.
 
-                        return row
-            else:
-                self.logger.info(f"Contract source code not verified for {token_address}")
-                row["name"] = "Unknown"
-                row["symbol"] = "Unknown"
-                row["decimals"] = 18
-                row["type"] = "Unknown"
-                row["status"] = "Unknown"
+        Returns:
+            pd.DataFrame: Pandas dataframe with the token metadata of the tokens found in the dimension.
+        """
 
-                return row
+        tokens = token_dimension.get_tokens(token_list["token_address"].tolist())
 
-        except Exception as e:
+        known_tokens = token_list[token_list["token_address"].str.lower().isin(tokens.index)].copy()
+        known_tokens_metadata = tokens.reindex(known_tokens["token_address"].str.lower())
 
-            if retries > 0:
-                self.logger.info(f"Error to get token metadata for {token_address} - {e}")
-                self.logger.info(f"Retrying {retries} more times")
+        known_tokens["name"] = known_tokens_metadata["name"].values
+        known_tokens["symbol"] = known_tokens_metadata["symbol"].values
+        known_tokens["decimals"] = known_tokens_metadata["decimals"].values
+        known_tokens["type"] = known_tokens_metadata["standard"].str.replace("-", "", regex=False).values
+        known_tokens["status"] = known_tokens_metadata["status"].values
 
-                return self.set_token_metadata_by_row(row, retries=retries - 1)
-            else:
-                raise Exception(f"Error to get token metadata for {token_address} - {e}")
+        return known_tokens
 
-    def set_token_metadata(self, dataframe: pd.DataFrame) -> pd.DataFrame:
-        """Function to get the token metadata for each token address in the dataframe.
+    def get_tokens_metadata(self, token_list: pd.DataFrame, token_dimension: TokenDimension = None) -> pd.DataFrame:
+        """Function to get the token metadata for a list of tokens.
+        When a token dimension is given, the tokens already in the dimension are not requested to the node.
+        The tokens that could not be read from any node are left out, so they are requested again on the next run.
 
         Args:
-            dataframe (pd.DataFrame): Pandas dataframe with the token addresses.
+            token_list (pd.DataFrame): Pandas dataframe with the token list (token_address and abi and/or
+                function_sighashes columns).
+            token_dimension (TokenDimension, optional): Token dimension. Defaults to None.
 
         Returns:
             pd.DataFrame: Pandas dataframe with the token metadata.
         """
 
-        dataframe = dataframe.apply(self.set_token_metadata_by_row, axis=1, args=(self.retry,))
+        known_tokens = None
 
-        return dataframe
-
-    def parallelize_dataframe(self, df: pd.DataFrame, func, n_chunks: int = 10) -> pd.DataFrame:
-        """Function to parallelize pandas dataframe using multiprocessing pool.
-        This function takes a dataframe, a function and the number of chunks to split the dataframe into.
-        After splitting the dataframe into chunks, the function is applied to each chunk using a multiprocessing pool to get the token metadata.
-
-        Args:
-            df (pd.DataFrame): Pandas dataframe to be split into chunks.
-            func (Callable): Function to be applied to each chunk.
-            n_chunks (int, optional): Number of chunks to split the dataframe into. Defaults to 10.
-
-        Returns:
-            pd.DataFrame: Pandas dataframe with the token metadata.
+        if token_dimension is not None:
+            known_tokens = self.get_tokens_metadata_from_dimension(token_list, token_dimension)
+            token_list = token_list[~token_list.index.isin(known_tokens.index)]
 
-        """
-        df_split = np.array_split(df, n_chunks)
-        with ThreadPool(processes=cpu_count()) as pool:
-            results = list(pool.map(func, df_split))
+            self.logger.info(
+                f"{known_tokens.shape[0]} tokens found in the token dimension - {token_list.shape[0]} tokens to request"
+            )
 
-        return pd.concat(results)
+        if token_list.empty:
+            return known_tokens
 
-    def get_tokens_metadata(self, token_list: pd.DataFrame) -> pd.DataFrame:
-        """Function to get the token metadata for a list of tokens.
+        abis = token_list["abi"].to_numpy() if "abi" in token_list else None
+        function_sighashes = token_list["function_sighashes"].to_numpy() if "function_sighashes" in token_list else None
 
-        Args:
-            token_list (pd.DataFrame): Pandas dataframe with the token list.
+        columns = asyncio.run(
+            self.get_tokens_metadata_columns(
+                token_list["token_address"].to_numpy(), abis=abis, function_sighashes=function_sighashes
+            )
+        )
+        results = token_list.assign(**columns)
 
-        Returns:
-            pd.DataFrame: Pandas dataframe with the token metadata.
-        """
+        if not results["is_read"].all():
+            self.logger.error(f"{int((~results['is_read']).sum())} tokens left out, their metadata could not be read")
 
-        n_chunks = 1000 if len(token_list) >= 10000 else 100
+        results = results[results["is_read"]].drop(columns=["is_read"])
 
-        results = self.parallelize_dataframe(token_list, self.set_token_metadata, n_chunks=n_chunks)
+        if known_tokens is not None and not known_tokens.empty:
+            results = pd.concat([known_tokens, results])
 
         return results
@@ -1,30 +1,105 @@
 import pandas as pd
+import pyarrow as pa
 import requests
 import time
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from config import settings
 from spectral_data_lib.log_manager import Logger
 from spectral_data_lib.data_lakehouse import DataLakehouse
 
+from src.helpers.rate_limit import TokenBucket
+
+# Timestamps sent to the API (window bounds and keyset cursor) and persisted as watermark: ISO-8601 in UTC, with
+# milliseconds, e.g. 2023-05-01T10:00:00.000Z
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def format_utc_timestamp(timestamp) -> str:
+    """Function to format a timestamp as ISO-8601 in UTC, naive timestamps being in UTC.
+
+    Args:
+        timestamp: Timestamp, as a string or a datetime.
+
+    Returns:
+        str: Timestamp as ISO-8601 in UTC with milliseconds (e.g. 2023-05-01T10:00:00.000Z).
+    """
+
+    timestamp = pd.Timestamp(timestamp)
+    timestamp = timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+    return timestamp.strftime(TIMESTAMP_FORMAT)[:-3] + "Z"
+
 
 class TranposeTokenMetadata:
-    """Class to load token metadata from Transpose API using SQL query API."""
+    """Class to load token metadata from Transpose API using SQL query API.
+
+    The SQL query behind the endpoint is paginated with a keyset (seek) on (last_refreshed, contract_address)
+    instead of limit/offset, so every page is an index range scan no matter how deep it is:
 
-    def __init__(self, api_key: str, last_timestamp_inserted: str = "2015-07-30 00:00:00.000"):
+        WHERE COALESCE(last_refreshed, created_timestamp) > {{last_timestamp_inserted}}
+            AND COALESCE(last_refreshed, created_timestamp) <= {{upper_timestamp}}
+            AND (COALESCE(last_refreshed, created_timestamp), contract_address)
+                > ({{cursor_last_refreshed}}, {{cursor_contract_address}})
+        ORDER BY COALESCE(last_refreshed, created_timestamp), contract_address
+        LIMIT {{limit_param}}
+
+    The range of timestamps is split into windows, which are paginated concurrently over a pooled session.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        last_timestamp_inserted: str = "2015-07-30T00:00:00.000Z",
+        concurrency: int = None,
+        requests_per_second: float = None,
+        page_size: int = None,
+    ):
         self.api_key = api_key
-        self.last_timestamp_inserted = last_timestamp_inserted
+        self.last_timestamp_inserted = format_utc_timestamp(last_timestamp_inserted)
         self.logger = Logger(logger_name="load_historical_token_metadata_transpose")
         self.data_lakehouse_client = DataLakehouse()
         self.headers = {
             "Content-Type": "application/json",
             "X-API-KEY": self.api_key,
         }
+        self.concurrency = concurrency or settings.TRANSPOSE_API_CONCURRENCY
+        self.page_size = page_size or settings.TRANSPOSE_API_PAGE_SIZE
+        self.rate_limiter = TokenBucket(rate=requests_per_second or settings.TRANSPOSE_API_REQUESTS_PER_SECOND)
+        self.session = self.create_session()
+
+    def create_session(self) -> requests.Session:
+        """Create a requests session with a connection pool sized to the number of concurrent requests.
+
+        Args:
+            None
+
+        Returns:
+            requests.Session: Session reused by every page request.
+        """
+
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency))
+
+        return session
 
-    def get_token_metadata(self, limit: int, offset: int, retries: int = 2) -> dict:
-        """Get token metadata from Transpose API using SQL query API.
+    def get_token_metadata(
+        self,
+        window_start: str,
+        window_end: str,
+        cursor_last_refreshed: str,
+        cursor_contract_address: str,
+        retries: int = 2,
+    ) -> dict:
+        """Get a page of token metadata from Transpose API using SQL query API.
 
         Args:
-            limit (int): Number of rows to fetch.
-            offset (int): Offset to fetch rows.
+            window_start (str): Lower bound (exclusive) of the last refreshed timestamp.
+            window_end (str): Upper bound (inclusive) of the last refreshed timestamp.
+            cursor_last_refreshed (str): Last refreshed timestamp of the last row of the previous page.
+            cursor_contract_address (str): Contract address of the last row of the previous page.
             retries (int): Number of retries.
 
         Returns:
@@ -33,36 +108,98 @@ class TranposeTokenMetadata:
         """
 
         parameters = {
-            "last_timestamp_inserted": self.last_timestamp_inserted,
-            "limit_param": str(limit),
-            "offset_param": str(offset),
+            "last_timestamp_inserted": window_start,
+            "upper_timestamp": window_end,
+            "cursor_last_refreshed": cursor_last_refreshed,
+            "cursor_contract_address": cursor_contract_address,
+            "limit_param": str(self.page_size),
         }
 
-        try:
-            response = requests.get(
-                url=settings.TRANSPOSE_API_TOKENS_METADATA_ENDPOINT, headers=self.headers, params=parameters
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                if retries > 0:
-                    self.logger.error(f"Failed to fetch data: {response.status_code} - {response.text}")
-                    self.logger.info(f"Retrying to fetch data - Retries left: {retries}")
-                    time.sleep(1)
-                    return self.get_token_metadata(limit=limit, offset=offset, retries=retries - 1)
-                else:
-                    self.logger.error(f"Failed to fetch data: {response.status_code} - {response.text}")
-                    return None
-
-        except Exception as e:
-            if retries > 0:
-                self.logger.error(f"Failed to fetch data: {e}")
-                self.logger.info(f"Retrying to fetch data - Retries left: {retries}")
-                time.sleep(1)
-                return self.get_token_metadata(limit=limit, offset=offset, retries=retries - 1)
-            else:
+        for attempt in range(retries + 1):
+
+            self.rate_limiter.acquire()
+
+            try:
+                response = self.session.get(url=settings.TRANSPOSE_API_TOKENS_METADATA_ENDPOINT, params=parameters)
+                if response.status_code == 200:
+                    return response.json()
+
+                self.logger.error(f"Failed to fetch data: {response.status_code} - {response.text}")
+
+            except Exception as e:
                 self.logger.error(f"Failed to fetch data: {e}")
-                return None
+
+            if attempt < retries:
+                self.logger.info(f"Retrying to fetch data - Retries left: {retries - attempt}")
+                time.sleep(2**attempt)
+
+        return None
+
+    def split_time_windows(self) -> List[Tuple[str, str]]:
+        """Split the range between the last timestamp inserted and now into windows paginated concurrently.
+
+        Args:
+            None
+
+        Returns:
+            List[Tuple[str, str]]: List of (window_start, window_end) timestamps, as ISO-8601 in UTC.
+        """
+
+        start = pd.Timestamp(self.last_timestamp_inserted)
+        end = pd.Timestamp.now(tz="UTC")
+
+        number_of_windows = max(self.concurrency * settings.TRANSPOSE_API_WINDOWS_PER_WORKER, 1)
+        boundaries = pd.date_range(start=start, end=max(start, end), periods=number_of_windows + 1)
+
+        # The last window is open ended to include the tokens refreshed while the pipeline is running.
+        boundaries = [format_utc_timestamp(boundary) for boundary in boundaries[:-1]] + ["9999-12-31T23:59:59.999Z"]
+
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def fetch_window(self, window_start: str, window_end: str) -> List[pa.Table]:
+        """Fetch every page of a time window, following the keyset cursor.
+
+        Args:
+            window_start (str): Lower bound (exclusive) of the last refreshed timestamp.
+            window_end (str): Upper bound (inclusive) of the last refreshed timestamp.
+
+        Returns:
+            List[pa.Table]: Pages of the window as arrow tables.
+        """
+
+        pages = []
+        cursor_last_refreshed, cursor_contract_address = window_start, ""
+
+        while True:
+            data = self.get_token_metadata(
+                window_start=window_start,
+                window_end=window_end,
+                cursor_last_refreshed=cursor_last_refreshed,
+                cursor_contract_address=cursor_contract_address,
+            )
+
+            if data is None:
+                raise Exception(f"Failed to fetch token metadata between {window_start} and {window_end}.")
+
+            results = data["results"]
+
+            if not results:
+                break
+
+            # The page is converted to a columnar arrow table right away, so the list of dicts can be released.
+            pages.append(pa.Table.from_pylist(results))
+
+            # The cursor is sent in the format of the window bounds, whatever the format returned by the API
+            last_row = results[-1]
+            cursor_last_refreshed = format_utc_timestamp(
+                last_row.get("last_refreshed") or last_row["created_timestamp"]
+            )
+            cursor_contract_address = last_row["contract_address"]
+
+            if len(results) < self.page_size:
+                break
+
+        return pages
 
     @staticmethod
     def convert_timestamp_to_datetime(data: pd.DataFrame, column: str) -> pd.DataFrame:
@@ -103,19 +240,25 @@ class TranposeTokenMetadata:
             None
         """
 
-        limit = 50000
-        offset = 0
-        all_data = []
+        pages = []
 
-        while True:
-            data = self.get_token_metadata(limit, offset)
-            if data is None or not data["results"]:
-                break
-            all_data.extend(data["results"])
-            offset += limit
-            time.sleep(1)  # To avoid hitting any rate limits
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [
+                    executor.submit(self.fetch_window, window_start=window_start, window_end=window_end)
+                    for window_start, window_end in self.split_time_windows()
+                ]
+
+                for future in as_completed(futures):
+                    pages.extend(future.result())
+        finally:
+            self.session.close()
+
+        if not pages:
+            self.logger.info("No data to load.")
+            return None
 
-        all_data = pd.DataFrame(all_data)
+        all_data = pa.concat_tables(pages, promote=True).to_pandas()
 
         if all_data.empty:
             self.logger.info("No data to load.")
@@ -0,0 +1,105 @@
+import pandas as pd
+
+from src.helpers.query_cache import get_query_cache
+
+
+def read_column_upper_bound(
+    database: str, table_name: str, column: str, partition_column: str = None, tags: dict = None
+) -> pd.DataFrame:
+    """Function to read the upper bound of a column from the statistics of the data files kept in the metadata of an
+    Iceberg table (the "$partitions" metadata table), instead of scanning the data files. The query only reads the
+    manifests, so it scans no data.
+
+    Upper bounds include the rows deleted by a MERGE (until the table is optimized), so they are only used for
+    columns which never decrease, like the watermarks.
+
+    Args:
+        database (str): Database name.
+        table_name (str): Iceberg table name.
+        column (str): Column name (number or timestamp, the bounds of strings are truncated).
+        partition_column (str): Partition column, to read the upper bound of each partition.
+        tags (dict): Query tags (pipeline, table), recorded in the Athena report.
+
+    Returns:
+        pd.DataFrame: upper_bound column, by partition when partition_column is set (one row per partition).
+    """
+
+    partitions_table = f'"{database}"."{table_name}$partitions"'
+
+    if partition_column:
+        sql = f"""
+        SELECT partition.{partition_column} AS {partition_column}, MAX(data.{column}.max) AS upper_bound
+        FROM {partitions_table}
+        GROUP BY partition.{partition_column}
+        """
+    else:
+        sql = f"SELECT MAX(data.{column}.max) AS upper_bound FROM {partitions_table}"
+
+    return get_query_cache().read_sql_query(sql=sql, database=database, tags=tags)
+
+
+def read_file_stats(
+    database: str, table_name: str, small_file_bytes: int, partition_column: str = None, tags: dict = None
+) -> pd.DataFrame:
+    """Function to read the number of data files, small data files and delete files of each partition of an Iceberg
+    table, from its "$files" metadata table (the files of the current snapshot), without scanning the data files.
+
+    The partition of a file is read from its path ({partition_column}=value directory), which is written the same way
+    for the data files and the delete files.
+
+    Args:
+        database (str): Database name.
+        table_name (str): Iceberg table name.
+        small_file_bytes (int): Data files under this size are counted as small files.
+        partition_column (str): Partition column, None for a table without partitions (a single partition).
+        tags (dict): Query tags (pipeline, table), recorded in the Athena report.
+
+    Returns:
+        pd.DataFrame: partition_value, data_files, small_files and delete_files columns, one row per partition.
+    """
+
+    partition_value = (
+        f"regexp_extract(file_path, '/{partition_column}=([^/]+)/', 1)" if partition_column else "CAST(NULL AS VARCHAR)"
+    )
+
+    return get_query_cache().read_sql_query(
+        sql=f"""
+        SELECT
+            {partition_value} AS partition_value,
+            COUNT_IF(content = 0) AS data_files,
+            COUNT_IF(content = 0 AND file_size_in_bytes < {small_file_bytes}) AS small_files,
+            COUNT_IF(content <> 0) AS delete_files
+        FROM "{database}"."{table_name}$files"
+        GROUP BY 1
+        """,
+        database=database,
+        tags=tags,
+    )
+
+
+def select_partitions_to_compact(
+    file_stats: pd.DataFrame, min_small_files: int, max_delete_file_ratio: float
+) -> pd.DataFrame:
+    """Function to select the partitions worth compacting: the partitions with at least min_small_files small data
+    files, or with more delete files by data file than max_delete_file_ratio. The most fragmented partitions (small
+    files and delete files) come first, so they are compacted first when the time budget runs out.
+
+    Args:
+        file_stats (pd.DataFrame): Number of files by partition, from read_file_stats.
+        min_small_files (int): Number of small data files from which a partition is compacted.
+        max_delete_file_ratio (float): Ratio of delete files to data files above which a partition is compacted.
+
+    Returns:
+        pd.DataFrame: Partitions to compact, with their delete_file_ratio, most fragmented first.
+    """
+
+    file_stats = file_stats.assign(
+        delete_file_ratio=file_stats["delete_files"] / file_stats["data_files"].clip(lower=1),
+        fragmented_files=file_stats["small_files"] + file_stats["delete_files"],
+    )
+
+    partitions_to_compact = file_stats[
+        (file_stats["small_files"] >= min_small_files) | (file_stats["delete_file_ratio"] > max_delete_file_ratio)
+    ]
+
+    return partitions_to_compact.sort_values("fragmented_files", ascending=False, kind="stable").reset_index(drop=True)
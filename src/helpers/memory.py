@@ -0,0 +1,299 @@
+import gc
+import math
+import os
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+from spectral_data_lib.log_manager import Logger
+
+# cgroup files exposing the memory used by the whole container (v2 and v1), this includes the
+# ethereum-etl subprocesses, which is what the ECS memory reservation is enforced against. The usage includes the
+# page cache, so the inactive file pages (reclaimed before the container runs out of memory) of the stat file are
+# subtracted from it: (usage file, stat file, inactive file pages field).
+CGROUP_MEMORY_FILES = [
+    ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+    ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+]
+
+# Approximate ratio between the size of a csv file on disk and the size of the dataframe in memory.
+CSV_TO_DATA_FRAME_MEMORY_RATIO = 3
+
+
+def get_memory_usage_mb() -> float:
+    """Function to get the current memory usage in megabytes.
+    The container memory usage (cgroup), without its inactive page cache, is used when available, otherwise the RSS
+    of the current process.
+
+    Args:
+        None
+
+    Returns:
+        float: Memory usage in megabytes.
+    """
+
+    for usage_file, stat_file, inactive_file_field in CGROUP_MEMORY_FILES:
+        if os.path.exists(usage_file):
+            try:
+                with open(usage_file, "r") as file:
+                    usage_bytes = int(file.read().strip())
+
+                with open(stat_file, "r") as file:
+                    stats = dict(line.split() for line in file if line.strip())
+
+                return max(usage_bytes - int(stats.get(inactive_file_field, 0)), 0) / 1024**2
+            except (OSError, ValueError):
+                continue
+
+    try:
+        with open("/proc/self/statm", "r") as file:
+            rss_pages = int(file.read().split()[1])
+        return rss_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak RSS, in kilobytes on linux
+
+
+def get_process_tree_memory_mb() -> float:
+    """Function to get the memory used by the current process and its descendants (e.g. the ethereum-etl
+    subprocesses), as the sum of their RSS read from /proc. Used when several pipeline processes share the container,
+    the container memory usage then being the one of every process.
+
+    Args:
+        None
+
+    Returns:
+        float: Memory usage in megabytes.
+    """
+
+    children_by_pid: Dict[int, list] = {}
+    rss_pages_by_pid: Dict[int, int] = {}
+
+    try:
+        pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return get_memory_usage_mb()
+
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as file:
+                stat = file.read()
+        except OSError:
+            continue  # the process ended in the meantime
+
+        # The fields after the command name (which can hold spaces) start with the state, then the parent pid, the
+        # RSS in pages being the 24th field of the line
+        fields = stat[stat.rindex(")") + 2 :].split()
+        children_by_pid.setdefault(int(fields[1]), []).append(pid)
+        rss_pages_by_pid[pid] = int(fields[21])
+
+    rss_pages = 0
+    pending_pids = [os.getpid()]
+
+    while pending_pids:
+        pid = pending_pids.pop()
+        rss_pages += rss_pages_by_pid.get(pid, 0)
+        pending_pids.extend(children_by_pid.get(pid, []))
+
+    return rss_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+class MemoryGovernor(object):
+    """Class to watch the memory usage of the pipeline and shrink the workload before reaching the memory budget."""
+
+    def __init__(
+        self,
+        memory_budget_mb: float,
+        soft_limit_ratio: float = 0.8,
+        sampling_interval: float = 0.5,
+        process_tree: bool = False,
+        logger_name: str = "Memory Governor Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            memory_budget_mb (float): Memory budget in megabytes, it should be lower than the container memory reservation.
+            soft_limit_ratio (float): Ratio of the budget from which the workload starts to be reduced.
+            sampling_interval (float): Interval in seconds between two memory samples inside a stage.
+            process_tree (bool): Measure the memory of the current process and its descendants instead of the
+                container, when the budget is a share of the container budget (e.g. a chunk of blocks).
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.memory_budget_mb = memory_budget_mb
+        self.soft_limit_mb = memory_budget_mb * soft_limit_ratio
+        self.sampling_interval = sampling_interval
+        self.process_tree = process_tree
+        self.peak_memory_by_stage: Dict[str, float] = {}
+        self.last_peak_memory_by_stage: Dict[str, float] = {}
+
+    def current_memory_mb(self) -> float:
+        """Function to get the current memory usage in megabytes.
+
+        Args:
+            None
+
+        Returns:
+            float: Memory usage in megabytes.
+        """
+
+        return get_process_tree_memory_mb() if self.process_tree else get_memory_usage_mb()
+
+    def is_under_pressure(self) -> bool:
+        """Function to check if the memory usage is above the soft limit.
+        A garbage collection is triggered before answering, to avoid reacting to memory that can be released.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if the memory usage is above the soft limit, False otherwise.
+        """
+
+        if self.current_memory_mb() < self.soft_limit_mb:
+            return False
+
+        gc.collect()
+
+        return self.current_memory_mb() >= self.soft_limit_mb
+
+    @contextmanager
+    def stage(self, stage_name: str) -> Iterator[None]:
+        """Context manager to track the peak memory usage of a pipeline stage.
+        The memory is sampled in a background thread, and the peak is logged when the stage ends.
+
+        Args:
+            stage_name (str): Stage name.
+
+        Returns:
+            Iterator[None]: Context manager.
+        """
+
+        peak_memory = [self.current_memory_mb()]
+        stop_sampling = threading.Event()
+
+        def sample_memory():
+            while not stop_sampling.wait(self.sampling_interval):
+                peak_memory[0] = max(peak_memory[0], self.current_memory_mb())
+
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+
+        try:
+            yield
+        finally:
+            stop_sampling.set()
+            sampler.join()
+            peak_memory[0] = max(peak_memory[0], self.current_memory_mb())
+
+            self.last_peak_memory_by_stage[stage_name] = peak_memory[0]
+            self.peak_memory_by_stage[stage_name] = max(self.peak_memory_by_stage.get(stage_name, 0), peak_memory[0])
+
+            self.logger.info(
+                f"Peak memory - Stage: {stage_name} - {peak_memory[0]:.0f} MB of {self.memory_budget_mb:.0f} MB budget"
+            )
+
+    def stage_reached_soft_limit(self, stage_name: str) -> bool:
+        """Function to check if the peak memory usage of the last execution of a stage reached the soft limit.
+
+        Args:
+            stage_name (str): Stage name.
+
+        Returns:
+            bool: True if the stage peak memory reached the soft limit, False otherwise.
+        """
+
+        return self.last_peak_memory_by_stage.get(stage_name, 0) >= self.soft_limit_mb
+
+    def adapt_batch_size(self, batch_size: int, min_batch_size: int = 1, stage_name: str = None) -> int:
+        """Function to shrink a batch size when the memory is under pressure.
+        The batch size is halved when the current usage (or the peak of the given stage) is above the soft limit.
+
+        Args:
+            batch_size (int): Current batch size.
+            min_batch_size (int): Minimum batch size.
+            stage_name (str): Stage name whose peak memory is also considered.
+
+        Returns:
+            int: New batch size.
+        """
+
+        if self.is_under_pressure() or (stage_name is not None and self.stage_reached_soft_limit(stage_name)):
+            new_batch_size = max(min_batch_size, batch_size // 2)
+
+            if new_batch_size < batch_size:
+                self.logger.warning(
+                    f"Memory usage is close to the budget - Shrinking batch size from {batch_size} to {new_batch_size}"
+                )
+
+            return new_batch_size
+
+        return batch_size
+
+    def rows_per_batch(self, file_path: str) -> Optional[int]:
+        """Function to estimate how many rows of a csv file can be loaded at once without exceeding the soft limit.
+
+        Args:
+            file_path (str): Path of the csv file.
+
+        Returns:
+            Optional[int]: Number of rows per batch, or None when the whole file fits in memory.
+        """
+
+        file_size_mb = os.path.getsize(file_path) / 1024**2
+        estimated_memory_mb = file_size_mb * CSV_TO_DATA_FRAME_MEMORY_RATIO
+        available_memory_mb = max(self.soft_limit_mb - self.current_memory_mb(), 0)
+
+        if estimated_memory_mb <= available_memory_mb:
+            return None
+
+        with open(file_path, "rb") as file:
+            number_of_rows = max(sum(1 for _ in file) - 1, 1)
+
+        number_of_batches = min(number_of_rows, math.ceil(estimated_memory_mb / max(available_memory_mb, 1e-6)))
+        rows_per_batch = math.ceil(number_of_rows / number_of_batches)
+
+        self.logger.warning(
+            f"Not enough memory to load {file_path} at once ({estimated_memory_mb:.0f} MB estimated, {available_memory_mb:.0f} MB available) - Loading it in batches of {rows_per_batch} rows"
+        )
+
+        return rows_per_batch
+
+    def read_csv_in_batches(self, file_path: str, dtype: dict = None, **kwargs) -> Iterator[pd.DataFrame]:
+        """Function to read a csv file in batches sized to fit the memory budget.
+        The dtypes are inferred by batch, so the columns whose inferred type depends on the rows read (e.g. nullable
+        columns) need an explicit dtype for every batch to get the same schema.
+
+        Args:
+            file_path (str): Path of the csv file.
+            dtype (dict): Dtype of the columns, passed to pandas.read_csv.
+            **kwargs: Keyword arguments passed to pandas.read_csv.
+
+        Returns:
+            Iterator[pd.DataFrame]: Iterator over the batches of the csv file.
+        """
+
+        rows_per_batch = self.rows_per_batch(file_path=file_path)
+
+        if rows_per_batch is None:
+            yield pd.read_csv(file_path, dtype=dtype, **kwargs)
+        else:
+            for batch in pd.read_csv(file_path, chunksize=rows_per_batch, dtype=dtype, **kwargs):
+                yield batch
+
+    def log_report(self) -> None:
+        """Function to log the peak memory usage of every stage.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        for stage_name, peak_memory in self.peak_memory_by_stage.items():
+            self.logger.info(f"Memory report - Stage: {stage_name} - Peak: {peak_memory:.0f} MB")
@@ -0,0 +1,267 @@
+import asyncio
+from typing import Dict, List
+
+import aiohttp
+from eth_abi import decode_abi, encode_abi
+from spectral_data_lib.log_manager import Logger
+from web3 import Web3
+
+# Multicall3 is deployed at the same address on every EVM chain (https://www.multicall3.com).
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+AGGREGATE3_SELECTOR = bytes.fromhex("82ad56cb")  # aggregate3((address,bool,bytes)[])
+
+TOKEN_METADATA_SELECTORS = {
+    "name": bytes.fromhex("06fdde03"),
+    "symbol": bytes.fromhex("95d89b41"),
+    "decimals": bytes.fromhex("313ce567"),
+    "total_supply": bytes.fromhex("18160ddd"),
+}
+
+
+def decode_string(return_data: bytes) -> str:
+    """Function to decode the result of name() or symbol(), either an ABI encoded string or a bytes32 (e.g. MKR).
+
+    Args:
+        return_data (bytes): Data returned by the call.
+
+    Returns:
+        str: Decoded string, or None when the data can not be decoded.
+    """
+
+    if len(return_data) == 32:
+        return return_data.rstrip(b"\x00").decode("utf-8", errors="ignore") or None
+
+    if len(return_data) >= 64:
+        try:
+            return decode_abi(["string"], return_data)[0]
+        except Exception:
+            return None
+
+    return None
+
+
+def decode_uint(return_data: bytes) -> int:
+    """Function to decode the result of decimals() or totalSupply().
+
+    Args:
+        return_data (bytes): Data returned by the call.
+
+    Returns:
+        int: Decoded integer, or None when the data can not be decoded.
+    """
+
+    return int.from_bytes(return_data[:32], "big") if len(return_data) >= 32 else None
+
+
+def encode_aggregate3(calls: List[tuple]) -> str:
+    """Function to encode the call data of an aggregate3 call, every call is allowed to fail.
+
+    Args:
+        calls (List[tuple]): List of (target address, call data) tuples.
+
+    Returns:
+        str: Hexadecimal call data.
+    """
+
+    data = encode_abi(["(address,bool,bytes)[]"], [[(target, True, call_data) for target, call_data in calls]])
+
+    return "0x" + (AGGREGATE3_SELECTOR + data).hex()
+
+
+def decode_aggregate3(return_data: str) -> List[tuple]:
+    """Function to decode the result of an aggregate3 call.
+
+    Args:
+        return_data (str): Hexadecimal data returned by the call.
+
+    Returns:
+        List[tuple]: List of (success, return data) tuples, in the same order as the calls.
+    """
+
+    return decode_abi(["(bool,bytes)[]"], bytes.fromhex(return_data[2:]))[0]
+
+
+class MulticallTokenReader(object):
+    """Class to read name, symbol, decimals and totalSupply of many tokens with Multicall3 aggregate3 calls.
+    Each token needs 4 calls, which are packed into a single eth_call for a whole batch of tokens, and the batches
+    are sent concurrently with asyncio.
+    """
+
+    def __init__(
+        self,
+        node_rpc_urls: List[str],
+        batch_size: int = 250,
+        concurrency: int = 16,
+        retries: int = 3,
+        max_backoff_seconds: int = 30,
+        logger_name: str = "Multicall Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            node_rpc_urls (List[str]): Node RPC urls, the next url is used when a call fails.
+            batch_size (int): Number of tokens by aggregate3 call.
+            concurrency (int): Maximum number of aggregate3 calls in flight.
+            retries (int): Number of retries of each aggregate3 call over the list of nodes.
+            max_backoff_seconds (int): Maximum wait between two rounds of retries over the list of nodes.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.node_rpc_urls = node_rpc_urls
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.max_backoff_seconds = max_backoff_seconds
+        self.number_of_calls = 0
+
+    async def aggregate(self, session: aiohttp.ClientSession, calls: List[tuple]) -> List[tuple]:
+        """Send a list of calls in a single aggregate3 eth_call, rotating over the nodes until one answers, with an
+        exponential backoff after each round over the list of nodes.
+
+        Args:
+            session (aiohttp.ClientSession): aiohttp session object.
+            calls (List[tuple]): List of (target address, call data) tuples.
+
+        Returns:
+            List[tuple]: List of (success, return data) tuples, in the same order as the calls, or None when the
+            aggregate3 call reverted (e.g. out of gas) and the calls have to be split.
+        """
+
+        payload = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "eth_call",
+            "params": [{"to": MULTICALL3_ADDRESS, "data": encode_aggregate3(calls)}, "latest"],
+        }
+
+        last_error = None
+
+        for attempt in range((self.retries + 1) * len(self.node_rpc_urls)):
+            retry_round, node_position = divmod(attempt, len(self.node_rpc_urls))
+            node_rpc_url = self.node_rpc_urls[node_position]
+
+            if retry_round and not node_position:
+                delay = min(2**retry_round, self.max_backoff_seconds)
+                self.logger.info(f"Every node failed the aggregate3 call, retrying in {delay} seconds - {last_error}")
+                await asyncio.sleep(delay)
+
+            self.number_of_calls += 1
+
+            try:
+                async with session.post(node_rpc_url, json=payload, timeout=60) as response:
+                    data = await response.json(content_type=None)
+
+                if "result" in data:
+                    return decode_aggregate3(data["result"])
+
+                last_error = data.get("error")
+
+                # A reverted aggregate3 fails on every node, the batch has to be split instead.
+                if "revert" in str(last_error).lower() or "gas" in str(last_error).lower():
+                    return None
+
+            except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+                last_error = e
+
+            self.logger.debug(f"Error on aggregate3 call with {len(calls)} calls - {last_error}")
+
+        raise Exception(f"Error on aggregate3 call with {len(calls)} calls: {last_error}")
+
+    async def read_batch(
+        self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, token_addresses: List[str]
+    ) -> Dict[str, list]:
+        """Read the metadata of a batch of tokens. When the aggregate3 call reverts, the batch is split in two until
+        each token is read on its own. Tokens of a batch that could not be sent to any node are flagged as not read
+        (is_read), so the caller does not mistake them for tokens without metadata.
+
+        Args:
+            session (aiohttp.ClientSession): aiohttp session object.
+            semaphore (asyncio.Semaphore): Semaphore limiting the number of calls in flight.
+            token_addresses (List[str]): Checksum token addresses.
+
+        Returns:
+            Dict[str, list]: Columns name, symbol, decimals, total_supply and is_read, in the same order as the
+            addresses.
+        """
+
+        columns = {field: [None] * len(token_addresses) for field in TOKEN_METADATA_SELECTORS}
+        columns["is_read"] = [False] * len(token_addresses)
+        pending_ranges = [(0, len(token_addresses))]
+
+        while pending_ranges:
+            start, end = pending_ranges.pop()
+
+            calls = [
+                (token_address, selector)
+                for token_address in token_addresses[start:end]
+                for selector in TOKEN_METADATA_SELECTORS.values()
+            ]
+
+            try:
+                async with semaphore:
+                    results = await self.aggregate(session, calls)
+            except Exception as e:
+                self.logger.error(f"Error to get token metadata for {end - start} tokens, left unread - {e}")
+                continue
+
+            if results is None:
+                if end - start > 1:
+                    middle = (start + end) // 2
+                    pending_ranges.extend([(start, middle), (middle, end)])
+                else:
+                    # The calls of the token revert on every node, the token has no readable metadata
+                    self.logger.info(f"Error to get token metadata for {token_addresses[start]} - call reverted")
+                    columns["is_read"][start] = True
+                continue
+
+            for position in range(start, end):
+                token_results = results[(position - start) * 4 : (position - start + 1) * 4]
+                (name_ok, name), (symbol_ok, symbol), (decimals_ok, decimals), (supply_ok, supply) = token_results
+
+                columns["name"][position] = decode_string(name) if name_ok else None
+                columns["symbol"][position] = decode_string(symbol) if symbol_ok else None
+                columns["decimals"][position] = decode_uint(decimals) if decimals_ok else None
+                columns["total_supply"][position] = decode_uint(supply) if supply_ok else None
+                columns["is_read"][position] = True
+
+        return columns
+
+    async def read(self, token_addresses: List[str]) -> Dict[str, list]:
+        """Read the metadata of a list of tokens, in concurrent batches of batch_size tokens.
+
+        Args:
+            token_addresses (List[str]): Token addresses.
+
+        Returns:
+            Dict[str, list]: Columns name, symbol, decimals, total_supply and is_read (False for the tokens that could
+            not be read from any node), in the same order as the addresses.
+        """
+
+        token_addresses = [Web3.toChecksumAddress(token_address) for token_address in token_addresses]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with aiohttp.ClientSession() as session:
+            batches_columns = await asyncio.gather(
+                *[
+                    self.read_batch(session, semaphore, token_addresses[start : start + self.batch_size])
+                    for start in range(0, len(token_addresses), self.batch_size)
+                ]
+            )
+
+        columns = {field: [] for field in [*TOKEN_METADATA_SELECTORS, "is_read"]}
+
+        for batch_columns in batches_columns:
+            for field, values in batch_columns.items():
+                columns[field].extend(values)
+
+        number_of_unread_tokens = len(token_addresses) - sum(columns["is_read"])
+
+        self.logger.info(
+            f"Token metadata read for {len(token_addresses) - number_of_unread_tokens} of {len(token_addresses)} "
+            f"tokens with {self.number_of_calls} eth_call"
+        )
+
+        return columns
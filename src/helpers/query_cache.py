@@ -0,0 +1,174 @@
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import pandas as pd
+from spectral_data_lib.log_manager import Logger
+
+from config import settings
+from src.helpers.execution_backend import get_execution_backend
+
+
+def normalize_sql(sql: str) -> str:
+    """Function to normalize a SQL query, so queries differing only by comments and whitespaces share a cache entry.
+
+    Args:
+        sql (str): SQL query.
+
+    Returns:
+        str: Normalized SQL query.
+    """
+
+    sql = re.sub(r"--[^\n]*", " ", sql)
+
+    return re.sub(r"\s+", " ", sql).strip().rstrip(";").strip()
+
+
+class QueryCache(object):
+    """Class to cache the results of idempotent metadata queries (watermarks, last partitions).
+    Results are memoized in the process for ttl_seconds, keyed by database and normalized SQL, and Athena is asked to
+    reuse the result of an identical query run in the last result_reuse_max_age_minutes.
+
+    Tables written by the process are tracked, and queries reading them bypass both caches for the rest of the
+    process, so a watermark read after a write is never stale.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 300,
+        result_reuse_max_age_minutes: int = 15,
+        logger_name: str = "Query Cache Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            ttl_seconds (int): Time to live of the results memoized in the process, 0 to disable the memo.
+            result_reuse_max_age_minutes (int): Maximum age of a result reused by Athena, 0 to disable the reuse.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.ttl_seconds = ttl_seconds
+        self.result_reuse_max_age_minutes = result_reuse_max_age_minutes
+        self.memo: Dict[Tuple[str, str], Tuple[float, pd.DataFrame, int]] = {}  # key -> (expires at, result, bytes)
+        self.scanned_bytes: Dict[Tuple[str, str], int] = {}  # key -> bytes scanned by the last run of the query
+        self.written_tables = set()
+        self.stats = {"lookups": 0, "memo_hits": 0, "reuse_hits": 0, "bytes_saved": 0}
+        self.lock = threading.RLock()  # the tables of a layer can run in threads of the same process
+
+    def reads_written_table(self, normalized_sql: str) -> bool:
+        """Check if a query reads a table written by the process.
+
+        Args:
+            normalized_sql (str): Normalized SQL query.
+
+        Returns:
+            bool: True if the query reads a written table
+        """
+
+        with self.lock:
+            return any(re.search(rf"\b{re.escape(table)}\b", normalized_sql) for table in self.written_tables)
+
+    def invalidate(self, table_name: str) -> None:
+        """Mark a table as written, dropping the memoized results of the queries reading it.
+
+        Args:
+            table_name (str): Table name.
+
+        Returns:
+            None
+        """
+
+        with self.lock:
+            self.written_tables.add(table_name)
+            self.memo = {key: value for key, value in self.memo.items() if not self.reads_written_table(key[1])}
+
+    def read_sql_query(self, sql: str, database: str, tags: dict = None) -> pd.DataFrame:
+        """Read the results of a query from the memo, or run it in Athena with result reuse.
+
+        Args:
+            sql (str): SQL query.
+            database (str): Athena database name.
+            tags (dict): Query tags (pipeline, table), recorded in the Athena report.
+
+        Returns:
+            pd.DataFrame: Query results.
+        """
+
+        key = (database, normalize_sql(sql))
+
+        with self.lock:
+            reads_written_table = self.reads_written_table(key[1])
+            self.stats["lookups"] += 1
+
+            memo_entry = self.memo.get(key)
+
+            if not reads_written_table and memo_entry is not None and memo_entry[0] > time.monotonic():
+                _, data_frame, scanned_bytes = memo_entry
+                self.stats["memo_hits"] += 1
+                self.stats["bytes_saved"] += scanned_bytes
+                return data_frame.copy()
+
+        execution_backend = get_execution_backend()
+        query_execution = execution_backend.run_query(
+            sql=sql,
+            database=database,
+            tags=tags,
+            result_reuse_max_age_minutes=0 if reads_written_table else self.result_reuse_max_age_minutes,
+        )
+        data_frame = execution_backend.get_query_results(query_execution)
+
+        statistics = query_execution.get("Statistics", {})
+        scanned_bytes = statistics.get("DataScannedInBytes", 0)
+
+        with self.lock:
+            if statistics.get("ResultReuseInformation", {}).get("ReusedPreviousResult", False):
+                scanned_bytes = self.scanned_bytes.get(key, 0)
+                self.stats["reuse_hits"] += 1
+                self.stats["bytes_saved"] += scanned_bytes
+            else:
+                self.scanned_bytes[key] = scanned_bytes
+
+            # a table written by another thread while the query ran invalidates its result
+            if self.ttl_seconds and not self.reads_written_table(key[1]):
+                self.memo[key] = (time.monotonic() + self.ttl_seconds, data_frame.copy(), scanned_bytes)
+
+        return data_frame
+
+    def log_report(self) -> None:
+        """Log the cache hits and the bytes not scanned thanks to them.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        if self.stats["lookups"]:
+            self.logger.info(
+                f"Query cache - {self.stats['lookups']} lookups - {self.stats['memo_hits']} memo hits - "
+                f"{self.stats['reuse_hits']} Athena reuse hits - "
+                f"{self.stats['bytes_saved'] / 1024 ** 2:.1f} MB not scanned (known sizes only)"
+            )
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryCache:
+    """Function to get the query cache of the process.
+
+    Args:
+        None
+
+    Returns:
+        QueryCache: Query cache.
+    """
+
+    return QueryCache(
+        ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+        result_reuse_max_age_minutes=settings.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES,
+    )
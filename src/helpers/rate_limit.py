@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket used to limit the rate of requests sent to an API."""
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        """Constructor for the class
+
+        Args:
+            rate (float): Number of tokens added to the bucket per second (requests per second).
+            capacity (float): Maximum number of tokens in the bucket (burst size). Defaults to the rate.
+
+        Returns:
+            None
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accumulated since the last refill, without exceeding the capacity.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Try to take tokens from the bucket without blocking.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds to wait before they are available.
+        """
+
+        with self.lock:
+            self._refill()
+
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Take tokens from the bucket, blocking until they are available.
+
+        Args:
+            tokens (float): Number of tokens to take.
+
+        Returns:
+            None
+        """
+
+        while True:
+            wait_time = self.try_acquire(tokens=tokens)
+
+            if wait_time == 0:
+                return
+
+            time.sleep(wait_time)
+
+
+class KeyScheduler(object):
+    """Asyncio scheduler spreading requests over several API keys, each key with its own token bucket.
+    Every request is given to the first key with capacity, so the throughput grows with the number of keys.
+    """
+
+    def __init__(self, api_keys: List[str], rate: float, capacity: float = None) -> None:
+        """Constructor for the class
+
+        Args:
+            api_keys (List[str]): API keys.
+            rate (float): Number of requests allowed per second for each key.
+            capacity (float): Burst size of each key. Defaults to the rate.
+
+        Returns:
+            None
+        """
+        self.api_keys = list(api_keys)
+        self.buckets: Dict[str, TokenBucket] = {key: TokenBucket(rate=rate, capacity=capacity) for key in self.api_keys}
+        self.cooldown_until: Dict[str, float] = {key: 0 for key in self.api_keys}
+        self.requests_by_key: Dict[str, int] = {key: 0 for key in self.api_keys}
+        self.next_key_index = 0
+
+    def try_acquire(self) -> tuple:
+        """Try to take a token from any key without blocking, starting after the last key used.
+
+        Args:
+            None
+
+        Returns:
+            tuple: (key, 0) if a key has capacity, otherwise (None, seconds to wait for the first key available).
+        """
+
+        now = time.monotonic()
+        min_wait_time = None
+
+        for offset in range(len(self.api_keys)):
+            key_index = (self.next_key_index + offset) % len(self.api_keys)
+            key = self.api_keys[key_index]
+
+            wait_time = self.cooldown_until[key] - now
+            if wait_time <= 0:
+                wait_time = self.buckets[key].try_acquire()
+
+            if wait_time == 0:
+                self.next_key_index = (key_index + 1) % len(self.api_keys)
+                self.requests_by_key[key] += 1
+                return key, 0
+
+            min_wait_time = wait_time if min_wait_time is None else min(min_wait_time, wait_time)
+
+        return None, min_wait_time
+
+    async def acquire(self) -> str:
+        """Take a token from the first key with capacity, waiting until one is available.
+
+        Args:
+            None
+
+        Returns:
+            str: API key to use for the request.
+        """
+
+        while True:
+            key, wait_time = self.try_acquire()
+
+            if key is not None:
+                return key
+
+            await asyncio.sleep(wait_time)
+
+    def cooldown(self, key: str, seconds: float) -> None:
+        """Stop handing out a key for a while, used when the API reports the key is over its rate limit.
+
+        Args:
+            key (str): API key.
+            seconds (float): Cooldown in seconds.
+
+        Returns:
+            None
+        """
+
+        self.cooldown_until[key] = time.monotonic() + seconds
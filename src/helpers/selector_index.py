@@ -0,0 +1,131 @@
+from typing import Dict, List
+
+import numpy as np
+from spectral_data_lib.config import settings as sdl_settings
+from spectral_data_lib.data_lakehouse import DataLakehouse
+from spectral_data_lib.log_manager import Logger
+
+from src.helpers.token_classifier import get_selectors
+
+
+class SelectorIndex(object):
+    """Class to query the inverted index from 4-byte selector to contract addresses (stage ethereum_selector_index).
+    Each selector is sharded by hash_partition into sorted arrays of addresses, so finding the contracts exposing a
+    set of functions is a merge of a few sorted arrays instead of a scan of the contracts bytecode.
+    """
+
+    def __init__(self, database_name: str = None, table_name: str = "ethereum_selector_index") -> None:
+        """Constructor for the class
+
+        Args:
+            database_name (str): Database of the index. Defaults to the stage database.
+            table_name (str): Table of the index.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name="Selector Index Logger")
+        self.database_name = database_name or sdl_settings.DATA_LAKE_STAGE_DATABASE
+        self.table_name = table_name
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}  # selector -> hash_partition -> sorted addresses
+        self.data_lakehouse_connection = DataLakehouse()
+
+    @staticmethod
+    def to_selectors(functions: List[str]) -> List[str]:
+        """Function to convert function signatures into selectors, selectors are kept as they are.
+
+        Args:
+            functions (List[str]): Function signatures (e.g. "mint(address,uint256)") or selectors (e.g. "0x40c10f19").
+
+        Returns:
+            List[str]: Selectors.
+        """
+
+        return [
+            function.lower() if function.startswith("0x") and len(function) == 10 else get_selectors([function])[0]
+            for function in functions
+        ]
+
+    def load(self, selectors: List[str]) -> None:
+        """Load the postings of the selectors that are not loaded yet.
+
+        Args:
+            selectors (List[str]): Selectors.
+
+        Returns:
+            None
+        """
+
+        missing_selectors = [selector for selector in selectors if selector not in self.postings]
+
+        if not missing_selectors:
+            return
+
+        selectors_filter = ", ".join(f"'{selector}'" for selector in missing_selectors)
+
+        query = f"""
+            SELECT selector, hash_partition, addresses
+            FROM {self.database_name}.{self.table_name}
+            WHERE selector IN ({selectors_filter})
+        """
+
+        postings = self.data_lakehouse_connection.read_sql_query(query=query, database_name=self.database_name)
+
+        for selector in missing_selectors:
+            self.postings[selector] = {}
+
+        for selector, hash_partition, addresses in zip(
+            postings["selector"], postings["hash_partition"], postings["addresses"]
+        ):
+            self.postings[selector][hash_partition] = np.asarray(addresses, dtype=object)
+
+        self.logger.info(f"Selector index loaded - {len(missing_selectors)} selectors - {postings.shape[0]} shards")
+
+    def refresh(self) -> None:
+        """Drop the loaded postings, so the next lookups read the index again once the stage pipeline rebuilt it.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        self.postings = {}
+        self.logger.info("Selector index postings dropped, they are read again on the next lookup")
+
+    def find_contracts(self, functions: List[str], match_all: bool = True) -> np.ndarray:
+        """Find the contracts exposing all (or any) of the functions.
+
+        Args:
+            functions (List[str]): Function signatures or selectors.
+            match_all (bool): Return the contracts exposing all the functions, otherwise any of them.
+
+        Returns:
+            np.ndarray: Sorted array of contract addresses.
+        """
+
+        selectors = self.to_selectors(functions)
+        self.load(selectors)
+
+        postings_by_selector = [self.postings[selector] for selector in selectors]
+        hash_partitions = set().union(*[postings.keys() for postings in postings_by_selector])
+
+        contracts = []
+
+        for hash_partition in sorted(hash_partitions):
+            shards = [postings.get(hash_partition) for postings in postings_by_selector]
+
+            if match_all:
+                if any(shard is None for shard in shards):
+                    continue
+                shard_contracts = shards[0]
+                for shard in shards[1:]:
+                    shard_contracts = np.intersect1d(shard_contracts, shard, assume_unique=True)
+            else:
+                shard_contracts = np.unique(np.concatenate([shard for shard in shards if shard is not None]))
+
+            contracts.append(shard_contracts)
+
+        # Shards hold disjoint address prefixes and are visited in order, so the concatenation is sorted.
+        return np.concatenate(contracts) if contracts else np.array([], dtype=object)
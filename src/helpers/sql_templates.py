@@ -0,0 +1,278 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from src.helpers.files import read_sql_file
+
+SQL_TEMPLATES_ROOT_DIR = "src/pipelines"
+INCREMENTAL_LOAD_MARKER = "-- incremental load"
+
+# Placeholders are written {{name}} or {{name:type}}, the type defaults to the one declared here.
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([a-z_]+)(?::([a-z]+))?\s*\}\}")
+DEFAULT_PLACEHOLDER_TYPES = {
+    "filter_value": "number",
+    "last_inserted_timestamp": "number",
+    "chunk": "tuple",
+    "source_database": "identifier",
+    "target_database": "identifier",
+    "table_name": "identifier",
+    "layer": "identifier",
+    "data_source": "identifier",
+    "bucket_name": "path",
+    "min_date_partition": "string",
+}
+# Types whose values can be sent as parameters of a prepared statement (each item of a tuple is a parameter), the
+# identifiers and paths are part of the statement.
+PREPARED_PARAMETER_TYPES = {"number", "timestamp", "string", "tuple"}
+
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+PATH_PATTERN = re.compile(r"^[A-Za-z0-9_.:/\-]+$")
+NUMBER_PATTERN = re.compile(r"^-?\d+(\.\d+)?$")
+TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2}(\.\d+)?)?([+-]\d{2}:\d{2})?$")
+TUPLE_ITEM_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+def render_value(name: str, placeholder_type: str, value) -> str:
+    """Function to validate a parameter and render it as a SQL literal (or identifier).
+
+    Args:
+        name (str): Placeholder name.
+        placeholder_type (str): Placeholder type (identifier, path, number, timestamp, string or tuple).
+        value: Parameter value.
+
+    Returns:
+        str: Rendered value.
+    """
+
+    if placeholder_type == "tuple":
+        items = [str(item) for item in value] if isinstance(value, (list, tuple)) or hasattr(value, "tolist") else None
+
+        if not items or not all(TUPLE_ITEM_PATTERN.match(item) for item in items):
+            raise Exception(f"Invalid value for the placeholder {name} ({placeholder_type}): {value}")
+
+        return "(" + ", ".join(f"'{item}'" for item in items) + ")"
+
+    value = str(value)
+
+    patterns = {
+        "identifier": IDENTIFIER_PATTERN,
+        "path": PATH_PATTERN,
+        "number": NUMBER_PATTERN,
+        "timestamp": TIMESTAMP_PATTERN,
+        "string": re.compile(r"^[^']*$"),
+    }
+
+    if placeholder_type not in patterns:
+        raise Exception(f"Unknown type for the placeholder {name}: {placeholder_type}")
+
+    if not patterns[placeholder_type].match(value):
+        raise Exception(f"Invalid value for the placeholder {name} ({placeholder_type}): {value}")
+
+    if placeholder_type == "timestamp":
+        return f"timestamp '{value}'"
+    elif placeholder_type == "string":
+        return f"'{value}'"
+
+    return value
+
+
+class SqlTemplate(object):
+    """Class to hold a SQL file compiled into sections of literal text and typed placeholders.
+    Files with a "-- incremental load" marker have a full_load and an incremental_load section, the other files
+    have a single query section.
+    """
+
+    def __init__(self, name: str, sql: str) -> None:
+        """Constructor for the class
+
+        Args:
+            name (str): Template name (path of the SQL file).
+            sql (str): SQL text with placeholders.
+
+        Returns:
+            None
+        """
+        self.name = name
+
+        if INCREMENTAL_LOAD_MARKER in sql:
+            full_load, incremental_load = sql.split(INCREMENTAL_LOAD_MARKER, 1)
+            sections = {"full_load": full_load, "incremental_load": incremental_load}
+        else:
+            sections = {"query": sql}
+
+        self.sections = {section: self.compile(section_sql) for section, section_sql in sections.items()}
+
+    def compile(self, sql: str) -> List:
+        """Compile a SQL text into a list of literal strings and (name, type) placeholders.
+
+        Args:
+            sql (str): SQL text with placeholders.
+
+        Returns:
+            List: Compiled segments.
+        """
+
+        segments = []
+        position = 0
+
+        for match in PLACEHOLDER_PATTERN.finditer(sql):
+            name, placeholder_type = match.group(1), match.group(2) or DEFAULT_PLACEHOLDER_TYPES.get(match.group(1))
+
+            if placeholder_type is None:
+                raise Exception(f"Placeholder {name} without type in the SQL template {self.name}")
+
+            segments.extend([sql[position : match.start()], (name, placeholder_type)])
+            position = match.end()
+
+        segments.append(sql[position:])
+
+        return segments
+
+    @property
+    def placeholders(self) -> Dict[str, set]:
+        """Placeholders names of each section."""
+
+        return {
+            section: {segment[0] for segment in segments if isinstance(segment, tuple)}
+            for section, segments in self.sections.items()
+        }
+
+    def get_segments(self, section: str, params: dict) -> List:
+        """Get the segments of a section, checking that every placeholder has a parameter.
+
+        Args:
+            section (str): Section name.
+            params (dict): Parameters.
+
+        Returns:
+            List: Compiled segments of the section.
+        """
+
+        if section not in self.sections:
+            raise Exception(f"Section {section} not found in the SQL template {self.name}")
+
+        missing_params = self.placeholders[section] - set(params)
+
+        if missing_params:
+            raise Exception(f"Missing parameters for the SQL template {self.name} ({section}): {missing_params}")
+
+        return self.sections[section]
+
+    def render(self, section: str = "query", **params) -> str:
+        """Render a section with validated parameters, parameters not used by the section are ignored.
+
+        Args:
+            section (str): Section name (query, full_load or incremental_load).
+            **params: Parameters.
+
+        Returns:
+            str: SQL query.
+        """
+
+        return "".join(
+            render_value(segment[0], segment[1], params[segment[0]]) if isinstance(segment, tuple) else segment
+            for segment in self.get_segments(section, params)
+        )
+
+    def render_prepared(self, section: str = "query", **params) -> Tuple[str, str, List[str]]:
+        """Render a section as a prepared statement: values become ? markers (one by item for tuples), identifiers
+        and paths are part of the statement. The statement only changes with the SQL file, the identifiers (e.g. the
+        table) and the number of items of the tuples, so the same statement is executed with every chunk and filter.
+
+        Args:
+            section (str): Section name (query, full_load or incremental_load).
+            **params: Parameters.
+
+        Returns:
+            Tuple[str, str, List[str]]: Statement name, statement and rendered values of its parameters.
+        """
+
+        statement_parts = []
+        values = []
+
+        for segment in self.get_segments(section, params):
+            if not isinstance(segment, tuple):
+                statement_parts.append(segment)
+            elif segment[1] == "tuple":
+                render_value(segment[0], segment[1], params[segment[0]])  # the tuple is validated as a whole
+                items = [render_value(segment[0], "string", item) for item in params[segment[0]]]
+                statement_parts.append("(" + ", ".join("?" for _ in items) + ")")
+                values.extend(items)
+            elif segment[1] in PREPARED_PARAMETER_TYPES:
+                statement_parts.append("?")
+                values.append(render_value(segment[0], segment[1], params[segment[0]]))
+            else:
+                statement_parts.append(render_value(segment[0], segment[1], params[segment[0]]))
+
+        statement = "".join(statement_parts).strip().rstrip(";")
+
+        # The statement name changes with the statement (it holds no values), so an edited SQL file is prepared again.
+        template_name = re.sub(r"[^A-Za-z0-9_]", "_", os.path.splitext(os.path.basename(self.name))[0])
+        statement_name = f"{template_name}_{section}_{hashlib.sha1(statement.encode()).hexdigest()[:10]}"
+
+        return statement_name, statement, values
+
+
+class SqlTemplateRegistry(object):
+    """Class to load and compile every SQL file of the pipelines once."""
+
+    def __init__(self, root_dir: str = SQL_TEMPLATES_ROOT_DIR) -> None:
+        """Constructor for the class
+
+        Args:
+            root_dir (str): Directory searched for SQL files.
+
+        Returns:
+            None
+        """
+        self.templates: Dict[str, SqlTemplate] = {}
+
+        for directory, _, file_names in os.walk(root_dir):
+            for file_name in sorted(file_names):
+                if file_name.endswith(".sql"):
+                    file_path = os.path.normpath(os.path.join(directory, file_name))
+                    self.templates[file_path] = SqlTemplate(name=file_path, sql=read_sql_file(file_path=file_path))
+
+    def get(self, file_path: str) -> SqlTemplate:
+        """Get the compiled template of a SQL file.
+
+        Args:
+            file_path (str): Path of the SQL file.
+
+        Returns:
+            SqlTemplate: Compiled template.
+        """
+
+        try:
+            return self.templates[os.path.normpath(file_path)]
+        except KeyError:
+            raise Exception(f"SQL template not found: {file_path}")
+
+
+@lru_cache(maxsize=1)
+def get_sql_template_registry() -> SqlTemplateRegistry:
+    """Function to get the registry of SQL templates, loaded on the first call.
+
+    Args:
+        None
+
+    Returns:
+        SqlTemplateRegistry: Registry of SQL templates.
+    """
+
+    return SqlTemplateRegistry()
+
+
+def get_sql_template(file_path: str) -> SqlTemplate:
+    """Function to get the compiled template of a SQL file.
+
+    Args:
+        file_path (str): Path of the SQL file.
+
+    Returns:
+        SqlTemplate: Compiled template.
+    """
+
+    return get_sql_template_registry().get(file_path)
@@ -0,0 +1,201 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+
+from spectral_data_lib.log_manager import Logger
+
+from config import settings
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.query_cache import get_query_cache
+from src.helpers.watermark_store import get_watermark_store
+
+
+def get_upstream_tables(dependencies: Dict[str, List[str]], table_name: str) -> set:
+    """Function to get every table a table depends on, directly or not.
+
+    Args:
+        dependencies (Dict[str, List[str]]): Tables each table depends on.
+        table_name (str): Table name.
+
+    Returns:
+        set: Upstream tables.
+    """
+
+    upstream_tables = set()
+    tables_to_visit = list(dependencies.get(table_name, []))
+
+    while tables_to_visit:
+        upstream_table = tables_to_visit.pop()
+
+        if upstream_table not in upstream_tables:
+            upstream_tables.add(upstream_table)
+            tables_to_visit.extend(dependencies.get(upstream_table, []))
+
+    return upstream_tables
+
+
+class TableScheduler(object):
+    """Class to run the pipelines of several tables of a layer from a single process.
+    Each table runs in a thread as soon as the tables it depends on succeeded, up to max_concurrent_tables at a time,
+    so the queries of independent tables are in flight together. The tables depending on a failed table are skipped,
+    the other ones still run, and the run fails at the end when a table did not succeed.
+    """
+
+    def __init__(
+        self,
+        dependencies: Dict[str, List[str]],
+        max_concurrent_tables: int = 8,
+        logger_name: str = "Table Scheduler Logger",
+    ) -> None:
+        """Constructor for the class
+
+        Args:
+            dependencies (Dict[str, List[str]]): Tables to run, with the tables each one depends on.
+            max_concurrent_tables (int): Maximum number of tables running at the same time.
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+        self.dependencies = dependencies
+        self.max_concurrent_tables = max(1, max_concurrent_tables)
+        self.table_stats: Dict[str, dict] = {}
+
+        for table_name, upstream_tables in dependencies.items():
+            unknown_tables = set(upstream_tables) - set(dependencies)
+
+            if unknown_tables:
+                raise Exception(f"Table {table_name} depends on tables not scheduled: {sorted(unknown_tables)}")
+
+            if table_name in get_upstream_tables(dependencies, table_name):
+                raise Exception(f"Table {table_name} depends on itself")
+
+    def run_table(self, run_table: Callable[[str], None], table_name: str) -> None:
+        """Run the pipeline of a table, recording its timings.
+
+        Args:
+            run_table (Callable[[str], None]): Function running the pipeline of a table.
+            table_name (str): Table name.
+
+        Returns:
+            None
+        """
+
+        started_at = time.monotonic()
+        self.table_stats[table_name].update(status="running", started_at=started_at)
+
+        try:
+            run_table(table_name)
+        except Exception as e:
+            self.table_stats[table_name].update(status="failed", seconds=time.monotonic() - started_at, error=str(e))
+            raise
+
+        self.table_stats[table_name].update(status="succeeded", seconds=time.monotonic() - started_at)
+
+    def run(self, run_table: Callable[[str], None]) -> Dict[str, dict]:
+        """Run the pipelines of every table, in the order of their dependencies.
+
+        Args:
+            run_table (Callable[[str], None]): Function running the pipeline of a table.
+
+        Returns:
+            Dict[str, dict]: Status and timings by table.
+        """
+
+        self.table_stats = {table_name: {"status": "pending"} for table_name in self.dependencies}
+        scheduler_started_at = time.monotonic()
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_tables) as executor:
+
+            while True:
+
+                for table_name, upstream_tables in self.dependencies.items():
+                    if self.table_stats[table_name]["status"] != "pending":
+                        continue
+
+                    upstream_status = {self.table_stats[upstream_table]["status"] for upstream_table in upstream_tables}
+
+                    if upstream_status & {"failed", "skipped"}:
+                        self.logger.info(f"Table {table_name} skipped - A table it depends on did not succeed.")
+                        self.table_stats[table_name]["status"] = "skipped"
+                    elif upstream_status <= {"succeeded"}:
+                        self.table_stats[table_name]["status"] = "submitted"
+                        futures[executor.submit(self.run_table, run_table, table_name)] = table_name
+
+                if not futures:
+                    if any(stats["status"] == "pending" for stats in self.table_stats.values()):
+                        continue  # tables skipped in this pass unblock the tables depending on them
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    table_name = futures.pop(future)
+
+                    if future.exception() is not None:
+                        self.logger.error(f"Table {table_name} failed: {future.exception()}")
+                    else:
+                        seconds = self.table_stats[table_name]["seconds"]
+                        self.logger.info(f"Table {table_name} succeeded in {seconds:.1f}s")
+
+        for stats in self.table_stats.values():
+            if "started_at" in stats:
+                stats["started_after_seconds"] = stats.pop("started_at") - scheduler_started_at
+
+        self.log_report(total_seconds=time.monotonic() - scheduler_started_at)
+
+        failed_tables = [table for table, stats in self.table_stats.items() if stats["status"] != "succeeded"]
+
+        if failed_tables:
+            raise Exception(f"Tables not loaded: {failed_tables}")
+
+        return self.table_stats
+
+    def log_report(self, total_seconds: float) -> None:
+        """Log the status and timings of every table.
+
+        Args:
+            total_seconds (float): Duration of the whole run, in seconds.
+
+        Returns:
+            None
+        """
+
+        self.logger.info(f"Table scheduler - {len(self.table_stats)} tables in {total_seconds:.1f}s")
+
+        table_stats = sorted(self.table_stats.items(), key=lambda item: item[1].get("started_after_seconds", 0))
+
+        for table_name, stats in table_stats:
+            if "seconds" in stats:
+                self.logger.info(
+                    f"Table {table_name} - {stats['status']} - started after {stats['started_after_seconds']:.1f}s - "
+                    f"ran {stats['seconds']:.1f}s"
+                )
+            else:
+                self.logger.info(f"Table {table_name} - {stats['status']}")
+
+
+def get_table_scheduler(dependencies: Dict[str, List[str]]) -> TableScheduler:
+    """Function to get a scheduler for the tables of a layer. Tables run one at a time with the DuckDB backend, which
+    already uses every core for each query.
+
+    The helpers shared by the tables (execution backend, watermark store, query cache) are created before the threads
+    start, so every table uses the same instances.
+
+    Args:
+        dependencies (Dict[str, List[str]]): Tables to run, with the tables each one depends on.
+
+    Returns:
+        TableScheduler: Table scheduler.
+    """
+
+    get_execution_backend()
+    get_watermark_store()
+    get_query_cache()
+
+    return TableScheduler(
+        dependencies=dependencies,
+        max_concurrent_tables=1 if settings.EXECUTION_BACKEND == "duckdb" else settings.MAX_CONCURRENT_TABLES,
+    )
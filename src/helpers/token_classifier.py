@@ -0,0 +1,107 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+from web3 import Web3
+
+
+def get_selectors(signatures: List[str]) -> List[str]:
+    """Function to get the 4-byte selectors of a list of function signatures.
+
+    Args:
+        signatures (List[str]): Function signatures, e.g. "balanceOf(address)".
+
+    Returns:
+        List[str]: Selectors in hexadecimal, e.g. "0x70a08231".
+    """
+
+    return ["0x" + bytes(Web3.keccak(text=signature)[:4]).hex() for signature in signatures]
+
+
+ERC20_SELECTORS = get_selectors(["balanceOf(address)", "totalSupply()"])
+ERC721_ONLY_SELECTORS = get_selectors(["ownerOf(uint256)"])
+ERC721_SELECTORS = get_selectors(
+    [
+        "setApprovalForAll(address,bool)",
+        "safeTransferFrom(address,address,uint256)",
+        "safeTransferFrom(address,address,uint256,bytes)",
+        "tokenURI(uint256)",
+    ]
+)
+DESTROY_SELECTORS = get_selectors(
+    ["destroy()", "destroy(address)", "selfDestruct()", "selfDestruct(address)", "destroyAndSend(address)"]
+)
+# Proxies forward the calls to an implementation, their own selectors do not describe the token.
+PROXY_SELECTORS = get_selectors(["implementation()", "upgradeTo(address)", "upgradeToAndCall(address,bytes)"])
+
+
+def parse_function_sighashes(function_sighashes: pd.Series) -> pd.Series:
+    """Function to normalize the function_sighashes column into lists of lowercase selectors.
+    Arrays read from the stage layer are kept, comma separated strings (raw layer, csv files) are split.
+
+    Args:
+        function_sighashes (pd.Series): Function selectors of each contract.
+
+    Returns:
+        pd.Series: List of selectors of each contract.
+    """
+
+    def parse(value) -> list:
+        if isinstance(value, str):
+            value = value.split(",")
+        elif value is None or (isinstance(value, float) and np.isnan(value)):
+            value = []
+
+        return [selector.strip().lower() for selector in value if selector and selector.strip()]
+
+    return function_sighashes.map(parse)
+
+
+def classify_token_selectors(function_sighashes: pd.Series) -> pd.DataFrame:
+    """Function to classify contracts as ERC20 or ERC721, and destroyable or not, from their function selectors.
+    The same rules as the ABI based check are used: ERC20 has balanceOf and totalSupply but not ownerOf, ERC721 has
+    setApprovalForAll, safeTransferFrom and tokenURI.
+
+    A contract is ambiguous when its selectors are not enough to decide: no selectors, proxies, or only part of the
+    ERC20/ERC721 selectors. Ambiguous contracts should go through the ABI based check.
+
+    Args:
+        function_sighashes (pd.Series): Function selectors of each contract (arrays or comma separated strings).
+
+    Returns:
+        pd.DataFrame: Columns type (ERC20, ERC721 or Unknown), is_destroyable and is_ambiguous, with the same index.
+    """
+
+    selectors = parse_function_sighashes(function_sighashes).reset_index(drop=True)
+    exploded = selectors.explode()
+
+    def has_any(selectors_to_find: List[str]) -> np.ndarray:
+        has_selector = exploded.isin(selectors_to_find).groupby(level=0).any()
+        return has_selector.reindex(selectors.index, fill_value=False).to_numpy()
+
+    has_balance_of, has_total_supply = (has_any([selector]) for selector in ERC20_SELECTORS)
+    has_owner_of = has_any(ERC721_ONLY_SELECTORS)
+    has_set_approval_for_all = has_any(ERC721_SELECTORS[0:1])
+    has_safe_transfer_from = has_any(ERC721_SELECTORS[1:3])
+    has_token_uri = has_any(ERC721_SELECTORS[3:4])
+
+    is_erc20 = has_balance_of & has_total_supply & ~has_owner_of
+    is_erc721 = has_set_approval_for_all & has_safe_transfer_from & has_token_uri
+    is_partial_erc20 = (has_balance_of | has_total_supply) & ~is_erc20
+    is_partial_erc721 = (has_set_approval_for_all | has_safe_transfer_from | has_token_uri) & ~is_erc721
+
+    is_ambiguous = (
+        (selectors.map(len).to_numpy() == 0)
+        | has_any(PROXY_SELECTORS)
+        | (is_partial_erc20 & ~is_erc721)
+        | (is_partial_erc721 & ~is_erc20)
+    )
+
+    return pd.DataFrame(
+        {
+            "type": np.select([is_erc20, is_erc721], ["ERC20", "ERC721"], default="Unknown"),
+            "is_destroyable": has_any(DESTROY_SELECTORS) & (is_erc20 | is_erc721),
+            "is_ambiguous": is_ambiguous,
+        },
+        index=function_sighashes.index,
+    )
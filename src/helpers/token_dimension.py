@@ -0,0 +1,138 @@
+import os
+from typing import List
+
+import awswrangler as wr
+import pandas as pd
+from spectral_data_lib.log_manager import Logger
+
+TOKEN_DIMENSION_COLUMNS = ["contract_address", "name", "decimals", "symbol", "standard", "status", "last_refreshed"]
+
+
+class TokenDimension(object):
+    """Class to manage a compact, deduplicated token dimension (contract address -> name, decimals, symbol, standard,
+    status).
+    The dimension is kept as a local parquet file, mirrored to S3 so it survives between container runs,
+    and is updated with incremental upserts keeping the most recently refreshed row of each contract.
+    """
+
+    def __init__(self, local_path: str, s3_path: str = None) -> None:
+        """Constructor for the class
+
+        Args:
+            local_path (str): Path of the local parquet file.
+            s3_path (str): S3 path of the parquet file mirrored from the local one.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name="Token Dimension Logger")
+        self.local_path = local_path
+        self.s3_path = s3_path
+        self.data = None
+
+    def load(self) -> pd.DataFrame:
+        """Load the token dimension, downloading it from S3 when there is no local copy.
+
+        Args:
+            None
+
+        Returns:
+            pd.DataFrame: Token dimension indexed by contract address.
+        """
+
+        if self.data is not None:
+            return self.data
+
+        if not os.path.exists(self.local_path) and self.s3_path and wr.s3.does_object_exist(self.s3_path):
+            os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+            wr.s3.download(path=self.s3_path, local_file=self.local_path)
+
+        if os.path.exists(self.local_path):
+            # Files saved before the name and status columns were kept get them empty
+            self.data = pd.read_parquet(self.local_path).reindex(columns=TOKEN_DIMENSION_COLUMNS)
+            self.data = self.data.set_index("contract_address")
+        else:
+            self.data = pd.DataFrame(columns=TOKEN_DIMENSION_COLUMNS).set_index("contract_address")
+
+        self.logger.info(f"Token dimension loaded - {self.data.shape[0]} tokens")
+
+        return self.data
+
+    def last_refreshed(self) -> pd.Timestamp:
+        """Get the most recent last refreshed timestamp of the dimension, used as incremental watermark.
+
+        Args:
+            None
+
+        Returns:
+            pd.Timestamp: Last refreshed timestamp, or None when the dimension is empty.
+        """
+
+        data = self.load()
+
+        return None if data.empty else data["last_refreshed"].max()
+
+    def upsert(self, tokens_metadata: pd.DataFrame) -> None:
+        """Upsert tokens metadata into the dimension, keeping the most recently refreshed row of each contract.
+
+        Args:
+            tokens_metadata (pd.DataFrame): Tokens metadata with the dimension columns, the name and status columns
+                are left empty when they are missing (e.g. the Transpose API gives no status).
+
+        Returns:
+            None
+        """
+
+        data = self.load()
+
+        new_data = tokens_metadata.reindex(columns=TOKEN_DIMENSION_COLUMNS)
+        new_data["contract_address"] = new_data["contract_address"].str.lower()
+        new_data["decimals"] = pd.to_numeric(new_data["decimals"], errors="coerce").fillna(18).astype("int64")
+        new_data["last_refreshed"] = pd.to_datetime(new_data["last_refreshed"])
+
+        # Only the most recent row of each contract is kept, both within the new data and against the dimension.
+        new_data = new_data.sort_values("last_refreshed").drop_duplicates("contract_address", keep="last")
+        new_data = new_data.set_index("contract_address")
+
+        current_last_refreshed = pd.to_datetime(data["last_refreshed"].reindex(new_data.index))
+        new_data = new_data[current_last_refreshed.isna() | (new_data["last_refreshed"] >= current_last_refreshed)]
+
+        self.data = pd.concat([data.drop(index=new_data.index, errors="ignore"), new_data])
+
+        self.logger.info(
+            f"Token dimension upserted - {new_data.shape[0]} tokens - {self.data.shape[0]} tokens in total"
+        )
+
+    def save(self) -> None:
+        """Persist the dimension to the local parquet file and mirror it to S3.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        data = self.load()
+
+        os.makedirs(os.path.dirname(self.local_path) or ".", exist_ok=True)
+        data.reset_index().to_parquet(self.local_path, index=False)
+
+        if self.s3_path:
+            wr.s3.upload(local_file=self.local_path, path=self.s3_path)
+
+        self.logger.info(f"Token dimension saved - {self.local_path}")
+
+    def get_tokens(self, contract_addresses: List[str]) -> pd.DataFrame:
+        """Get the dimension rows of a list of contract addresses, missing addresses are ignored.
+
+        Args:
+            contract_addresses (List[str]): Contract addresses.
+
+        Returns:
+            pd.DataFrame: Dimension rows indexed by contract address.
+        """
+
+        data = self.load()
+
+        return data[data.index.isin([address.lower() for address in contract_addresses])]
@@ -0,0 +1,240 @@
+import abc
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import boto3
+from spectral_data_lib.log_manager import Logger
+
+from config import settings
+
+
+def encode_watermark(watermark) -> str:
+    """Function to encode a watermark (block number, timestamp or dict of them) as JSON.
+
+    Args:
+        watermark: Watermark value.
+
+    Returns:
+        str: JSON encoded watermark, timestamps are encoded as strings.
+    """
+
+    def default(value):
+        if hasattr(value, "item"):  # numpy scalars
+            return value.item()
+        return str(value)
+
+    return json.dumps(watermark, default=default, sort_keys=True)
+
+
+def get_watermark_key(database: str, table_name: str) -> str:
+    """Function to get the key of a table in the watermark store.
+
+    Args:
+        database (str): Database name.
+        table_name (str): Table name.
+
+    Returns:
+        str: Watermark key.
+    """
+
+    return f"{database}.{table_name}"
+
+
+class WatermarkStore(abc.ABC):
+    """Base class of the watermark stores: table -> last block or timestamp inserted, and whether the table exists.
+    Watermarks are written once the write of a table succeeded, and read in O(1) instead of scanning the table.
+    """
+
+    def __init__(self, logger_name: str = "Watermark Store Logger") -> None:
+        """Constructor for the class
+
+        Args:
+            logger_name (str): Logger name.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=logger_name)
+
+    @abc.abstractmethod
+    def get(self, key: str) -> dict:
+        """Get the watermark of a table.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+
+        Returns:
+            dict: Watermark, table_exists and updated_at, or None when the table has no watermark yet.
+        """
+
+    @abc.abstractmethod
+    def set(self, key: str, watermark, table_exists: bool = True) -> None:
+        """Set the watermark of a table, in a single atomic write.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+            watermark: Watermark value (block number, timestamp or dict of them).
+            table_exists (bool): Whether the table exists.
+
+        Returns:
+            None
+        """
+
+
+class SqliteWatermarkStore(WatermarkStore):
+    """Watermark store in a local SQLite file, for local runs and tests."""
+
+    def __init__(self, path: str) -> None:
+        """Constructor for the class
+
+        Args:
+            path (str): Path of the SQLite file.
+
+        Returns:
+            None
+        """
+        super().__init__()
+        self.path = path
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    watermark_key TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    table_exists INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+
+    def get(self, key: str) -> dict:
+        """Get the watermark of a table from the SQLite file.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+
+        Returns:
+            dict: Watermark, table_exists and updated_at, or None when the table has no watermark yet.
+        """
+
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute(
+                "SELECT watermark, table_exists, updated_at FROM watermarks WHERE watermark_key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {"watermark": json.loads(row[0]), "table_exists": bool(row[1]), "updated_at": row[2]}
+
+    def set(self, key: str, watermark, table_exists: bool = True) -> None:
+        """Set the watermark of a table in the SQLite file, upserted in a single transaction.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+            watermark: Watermark value (block number, timestamp or dict of them).
+            table_exists (bool): Whether the table exists.
+
+        Returns:
+            None
+        """
+
+        with sqlite3.connect(self.path) as connection:  # the connection commits the transaction on exit
+            connection.execute(
+                """
+                INSERT INTO watermarks (watermark_key, watermark, table_exists, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (watermark_key) DO UPDATE SET
+                    watermark = excluded.watermark,
+                    table_exists = excluded.table_exists,
+                    updated_at = excluded.updated_at
+                """,
+                (key, encode_watermark(watermark), int(table_exists), datetime.now(timezone.utc).isoformat()),
+            )
+
+        self.logger.info(f"Watermark of {key} set to {encode_watermark(watermark)[:200]}")
+
+
+class DynamoDBWatermarkStore(WatermarkStore):
+    """Watermark store in a DynamoDB table (partition key watermark_key), shared by every task of the pipeline."""
+
+    def __init__(self, table_name: str) -> None:
+        """Constructor for the class
+
+        Args:
+            table_name (str): DynamoDB table name.
+
+        Returns:
+            None
+        """
+        super().__init__()
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key: str) -> dict:
+        """Get the watermark of a table from the DynamoDB table, with a strongly consistent read.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+
+        Returns:
+            dict: Watermark, table_exists and updated_at, or None when the table has no watermark yet.
+        """
+
+        item = self.table.get_item(Key={"watermark_key": key}, ConsistentRead=True).get("Item")
+
+        if item is None:
+            return None
+
+        return {
+            "watermark": json.loads(item["watermark"]),
+            "table_exists": bool(item["table_exists"]),
+            "updated_at": item["updated_at"],
+        }
+
+    def set(self, key: str, watermark, table_exists: bool = True) -> None:
+        """Set the watermark of a table in the DynamoDB table, in a single put of the whole item.
+
+        Args:
+            key (str): Watermark key (database.table_name).
+            watermark: Watermark value (block number, timestamp or dict of them).
+            table_exists (bool): Whether the table exists.
+
+        Returns:
+            None
+        """
+
+        self.table.put_item(
+            Item={
+                "watermark_key": key,
+                "watermark": encode_watermark(watermark),
+                "table_exists": table_exists,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+
+        self.logger.info(f"Watermark of {key} set to {encode_watermark(watermark)[:200]}")
+
+
+@lru_cache(maxsize=1)
+def get_watermark_store() -> WatermarkStore:
+    """Function to get the watermark store of the backend set in the settings (sqlite or dynamodb).
+
+    Args:
+        None
+
+    Returns:
+        WatermarkStore: Watermark store.
+    """
+
+    if settings.WATERMARK_STORE_BACKEND == "sqlite":
+        return SqliteWatermarkStore(path=settings.WATERMARK_STORE_SQLITE_PATH)
+    elif settings.WATERMARK_STORE_BACKEND == "dynamodb":
+        return DynamoDBWatermarkStore(table_name=settings.WATERMARK_STORE_DYNAMODB_TABLE)
+
+    raise Exception(f"Unknown watermark store backend: {settings.WATERMARK_STORE_BACKEND}")
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+
+from spectral_data_lib.log_manager import Logger
+
+TMPFS_DIR = "/dev/shm"
+
+
+class RunWorkspace(object):
+    """Class to manage the scratch directory of a single pipeline run.
+    Every run gets its own directory, so several runs can share the same container or host without clobbering
+    each other's temporary files.
+    """
+
+    def __init__(self, run_name: str, root_dir: str = None, use_tmpfs: bool = False) -> None:
+        """Constructor for the class
+
+        Args:
+            run_name (str): Run name, used as prefix of the scratch directory.
+            root_dir (str): Directory where the scratch directory is created. Defaults to the system temp directory.
+            use_tmpfs (bool): Create the scratch directory on tmpfs (/dev/shm) when it is available.
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name="Run Workspace Logger")
+
+        if use_tmpfs and os.path.isdir(TMPFS_DIR):
+            root_dir = TMPFS_DIR
+        elif root_dir:
+            os.makedirs(root_dir, exist_ok=True)
+        else:
+            root_dir = None  # tempfile uses the system temp directory
+
+        self.path = tempfile.mkdtemp(prefix=f"{run_name}_", dir=root_dir)
+
+        self.logger.info(f"Scratch directory created - {self.path}")
+
+    def file(self, file_name: str) -> str:
+        """Function to get the path of a file inside the scratch directory.
+
+        Args:
+            file_name (str): File name.
+
+        Returns:
+            str: Path of the file.
+        """
+
+        return os.path.join(self.path, file_name)
+
+    def clear(self) -> None:
+        """Remove every file of the scratch directory, keeping the directory itself.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        for entry in os.listdir(self.path):
+            entry_path = os.path.join(self.path, entry)
+
+            if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+
+    def cleanup(self) -> None:
+        """Remove the scratch directory.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+        self.logger.info(f"Scratch directory removed - {self.path}")
+
+    def __enter__(self) -> "RunWorkspace":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.cleanup()
@@ -1,17 +1,46 @@
-import numpy as np
-import awswrangler as wr
-import concurrent.futures
-from itertools import product
+import pandas as pd
 
 from config import settings
 from spectral_data_lib.log_manager import Logger
 from spectral_data_lib.config import settings as sdl_settings
-from spectral_data_lib.data_lakehouse import DataLakehouse
-from src.helpers.files import read_sql_file
-from src.helpers.athena import write_data_into_datalake_using_ctas, write_data_into_datalake_using_ctas_by_chunks
+from src.helpers.sql_templates import get_sql_template, render_value
+from src.helpers.chunk_planner import ChunkPlanner
+from src.helpers.query_cache import get_query_cache
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.watermark_store import get_watermark_key, get_watermark_store
+from src.helpers.athena import (
+    write_data_into_datalake_using_ctas,
+    write_data_into_datalake_using_ctas_by_chunks_concurrently,
+)
+from src.helpers.table_scheduler import get_table_scheduler
 
 # from src.schemas.analytics_layer import ETHEREUM_TABLES_SCHEMA
 
+# Analytics tables loaded by --table-name all, with the analytics tables each one reads
+ANALYTICS_TABLES_DEPENDENCIES = {
+    "ethereum_erc20_transactions": [],
+    "ethereum_normal_transactions": [],
+    "ethereum_internal_transactions": [],
+    "ethereum_wallet_transactions": [
+        "ethereum_erc20_transactions",
+        "ethereum_normal_transactions",
+        "ethereum_internal_transactions",
+    ],
+}
+
+# Tables whose rows each analytics table reads from a block on, their watermarks bound the blocks loaded by a run:
+# (layer, table)
+ANALYTICS_TABLES_SOURCES = {
+    "ethereum_erc20_transactions": [("stage", "ethereum_token_transfers")],
+    "ethereum_normal_transactions": [("stage", "ethereum_transactions")],
+    "ethereum_internal_transactions": [("stage", "ethereum_traces")],
+    "ethereum_wallet_transactions": [
+        ("analytics", "ethereum_erc20_transactions"),
+        ("analytics", "ethereum_normal_transactions"),
+        ("analytics", "ethereum_internal_transactions"),
+    ],
+}
+
 
 class AnalyticsPipeline(object):
     """Class to create a analytics pipeline"""
@@ -32,53 +61,122 @@ class AnalyticsPipeline(object):
         self.data_lake_bucket = sdl_settings.DATA_LAKE_BUCKET_S3
         self.data_source = "ethereum"
         self.env = settings.ENV
-        self.data_lakehouse_connection = DataLakehouse()
+        self.watermark_store = get_watermark_store()
+        self.watermark_key = get_watermark_key(database=self.target_data_lake_database, table_name=self.table_name)
+        self.table_exists = None
+
+    def scan_last_block_from_table(self) -> int:
+        """Function to scan the last block inserted in the table in the data lakehouse, only when the table has no
+        watermark yet
+
+        Args:
+            None
+
+        Returns:
+            int: Last block
+        """
+
+        query_to_get_last_block_inserted = f"""
+        SELECT MAX(block_number) AS last_block_inserted
+        FROM {self.target_data_lake_database}.{self.table_name}
+        WHERE date_partition in (
+                SELECT MAX(date_partition) AS last_partition
+                FROM {self.target_data_lake_database}.{self.table_name}
+            )
+        """
+
+        return get_query_cache().read_sql_query(
+            sql=query_to_get_last_block_inserted,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "analytics_watermark", "table": self.table_name},
+        )["last_block_inserted"][0]
 
     def get_last_block_from_table(self) -> int:
-        """Function to get the last block from the table in the data lakehouse
+        """Function to get the first block to insert into the table, from the watermark store.
+        The table is scanned only once, when it has no watermark yet.
 
         Args:
             None
 
         Returns:
-            int: Last timestamp
+            int: Last block inserted + 1, or the first block of the data source for the first time
         """
 
-        table_exist = wr.catalog.does_table_exist(database=self.target_data_lake_database, table=self.table_name)
+        watermark = self.watermark_store.get(self.watermark_key)
 
-        if table_exist:
+        if watermark is not None:
+            self.table_exists = watermark["table_exists"]
+            return watermark["watermark"] + 1
 
-            self.logger.info(f"Table {self.table_name} exist - Incremental ingestion.")
+        self.table_exists = get_execution_backend().does_table_exist(
+            database=self.target_data_lake_database, table=self.table_name
+        )
 
-            query_to_get_last_block_inserted = f"""
-            SELECT MAX(column) AS last_block_inserted
-            FROM {self.target_data_lake_database}.{self.table_name}
-            WHERE date_partition in (
-                    SELECT MAX(date_partition) AS last_partition
-                    FROM {self.target_data_lake_database}.{self.table_name}
-                )
-            """
+        if self.table_exists:
+            self.logger.info(f"Table {self.table_name} exist - No watermark yet, scanning the table.")
+            return self.scan_last_block_from_table() + 1
 
-            last_block_inserted = (
-                self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_block_inserted.replace("column", "block_number"),
-                    database_name=self.target_data_lake_database,
-                )["last_block_inserted"][0]
-                + 1
-            )
+        # Default values for the first time
+        self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
+
+        return settings.FIRST_RUN_WATERMARKS.analytics.get(self.table_name, 0)
+
+    def read_last_block_from_sources(self, last_block: int) -> int:
+        """Function to read the last block of the rows loaded by the run from the tables it reads, before the write,
+        so the watermark is committed without scanning the table after it. The watermark of a source table is read
+        from the watermark store, the source rows selected by the run are aggregated when it has none yet.
+
+        Args:
+            last_block (int): First block loaded by the run, the filter value of the run.
+
+        Returns:
+            int: Last block of the source rows, None when there is no new row
+        """
+
+        last_blocks = []
+
+        for source_layer, source_table in ANALYTICS_TABLES_SOURCES[self.table_name]:
+            source_database = {
+                "stage": sdl_settings.DATA_LAKE_STAGE_DATABASE,
+                "analytics": self.target_data_lake_database,
+            }[source_layer]
+
+            watermark = self.watermark_store.get(get_watermark_key(database=source_database, table_name=source_table))
+
+            if watermark is not None:
+                last_blocks.append(watermark["watermark"])
+                continue
 
-        else:  # Default values for the first time
+            self.logger.info(f"Table {source_table} has no watermark yet, reading the last block of the new rows.")
 
-            self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
+            source_last_block = get_query_cache().read_sql_query(
+                sql=f"""
+                SELECT MAX(block_number) AS last_block
+                FROM {source_database}.{source_table}
+                WHERE block_number >= {render_value("filter_value", "number", last_block)}
+                """,
+                database=source_database,
+                tags={"pipeline": "analytics_watermark", "table": self.table_name},
+            )["last_block"][0]
 
-            if self.table_name == "ethereum_normal_transactions":
-                last_block_inserted = 46147
-            elif self.table_name == "ethereum_erc20_transactions":
-                last_block_inserted = 447767
-            else:
-                last_block_inserted = 0
+            if not pd.isna(source_last_block):
+                last_blocks.append(source_last_block)
 
-        return last_block_inserted
+        last_blocks = [source_last_block for source_last_block in last_blocks if source_last_block >= last_block]
+
+        return int(max(last_blocks)) if last_blocks else None
+
+    def commit_watermark(self, last_block_inserted: int) -> None:
+        """Function to save the last block inserted in the table into the watermark store, once the write succeeded.
+
+        Args:
+            last_block_inserted (int): Last block of the rows loaded by the run (see read_last_block_from_sources).
+
+        Returns:
+            None
+        """
+
+        self.watermark_store.set(self.watermark_key, last_block_inserted, table_exists=True)
 
     def run(self, **kwargs) -> None:
         """Function to run the pipeline
@@ -94,7 +192,7 @@ class AnalyticsPipeline(object):
             f"Running data ingestion - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
         )
 
-        sql_query = read_sql_file(file_path=sql_file_path)
+        sql_template = get_sql_template(file_path=sql_file_path)
 
         last_block = self.get_last_block_from_table()
 
@@ -102,46 +200,36 @@ class AnalyticsPipeline(object):
             f"Last block: {last_block} - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
         )
 
+        # Read before the write: the source rows of the run are the ones loaded, whatever is written in the sources next
+        last_block_inserted = self.read_last_block_from_sources(last_block=last_block)
+
         if self.table_name == "ethereum_wallet_transactions":
 
-            addresses_partitions = list(
-                map("".join, product("0123456789abcdef", repeat=2))
-            )  # generate all the possible addresses partitions (256)
-            addresses_partitions_chunks = np.array_split(addresses_partitions, 10)
-
-            # We are using a ProcessPoolExecutor to run the queries in parallel.
-            # We are using a CTAS to write the data into the data lakehouse by chunks.
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                futures = []
-                for addresses_partition_chunk in addresses_partitions_chunks:
-
-                    addresses_partition_chunk = tuple(addresses_partition_chunk)
-
-                    futures.append(
-                        executor.submit(
-                            write_data_into_datalake_using_ctas_by_chunks,
-                            sql_query=sql_query,
-                            chunk=addresses_partition_chunk,
-                            filter_value=last_block,
-                            env=self.env,
-                            data_lake_layer=self.data_lake_layer,
-                            target_database=self.target_data_lake_database,
-                            source_database=f"db_analytics_{self.env}",
-                            target_table_name=self.table_name,
-                            data_lake_bucket=self.data_lake_bucket,
-                            data_source=self.data_source,
-                        )
-                    )
-
-                for future in concurrent.futures.as_completed(futures):
-                    try:
-                        result = future.result()
-                    except Exception as e:
-                        raise Exception(f"Error while executing the query to write data into the data lakehouse: {e}")
+            # Chunks of the 256 address partitions, balanced by the number of rows of the partitions of the table.
+            addresses_partitions_chunks = ChunkPlanner(
+                database=self.target_data_lake_database,
+                table_name=self.table_name,
+                refresh_days=settings.CHUNK_PLAN_REFRESH_DAYS,
+            ).get_chunks(number_of_chunks=10)
+
+            # The queries of the chunks are run concurrently from a single process, up to the Athena concurrency quota.
+            write_data_into_datalake_using_ctas_by_chunks_concurrently(
+                sql_template=sql_template,
+                chunks=addresses_partitions_chunks,
+                filter_value=last_block,
+                env=self.env,
+                data_lake_layer=self.data_lake_layer,
+                target_database=self.target_data_lake_database,
+                source_database=f"db_analytics_{self.env}",
+                target_table_name=self.table_name,
+                data_lake_bucket=self.data_lake_bucket,
+                data_source=self.data_source,
+                table_exists=self.table_exists,
+            )
 
         else:
             write_data_into_datalake_using_ctas(
-                sql_query=sql_query,
+                sql_template=sql_template,
                 filter_value=last_block,
                 env=self.env,
                 data_lake_layer=self.data_lake_layer,
@@ -149,8 +237,31 @@ class AnalyticsPipeline(object):
                 target_table_name=self.table_name,
                 data_lake_bucket=self.data_lake_bucket,
                 data_source=self.data_source,
+                table_exists=self.table_exists,
             )
 
+        if last_block_inserted is None:
+            self.logger.info(f"No new rows in the sources of {self.table_name} - Watermark not moved.")
+            last_block_inserted = last_block - 1
+
+        self.commit_watermark(last_block_inserted=last_block_inserted)
+
         self.logger.info(
             f"Data written into {self.table_name} table - Data Source: {self.data_source} - Layer: {self.data_lake_layer}"
         )
+
+
+def run_all_tables() -> None:
+    """Run the analytics pipeline of every analytics table from this process, each table as soon as the tables it
+    reads are loaded.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+
+    get_table_scheduler(dependencies=ANALYTICS_TABLES_DEPENDENCIES).run(
+        run_table=lambda table_name: AnalyticsPipeline(table_name=table_name).run()
+    )
@@ -1,9 +1,8 @@
 from config import settings
 from spectral_data_lib.log_manager import Logger
 from spectral_data_lib.config import settings as sdl_settings
-from src.helpers.files import read_sql_file
-
-from spectral_data_lib.data_lakehouse import DataLakehouse
+from src.helpers.sql_templates import get_sql_template
+from src.helpers.execution_backend import get_execution_backend
 
 
 class FeatureDataQualityPipeline(object):
@@ -12,7 +11,6 @@ class FeatureDataQualityPipeline(object):
         self.table_name = table_name
         self.target_data_lake_database = sdl_settings.DATA_LAKE_ANALYTICS_DATABASE
         self.env = settings.ENV
-        self.data_lakehouse_connection = DataLakehouse()
 
     def check_data_quality(self, sql_query_path: str) -> None:
         """Check data quality for a feature set based on a SQL query.
@@ -24,10 +22,11 @@ class FeatureDataQualityPipeline(object):
             None
         """
 
-        sql_query = read_sql_file(sql_query_path)
-        data_quality_df_checks = self.data_lakehouse_connection.read_sql_query(
-            query=sql_query,
-            database_name=self.target_data_lake_database,
+        sql_query = get_sql_template(sql_query_path).render()
+        data_quality_df_checks = get_execution_backend().read_query(
+            sql=sql_query,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "data_quality", "table": self.table_name},
         )
 
         fail_data_quality_df_checks = data_quality_df_checks[data_quality_df_checks["is_fail"] == True][
@@ -1,24 +1,47 @@
-import awswrangler as wr
-import numpy as np
-from itertools import product
-from concurrent.futures import ThreadPoolExecutor
-from multiprocessing import cpu_count
-from datetime import datetime
+import threading
+import pandas as pd
+from typing import Iterator, List, Tuple
 
 from config import settings
 from spectral_data_lib.log_manager import Logger
 from spectral_data_lib.config import settings as sdl_settings
-from src.helpers.files import read_sql_file
+from src.helpers.sql_templates import SqlTemplate, get_sql_template
+from src.helpers.chunk_planner import ChunkPlanner
+from src.helpers.query_cache import get_query_cache
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.iceberg_metadata import read_column_upper_bound
+from src.helpers.watermark_store import get_watermark_key, get_watermark_store
 from src.helpers.athena import (
     write_data_into_datalake_using_ctas,
     write_data_into_datalake_using_ctas_by_chunks,
+    write_data_into_datalake_using_ctas_by_chunks_concurrently,
     iterate_over_last_updated_items,
-    optimize_iceberg_table,
 )
-from src.helpers.data_transformations import convert_string_to_dict
+from src.helpers.data_transformations import build_nested_documents
+from src.helpers.change_detection import FEATURES_HASH_FIELD, get_document_changes, hash_nested_values, hash_rows
+from src.helpers.memory import MemoryGovernor
+from src.helpers.features_db_sync import FeaturesDbSync
 
 from spectral_data_lib.feature_data_documentdb.sync_mongo_connection import SyncMongoConnection
-from spectral_data_lib.data_lakehouse import DataLakehouse
+
+# Details of each contract of the wallet features, in the order of the contract_metrics array of the
+# ethereum_wallet_features_data_to_features_db query
+WALLET_CONTRACT_METRICS = [
+    "total_balance",
+    "total_balance_in_eth",
+    "total_auc",
+    "total_time_in_ever",
+    "min_eth_balance_in_ever",
+    "max_eth_balance_in_ever",
+    "total_incoming_value_in_eth",
+    "total_outgoing_value_in_eth",
+    "total_tx_fee",
+    "incoming_transactions_count",
+    "outgoing_transactions_count",
+    "transactions_count",
+    "first_transaction_timestamp",
+    "last_transaction_timestamp",
+]
 
 
 class FeaturesPipeline(object):
@@ -37,10 +60,27 @@ class FeaturesPipeline(object):
         self.features_db_connection = SyncMongoConnection(
             addition_connection_parameters_string=settings.MONGO_RETRY_WRITE_TO_FALSE
         )
-        self.data_lakehouse_connection = DataLakehouse()
+        self.memory_governor = MemoryGovernor(
+            memory_budget_mb=settings.MEMORY_BUDGET_MB,
+            soft_limit_ratio=settings.MEMORY_SOFT_LIMIT_RATIO,
+            logger_name="Ethereum - Features Pipeline Memory Logger",
+        )
+        self.watermark_store = get_watermark_store()
+        self.watermark_key = get_watermark_key(database=self.target_data_lake_database, table_name=self.table_name)
+        self.table_exists = None
+        self.is_iceberg_table = False
+        self.features_db_changes = {"unchanged": 0, "whole": 0}
+        self.features_db_changes_lock = threading.Lock()
+        self.features_db_collection_name = (
+            self.table_name.replace("ethereum_", "") if self.table_name.startswith("ethereum_") else self.table_name
+        )
+        self.timestamp_column = (
+            "last_interaction_timestamp" if self.table_name == "rugpull_features" else "wallet_last_tx"
+        )
 
-    def get_last_timestamp_inserted(self, filter: str = None) -> int:
-        """Function to get the last timestamp inserted in the data lakehouse
+    def scan_last_timestamp_inserted(self) -> int:
+        """Function to scan the last timestamp inserted in the table in the data lakehouse. For Iceberg tables, it is
+        read from the statistics of the data files in the table metadata, without scanning the table.
 
         Args:
             None
@@ -49,31 +89,252 @@ class FeaturesPipeline(object):
             int: Last timestamp
         """
 
-        table_exist = wr.catalog.does_table_exist(database=self.target_data_lake_database, table=self.table_name)
+        if self.is_iceberg_table:
+            return read_column_upper_bound(
+                database=self.target_data_lake_database,
+                table_name=self.table_name,
+                column=self.timestamp_column,
+                tags={"pipeline": "features_watermark", "table": self.table_name},
+            )["upper_bound"][0]
+
+        return get_query_cache().read_sql_query(
+            sql=f"""
+            SELECT MAX({self.timestamp_column}) AS last_timestamp_inserted
+            FROM {self.target_data_lake_database}.{self.table_name}
+            """,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "features_watermark", "table": self.table_name},
+        )["last_timestamp_inserted"][0]
+
+    def scan_last_timestamps_by_address_partition(self) -> dict:
+        """Function to scan the last timestamp inserted in the table for each address partition, with a single
+        query instead of one query by chunk of address partitions. For Iceberg tables, they are read from the
+        statistics of the data files of each partition in the table metadata, without scanning the table.
+
+        Args:
+            None
+
+        Returns:
+            dict: Last timestamp by address partition
+        """
+
+        if self.is_iceberg_table:
+            last_timestamps = read_column_upper_bound(
+                database=self.target_data_lake_database,
+                table_name=self.table_name,
+                column=self.timestamp_column,
+                partition_column="address_partition",
+                tags={"pipeline": "features_watermark", "table": self.table_name},
+            ).dropna()
+
+            return dict(zip(last_timestamps["address_partition"], last_timestamps["upper_bound"]))
+
+        last_timestamps = get_query_cache().read_sql_query(
+            sql=f"""
+            SELECT address_partition, MAX({self.timestamp_column}) AS last_timestamp_inserted
+            FROM {self.target_data_lake_database}.{self.table_name}
+            GROUP BY address_partition
+            """,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "features_watermark", "table": self.table_name},
+        )
+        last_timestamps = last_timestamps.dropna()
 
-        if table_exist:
+        return dict(zip(last_timestamps["address_partition"], last_timestamps["last_timestamp_inserted"]))
 
-            self.logger.info(f"Table {self.table_name} exist - Incremental ingestion.")
+    def scan_watermark(self) -> dict:
+        """Function to scan the watermark of the table: the last timestamp inserted and, for the wallet features,
+        the last timestamp inserted by address partition.
 
-            query_to_get_last_timestamp_inserted = f"""
-            SELECT MAX(column) AS last_timestamp_inserted
-            FROM {self.target_data_lake_database}.{self.table_name} {filter if filter else ""}
-            """
+        Args:
+            None
 
-            timestamp_column = (
-                "last_interaction_timestamp" if self.table_name == "rugpull_features" else "wallet_last_tx"
+        Returns:
+            dict: Watermark of the table
+        """
+
+        self.is_iceberg_table = get_execution_backend().is_iceberg_table(
+            database=self.target_data_lake_database, table=self.table_name
+        )
+
+        if self.table_name == "ethereum_wallet_features":
+            last_timestamps_by_address_partition = self.scan_last_timestamps_by_address_partition()
+
+            return {
+                "last_timestamp_inserted": max(last_timestamps_by_address_partition.values(), default=0),
+                "by_address_partition": last_timestamps_by_address_partition,
+            }
+
+        last_timestamp_inserted = self.scan_last_timestamp_inserted()
+
+        return {"last_timestamp_inserted": 0 if pd.isna(last_timestamp_inserted) else last_timestamp_inserted}
+
+    def get_watermark(self) -> dict:
+        """Function to get the watermark of the table from the watermark store.
+        The table is scanned only once, when it has no watermark yet.
+
+        Args:
+            None
+
+        Returns:
+            dict: Watermark of the table
+        """
+
+        watermark = self.watermark_store.get(self.watermark_key)
+
+        if watermark is not None:
+            self.table_exists = watermark["table_exists"]
+            return watermark["watermark"]
+
+        self.table_exists = get_execution_backend().does_table_exist(
+            database=self.target_data_lake_database, table=self.table_name
+        )
+
+        if self.table_exists:
+            self.logger.info(f"Table {self.table_name} exist - No watermark yet, scanning the table.")
+            return self.scan_watermark()
+
+        # Default values for the first time
+        self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
+
+        return {"last_timestamp_inserted": 0, "by_address_partition": {}}
+
+    def commit_watermark(self) -> dict:
+        """Function to save the watermark of the table into the watermark store, once the write succeeded.
+
+        Args:
+            None
+
+        Returns:
+            dict: New watermark of the table
+        """
+
+        watermark = self.scan_watermark()
+        self.watermark_store.set(self.watermark_key, watermark, table_exists=True)
+
+        return watermark
+
+    def iterate_over_features_db_batches(
+        self, sql_template: SqlTemplate, last_timestamp_inserted_features_db: int, field: str
+    ) -> Iterator[Tuple[List[dict], int]]:
+        """Function to iterate over the batches of documents to write into the features db: the rows updated in the
+        data lakehouse since the last timestamp of the features db, read by chunks from Athena. The batch size is
+        reduced when the memory gets close to the budget.
+
+        Args:
+            sql_template (SqlTemplate): Compiled SQL template of the query reading the updated rows
+            last_timestamp_inserted_features_db (int): Last timestamp inserted in the features db
+            field (str): Timestamp column of the documents
+
+        Returns:
+            Iterator[Tuple[List[dict], int]]: Documents of each batch, with the last timestamp of the batch
+        """
+
+        features_db_batch_size = settings.FEATURES_DB_BATCH_SIZE
+
+        for new_data in iterate_over_last_updated_items(
+            sql_template=sql_template, last_inserted_timestamp=last_timestamp_inserted_features_db
+        ):  # pagination
+
+            new_data.rename(columns={"wallet_address": "walletAddress"}, inplace=True)
+
+            if self.table_name == "ethereum_wallet_features":
+
+                # Content hashes of the wallet fields and of each contract, compared with the hashes written with the
+                # documents to only send what changed
+                new_data[FEATURES_HASH_FIELD] = hash_rows(
+                    new_data.drop(columns=["contract_addresses", "contract_metrics"])
+                )
+                new_data["contracts_hashes"] = hash_nested_values(
+                    keys=new_data["contract_addresses"],
+                    values=new_data["contract_metrics"],
+                    width=len(WALLET_CONTRACT_METRICS),
+                )
+                new_data["contracts"] = build_nested_documents(
+                    keys=new_data.pop("contract_addresses"),
+                    values=new_data.pop("contract_metrics"),
+                    value_names=WALLET_CONTRACT_METRICS,
+                )
+
+            batch_start = 0
+
+            while batch_start < new_data.shape[0]:
+
+                features_db_batch_size = self.memory_governor.adapt_batch_size(
+                    batch_size=features_db_batch_size, min_batch_size=settings.FEATURES_DB_MIN_BATCH_SIZE
+                )
+
+                batch = new_data.iloc[batch_start : batch_start + features_db_batch_size]
+                batch_start += batch.shape[0]
+
+                yield batch.to_dict("records"), batch[field].max()
+
+            del new_data
+
+    def write_features_db_batch(self, documents: List[dict]) -> int:
+        """Function to upsert a batch of documents into the collection of the table in the features db, matched on
+        the wallet address.
+
+        Args:
+            documents (List[dict]): Documents
+
+        Returns:
+            int: Number of documents acknowledged by the features db (matched or upserted by the bulk write), unchanged
+                documents included
+        """
+
+        updates = (
+            self.get_wallet_features_changes(documents) if self.table_name == "ethereum_wallet_features" else documents
+        )
+        acknowledged = len(documents) - len(updates)  # the unchanged documents are already in the features db
+
+        if updates:
+            result = self.features_db_connection.update_documents(
+                db_name="features_db",
+                collection_name=self.features_db_collection_name,
+                key_to_match="walletAddress",
+                update_collection=updates,
+                upsert=True,
             )
+            acknowledged += result.upserted_count + result.matched_count
+
+        return acknowledged
 
-            last_timestamp_inserted = self.data_lakehouse_connection.read_sql_query(
-                query=query_to_get_last_timestamp_inserted.replace("column", timestamp_column),
-                database_name=self.target_data_lake_database,
-            )["last_timestamp_inserted"][0]
+    def get_wallet_features_changes(self, documents: List[dict]) -> List[dict]:
+        """Function to get the updates of a batch of wallet features documents: the hashes written with the documents
+        are read from the features db, the wallets which did not change are skipped, and only the changed contracts
+        of the other wallets are set (contracts.<address>), instead of the whole contracts map.
 
-        else:  # Default values for the first time
-            self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
-            last_timestamp_inserted = 0
+        Args:
+            documents (List[dict]): Wallet features documents, with their hashes
 
-        return last_timestamp_inserted
+        Returns:
+            List[dict]: Updates of the changed documents
+        """
+
+        written_hashes = self.features_db_connection.get_data(
+            db_name="features_db",
+            collection_name=self.features_db_collection_name,
+            filter={"walletAddress": {"$in": [document["walletAddress"] for document in documents]}},
+            attributes_to_project=["walletAddress", FEATURES_HASH_FIELD, "contracts_hashes"],
+        )
+        written_hashes = {hashes["walletAddress"]: hashes for hashes in written_hashes}
+
+        updates = [
+            get_document_changes(
+                document=document,
+                written_hashes=written_hashes.get(document["walletAddress"]),
+                key_field="walletAddress",
+                nested_field="contracts",
+            )
+            for document in documents
+        ]
+
+        with self.features_db_changes_lock:
+            self.features_db_changes["unchanged"] += sum(update is None for update in updates)
+            self.features_db_changes["whole"] += sum(update is document for update, document in zip(updates, documents))
+
+        return [update for update in updates if update is not None]
 
     def run(self, **kwargs) -> None:
         """Implements the `Features` pipeline
@@ -90,32 +351,43 @@ class FeaturesPipeline(object):
             f"Running data processing - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
         )
 
-        sql_query = read_sql_file(file_path=sql_file_path)
+        sql_template = get_sql_template(file_path=sql_file_path)
 
         if self.table_name == "ethereum_wallet_features":
 
-            addresses_partitions = list(
-                map("".join, product("0123456789abcdef", repeat=2))
-            )  # generate all the possible addresses partitions (256)
-            addresses_partitions_chunks = np.array_split(addresses_partitions, 20)
-
-            # We are using a CTAS to write the data into the data lakehouse by chunks.
-            # We are using iceberg tables, which are not compatible with concurrent writes at this moment.
-            for addresses_partition_chunk in addresses_partitions_chunks:
-
-                addresses_partition_chunk = tuple(addresses_partition_chunk)
-
-                # Athena query to get the last timestamp inserted in the data lakehouse by chunk.
-                # We are doing this to avoid writing the same data multiple times in the data lakehouse.
-                # Because if we use a single query to get the last timestamp inserted, we can have issues if a new data is inserted while we are writing the data.
-                last_timestamp_insert = self.get_last_timestamp_inserted(
-                    filter=f"WHERE address_partition IN {addresses_partition_chunk}"
+            # Chunks of the 256 address partitions, balanced by the number of wallet transactions of the partitions.
+            addresses_partitions_chunks = ChunkPlanner(
+                database=self.target_data_lake_database,
+                table_name="ethereum_wallet_transactions",
+                refresh_days=settings.CHUNK_PLAN_REFRESH_DAYS,
+            ).get_chunks(number_of_chunks=20)
+
+            # The last timestamp inserted is read for every address partition before writing any chunk.
+            # Each chunk only writes its own address partitions, so the timestamps of the next chunks stay valid.
+            # The watermark is committed once every chunk is written, so the partitions regrouped by a new chunk plan
+            # were all processed up to the same transactions.
+            last_timestamps_by_address_partition = self.get_watermark().get("by_address_partition", {})
+
+            # Last timestamp inserted in each chunk, to avoid writing the same data multiple times.
+            last_timestamps_by_chunk = {
+                addresses_partition_chunk: max(
+                    (
+                        last_timestamps_by_address_partition[address_partition]
+                        for address_partition in addresses_partition_chunk
+                        if address_partition in last_timestamps_by_address_partition
+                    ),
+                    default=0,
                 )
+                for addresses_partition_chunk in addresses_partitions_chunks
+            }
 
+            if not self.table_exists:
+
+                # The first chunk creates the table, the other chunks are merged into it.
                 write_data_into_datalake_using_ctas_by_chunks(
-                    sql_query=sql_query,
-                    chunk=addresses_partition_chunk,
-                    filter_value=last_timestamp_insert,
+                    sql_template=sql_template,
+                    chunk=addresses_partitions_chunks[0],
+                    filter_value=last_timestamps_by_chunk[addresses_partitions_chunks[0]],
                     env=self.env,
                     data_lake_layer=self.data_lake_layer,
                     target_database=self.target_data_lake_database,
@@ -123,28 +395,38 @@ class FeaturesPipeline(object):
                     target_table_name=self.table_name,
                     data_lake_bucket=self.data_lake_bucket,
                     data_source=self.data_source,
+                    table_exists=self.table_exists,
                 )
 
-                if datetime.today().weekday() == 6:  # Sunday
+                addresses_partitions_chunks = addresses_partitions_chunks[1:]
+                self.table_exists = True
 
-                    self.logger.info(
-                        f"Optimizing Iceberg table for addresses partitions: {addresses_partition_chunk} to avoid small files and improve performance."
-                    )
-                    optimize_iceberg_table(
-                        target_database=self.target_data_lake_database,
-                        table_name=self.table_name,
-                        chunk=addresses_partition_chunk,
-                    )
-                    self.logger.info("Iceberg table optimized.")
+            # The chunks write disjoint address partitions of the Iceberg table, so their writes only conflict when
+            # they commit: the multiplexer runs the queries of the conflicting commits again.
+            write_data_into_datalake_using_ctas_by_chunks_concurrently(
+                sql_template=sql_template,
+                chunks=addresses_partitions_chunks,
+                filter_value=None,
+                filter_values_by_chunk=last_timestamps_by_chunk,
+                max_concurrent_queries=settings.FEATURES_MAX_CONCURRENT_CHUNKS,
+                env=self.env,
+                data_lake_layer=self.data_lake_layer,
+                target_database=self.target_data_lake_database,
+                source_database=f"db_analytics_{self.env}",
+                target_table_name=self.table_name,
+                data_lake_bucket=self.data_lake_bucket,
+                data_source=self.data_source,
+                table_exists=self.table_exists,
+            )
 
-                self.logger.info(
-                    f"Data written into data lakehouse for addresses partitions: {addresses_partition_chunk}"
-                )
+            self.logger.info(f"Data written into data lakehouse for {len(last_timestamps_by_chunk)} address chunks")
 
         else:
+            self.get_watermark()
+
             # Updates datalake house data
             write_data_into_datalake_using_ctas(
-                sql_query=sql_query,
+                sql_template=sql_template,
                 filter_value=None,
                 env=self.env,
                 data_lake_layer=self.data_lake_layer,
@@ -153,35 +435,20 @@ class FeaturesPipeline(object):
                 target_table_name=self.table_name,
                 data_lake_bucket=self.data_lake_bucket,
                 data_source=self.data_source,
+                table_exists=self.table_exists,
             )
 
-            if datetime.today().weekday() == 6:  # Sunday
-
-                self.logger.info(f"Optimizing Iceberg table to avoid small files and improve performance.")
-                optimize_iceberg_table(target_database=self.target_data_lake_database, table_name=self.table_name)
-                self.logger.info("Iceberg table optimized.")
-
         # Updates features db data
-        sql_query = read_sql_file(
+        sql_template = get_sql_template(
             file_path=f"{self.update_features_db_query_dir}/{self.table_name}_data_to_features_db.sql"
         )
 
-        # Athena query to get the last timestamp inserted in the data lakehouse after the data ingestion
-        last_timestamp_inserted_data_lakehouse = self.get_last_timestamp_inserted()
+        # Last timestamp inserted in the data lakehouse after the data ingestion, saved as the new watermark
+        last_timestamp_inserted_data_lakehouse = self.commit_watermark()["last_timestamp_inserted"]
 
         # MongoDB aggregation pipeline to get the last timestamp inserted in the features db
-        if self.table_name == "rugpull_features":
-
-            features_db_query = {"collectionName": self.table_name}
-            field = "last_interaction_timestamp"
-
-        else:  # wallet_features
-            features_db_query = {
-                "collectionName": self.table_name.replace("ethereum_", "")
-                if self.table_name.startswith("ethereum_")
-                else self.table_name
-            }
-            field = "wallet_last_tx"
+        features_db_query = {"collectionName": self.features_db_collection_name}
+        field = self.timestamp_column
 
         last_timestamp_inserted_features_db = self.features_db_connection.get_data(
             db_name="features_db",
@@ -198,53 +465,36 @@ class FeaturesPipeline(object):
         # Comparing the last timestamp before and after the data ingestion to get only new data inserted to insert into the features db
         if last_timestamp_inserted_data_lakehouse > last_timestamp_inserted_features_db:
 
-            new_last_timestamp_inserted_features_db = 0
-
-            for batch in iterate_over_last_updated_items(
-                sql_query=sql_query, last_inserted_timestamp=last_timestamp_inserted_features_db
-            ):  # pagination
-
-                new_data = batch.copy()
-                new_data.rename(columns={"wallet_address": "walletAddress"}, inplace=True)
+            # The Athena result chunks are read while the previous batches are written, and the collection metadata
+            # only moves once every batch was acknowledged by the features db (the sync raises otherwise).
+            with self.memory_governor.stage("features_db_sync"):
+                sync_stats = FeaturesDbSync(
+                    write_batch=self.write_features_db_batch,
+                    max_writers=settings.FEATURES_DB_MAX_WRITERS,
+                    max_queued_batches=settings.FEATURES_DB_MAX_QUEUED_BATCHES,
+                    logger_name="Ethereum - Features DB Sync Logger",
+                ).run(
+                    self.iterate_over_features_db_batches(
+                        sql_template=sql_template,
+                        last_timestamp_inserted_features_db=last_timestamp_inserted_features_db,
+                        field=field,
+                    )
+                )
 
-                if self.table_name == "ethereum_wallet_features":
+            if self.table_name == "ethereum_wallet_features":
+                self.logger.info(
+                    f"Features db documents - Acknowledged: {sync_stats['acknowledged']} - Unchanged (skipped): "
+                    f"{self.features_db_changes['unchanged']} - Written whole: {self.features_db_changes['whole']}"
+                )
 
-                    new_data["contracts_aggregations"] = new_data["contracts_aggregations"].apply(
-                        convert_string_to_dict
-                    )
-                    new_data.rename(columns={"contracts_aggregations": "contracts"}, inplace=True)
-
-                if new_last_timestamp_inserted_features_db < new_data[field].max():
-                    new_last_timestamp_inserted_features_db = new_data[field].max()
-
-                chunks = np.array_split(new_data, cpu_count())
-
-                with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-                    executor.map(
-                        self.features_db_connection.update_documents,
-                        [
-                            {
-                                "db_name": "features_db",
-                                "collection_name": self.table_name.replace("ethereum_", "")
-                                if self.table_name.startswith("ethereum_")
-                                else self.table_name,
-                                "key_to_match": "walletAddress",
-                                "update_collection": chunk.to_dict("records"),
-                                "upsert": True,
-                            }
-                            for chunk in chunks
-                        ],
-                    )
+            if sync_stats["last_timestamp"] is None:
+                self.logger.info(f"No document to write into the features db - Table: {self.table_name}")
+                return
 
             # Update the last timestamp inserted in the features db after the data ingestion in the collection metadata
             # This collection metadata is used to get the last timestamp inserted in the features db instead execute the MongoDB aggregation pipeline every time
             collections_metadata = [
-                {
-                    "collectionName": self.table_name.replace("ethereum_", "")
-                    if self.table_name.startswith("ethereum_")
-                    else self.table_name,
-                    field: int(new_last_timestamp_inserted_features_db),
-                },
+                {"collectionName": self.features_db_collection_name, field: int(sync_stats["last_timestamp"])},
             ]
 
             self.features_db_connection.update_documents(
@@ -1,8 +1,8 @@
 -- full load
-CREATE TABLE target_database.table_name WITH (
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
     format = 'parquet',
     write_compression = 'SNAPPY',
-    location = 's3://bucket_name/layer/data_source/table_name/',
+    location = 's3://{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
     table_type = 'ICEBERG',
     is_external = false,
     partitioning = ARRAY['address_partition']
@@ -42,7 +42,7 @@ WITH coin_balances as (
         current_timestamp(6) as inserted_at,
         current_timestamp(6) as updated_at,
         address_partition
-    FROM source_database.ethereum_wallet_transactions AS wt
+    FROM {{source_database}}.ethereum_wallet_transactions AS wt
     WHERE wt.address_partition = '0000' --and date_partition between '2015-01' and '2023-12' and contract_address = 'ETH' and wallet_address = '0x0000000000a0aa7908bda39fbb8f95e5a0a6ee42'
 ),
 coin_balances_with_min_max as (
@@ -123,12 +123,12 @@ INNER JOIN latest_transactions AS lt
     AND cb.transaction_index = lt.max_transaction_index
 
 -- incremental load
-MERGE INTO target_database.table_name
+MERGE INTO {{target_database}}.{{table_name}}
 USING (
     WITH last_transaction_timestamp_inserted as (
         SELECT
             MAX(last_transaction_timestamp) AS last_transaction_timestamp
-        FROM target_database.table_name
+        FROM {{target_database}}.{{table_name}}
     ),
     coin_balances as (
         SELECT
@@ -165,10 +165,10 @@ USING (
             current_timestamp(6) as inserted_at,
             current_timestamp(6) as updated_at,
             address_partition
-        FROM source_database.ethereum_wallet_transactions AS wt
+        FROM {{source_database}}.ethereum_wallet_transactions AS wt
         CROSS JOIN last_transaction_timestamp_inserted l
         WHERE wt.timestamp > l.last_transaction_timestamp
-            AND wt.address_partition in filter_value
+            AND wt.address_partition in {{filter_value:tuple}}
         ),
     coin_balances_with_min_max as (
         SELECT
@@ -252,7 +252,7 @@ USING (
             lcb.wallet_address,
             lcb.contract_address,
             MAX(lcb.last_transaction_timestamp) OVER (PARTITION BY lcb.contract_address) AS last_transaction_timestamp
-        FROM target_database.ethereum_wallet_coin_balances AS lcb
+        FROM {{target_database}}.ethereum_wallet_coin_balances AS lcb
         WHERE EXISTS (SELECT 1 FROM new_coin_balances as tb where tb.wallet_address = lcb.wallet_address)
     ),
     merged_coin_balances as (
@@ -280,7 +280,7 @@ USING (
             ncb.last_transaction_timestamp AS last_transaction_timestamp,
             ncb.address_partition
         FROM new_coin_balances as ncb
-        LEFT JOIN target_database.ethereum_wallet_coin_balances AS lcb -- last coin balances
+        LEFT JOIN {{target_database}}.ethereum_wallet_coin_balances AS lcb -- last coin balances
             ON ncb.wallet_address = lcb.wallet_address
             AND ncb.contract_address = lcb.contract_address
             AND ncb.address_partition = lcb.address_partition
@@ -45,13 +45,13 @@ WITH ranked_wallet_transactions as (
     DENSE_RANK() OVER (PARTITION BY wt.wallet_address, wt.address_partition, wt.hash ORDER BY wt.priority asc) as hash_rank
     FROM db_analytics_prod.ethereum_wallet_transactions AS wt
     INNER JOIN (
-        SELECT contract_address as contract_address_metadata FROM db_stage_prod.ethereum_tokens_metadata where decimals > 0
+        SELECT contract_address as contract_address_metadata FROM db_stage_prod.ethereum_tokens_dimension where decimals > 0
         UNION ALL
         -- This query is needed because we don't have the ETH contract on tokens_metadata table
         SELECT 'ETH' as contract_address_metadata) as tm
         ON tm.contract_address_metadata = wt.contract_address
-    where wt.timestamp > filter_value
-    and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME(filter_value), '%Y-%m')
+    where wt.timestamp > {{filter_value}}
+    and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME({{filter_value}}), '%Y-%m')
 ),
 
 daily_token_prices AS (
@@ -364,19 +364,19 @@ USING (
         DENSE_RANK() OVER (PARTITION BY wt.wallet_address, wt.address_partition, wt.hash ORDER BY wt.priority asc) as hash_rank
         FROM db_analytics_prod.ethereum_wallet_transactions AS wt
         INNER JOIN (
-            SELECT contract_address as contract_address_metadata FROM db_stage_prod.ethereum_tokens_metadata where decimals > 0
+            SELECT contract_address as contract_address_metadata FROM db_stage_prod.ethereum_tokens_dimension where decimals > 0
             UNION ALL
             -- This query is needed because we don't have the ETH contract on tokens_metadata table
             SELECT 'ETH' as contract_address_metadata
         ) as tm ON tm.contract_address_metadata = wt.contract_address
-            where wt.timestamp > filter_value
-            and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME(filter_value), '%Y-%m')
-            and wt.address_partition in chunk
+            where wt.timestamp > {{filter_value}}
+            and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME({{filter_value}}), '%Y-%m')
+            and wt.address_partition in {{chunk}}
             and wt.wallet_address in (select distinct wallet_address
                 from db_analytics_prod.ethereum_wallet_transactions as wt
-                where wt.timestamp > filter_value
-                and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME(filter_value), '%Y-%m')
-                and wt.address_partition in chunk
+                where wt.timestamp > {{filter_value}}
+                and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME({{filter_value}}), '%Y-%m')
+                and wt.address_partition in {{chunk}}
             )
             and wt.wallet_address not in (
                 '0xea674fdde714fd979de3edf0f56aa9716b898ec8', -- wallet with more than 20M of transactions
@@ -429,7 +429,7 @@ USING (
             FROM db_analytics_prod.ethereum_wallet_features as lcb
             CROSS JOIN UNNEST(contracts_aggregations) AS p (column, value)
             WHERE EXISTS (SELECT 1 FROM ranked_wallet_transactions as tb where tb.wallet_address = lcb.wallet_address and tb.address_partition = lcb.address_partition)
-            AND lcb.address_partition in chunk
+            AND lcb.address_partition in {{chunk}}
             --and lcb.wallet_address in (select wallet_address from db_sandbox_prod.test_set_wallet_addresses) -- only wallets from test se
         ) t
     ), --select * from last_coin_balances_and_wallet_balances
@@ -755,7 +755,7 @@ USING (
             --cb.total_time_in_ever_eth
     )
 
-    select * from wallet_balances where address_partition in chunk
+    select * from wallet_balances where address_partition in {{chunk}}
     ) wallet_features_updated
 ON wallet_features_updated.wallet_address = ethereum_wallet_features.wallet_address
 WHEN MATCHED THEN
@@ -18,6 +18,24 @@ SELECT
   misc_total_fees_eth,
   misc_avg_total_fees_eth,
   number_of_contracts,
-  contracts_aggregations
+  -- contracts_aggregations is returned as two arrays decoded for the whole batch at once: the contract addresses, and
+  -- the details of every contract flattened in the order of WALLET_CONTRACT_METRICS (features pipeline)
+  map_keys(contracts_aggregations) AS contract_addresses,
+  flatten(transform(map_values(contracts_aggregations), contract_details -> ARRAY[
+      element_at(contract_details, 'total_balance'),
+      element_at(contract_details, 'total_balance_in_eth'),
+      element_at(contract_details, 'total_auc'),
+      element_at(contract_details, 'total_time_in_ever'),
+      element_at(contract_details, 'min_eth_balance_in_ever'),
+      element_at(contract_details, 'max_eth_balance_in_ever'),
+      element_at(contract_details, 'total_incoming_value_in_eth'),
+      element_at(contract_details, 'total_outgoing_value_in_eth'),
+      element_at(contract_details, 'total_tx_fee'),
+      element_at(contract_details, 'incoming_transactions_count'),
+      element_at(contract_details, 'outgoing_transactions_count'),
+      element_at(contract_details, 'transactions_count'),
+      element_at(contract_details, 'first_transaction_timestamp'),
+      element_at(contract_details, 'last_transaction_timestamp')
+  ])) AS contract_metrics
 FROM db_analytics_prod.ethereum_wallet_features
-    WHERE wallet_last_tx > last_inserted_timestamp
+    WHERE wallet_last_tx > {{last_inserted_timestamp}}
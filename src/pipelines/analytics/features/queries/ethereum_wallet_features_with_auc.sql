@@ -42,8 +42,8 @@ WITH ranked_wallet_transactions as (
     END AS transaction_index_by_transaction_type,
     DENSE_RANK() OVER (PARTITION BY wt.wallet_address, wt.address_partition, wt.hash ORDER BY wt.priority asc) as hash_rank
     FROM db_analytics_prod.ethereum_wallet_transactions AS wt
-        where wt.timestamp > filter_value
-        and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME(filter_value), '%Y-%m')
+        where wt.timestamp > {{filter_value}}
+        and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME({{filter_value}}), '%Y-%m')
 ),
 
 daily_token_prices AS (
@@ -406,9 +406,9 @@ USING (
         END AS transaction_index_by_transaction_type,
         DENSE_RANK() OVER (PARTITION BY wt.wallet_address, wt.address_partition, wt.hash ORDER BY wt.priority asc) as hash_rank
         FROM db_analytics_prod.ethereum_wallet_transactions AS wt
-            where wt.timestamp > filter_value
-            and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME(filter_value), '%Y-%m')
-            and address_partition in chunk
+            where wt.timestamp > {{filter_value}}
+            and wt.date_partition >= DATE_FORMAT(FROM_UNIXTIME({{filter_value}}), '%Y-%m')
+            and address_partition in {{chunk}}
             --and wt.wallet_address in (select wallet_address from db_sandbox_prod.test_set_wallet_addresses) -- only wallets from test se
     ), --select * from ranked_wallet_transactions
 
@@ -891,7 +891,7 @@ USING (
             cb.address_partition
     )
 
-    select * from wallet_balances where address_partition in chunk
+    select * from wallet_balances where address_partition in {{chunk}}
     ) wallet_features_updated
 ON wallet_features_updated.wallet_address = ethereum_wallet_features.wallet_address
 WHEN MATCHED THEN
@@ -1,10 +1,10 @@
 -- full load
-CREATE TABLE target_database.table_name WITH (
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
 	format = 'PARQUET',
 	write_compression = 'SNAPPY',
     optimize_rewrite_delete_file_threshold = 10,
     vacuum_max_snapshot_age_seconds = 259200,
-	location = 's3://bucket_name/layer/data_source/table_name/',
+	location = 's3://{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
     table_type = 'ICEBERG',
     is_external = FALSE
 ) AS
@@ -15,9 +15,9 @@ WITH rugpull_transactions AS ( -- Fetches all transactions related to rugpulls
         wt.current_value,
         wt.contract_address,
         wt.address_role
-    FROM target_database.ethereum_wallet_transactions as wt
+    FROM {{target_database}}.ethereum_wallet_transactions as wt
     INNER JOIN (
-        SELECT contract_address FROM db_stage_prod.ethereum_tokens_metadata where decimals > 0
+        SELECT contract_address FROM db_stage_prod.ethereum_tokens_dimension where decimals > 0
         UNION ALL
         -- This query is needed because we don't have the ETH contract on tokens_metadata table
         SELECT 'ETH' as contract_address) as tm
@@ -32,7 +32,7 @@ daily_token_prices AS (
         tp.address,
         tp.price,
         tp.timestamp
-    FROM target_database.features_daily_token_prices as tp
+    FROM {{target_database}}.features_daily_token_prices as tp
     INNER JOIN rugpull_transactions as rt
         ON tp.address = rt.contract_address
         AND date(from_unixtime(tp.timestamp)) <= date(from_unixtime(rt.timestamp))
@@ -81,11 +81,11 @@ SELECT
 FROM rugpull_features;
 
 -- incremental load
-MERGE INTO target_database.rugpull_features
+MERGE INTO {{target_database}}.rugpull_features
 USING (
     WITH existing_lastest_interaction_timestamp AS (
         SELECT max(last_interaction_timestamp) as lastest_interaction_timestamp
-        FROM target_database.rugpull_features
+        FROM {{target_database}}.rugpull_features
     ), -- Fetches the latest block number from the existing table to be the lower limit of the new data
     new_rugpull_transactions AS ( -- Fetches new transactions related to rugpulls
         SELECT
@@ -95,7 +95,7 @@ USING (
             contract_address,
             address_role
         FROM
-            target_database.ethereum_wallet_transactions,
+            {{target_database}}.ethereum_wallet_transactions,
             existing_lastest_interaction_timestamp
         WHERE
             date_partition >= date_format(from_unixtime(lastest_interaction_timestamp), '%Y-%m')
@@ -109,7 +109,7 @@ USING (
         tp.address,
         tp.price,
         tp.timestamp
-    FROM target_database.features_daily_token_prices as tp
+    FROM {{target_database}}.features_daily_token_prices as tp
     INNER JOIN new_rugpull_transactions as rt
         ON tp.address = rt.contract_address
         AND date(from_unixtime(tp.timestamp)) <= date(from_unixtime(rt.timestamp))
@@ -145,7 +145,7 @@ USING (
             AND rp.rt_timestamp = r.timestamp
             AND rp.rank = 1
         INNER JOIN (
-            SELECT contract_address FROM db_stage_prod.ethereum_tokens_metadata where decimals > 0
+            SELECT contract_address FROM db_stage_prod.ethereum_tokens_dimension where decimals > 0
             UNION ALL
             -- This query is needed because we don't have the ETH contract on tokens_metadata table
             SELECT 'ETH' as contract_address) as tm
@@ -162,7 +162,7 @@ USING (
             COALESCE(rf.first_interaction_timestamp, dtm.first_interaction_timestamp) as first_interaction_timestamp
         FROM
             new_data dtm
-            LEFT JOIN target_database.rugpull_features rf on dtm.wallet_address = rf.wallet_address
+            LEFT JOIN {{target_database}}.rugpull_features rf on dtm.wallet_address = rf.wallet_address
     )
     SELECT
         wallet_address,
@@ -8,4 +8,4 @@ SELECT
     first_interaction_timestamp
 FROM
     db_analytics_prod.rugpull_features
-    WHERE last_interaction_timestamp > last_inserted_timestamp
+    WHERE last_interaction_timestamp > {{last_inserted_timestamp}}
@@ -1,32 +1,19 @@
 -- full load
-CREATE table target_database.table_name WITH (
+CREATE table {{target_database}}.{{table_name}} WITH (
 	format = 'PARQUET',
 	parquet_compression = 'SNAPPY',
 	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+	external_location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/'
 ) AS
 WITH tokens_metadata AS (
     SELECT
         contract_address,
         decimals,
         symbol,
-        type,
+        standard as type,
         hash_partition
-    FROM (
-        SELECT
-            contract_address,
-            decimals,
-            symbol,
-            standard as type,
-            hash_partition,
-            ROW_NUMBER() OVER (
-                PARTITION BY contract_address
-                ORDER BY last_refreshed DESC
-            ) AS rn
-        FROM source_database.ethereum_tokens_metadata
-            WHERE standard = 'ERC-20'
-    )
-    WHERE rn = 1
+    FROM {{source_database}}.ethereum_tokens_dimension
+        WHERE standard = 'ERC-20'
 ),
 erc20_transactions_source AS (
     SELECT DISTINCT
@@ -45,16 +32,16 @@ erc20_transactions_source AS (
         END AS is_error,
         tf.date_partition
     FROM
-        source_database.ethereum_token_transfers AS tf
-        INNER JOIN source_database.ethereum_traces tc ON
+        {{source_database}}.ethereum_token_transfers AS tf
+        INNER JOIN {{source_database}}.ethereum_traces tc ON
             tc.transaction_hash = tf.transaction_hash
             AND tc.block_number = tf.block_number
             AND tc.date_partition = tf.date_partition
-        INNER JOIN source_database.ethereum_transactions ts ON
+        INNER JOIN {{source_database}}.ethereum_transactions ts ON
             ts.hash = tf.transaction_hash
             AND ts.block_number = tf.block_number
             AND ts.date_partition = tf.date_partition
-        WHERE tf.block_number >= filter_value
+        WHERE tf.block_number >= {{filter_value}}
         AND tc.status = 1
         AND tf.value > 0
 ),
@@ -90,10 +77,10 @@ erc20_transactions_final AS (
         INNER join tokens_metadata as tk
             ON tk.contract_address = t.token_address
             AND tk.hash_partition = SUBSTR(t.token_address, 3, 2)
-    	LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+    	LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-    	LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to addresses is a contract
+    	LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to addresses is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
         LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -115,29 +102,16 @@ erc20_transactions_final AS (
 select CAST(uuid() AS varchar) AS uuid, * from erc20_transactions_final
 
 -- incremental load
-INSERT INTO target_database.table_name
+INSERT INTO {{target_database}}.{{table_name}}
 WITH tokens_metadata AS (
     SELECT
         contract_address,
         decimals,
         symbol,
-        type,
+        standard as type,
         hash_partition
-    FROM (
-        SELECT
-            contract_address,
-            decimals,
-            symbol,
-            standard as type,
-            hash_partition,
-            ROW_NUMBER() OVER (
-                PARTITION BY contract_address
-                ORDER BY last_refreshed DESC
-            ) AS rn
-        FROM source_database.ethereum_tokens_metadata
-            WHERE standard = 'ERC-20'
-    )
-    WHERE rn = 1
+    FROM {{source_database}}.ethereum_tokens_dimension
+        WHERE standard = 'ERC-20'
 ),
 erc20_transactions_source AS (
     SELECT DISTINCT
@@ -155,16 +129,16 @@ erc20_transactions_source AS (
         END AS is_error,
         tf.date_partition
     FROM
-        source_database.ethereum_token_transfers AS tf
-        INNER JOIN source_database.ethereum_traces tc ON
+        {{source_database}}.ethereum_token_transfers AS tf
+        INNER JOIN {{source_database}}.ethereum_traces tc ON
             tc.transaction_hash = tf.transaction_hash
             AND tc.block_number = tf.block_number
             AND tc.date_partition = tf.date_partition
-        INNER JOIN source_database.ethereum_transactions ts ON
+        INNER JOIN {{source_database}}.ethereum_transactions ts ON
             ts.hash = tf.transaction_hash
             AND ts.block_number = tf.block_number
             AND ts.date_partition = tf.date_partition
-        WHERE tf.block_number >= filter_value
+        WHERE tf.block_number >= {{filter_value}}
         AND tc.status = 1
         AND tf.value > 0
 ),
@@ -200,10 +174,10 @@ erc20_transactions_final AS (
         INNER join tokens_metadata as tk
             ON tk.contract_address = t.token_address
             AND tk.hash_partition = SUBSTR(t.token_address, 3, 2)
-    	LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+    	LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-    	LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to addresses is a contract
+    	LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to addresses is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
         LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -224,7 +198,7 @@ erc20_transactions_final AS (
 
 select CAST(uuid() AS varchar) AS uuid, * from erc20_transactions_final AS source
 	WHERE NOT EXISTS (
-		SELECT 1 FROM target_database.table_name as target
+		SELECT 1 FROM {{target_database}}.{{table_name}} as target
 		WHERE target.hash = source.hash
 		AND target.block_number = source.block_number
 		AND target.from_address = source.from_address
@@ -1,9 +1,9 @@
 -- full load
-CREATE TABLE target_database.table_name WITH (
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
 	format = 'PARQUET',
 	parquet_compression = 'SNAPPY',
 	partitioned_by = ARRAY['date_partition'],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+	external_location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/'
 ) AS
 WITH internal_transactions_source AS (
 	SELECT DISTINCT
@@ -27,10 +27,10 @@ WITH internal_transactions_source AS (
             ELSE true
         END AS is_error,
 		t.date_partition
-	FROM source_database.ethereum_traces AS t -- internal
-	LEFT JOIN source_database.ethereum_transactions AS nt --normal
+	FROM {{source_database}}.ethereum_traces AS t -- internal
+	LEFT JOIN {{source_database}}.ethereum_transactions AS nt --normal
 		ON nt.hash = t.transaction_hash AND nt.date_partition = t.date_partition and nt.block_number = t.block_number
-	WHERE t.block_number >= filter_value
+	WHERE t.block_number >= {{filter_value}}
 		AND t.value > 0 -- only transactions where the value is gt 0.
 		AND (t.call_type NOT IN ('delegatecall', 'staticcall', 'callcode') OR t.call_type is null)
 		AND NOT (t.from_address = nt.from_address AND t.to_address = nt.to_address AND t.value = nt.value) -- where these conditions are true, it means that the internal transaction is the same as the normal transaction, so we need to filter
@@ -57,7 +57,7 @@ rewards_transactions as (
 		END AS is_error,
 		t.date_partition
 	FROM db_stage_prod.ethereum_traces AS t -- internal
-    WHERE t.block_number >= filter_value
+    WHERE t.block_number >= {{filter_value}}
 		AND (t.call_type NOT IN ('delegatecall', 'staticcall', 'callcode') OR t.call_type is null)
     	AND t.trace_type = 'reward'
 ),
@@ -102,10 +102,10 @@ internal_transactions_final AS (
         substr(t.to_address, 3, 2) as to_hash_partition,
         t.date_partition
 	FROM internal_and_rewards_transactions AS t
-		LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+		LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-		LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to address is a contract
+		LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to address is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
 		LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -127,7 +127,7 @@ internal_transactions_final AS (
 SELECT CAST(uuid() AS varchar) AS uuid, * FROM internal_transactions_final;
 
 -- incremental load
-INSERT INTO target_database.table_name
+INSERT INTO {{target_database}}.{{table_name}}
 WITH internal_transactions_source AS (
 	SELECT DISTINCT
 		t.block_number,
@@ -149,10 +149,10 @@ WITH internal_transactions_source AS (
 			WHEN t.status = 1 THEN false ELSE true
 		END AS is_error,
 		t.date_partition
-	FROM source_database.ethereum_traces AS t -- internal
-	LEFT JOIN source_database.ethereum_transactions AS nt --normal
+	FROM {{source_database}}.ethereum_traces AS t -- internal
+	LEFT JOIN {{source_database}}.ethereum_transactions AS nt --normal
 		ON nt.hash = t.transaction_hash AND nt.date_partition = t.date_partition and nt.block_number = t.block_number
-	WHERE t.block_number >= filter_value
+	WHERE t.block_number >= {{filter_value}}
 		AND t.value > 0 -- only transactions where the value is gt 0.
 		AND (t.call_type NOT IN ('delegatecall', 'staticcall', 'callcode') OR t.call_type is null)
 		AND NOT (t.from_address = nt.from_address AND t.to_address = nt.to_address AND t.value = nt.value) -- where these conditions are true, it means that the internal transaction is the same as the normal transaction, so we need to filter
@@ -179,7 +179,7 @@ rewards_transactions as (
 		END AS is_error,
 		t.date_partition
 	FROM db_stage_prod.ethereum_traces AS t -- internal
-    WHERE t.block_number >= filter_value
+    WHERE t.block_number >= {{filter_value}}
 		AND (t.call_type NOT IN ('delegatecall', 'staticcall', 'callcode') OR t.call_type is null)
     	AND t.trace_type = 'reward'
 ),
@@ -224,10 +224,10 @@ internal_transactions_final AS (
         substr(t.to_address, 3, 2) as to_hash_partition,
         t.date_partition
 	FROM internal_and_rewards_transactions AS t
-		LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+		LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-		LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to address is a contract
+		LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to address is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
 		LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -250,7 +250,7 @@ SELECT CAST(uuid() AS varchar) AS uuid, *
 FROM internal_transactions_final AS source
 WHERE NOT EXISTS (
 	SELECT 1
-	FROM target_database.table_name AS target
+	FROM {{target_database}}.{{table_name}} AS target
 	WHERE target.hash = source.hash
 	AND target.block_number = source.block_number
 	AND target.trace_id = source.trace_id
@@ -1,9 +1,9 @@
 -- full load
-CREATE table target_database.table_name WITH (
+CREATE table {{target_database}}.{{table_name}} WITH (
 	format = 'PARQUET',
 	parquet_compression = 'SNAPPY',
 	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+	external_location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/'
 ) AS
 WITH normal_transactions_source AS (
     SELECT DISTINCT
@@ -30,15 +30,15 @@ WITH normal_transactions_source AS (
         18 AS token_decimal,
         ts.receipt_gas_used AS gas_used,
         ts.date_partition
-    FROM source_database.ethereum_transactions ts
-    INNER JOIN source_database.ethereum_blocks as b ON b.number = ts.block_number
+    FROM {{source_database}}.ethereum_transactions ts
+    INNER JOIN {{source_database}}.ethereum_blocks as b ON b.number = ts.block_number
         AND b.date_partition = ts.date_partition
-    LEFT JOIN source_database.ethereum_traces tc ON tc.transaction_hash = ts.hash
+    LEFT JOIN {{source_database}}.ethereum_traces tc ON tc.transaction_hash = ts.hash
         AND tc.block_number = ts.block_number
         AND tc.date_partition = ts.date_partition
         AND tc.from_address = ts.from_address
         AND tc.to_address = ts.to_address
-    WHERE ts.block_number >= filter_value
+    WHERE ts.block_number >= {{filter_value}}
 ),
 normal_transactions_final AS (
     SELECT DISTINCT
@@ -82,10 +82,10 @@ normal_transactions_final AS (
         SUBSTR(t.to_address, 3, 2) AS to_hash_partition,
         t.date_partition
     FROM normal_transactions_source AS t
-        LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+        LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-        LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to address is a contract
+        LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to address is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
         LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -107,7 +107,7 @@ normal_transactions_final AS (
 SELECT CAST(uuid() AS varchar) AS uuid, * FROM normal_transactions_final;
 
 -- incremental load
-INSERT INTO target_database.table_name
+INSERT INTO {{target_database}}.{{table_name}}
 WITH normal_transactions_source AS (
     SELECT DISTINCT
         ts.block_number,
@@ -133,15 +133,15 @@ WITH normal_transactions_source AS (
         18 AS token_decimal,
         ts.receipt_gas_used AS gas_used,
         ts.date_partition
-    FROM source_database.ethereum_transactions ts
-    INNER JOIN source_database.ethereum_blocks as b ON b.number = ts.block_number
+    FROM {{source_database}}.ethereum_transactions ts
+    INNER JOIN {{source_database}}.ethereum_blocks as b ON b.number = ts.block_number
         AND b.date_partition = ts.date_partition
-    LEFT JOIN source_database.ethereum_traces tc ON tc.transaction_hash = ts.hash
+    LEFT JOIN {{source_database}}.ethereum_traces tc ON tc.transaction_hash = ts.hash
         AND tc.block_number = ts.block_number
         AND tc.date_partition = ts.date_partition
         AND tc.from_address = ts.from_address
         AND tc.to_address = ts.to_address
-    WHERE ts.block_number >= filter_value
+    WHERE ts.block_number >= {{filter_value}}
 ),
 normal_transactions_final AS (
     SELECT DISTINCT
@@ -185,10 +185,10 @@ normal_transactions_final AS (
         SUBSTR(t.to_address, 3, 2) AS to_hash_partition,
         t.date_partition
     FROM normal_transactions_source AS t
-        LEFT JOIN source_database.ethereum_contracts AS c_1 -- when the from address is a contract
+        LEFT JOIN {{source_database}}.ethereum_contracts AS c_1 -- when the from address is a contract
             ON c_1.address = t.from_address
             AND c_1.hash_partition = SUBSTR(t.from_address, 3, 2)
-        LEFT JOIN source_database.ethereum_contracts AS c_2 -- when the to address is a contract
+        LEFT JOIN {{source_database}}.ethereum_contracts AS c_2 -- when the to address is a contract
             ON c_2.address = t.to_address
             AND c_2.hash_partition = SUBSTR(t.to_address, 3, 2)
         LEFT JOIN db_analytics_prod.rugpull_market_data AS r_1 -- when it is a rugpull
@@ -211,7 +211,7 @@ SELECT CAST(uuid() AS varchar) AS uuid, *
 FROM normal_transactions_final as source
 	WHERE NOT EXISTS (
 		SELECT 1
-		FROM target_database.table_name as target
+		FROM {{target_database}}.{{table_name}} as target
 		WHERE target.hash = source.hash
 		AND target.block_number = source.block_number
 		AND target.from_address = source.from_address
@@ -1,6 +1,6 @@
 -- full load is executed using EMR with Pyspark scritp: src/utils/processing_wallet_transactions_pyspark.py
 -- incremental load
-INSERT INTO target_database.table_name
+INSERT INTO {{target_database}}.{{table_name}}
 WITH wallet_transactions_source AS (
     -- erc20
     SELECT
@@ -25,8 +25,8 @@ WITH wallet_transactions_source AS (
         t.from_hash_partition,
         t.to_hash_partition,
         t.date_partition
-    FROM source_database.ethereum_erc20_transactions t
-    WHERE t.block_number >= filter_value
+    FROM {{source_database}}.ethereum_erc20_transactions t
+    WHERE t.block_number >= {{filter_value}}
         AND NOT (t.from_is_contract = true AND t.to_is_contract = true)
     UNION ALL
     -- normal
@@ -52,8 +52,8 @@ WITH wallet_transactions_source AS (
         t.from_hash_partition,
         t.to_hash_partition,
         t.date_partition
-    FROM source_database.ethereum_normal_transactions t
-    WHERE t.block_number >= filter_value
+    FROM {{source_database}}.ethereum_normal_transactions t
+    WHERE t.block_number >= {{filter_value}}
         AND NOT (t.from_is_contract = true AND t.to_is_contract = true)
     UNION ALL
     -- internal
@@ -79,8 +79,8 @@ WITH wallet_transactions_source AS (
         t.from_hash_partition,
         t.to_hash_partition,
         t.date_partition
-    FROM source_database.ethereum_internal_transactions t
-    WHERE t.block_number >= filter_value
+    FROM {{source_database}}.ethereum_internal_transactions t
+    WHERE t.block_number >= {{filter_value}}
         AND NOT (t.from_is_contract = true AND t.to_is_contract = true)
 ),
 wallet_transactions_sender AS (
@@ -147,8 +147,8 @@ wallet_transactions_final as (
 )
 SELECT * FROM wallet_transactions_final as source
 WHERE NOT EXISTS (
-    SELECT 1 FROM target_database.table_name as target
-    WHERE target.block_number >= filter_value
+    SELECT 1 FROM {{target_database}}.{{table_name}} as target
+    WHERE target.block_number >= {{filter_value}}
     AND target.hash = source.hash
     AND target.timestamp = source.timestamp
     AND target.block_number = source.block_number
@@ -159,4 +159,4 @@ WHERE NOT EXISTS (
     AND target.transaction_type = source.transaction_type
     AND target.current_value = source.current_value
 )
-AND source.address_partition IN chunk -- filter by tuple of address partitions
+AND source.address_partition IN {{chunk}} -- filter by tuple of address partitions
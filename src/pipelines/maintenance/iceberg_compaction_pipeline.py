@@ -0,0 +1,140 @@
+import time
+
+from config import settings
+from spectral_data_lib.log_manager import Logger
+from spectral_data_lib.config import settings as sdl_settings
+from src.helpers.athena import optimize_iceberg_table, vacuum_iceberg_table
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.iceberg_metadata import read_file_stats, select_partitions_to_compact
+from src.pipelines.stage.stage_data_ingestion_pipeline import (
+    STAGE_TABLES_DEPENDENCIES,
+    UNPARTITIONED_TABLES_WATERMARK_COLUMN,
+)
+
+# Iceberg tables compacted by --table-name all, with the data lake layer of their database and their partition column
+ICEBERG_COMPACTION_TABLES = {
+    "ethereum_wallet_features": ("analytics", "address_partition"),
+    "rugpull_features": ("analytics", None),
+    **{
+        table_name: ("stage", None if table_name in UNPARTITIONED_TABLES_WATERMARK_COLUMN else "date_partition")
+        for table_name in STAGE_TABLES_DEPENDENCIES
+    },
+}
+
+
+class IcebergCompactionPipeline(object):
+    """Class to compact the fragmented partitions of an Iceberg table, out of the loading pipelines.
+
+    The number of small data files and delete files of each partition is read from the table metadata, and only the
+    partitions over the thresholds are rewritten (OPTIMIZE ... BIN_PACK), the most fragmented first, until the time
+    budget is spent. The partitions left are compacted by the next run.
+    """
+
+    def __init__(self, table_name: str, deadline: float = None) -> None:
+        """Constructor for the class
+
+        Args:
+            table_name (str): Table name
+            deadline (float): time.monotonic() after which no partition is compacted anymore, defaults to the
+                compaction time budget from now
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=f"Ethereum - Iceberg Compaction Pipeline Logger")
+        self.table_name = table_name
+        data_lake_layer, self.partition_column = ICEBERG_COMPACTION_TABLES[table_name]
+        self.target_data_lake_database = (
+            sdl_settings.DATA_LAKE_STAGE_DATABASE
+            if data_lake_layer == "stage"
+            else sdl_settings.DATA_LAKE_ANALYTICS_DATABASE
+        )
+        self.small_file_bytes = settings.ICEBERG_COMPACTION_SMALL_FILE_MB * 1024 * 1024
+        self.min_small_files = settings.ICEBERG_COMPACTION_MIN_SMALL_FILES
+        self.max_delete_file_ratio = settings.ICEBERG_COMPACTION_MAX_DELETE_FILE_RATIO
+        self.deadline = deadline or time.monotonic() + settings.ICEBERG_COMPACTION_TIME_BUDGET_MINUTES * 60
+
+    def run(self) -> None:
+        """Implements the `Iceberg Compaction` pipeline
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        if not get_execution_backend().is_iceberg_table(database=self.target_data_lake_database, table=self.table_name):
+            self.logger.info(f"Table {self.table_name} is not an Iceberg table - Compaction skipped.")
+            return
+
+        file_stats = read_file_stats(
+            database=self.target_data_lake_database,
+            table_name=self.table_name,
+            small_file_bytes=self.small_file_bytes,
+            partition_column=self.partition_column,
+            tags={"pipeline": "iceberg_compaction", "table": self.table_name},
+        )
+        partitions_to_compact = select_partitions_to_compact(
+            file_stats=file_stats,
+            min_small_files=self.min_small_files,
+            max_delete_file_ratio=self.max_delete_file_ratio,
+        )
+
+        self.logger.info(
+            f"Table {self.table_name} - {len(partitions_to_compact)} of {len(file_stats)} partitions to compact"
+        )
+
+        compacted_partitions = 0
+
+        for partition in partitions_to_compact.itertuples():
+
+            if time.monotonic() >= self.deadline:
+                self.logger.info(
+                    f"Compaction time budget spent - {len(partitions_to_compact) - compacted_partitions} partitions of "
+                    f"{self.table_name} left for the next run."
+                )
+                break
+
+            self.logger.info(
+                f"Compacting {self.table_name} partition {partition.partition_value} - Small files: "
+                f"{partition.small_files} - Delete files: {partition.delete_files} of {partition.data_files} data files"
+            )
+            optimize_iceberg_table(
+                target_database=self.target_data_lake_database,
+                table_name=self.table_name,
+                chunk=(partition.partition_value,) if self.partition_column else None,
+                partition_column=self.partition_column,
+            )
+            compacted_partitions += 1
+
+        if compacted_partitions:
+            vacuum_iceberg_table(target_database=self.target_data_lake_database, table_name=self.table_name)
+            self.logger.info(f"Table {self.table_name} - {compacted_partitions} partitions compacted.")
+
+
+def run_all_tables() -> None:
+    """Function to compact every Iceberg table, one after the other, within a single time budget.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+
+    deadline = time.monotonic() + settings.ICEBERG_COMPACTION_TIME_BUDGET_MINUTES * 60
+    failed_tables = []
+
+    for table_name in ICEBERG_COMPACTION_TABLES:
+
+        try:
+            IcebergCompactionPipeline(table_name=table_name, deadline=deadline).run()
+        except Exception as e:
+            Logger(logger_name=f"Ethereum - Iceberg Compaction Pipeline Logger").error(
+                f"Table {table_name} not compacted: {e}"
+            )
+            failed_tables.append(table_name)
+
+    if failed_tables:
+        raise Exception(f"Tables not compacted: {failed_tables}")
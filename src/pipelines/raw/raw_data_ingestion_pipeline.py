@@ -1,25 +1,65 @@
 import os
 from typing import List
 import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 from decimal import Decimal
 import pyarrow as pa
 
 from web3 import Web3
+from config import settings
 from spectral_data_lib.helpers.get_secrets import get_secret
 from spectral_data_lib.config import settings as sdl_settings
 from spectral_data_lib.data_lakehouse import DataLakehouse
 from spectral_data_lib.log_manager import Logger
 
 from src.helpers.data_transformations import add_partition_column, convert_timestamp_to_datetime
-from src.helpers.get_token_metadata_transpose import TranposeTokenMetadata
+from src.helpers.get_token_metadata_transpose import TranposeTokenMetadata, format_utc_timestamp
+from src.helpers.memory import MemoryGovernor
+from src.helpers.token_dimension import TokenDimension
+from src.helpers.watermark_store import get_watermark_key, get_watermark_store
+from src.helpers.workspace import RunWorkspace
+
+# Explicit dtypes of the ethereum-etl csv columns whose inferred type depends on the rows read (nullable columns, and
+# wei amounts overflowing int64), so every batch of a file read in batches, and every run, gets the same schema.
+ETHEREUM_ETL_CSV_DTYPES = {
+    "transactions.csv": {
+        "to_address": str,
+        "value": str,
+        "max_fee_per_gas": "float64",
+        "max_priority_fee_per_gas": "float64",
+    },
+    "logs.csv": {"topics": str},
+    "token_transfers.csv": {"value": str},
+    "traces.csv": {
+        "from_address": str,
+        "to_address": str,
+        "value": str,
+        "input": str,
+        "output": str,
+        "call_type": str,
+        "reward_type": str,
+        "gas": "float64",
+        "gas_used": "float64",
+        "trace_address": str,
+        "error": str,
+    },
+}
 
 
 class RawPipeline(object):
     """Class to fetch data from the ethereum blockchain and Save it into the data lakehouse."""
 
-    def __init__(self):
-        """Initialize the class."""
+    def __init__(self, scratch_root_dir: str = None, use_tmpfs: bool = None, number_of_block_chunks: int = 1):
+        """Initialize the class.
+
+        Args:
+            scratch_root_dir (str): Directory where the scratch directory of each run is created.
+            use_tmpfs (bool): Create the scratch directory of each run on tmpfs.
+            number_of_block_chunks (int): Number of chunks of blocks run concurrently in the container, each chunk
+                gets its share of the memory budget.
+        """
         self.logger = Logger(logger_name=f"Ethereum - Raw Pipeline Logger")
         self.data_lakehouse_connection = DataLakehouse()
         self.node_rpc_url_secret = get_secret("prod/ethereum_node/rpc_urls")
@@ -27,6 +67,23 @@ class RawPipeline(object):
         self.node_rpc_urls = list(self.node_rpc_url_secret.values())
         self.retry = len(self.node_rpc_urls)
         self.timeout = 600  # Default timeout in seconds to run the subprocesses in the fetch methods.
+        self.scratch_root_dir = scratch_root_dir or settings.RAW_SCRATCH_ROOT_DIR
+        self.use_tmpfs = settings.RAW_SCRATCH_USE_TMPFS if use_tmpfs is None else use_tmpfs
+        self.workspace = None  # Scratch directory of the current run, created when the run starts.
+        self.token_dimension = TokenDimension(
+            local_path=settings.TOKEN_DIMENSION_LOCAL_PATH,
+            s3_path=f"{sdl_settings.DATA_LAKE_BUCKET_S3}/{settings.TOKEN_DIMENSION_S3_KEY}",
+        )
+        self.memory_governor = MemoryGovernor(
+            memory_budget_mb=settings.MEMORY_BUDGET_MB / number_of_block_chunks,
+            soft_limit_ratio=settings.MEMORY_SOFT_LIMIT_RATIO,
+            process_tree=number_of_block_chunks > 1,
+            logger_name="Ethereum - Raw Pipeline Memory Logger",
+        )
+        self.watermark_store = get_watermark_store()
+        self.token_metadata_watermark_key = get_watermark_key(
+            database=sdl_settings.DATA_LAKE_RAW_DATABASE, table_name="ethereum_tokens_metadata"
+        )
 
     def fetch_blocks_and_transactions(self, start_block: int, end_block: int, node_rpc_urls: List[str], retry: int = 3):
         """Fetch blocks and transactions from the ethereum blockchain and save them to csv files.
@@ -47,7 +104,7 @@ class RawPipeline(object):
             ethereum_etl_command = f"""
                 ethereumetl export_blocks_and_transactions --start-block {start_block} --end-block {end_block} \
                 --provider-uri {node_rpc_urls[0]} \
-                --blocks-output data/blocks.csv --transactions-output data/transactions.csv
+                --blocks-output {self.workspace.path}/blocks.csv --transactions-output {self.workspace.path}/transactions.csv
             """
 
             try:
@@ -101,7 +158,7 @@ class RawPipeline(object):
 
         self.logger.info(f"Saving blocks into the data lakehouse.")
 
-        blocks_data_frame = pd.read_csv("data/blocks.csv")
+        blocks_data_frame = pd.read_csv(self.workspace.file("blocks.csv"))
         blocks_data_frame = convert_timestamp_to_datetime(
             data=blocks_data_frame, column="timestamp"
         )  # Needed to match with BigQuery historical data schema
@@ -135,9 +192,6 @@ class RawPipeline(object):
 
         self.logger.info(f"Saving transactions into the data lakehouse.")
 
-        transactions_data_frame = pd.read_csv("data/transactions.csv")
-        receipts_data_frame = pd.read_csv("data/receipts.csv")
-
         # Select only the columns that we need
         receipts_columns = [
             "transaction_hash",
@@ -150,14 +204,7 @@ class RawPipeline(object):
             "effective_gas_price",
         ]
 
-        self.logger.info("Merging transactions and receipts dataframes, and renaming columns.")
-
-        transactions_data_frame = transactions_data_frame.merge(
-            receipts_data_frame[receipts_columns],
-            left_on=["hash", "block_number"],
-            right_on=["transaction_hash", "block_number"],
-            how="inner",
-        )
+        receipts_data_frame = pd.read_csv(self.workspace.file("receipts.csv"), usecols=receipts_columns)
 
         columns_to_rename = {
             "cumulative_gas_used": "receipt_cumulative_gas_used",
@@ -168,26 +215,44 @@ class RawPipeline(object):
             "effective_gas_price": "receipt_effective_gas_price",
         }
 
-        transactions_data_frame = transactions_data_frame.rename(columns=columns_to_rename)
-        transactions_data_frame = transactions_data_frame.drop(columns=["transaction_hash"])
+        total_transactions = 0
 
-        transactions_data_frame = convert_timestamp_to_datetime(
-            data=transactions_data_frame, column="block_timestamp"
-        )  # Needed to match with BigQuery historical data schema
-        transactions_data_frame = add_partition_column(data=transactions_data_frame, column="block_timestamp")
+        # The transactions file is loaded in batches when it doesn't fit in the memory budget.
+        for transactions_data_frame in self.memory_governor.read_csv_in_batches(
+            self.workspace.file("transactions.csv"), dtype=ETHEREUM_ETL_CSV_DTYPES["transactions.csv"]
+        ):
 
-        self.data_lakehouse_connection.write_parquet_table(
-            table_name="ethereum_transactions",
-            database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
-            data=transactions_data_frame,
-            source="ethereum",
-            layer="raw",
-            partition_columns=["date_partition"],
-            mode_write="append",
-        )
+            self.logger.info("Merging transactions and receipts dataframes, and renaming columns.")
+
+            transactions_data_frame = transactions_data_frame.merge(
+                receipts_data_frame,
+                left_on=["hash", "block_number"],
+                right_on=["transaction_hash", "block_number"],
+                how="inner",
+            )
+
+            transactions_data_frame = transactions_data_frame.rename(columns=columns_to_rename)
+            transactions_data_frame = transactions_data_frame.drop(columns=["transaction_hash"])
+
+            transactions_data_frame = convert_timestamp_to_datetime(
+                data=transactions_data_frame, column="block_timestamp"
+            )  # Needed to match with BigQuery historical data schema
+            transactions_data_frame = add_partition_column(data=transactions_data_frame, column="block_timestamp")
+
+            self.data_lakehouse_connection.write_parquet_table(
+                table_name="ethereum_transactions",
+                database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
+                data=transactions_data_frame,
+                source="ethereum",
+                layer="raw",
+                partition_columns=["date_partition"],
+                mode_write="append",
+            )
+
+            total_transactions += transactions_data_frame.shape[0]
 
         self.logger.info(
-            f"Transactions saved into the data lakehouse - {transactions_data_frame.shape[0]} rows - Raw Layer - Ethereum Transactions Table"
+            f"Transactions saved into the data lakehouse - {total_transactions} rows - Raw Layer - Ethereum Transactions Table"
         )
 
     def fetch_receipts_and_logs(self, node_rpc_urls: List[str], retry: int = 3):
@@ -206,9 +271,9 @@ class RawPipeline(object):
 
         if Web3.HTTPProvider(node_rpc_urls[0]).isConnected():
             ethereum_etl_command = f"""
-                ethereumetl extract_csv_column --input data/transactions.csv --column hash --output data/transaction_hashes.txt && \
-                ethereumetl export_receipts_and_logs --transaction-hashes data/transaction_hashes.txt \
-                --provider-uri {node_rpc_urls[0]} --receipts-output data/receipts.csv --logs-output data/logs.csv
+                ethereumetl extract_csv_column --input {self.workspace.path}/transactions.csv --column hash --output {self.workspace.path}/transaction_hashes.txt && \
+                ethereumetl export_receipts_and_logs --transaction-hashes {self.workspace.path}/transaction_hashes.txt \
+                --provider-uri {node_rpc_urls[0]} --receipts-output {self.workspace.path}/receipts.csv --logs-output {self.workspace.path}/logs.csv
             """
 
             try:
@@ -249,15 +314,6 @@ class RawPipeline(object):
 
         self.logger.info(f"Saving logs into the data lakehouse.")
 
-        logs_data_frame = pd.read_csv("data/logs.csv")
-
-        self.logger.info("Merging logs with blocks dataframe to get the block timestamp.")
-
-        logs_data_frame = logs_data_frame.merge(
-            blocks_data_frame, how="inner", left_on="block_number", right_on="number"
-        )
-        logs_data_frame.rename(columns={"timestamp": "block_timestamp"}, inplace=True)
-
         selected_columns = [
             "log_index",
             "transaction_hash",
@@ -270,23 +326,39 @@ class RawPipeline(object):
             "block_timestamp",
         ]
 
-        logs_data_frame = logs_data_frame[selected_columns]
+        total_logs = 0
 
-        logs_data_frame = convert_timestamp_to_datetime(data=logs_data_frame, column="block_timestamp")
-        logs_data_frame = add_partition_column(data=logs_data_frame, column="block_timestamp")
+        # The logs file is loaded in batches when it doesn't fit in the memory budget.
+        for logs_data_frame in self.memory_governor.read_csv_in_batches(
+            self.workspace.file("logs.csv"), dtype=ETHEREUM_ETL_CSV_DTYPES["logs.csv"]
+        ):
 
-        self.data_lakehouse_connection.write_parquet_table(
-            table_name="ethereum_logs",
-            database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
-            data=logs_data_frame,
-            source="ethereum",
-            layer="raw",
-            partition_columns=["date_partition"],
-            mode_write="append",
-        )
+            self.logger.info("Merging logs with blocks dataframe to get the block timestamp.")
+
+            logs_data_frame = logs_data_frame.merge(
+                blocks_data_frame, how="inner", left_on="block_number", right_on="number"
+            )
+            logs_data_frame.rename(columns={"timestamp": "block_timestamp"}, inplace=True)
+
+            logs_data_frame = logs_data_frame[selected_columns]
+
+            logs_data_frame = convert_timestamp_to_datetime(data=logs_data_frame, column="block_timestamp")
+            logs_data_frame = add_partition_column(data=logs_data_frame, column="block_timestamp")
+
+            self.data_lakehouse_connection.write_parquet_table(
+                table_name="ethereum_logs",
+                database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
+                data=logs_data_frame,
+                source="ethereum",
+                layer="raw",
+                partition_columns=["date_partition"],
+                mode_write="append",
+            )
+
+            total_logs += logs_data_frame.shape[0]
 
         self.logger.info(
-            f"Logs saved into the data lakehouse - {logs_data_frame.shape[0]} logs saved - Raw Layer - Ethereum Logs Table"
+            f"Logs saved into the data lakehouse - {total_logs} logs saved - Raw Layer - Ethereum Logs Table"
         )
 
     def fetch_contracts(self, node_rpc_urls: List[str], retry: int = 3):
@@ -304,9 +376,9 @@ class RawPipeline(object):
 
         if Web3.HTTPProvider(node_rpc_urls[0]).isConnected():
             ethereum_etl_command = f"""
-                ethereumetl extract_csv_column --input data/receipts.csv --column contract_address --output data/contract_addresses.txt &&
-                ethereumetl export_contracts --contract-addresses data/contract_addresses.txt \
-                    --provider-uri {node_rpc_urls[0]} --output data/contracts.csv
+                ethereumetl extract_csv_column --input {self.workspace.path}/receipts.csv --column contract_address --output {self.workspace.path}/contract_addresses.txt &&
+                ethereumetl export_contracts --contract-addresses {self.workspace.path}/contract_addresses.txt \
+                    --provider-uri {node_rpc_urls[0]} --output {self.workspace.path}/contracts.csv
             """
 
             try:
@@ -348,15 +420,18 @@ class RawPipeline(object):
         self.logger.info(f"Saving contracts into the data lakehouse.")
 
         # Check if the contracts file is empty, because sometimes the logs events don't have contracts.
-        if os.stat("data/contracts.csv").st_size == 0:
+        if os.stat(self.workspace.file("contracts.csv")).st_size == 0:
             self.logger.info("No contracts to save.")
         else:
-            contracts_data_frame = pd.read_csv("data/contracts.csv")
+            contracts_data_frame = pd.read_csv(self.workspace.file("contracts.csv"))
 
             contracts_data_frame["block_timestamp"] = pd.Timestamp.now()
             contracts_data_frame = add_partition_column(data=contracts_data_frame, column="block_timestamp")
 
-            contracts_data_frame["function_sighashes"] = contracts_data_frame["function_sighashes"].astype(str).tolist()
+            # Comma separated selectors, split into an array in the stage layer. Contracts without selectors are
+            # read as NaN, which must not be stored as the "nan" string.
+            function_sighashes = contracts_data_frame["function_sighashes"]
+            contracts_data_frame["function_sighashes"] = function_sighashes.fillna("").astype(str)
 
             self.data_lakehouse_connection.write_parquet_table(
                 table_name="ethereum_contracts",
@@ -387,10 +462,10 @@ class RawPipeline(object):
 
         if Web3.HTTPProvider(node_rpc_urls[0]).isConnected():
             ethereum_etl_command = f"""
-                ethereumetl filter_items -i data/contracts.csv -p "item['is_erc20'] or item['is_erc721']" | \
-                ethereumetl extract_field -f address -o data/token_addresses.txt &&
-                ethereumetl export_tokens --token-addresses data/token_addresses.txt \
-                --provider-uri {node_rpc_urls[0]} --output data/tokens.csv
+                ethereumetl filter_items -i {self.workspace.path}/contracts.csv -p "item['is_erc20'] or item['is_erc721']" | \
+                ethereumetl extract_field -f address -o {self.workspace.path}/token_addresses.txt &&
+                ethereumetl export_tokens --token-addresses {self.workspace.path}/token_addresses.txt \
+                --provider-uri {node_rpc_urls[0]} --output {self.workspace.path}/tokens.csv
             """
 
             try:
@@ -430,10 +505,10 @@ class RawPipeline(object):
         self.logger.info(f"Saving tokens into the data lakehouse.")
 
         # Check if the tokens file is empty, because sometimes the contracts don't have tokens.
-        if os.stat("data/tokens.csv").st_size == 0:
+        if os.stat(self.workspace.file("tokens.csv")).st_size == 0:
             self.logger.info("No tokens to save.")
         else:
-            tokens_data_frame = pd.read_csv("data/tokens.csv")
+            tokens_data_frame = pd.read_csv(self.workspace.file("tokens.csv"))
 
             tokens_data_frame["block_timestamp"] = pd.Timestamp.now()
             tokens_data_frame = add_partition_column(data=tokens_data_frame, column="block_timestamp")
@@ -465,9 +540,7 @@ class RawPipeline(object):
 
         self.logger.info(f"Fetching token transfers from the ethereum blockchain using logs events.")
 
-        ethereum_etl_command = (
-            "ethereumetl extract_token_transfers --logs data/logs.csv --output data/token_transfers.csv"
-        )
+        ethereum_etl_command = f"ethereumetl extract_token_transfers --logs {self.workspace.path}/logs.csv --output {self.workspace.path}/token_transfers.csv"
 
         try:
             subprocess.run(ethereum_etl_command, shell=True, check=True)
@@ -486,15 +559,6 @@ class RawPipeline(object):
 
         self.logger.info(f"Saving token transfers into the data lakehouse.")
 
-        token_transfers_data_frame = pd.read_csv("data/token_transfers.csv")
-
-        self.logger.info("Merging token_transfer with blocks dataframe to get the block timestamp and block hash.")
-
-        token_transfers_data_frame = token_transfers_data_frame.merge(
-            blocks_data_frame, how="inner", left_on="block_number", right_on="number"
-        )
-        token_transfers_data_frame.rename(columns={"timestamp": "block_timestamp", "hash": "block_hash"}, inplace=True)
-
         selected_columns = [
             "token_address",
             "from_address",
@@ -507,29 +571,49 @@ class RawPipeline(object):
             "block_hash",
         ]
 
-        token_transfers_data_frame = token_transfers_data_frame[selected_columns]
+        total_token_transfers = 0
 
-        token_transfers_data_frame = convert_timestamp_to_datetime(
-            data=token_transfers_data_frame, column="block_timestamp"
-        )
-        token_transfers_data_frame = add_partition_column(data=token_transfers_data_frame, column="block_timestamp")
+        # The token transfers file is loaded in batches when it doesn't fit in the memory budget.
+        for token_transfers_data_frame in self.memory_governor.read_csv_in_batches(
+            self.workspace.file("token_transfers.csv"), dtype=ETHEREUM_ETL_CSV_DTYPES["token_transfers.csv"]
+        ):
 
-        self.data_lakehouse_connection.write_parquet_table(
-            table_name="ethereum_token_transfers",
-            database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
-            data=token_transfers_data_frame,
-            source="ethereum",
-            layer="raw",
-            partition_columns=["date_partition"],
-            mode_write="append",
-        )
+            self.logger.info("Merging token_transfer with blocks dataframe to get the block timestamp and block hash.")
+
+            token_transfers_data_frame = token_transfers_data_frame.merge(
+                blocks_data_frame, how="inner", left_on="block_number", right_on="number"
+            )
+            token_transfers_data_frame.rename(
+                columns={"timestamp": "block_timestamp", "hash": "block_hash"}, inplace=True
+            )
+
+            token_transfers_data_frame = token_transfers_data_frame[selected_columns]
+
+            token_transfers_data_frame = convert_timestamp_to_datetime(
+                data=token_transfers_data_frame, column="block_timestamp"
+            )
+            token_transfers_data_frame = add_partition_column(data=token_transfers_data_frame, column="block_timestamp")
+
+            self.data_lakehouse_connection.write_parquet_table(
+                table_name="ethereum_token_transfers",
+                database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
+                data=token_transfers_data_frame,
+                source="ethereum",
+                layer="raw",
+                partition_columns=["date_partition"],
+                mode_write="append",
+            )
+
+            total_token_transfers += token_transfers_data_frame.shape[0]
 
         self.logger.info(
-            f"Token transfers saved into the data lakehouse - {token_transfers_data_frame.shape[0]} token transfers saved - Raw Layer - Ethereum Token Transfers Table"
+            f"Token transfers saved into the data lakehouse - {total_token_transfers} token transfers saved - Raw Layer - Ethereum Token Transfers Table"
         )
 
     def fetch_token_metadata(self) -> pd.DataFrame:
-        """Fetch tokens metadata from Transpose API
+        """Fetch tokens metadata from Transpose API.
+        The watermark is read from the token dimension, then from the watermark store, and the table in the data
+        lakehouse is only scanned when both are empty (first run or lost cache).
 
         Args:
             None
@@ -538,23 +622,29 @@ class RawPipeline(object):
             DataFrame: Token metadata dataframe
         """
 
-        query = f"""
-            SELECT MAX(last_refreshed) AS last_token_metadata_inserted
-            FROM {sdl_settings.DATA_LAKE_RAW_DATABASE}.ethereum_tokens_metadata
-            WHERE date_partition in (
-                    SELECT MAX(date_partition) AS last_partition
-                    FROM {sdl_settings.DATA_LAKE_RAW_DATABASE}.ethereum_tokens_metadata
-                )
-        """
+        last_timestamp_inserted = self.token_dimension.last_refreshed()
+        watermark = self.watermark_store.get(self.token_metadata_watermark_key)
+
+        if last_timestamp_inserted is None and watermark is not None:
+            last_timestamp_inserted = pd.Timestamp(watermark["watermark"])
 
-        last_timestamp_inserted = self.data_lakehouse_connection.read_sql_query(
-            query=query, database_name=sdl_settings.DATA_LAKE_RAW_DATABASE
-        )["last_token_metadata_inserted"][0]
+        if last_timestamp_inserted is None:
 
-        last_timestamp_inserted = last_timestamp_inserted.strftime("%Y-%m-%d %H:%M:%S")
+            query = f"""
+                SELECT MAX(last_refreshed) AS last_token_metadata_inserted
+                FROM {sdl_settings.DATA_LAKE_RAW_DATABASE}.ethereum_tokens_metadata
+                WHERE date_partition in (
+                        SELECT MAX(date_partition) AS last_partition
+                        FROM {sdl_settings.DATA_LAKE_RAW_DATABASE}.ethereum_tokens_metadata
+                    )
+            """
+
+            last_timestamp_inserted = self.data_lakehouse_connection.read_sql_query(
+                query=query, database_name=sdl_settings.DATA_LAKE_RAW_DATABASE
+            )["last_token_metadata_inserted"][0]
 
         token_metadata_instance = TranposeTokenMetadata(
-            api_key=self.transpose_api_key, last_timestamp_inserted=last_timestamp_inserted
+            api_key=self.transpose_api_key, last_timestamp_inserted=format_utc_timestamp(last_timestamp_inserted)
         )
         tokens_metadata_data_frame = token_metadata_instance.run()
 
@@ -597,6 +687,14 @@ class RawPipeline(object):
             self.logger.info(
                 f"Token metadata saved into the data lakehouse - {tokens_metadata_data_frame.shape[0]} token metadata saved - Raw Layer - Ethereum Tokens Metadata Table"
             )
+
+            self.token_dimension.upsert(tokens_metadata=tokens_metadata_data_frame)
+            self.token_dimension.save()
+            self.watermark_store.set(
+                self.token_metadata_watermark_key,
+                format_utc_timestamp(tokens_metadata_data_frame["last_refreshed"].max()),
+                table_exists=True,
+            )
         else:
             self.logger.info(f"No token metadata to save.")
 
@@ -619,7 +717,7 @@ class RawPipeline(object):
 
             ethereum_etl_command = f"""
                 ethereumetl export_traces --start-block {start_block} --end-block {end_block} \
-                --provider-uri {node_rpc_urls[0]} --batch-size 100 --output data/traces.csv
+                --provider-uri {node_rpc_urls[0]} --batch-size 100 --output {self.workspace.path}/traces.csv
             """
 
             try:
@@ -681,35 +779,46 @@ class RawPipeline(object):
 
         self.logger.info(f"Saving traces into the data lakehouse.")
 
-        traces_data_frame = pd.read_csv("data/traces.csv")
-        traces_data_frame["value"] = traces_data_frame["value"].apply(self.change_precision_for_high_numbers)
+        columns_to_rename = {"timestamp": "block_timestamp", "hash": "block_hash"}
 
-        self.logger.info("Merging traces with blocks dataframe to get the block timestamp and block hash.")
+        total_traces = 0
 
-        traces_data_frame = traces_data_frame.merge(
-            blocks_data_frame[["number", "hash", "timestamp"]], how="inner", left_on="block_number", right_on="number"
-        )
+        # The traces file is loaded in batches when it doesn't fit in the memory budget.
+        for traces_data_frame in self.memory_governor.read_csv_in_batches(
+            self.workspace.file("traces.csv"), dtype=ETHEREUM_ETL_CSV_DTYPES["traces.csv"]
+        ):
 
-        columns_to_rename = {"timestamp": "block_timestamp", "hash": "block_hash"}
+            traces_data_frame["value"] = traces_data_frame["value"].apply(self.change_precision_for_high_numbers)
 
-        traces_data_frame.rename(columns=columns_to_rename, inplace=True)
-        traces_data_frame = traces_data_frame.drop(columns=["number"])
+            self.logger.info("Merging traces with blocks dataframe to get the block timestamp and block hash.")
 
-        traces_data_frame = convert_timestamp_to_datetime(data=traces_data_frame, column="block_timestamp")
-        traces_data_frame = add_partition_column(data=traces_data_frame, column="block_timestamp")
+            traces_data_frame = traces_data_frame.merge(
+                blocks_data_frame[["number", "hash", "timestamp"]],
+                how="inner",
+                left_on="block_number",
+                right_on="number",
+            )
 
-        self.data_lakehouse_connection.write_parquet_table(
-            table_name="ethereum_traces",
-            database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
-            data=traces_data_frame,
-            source="ethereum",
-            layer="raw",
-            partition_columns=["date_partition"],
-            mode_write="append",
-        )
+            traces_data_frame.rename(columns=columns_to_rename, inplace=True)
+            traces_data_frame = traces_data_frame.drop(columns=["number"])
+
+            traces_data_frame = convert_timestamp_to_datetime(data=traces_data_frame, column="block_timestamp")
+            traces_data_frame = add_partition_column(data=traces_data_frame, column="block_timestamp")
+
+            self.data_lakehouse_connection.write_parquet_table(
+                table_name="ethereum_traces",
+                database_name=sdl_settings.DATA_LAKE_RAW_DATABASE,
+                data=traces_data_frame,
+                source="ethereum",
+                layer="raw",
+                partition_columns=["date_partition"],
+                mode_write="append",
+            )
+
+            total_traces += traces_data_frame.shape[0]
 
         self.logger.info(
-            f"Traces saved into the data lakehouse - {traces_data_frame.shape[0]} traces saved - Raw Layer - Ethereum Traces Table"
+            f"Traces saved into the data lakehouse - {total_traces} traces saved - Raw Layer - Ethereum Traces Table"
         )
 
     def check_missing_blocks(self, start_block: int, end_block: int):
@@ -831,7 +940,7 @@ class RawPipeline(object):
             raise Exception(f"Error during the process of checking missing transactions by block - {e}")
 
     def remove_temporary_files(self):
-        """Remove temporary files.
+        """Remove temporary files from the scratch directory of the current run.
 
         Args:
             None
@@ -843,16 +952,77 @@ class RawPipeline(object):
         self.logger.info(f"Removing temporary files.")
 
         try:
-            subprocess.run("rm -rf data", shell=True, check=True)
-        except subprocess.CalledProcessError as e:
+            self.workspace.clear()
+        except OSError as e:
             raise Exception(f"Error removing temporary files - {e}")
 
-    def run(self, last_block_data_lakehouse: int, last_block_ethereum_node: int) -> None:
+    def process_block_range(self, start_block: int, end_block: int) -> None:
+        """Fetch and save the data of a range of blocks from the ethereum blockchain.
+
+        Args:
+            start_block (int): The start block number.
+            end_block (int): The end block number.
+
+        Returns:
+            None
+        """
+
+        self.logger.info(f"Processing blocks between {start_block} and {end_block}.")
+
+        with self.memory_governor.stage("blocks_and_transactions"):
+            self.fetch_blocks_and_transactions(
+                start_block=start_block,
+                end_block=end_block,
+                node_rpc_urls=self.node_rpc_urls,
+                retry=self.retry,
+            )
+            blocks_data_frame = self.save_blocks()
+
+            # Only the columns needed to enrich the next tables are kept in memory.
+            blocks_data_frame = blocks_data_frame[["number", "hash", "timestamp"]]
+
+        with self.memory_governor.stage("receipts_and_logs"):
+            self.fetch_receipts_and_logs(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
+            self.save_logs(blocks_data_frame=blocks_data_frame)
+
+        with self.memory_governor.stage("contracts"):
+            self.fetch_contracts(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
+            self.save_contracts()
+
+        with self.memory_governor.stage("tokens"):
+            self.fetch_tokens(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
+            self.save_tokens()
+
+        with self.memory_governor.stage("transactions"):
+            self.save_transactions()
+
+        with self.memory_governor.stage("token_transfers"):
+            self.fetch_token_transfers()
+            self.save_token_transfers(blocks_data_frame=blocks_data_frame)
+
+        with self.memory_governor.stage("traces"):
+            self.fetch_traces(
+                start_block=start_block,
+                end_block=end_block,
+                node_rpc_urls=self.node_rpc_urls,
+                retry=self.retry,
+            )
+            self.save_traces(blocks_data_frame=blocks_data_frame)
+
+        self.remove_temporary_files()
+
+    def run(
+        self, last_block_data_lakehouse: int, last_block_ethereum_node: int, with_token_metadata: bool = True
+    ) -> None:
         """ "Run the pipeline to fetch and save the data from the ethereum blockchain.
+        The range of blocks is processed in batches, and the batch size is reduced when the memory usage gets close
+        to the memory budget, this way a heavy range slows down the pipeline instead of killing the container.
+        The temporary files are written into a scratch directory owned by this run, which is removed when it ends.
 
         Args:
             last_block_data_lakehouse (int): The last block saved in the data lakehouse.
             last_block_ethereum_node (int): The last block saved in the ethereum node.
+            with_token_metadata (bool): Fetch and save the tokens metadata from the Transpose API.
 
         Returns:
             None
@@ -862,45 +1032,111 @@ class RawPipeline(object):
         self.logger.info(f"Last block saved in the data lakehouse - {last_block_data_lakehouse}")
         self.logger.info(f"Last block inserted in the ethereum node - {last_block_ethereum_node}")
 
-        self.fetch_blocks_and_transactions(
-            start_block=last_block_data_lakehouse,
-            end_block=last_block_ethereum_node,
-            node_rpc_urls=self.node_rpc_urls,
-            retry=self.retry,
+        self.workspace = RunWorkspace(
+            run_name=f"raw_{last_block_data_lakehouse}_{last_block_ethereum_node}",
+            root_dir=self.scratch_root_dir,
+            use_tmpfs=self.use_tmpfs,
         )
-        blocks_data_frame = self.save_blocks()
 
-        self.fetch_receipts_and_logs(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
-        self.save_logs(blocks_data_frame=blocks_data_frame)
+        try:
+            block_batch_size = settings.RAW_BLOCK_BATCH_SIZE
+            start_block = last_block_data_lakehouse
 
-        self.fetch_contracts(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
-        self.save_contracts()
+            while start_block <= last_block_ethereum_node:
 
-        self.fetch_tokens(node_rpc_urls=self.node_rpc_urls, retry=self.retry)
-        self.save_tokens()
+                end_block = min(start_block + block_batch_size - 1, last_block_ethereum_node)
 
-        self.save_transactions()
+                with self.memory_governor.stage("block_range"):
+                    self.process_block_range(start_block=start_block, end_block=end_block)
 
-        self.fetch_token_transfers()
-        self.save_token_transfers(blocks_data_frame=blocks_data_frame)
+                start_block = end_block + 1
 
-        tokens_metdata_df = self.fetch_token_metadata()
-        self.save_token_metadata(tokens_metadata_data_frame=tokens_metdata_df)
+                # The next range is split in half when this one got close to the memory budget.
+                block_batch_size = self.memory_governor.adapt_batch_size(
+                    batch_size=block_batch_size,
+                    min_batch_size=settings.RAW_MIN_BLOCK_BATCH_SIZE,
+                    stage_name="block_range",
+                )
 
-        self.fetch_traces(
-            start_block=last_block_data_lakehouse,
-            end_block=last_block_ethereum_node,
-            node_rpc_urls=self.node_rpc_urls,
-            retry=self.retry,
-        )
-        self.save_traces(blocks_data_frame=blocks_data_frame)
+            if with_token_metadata:
+                with self.memory_governor.stage("token_metadata"):
+                    tokens_metdata_df = self.fetch_token_metadata()
+                    self.save_token_metadata(tokens_metadata_data_frame=tokens_metdata_df)
 
-        self.check_missing_blocks(start_block=last_block_data_lakehouse, end_block=last_block_ethereum_node)
+            self.check_missing_blocks(start_block=last_block_data_lakehouse, end_block=last_block_ethereum_node)
 
-        self.check_missing_transactions_by_block(
-            start_block=last_block_data_lakehouse, end_block=last_block_ethereum_node
-        )
+            self.check_missing_transactions_by_block(
+                start_block=last_block_data_lakehouse, end_block=last_block_ethereum_node
+            )
 
-        self.remove_temporary_files()
+        finally:
+            self.workspace.cleanup()
+
+        self.memory_governor.log_report()
 
         self.logger.info(f"Ethereum pipeline finished - Raw Layer.")
+
+
+def run_block_chunk(start_block: int, end_block: int, number_of_chunks: int) -> None:
+    """Run the raw pipeline for a chunk of blocks. This function is executed in a child process, with its share of
+    the memory budget of the container.
+
+    Args:
+        start_block (int): The start block number of the chunk.
+        end_block (int): The end block number of the chunk.
+        number_of_chunks (int): Number of chunks run concurrently.
+
+    Returns:
+        None
+    """
+
+    raw_pipeline = RawPipeline(number_of_block_chunks=number_of_chunks)
+    raw_pipeline.run(
+        last_block_data_lakehouse=start_block, last_block_ethereum_node=end_block, with_token_metadata=False
+    )
+
+
+def run_by_block_chunks(last_block_data_lakehouse: int, last_block_ethereum_node: int, number_of_chunks: int) -> None:
+    """Run the raw pipeline splitting the range of blocks into chunks processed concurrently.
+    Each chunk runs in its own process with its own scratch directory, and the tokens metadata (which doesn't
+    depend on the range of blocks) is fetched only once.
+
+    Args:
+        last_block_data_lakehouse (int): The last block saved in the data lakehouse.
+        last_block_ethereum_node (int): The last block saved in the ethereum node.
+        number_of_chunks (int): Number of chunks processed concurrently.
+
+    Returns:
+        None
+    """
+
+    logger = Logger(logger_name=f"Ethereum - Raw Pipeline Logger")
+
+    blocks_range = np.arange(last_block_data_lakehouse, last_block_ethereum_node + 1)
+    blocks_chunks = [chunk for chunk in np.array_split(blocks_range, number_of_chunks) if len(chunk) > 0]
+
+    logger.info(f"Running the raw pipeline in {len(blocks_chunks)} concurrent chunks of blocks.")
+
+    with ProcessPoolExecutor(max_workers=len(blocks_chunks)) as executor:
+        futures = {
+            executor.submit(
+                run_block_chunk,
+                start_block=int(chunk[0]),
+                end_block=int(chunk[-1]),
+                number_of_chunks=len(blocks_chunks),
+            ): chunk
+            for chunk in blocks_chunks
+        }
+
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                raise Exception(f"Error while running the raw pipeline from block {chunk[0]} to block {chunk[-1]}: {e}")
+
+            logger.info(f"Raw pipeline finished from block {chunk[0]} to block {chunk[-1]}.")
+
+    raw_pipeline = RawPipeline()
+    tokens_metadata_data_frame = raw_pipeline.fetch_token_metadata()
+    raw_pipeline.save_token_metadata(tokens_metadata_data_frame=tokens_metadata_data_frame)
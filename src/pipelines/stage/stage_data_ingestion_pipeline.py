@@ -1,14 +1,58 @@
-import awswrangler as wr
+import pandas as pd
+from typing import Tuple
 
 from config import settings
 from spectral_data_lib.log_manager import Logger
 from spectral_data_lib.config import settings as sdl_settings
-from spectral_data_lib.data_lakehouse import DataLakehouse
-from src.helpers.files import read_sql_file
+from src.helpers.sql_templates import get_sql_template, render_value
+from src.helpers.query_cache import get_query_cache
+from src.helpers.execution_backend import get_execution_backend
+from src.helpers.iceberg_metadata import read_column_upper_bound
+from src.helpers.watermark_store import get_watermark_key, get_watermark_store
 from src.helpers.athena import write_data_into_datalake_using_ctas
+from src.helpers.table_scheduler import get_table_scheduler
 
 # from src.schemas.stage_layer import ETHEREUM_TABLES_SCHEMA
 
+# Watermark column of the stage tables which are not partitioned by date_partition
+UNPARTITIONED_TABLES_WATERMARK_COLUMN = {
+    "ethereum_tokens_dimension": "last_refreshed",
+    "ethereum_selector_index": "last_block_timestamp",
+}
+
+# Watermark column of the stage tables, block_number for the other tables
+WATERMARK_COLUMNS = {
+    "ethereum_blocks": "number",
+    "ethereum_contracts": "block_timestamp",
+    "ethereum_tokens": "block_timestamp",
+    "ethereum_tokens_metadata": "created_timestamp",  # last created_at, the tokens metadata have no block
+    **UNPARTITIONED_TABLES_WATERMARK_COLUMN,
+}
+
+# Source of the stage tables which do not read the raw table of the same name: (layer, table, watermark column)
+STAGE_TABLES_SOURCES = {
+    "ethereum_tokens_dimension": ("raw", "ethereum_tokens_metadata", "last_refreshed"),
+    "ethereum_selector_index": ("stage", "ethereum_contracts", "block_timestamp"),
+}
+
+# Lower bound of the date partitions read by the MERGE of a table without any partition yet (empty table), it sorts
+# before every date partition
+FIRST_DATE_PARTITION = "0000-00"
+
+# Stage tables loaded by --table-name all, with the stage tables each one reads
+STAGE_TABLES_DEPENDENCIES = {
+    "ethereum_logs": [],
+    "ethereum_transactions": [],
+    "ethereum_blocks": [],
+    "ethereum_token_transfers": [],
+    "ethereum_traces": [],
+    "ethereum_contracts": [],
+    "ethereum_tokens": [],
+    "ethereum_tokens_metadata": [],
+    "ethereum_tokens_dimension": [],
+    "ethereum_selector_index": ["ethereum_contracts"],
+}
+
 
 class StagePipeline(object):
     """Class to create a stage pipeline"""
@@ -29,85 +73,218 @@ class StagePipeline(object):
         self.data_lake_bucket = sdl_settings.DATA_LAKE_BUCKET_S3
         self.data_source = "ethereum"
         self.env = settings.ENV
-        self.data_lakehouse_connection = DataLakehouse()
+        self.watermark_store = get_watermark_store()
+        self.watermark_key = get_watermark_key(database=self.target_data_lake_database, table_name=self.table_name)
+        self.partition_watermark_key = f"{self.watermark_key}:date_partition"
+        self.is_partitioned = self.table_name not in UNPARTITIONED_TABLES_WATERMARK_COLUMN
+        self.watermark_column = WATERMARK_COLUMNS.get(self.table_name, "block_number")
+        self.table_exists = None
 
-    def get_last_row_from_table(self) -> int:
-        """Function to get the last block from the table in the data lakehouse
+    def scan_last_row_from_table(self) -> int:
+        """Function to scan the last block (or timestamp) inserted in the table in the data lakehouse
 
         Args:
             None
 
         Returns:
-            int: Last timestamp
+            int: Last block or timestamp
         """
 
-        table_exist = wr.catalog.does_table_exist(database=self.target_data_lake_database, table=self.table_name)
-
-        if table_exist:
-
-            self.logger.info(f"Table {self.table_name} exist - Incremental ingestion.")
-
-            query_to_get_last_row_inserted = f"""
-            SELECT MAX(column) AS last_row_inserted
+        if self.is_partitioned:
+            sql = f"""
+            SELECT MAX({self.watermark_column}) AS last_row_inserted
             FROM {self.target_data_lake_database}.{self.table_name}
             WHERE date_partition in (
                     SELECT MAX(date_partition) AS last_partition
                     FROM {self.target_data_lake_database}.{self.table_name}
                 )
             """
+        else:  # Tables without date_partition
+            sql = f"""
+            SELECT MAX({self.watermark_column}) AS last_row_inserted
+            FROM {self.target_data_lake_database}.{self.table_name}
+            """
+
+        return get_query_cache().read_sql_query(
+            sql=sql,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "stage_watermark", "table": self.table_name},
+        )["last_row_inserted"][0]
+
+    def scan_last_partition_from_table(self) -> str:
+        """Function to scan the last date partition of the table in the data lakehouse
+
+        Args:
+            None
+
+        Returns:
+            str: Last date partition
+        """
+
+        return get_query_cache().read_sql_query(
+            sql=f"""
+            SELECT MAX(date_partition) AS last_partition
+            FROM {self.target_data_lake_database}.{self.table_name}
+            """,
+            database=self.target_data_lake_database,
+            tags={"pipeline": "stage_watermark", "table": self.table_name},
+        )["last_partition"][0]
+
+    def read_watermarks_from_table(self) -> Tuple:
+        """Function to read the last block (or timestamp) inserted in the table and its last date partition.
+        For Iceberg tables, they are read from the statistics of the data files in the table metadata, without
+        scanning the table. The other tables are scanned. Only used when the table has no watermark yet.
+
+        Args:
+            None
+
+        Returns:
+            Tuple: Last block or timestamp, last date partition (None when the table is not partitioned)
+        """
+
+        if not get_execution_backend().is_iceberg_table(database=self.target_data_lake_database, table=self.table_name):
+            last_partition = self.scan_last_partition_from_table() if self.is_partitioned else None
+            return self.scan_last_row_from_table(), last_partition
+
+        upper_bounds = read_column_upper_bound(
+            database=self.target_data_lake_database,
+            table_name=self.table_name,
+            column=self.watermark_column,
+            partition_column="date_partition" if self.is_partitioned else None,
+            tags={"pipeline": "stage_watermark", "table": self.table_name},
+        )
+
+        if not self.is_partitioned:
+            return upper_bounds["upper_bound"][0], None
+
+        return upper_bounds["upper_bound"].max(), upper_bounds["date_partition"].max()
+
+    def read_watermarks_from_source(self, last_row_inserted, last_partition: str) -> Tuple:
+        """Function to read the last block (or timestamp) and the last date partition of the rows loaded by the run,
+        from its source and before the write, so the watermarks are committed without scanning the table after it.
+        The watermark of a stage source is read from the watermark store, the rows of a raw source selected by the
+        run (from the last partition of the table on) are aggregated.
+
+        Args:
+            last_row_inserted: Last block or timestamp inserted in the table, the filter value of the run.
+            last_partition (str): Last date partition of the table, None when it is not partitioned or does not exist.
+
+        Returns:
+            Tuple: Last block or timestamp of the source rows (None when there is no new row), last date partition of
+            the source rows (None when the table is not partitioned or the partition is not known)
+        """
+
+        source_layer, source_table, source_column = STAGE_TABLES_SOURCES.get(
+            self.table_name, ("raw", self.table_name, self.watermark_column)
+        )
+        source_database = {
+            "raw": sdl_settings.DATA_LAKE_RAW_DATABASE,
+            "stage": self.target_data_lake_database,
+        }[source_layer]
+
+        if source_layer == "stage":
+            watermark = self.watermark_store.get(get_watermark_key(database=source_database, table_name=source_table))
+
+            if watermark is not None:
+                return watermark["watermark"], None
+
+        filter_type = "number" if source_column in ("number", "block_number") else "timestamp"
+        filters = [f"{source_column} >= {render_value('filter_value', filter_type, last_row_inserted)}"]
+
+        if last_partition is not None:
+            filters.append(f"date_partition >= {render_value('min_date_partition', 'string', last_partition)}")
+
+        source_watermarks = get_query_cache().read_sql_query(
+            sql=f"""
+            SELECT MAX({source_column}) AS last_row_inserted, MAX(date_partition) AS last_partition
+            FROM {source_database}.{source_table}
+            WHERE {" AND ".join(filters)}
+            """,
+            database=source_database,
+            tags={"pipeline": "stage_watermark", "table": self.table_name},
+        )
+
+        last_row = source_watermarks["last_row_inserted"][0]
+        last_source_partition = source_watermarks["last_partition"][0] if self.is_partitioned else None
+
+        return (None if pd.isna(last_row) else last_row), last_source_partition
+
+    def get_last_partition_from_table(self) -> str:
+        """Function to get the last date partition of the table, from the watermark store. The rows of the next
+        load are in this partition or in the next ones, so the MERGE only reads the target from this partition.
+
+        Args:
+            None
+
+        Returns:
+            str: Last date partition (FIRST_DATE_PARTITION when the table has no partition yet), or None when the table
+            is not partitioned by date_partition or does not exist
+        """
+
+        if not self.is_partitioned or not self.table_exists:
+            return None
+
+        watermark = self.watermark_store.get(self.partition_watermark_key)
+
+        if watermark is not None:
+            return watermark["watermark"]
+
+        self.logger.info(f"Table {self.table_name} has no partition watermark yet, reading it from the table.")
+
+        last_partition = self.read_watermarks_from_table()[1]
+
+        if pd.isna(last_partition):
+            self.logger.info(f"Table {self.table_name} has no partition yet - The MERGE reads every partition.")
+            return FIRST_DATE_PARTITION
+
+        return last_partition
 
-            if self.table_name == "ethereum_blocks":
-                last_row_inserted = self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_row_inserted.replace("column", "number"),
-                    database_name=self.target_data_lake_database,
-                )["last_row_inserted"][0]
-
-            elif self.table_name == "ethereum_contracts":
-                last_row_inserted = self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_row_inserted.replace("column", "block_timestamp"),
-                    database_name=self.target_data_lake_database,
-                )["last_row_inserted"][0]
-
-            elif self.table_name == "ethereum_tokens":
-                last_row_inserted = self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_row_inserted.replace("column", "block_timestamp"),
-                    database_name=self.target_data_lake_database,
-                )["last_row_inserted"][0]
-
-            elif (
-                self.table_name == "ethereum_tokens_metadata"
-            ):  # For tokens metadata table we use the created_timestamp column as last_block (last_created_at)
-                last_row_inserted = self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_row_inserted.replace("column", "created_timestamp"),
-                    database_name=self.target_data_lake_database,
-                )["last_row_inserted"][0]
-
-            else:
-                last_row_inserted = self.data_lakehouse_connection.read_sql_query(
-                    query=query_to_get_last_row_inserted.replace("column", "block_number"),
-                    database_name=self.target_data_lake_database,
-                )["last_row_inserted"][0]
-
-        else:  # Default values for the first time
-
-            self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
-
-            if self.table_name == "ethereum_transactions":
-                last_row_inserted = 46147
-            elif self.table_name == "ethereum_logs":
-                last_row_inserted = 52029
-            elif self.table_name == "ethereum_token_transfers":
-                last_row_inserted = 447767
-            elif (
-                self.table_name == "ethereum_contracts"
-                or self.table_name == "ethereum_tokens"
-                or self.table_name == "ethereum_tokens_metadata"
-            ):
-                last_row_inserted = "2015-01-01 00:00:00.000"
-            else:
-                last_row_inserted = 0
-
-        return last_row_inserted
+    def get_last_row_from_table(self) -> int:
+        """Function to get the last block (or timestamp) inserted in the table, from the watermark store.
+        The table is scanned only once, when it has no watermark yet.
+
+        Args:
+            None
+
+        Returns:
+            int: Last block or timestamp
+        """
+
+        watermark = self.watermark_store.get(self.watermark_key)
+
+        if watermark is not None:
+            self.table_exists = watermark["table_exists"]
+            return watermark["watermark"]
+
+        self.table_exists = get_execution_backend().does_table_exist(
+            database=self.target_data_lake_database, table=self.table_name
+        )
+
+        if self.table_exists:
+            self.logger.info(f"Table {self.table_name} exist - No watermark yet, reading it from the table.")
+            return self.read_watermarks_from_table()[0]
+
+        # Default values for the first time
+        self.logger.info(f"Table {self.table_name} does not exist - Full ingestion.")
+
+        return settings.FIRST_RUN_WATERMARKS.stage.get(self.table_name, 0)
+
+    def commit_watermark(self, last_row_inserted, last_partition: str) -> None:
+        """Function to save the last block (or timestamp) inserted in the table into the watermark store,
+        once the write succeeded.
+
+        Args:
+            last_row_inserted: Last block or timestamp of the rows loaded by the run (see read_watermarks_from_source).
+            last_partition (str): Last date partition of the rows loaded by the run, None when it is not known.
+
+        Returns:
+            None
+        """
+
+        self.watermark_store.set(self.watermark_key, last_row_inserted, table_exists=True)
+
+        if self.is_partitioned and not pd.isna(last_partition):
+            self.watermark_store.set(self.partition_watermark_key, last_partition)
 
     def run(self, **kwargs) -> None:
         """Function to run the pipeline
@@ -123,16 +300,22 @@ class StagePipeline(object):
             f"Running data ingestion - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
         )
 
-        sql_query = read_sql_file(file_path=sql_file_path)
+        sql_template = get_sql_template(file_path=sql_file_path)
 
         last_row_inserted = self.get_last_row_from_table()
+        last_partition = self.get_last_partition_from_table()
 
         self.logger.info(
-            f"Last row inserted (block_timestamp or block_number): {last_row_inserted} - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
+            f"Last row inserted (block_timestamp or block_number): {last_row_inserted} - Last partition: {last_partition} - Data Source: {self.data_source} - Table: {self.table_name} - Layer: {self.data_lake_layer}"
+        )
+
+        # Read before the write: the source rows of the run are the ones loaded, whatever is written in the source next
+        source_last_row, source_last_partition = self.read_watermarks_from_source(
+            last_row_inserted=last_row_inserted, last_partition=last_partition
         )
 
         write_data_into_datalake_using_ctas(
-            sql_query=sql_query,
+            sql_template=sql_template,
             filter_value=last_row_inserted,
             env=self.env,
             data_lake_layer=self.data_lake_layer,
@@ -140,8 +323,32 @@ class StagePipeline(object):
             target_table_name=self.table_name,
             data_lake_bucket=self.data_lake_bucket,
             data_source=self.data_source,
+            table_exists=self.table_exists,
+            min_date_partition=last_partition,
         )
 
+        if source_last_row is None:
+            self.logger.info(f"No new rows in the source of {self.table_name} - Watermark not moved.")
+            source_last_row = last_row_inserted
+
+        self.commit_watermark(last_row_inserted=source_last_row, last_partition=source_last_partition)
+
         self.logger.info(
             f"Data written into {self.table_name} table - Data Source: {self.data_source} - Layer: {self.data_lake_layer}"
         )
+
+
+def run_all_tables() -> None:
+    """Run the stage pipeline of every stage table from this process, each table as soon as the tables it reads are
+    loaded.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+
+    get_table_scheduler(dependencies=STAGE_TABLES_DEPENDENCIES).run(
+        run_table=lambda table_name: StagePipeline(table_name=table_name).run()
+    )
@@ -0,0 +1,254 @@
+from typing import List
+
+import awswrangler as wr
+from spectral_data_lib.config import settings as sdl_settings
+from spectral_data_lib.log_manager import Logger
+
+from config import settings
+from src.helpers.athena_multiplexer import get_athena_multiplexer
+
+# Columns whose type changed since the Hive table was written, converted while copying the rows: {table: {column: SQL}}.
+# A column is converted only when the Hive table still has it as a string.
+ICEBERG_MIGRATION_CONVERTED_COLUMNS = {
+    "ethereum_contracts": {
+        "function_sighashes": "filter(split(function_sighashes, ','), selector -> selector NOT IN ('', 'nan'))",
+    },
+}
+
+
+def get_partition_batches(partitions: List[str], partitions_by_query: int) -> List[List[str]]:
+    """Function to split the partitions of a table into the batches copied by each query.
+
+    Args:
+        partitions (List[str]): Sorted date partitions.
+        partitions_by_query (int): Number of partitions copied by each query (Athena writes 100 partitions at most).
+
+    Returns:
+        List[List[str]]: Batches of partitions.
+    """
+
+    partitions_by_query = max(1, min(partitions_by_query, 100))
+
+    return [partitions[i : i + partitions_by_query] for i in range(0, len(partitions), partitions_by_query)]
+
+
+class StageIcebergMigration(object):
+    """Class to migrate a Hive stage table, written by the former CTAS + INSERT INTO queries, to an Iceberg table with
+    the same name, so the incremental loads can MERGE into it.
+
+    The rows are copied by batches of date partitions into a new Iceberg table, the row counts are compared, then the
+    Hive table is renamed {table_name}__hive (its files are not touched, it stays queryable as a backup) and the
+    Iceberg table takes its name. The stage DAG must be paused during the migration.
+    """
+
+    def __init__(self, table_name: str) -> None:
+        """Constructor for the class
+
+        Args:
+            table_name (str): Table name
+
+        Returns:
+            None
+        """
+        self.logger = Logger(logger_name=f"Ethereum - Stage Iceberg Migration Logger")
+        self.table_name = table_name
+        self.database = sdl_settings.DATA_LAKE_STAGE_DATABASE
+        self.iceberg_table_name = f"{table_name}__iceberg"
+        self.backup_table_name = f"{table_name}__hive"
+        self.location = f"{sdl_settings.DATA_LAKE_BUCKET_S3}/stage/ethereum/iceberg/{table_name}/"
+        self.multiplexer = get_athena_multiplexer()
+
+    def run_query(self, sql: str, chunk: str = None) -> None:
+        """Run a migration query in Athena.
+
+        Args:
+            sql (str): SQL query
+            chunk (str): Partitions copied by the query
+
+        Returns:
+            None
+        """
+
+        self.multiplexer.run_query(
+            sql=sql,
+            database=self.database,
+            tags={"pipeline": "iceberg_migration", "table": self.table_name, "chunk": chunk},
+        )
+
+    def is_iceberg_table(self, table_name: str) -> bool:
+        """Check if a table of the stage database is an Iceberg table.
+
+        Args:
+            table_name (str): Table name
+
+        Returns:
+            bool: True if the table is an Iceberg table
+        """
+
+        table_parameters = wr.catalog.get_table_parameters(database=self.database, table=table_name)
+
+        return table_parameters.get("table_type", "").upper() == "ICEBERG"
+
+    def get_select_columns(self) -> str:
+        """Get the columns selected from the Hive table, with the columns of ICEBERG_MIGRATION_CONVERTED_COLUMNS
+        converted to their current type.
+
+        Args:
+            None
+
+        Returns:
+            str: Select list of the migration queries
+        """
+
+        converted_columns = ICEBERG_MIGRATION_CONVERTED_COLUMNS.get(self.table_name)
+
+        if not converted_columns:
+            return "*"
+
+        columns_types = wr.catalog.get_table_types(database=self.database, table=self.table_name)
+
+        return ", ".join(
+            f"{converted_columns[column]} AS {column}"
+            if column in converted_columns and column_type == "string"
+            else column
+            for column, column_type in columns_types.items()
+        )
+
+    def create_iceberg_table(self) -> None:
+        """Create the empty Iceberg table with the schema of the Hive table, dropping the one of a failed migration.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        self.run_query(f"DROP TABLE IF EXISTS {self.database}.{self.iceberg_table_name}")
+        self.run_query(
+            f"""
+            CREATE TABLE {self.database}.{self.iceberg_table_name} WITH (
+                format = 'parquet',
+                write_compression = 'SNAPPY',
+                location = '{self.location}',
+                table_type = 'ICEBERG',
+                is_external = false,
+                partitioning = ARRAY['date_partition']
+            ) AS
+            SELECT {self.get_select_columns()} FROM {self.database}.{self.table_name}
+            WITH NO DATA
+            """
+        )
+
+    def copy_partitions(self) -> None:
+        """Copy the rows of the Hive table into the Iceberg table, by batches of date partitions.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        partitions = self.multiplexer.read_query(
+            sql=f"SELECT DISTINCT date_partition FROM {self.database}.{self.table_name} ORDER BY date_partition",
+            database=self.database,
+        )["date_partition"].tolist()
+
+        batches = get_partition_batches(partitions, settings.ICEBERG_MIGRATION_PARTITIONS_BY_QUERY)
+        select_columns = self.get_select_columns()
+
+        for number, batch in enumerate(batches, start=1):
+            self.logger.info(f"Copying partitions {batch[0]} to {batch[-1]} - Batch {number}/{len(batches)}")
+            self.run_query(
+                f"""
+                INSERT INTO {self.database}.{self.iceberg_table_name}
+                SELECT {select_columns} FROM {self.database}.{self.table_name}
+                WHERE date_partition IN ({", ".join(f"'{partition}'" for partition in batch)})
+                """,
+                chunk=f"{batch[0]}..{batch[-1]}",
+            )
+
+    def check_row_counts(self) -> None:
+        """Check that the Iceberg table has every row of the Hive table.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        row_counts = self.multiplexer.read_query(
+            sql=f"""
+            SELECT
+                (SELECT COUNT(*) FROM {self.database}.{self.table_name}) AS hive_rows,
+                (SELECT COUNT(*) FROM {self.database}.{self.iceberg_table_name}) AS iceberg_rows
+            """,
+            database=self.database,
+        )
+        hive_rows, iceberg_rows = row_counts["hive_rows"][0], row_counts["iceberg_rows"][0]
+
+        if hive_rows != iceberg_rows:
+            raise Exception(f"Row counts differ - Hive table: {hive_rows} rows - Iceberg table: {iceberg_rows} rows")
+
+        self.logger.info(f"{iceberg_rows} rows copied into the Iceberg table of {self.table_name}")
+
+    def swap_tables(self) -> None:
+        """Rename the Hive table {table_name}__hive, with its partitions, and give its name to the Iceberg table.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        partitions_types = {"date_partition": "string"}
+        columns_types = {
+            column: column_type
+            for column, column_type in wr.catalog.get_table_types(database=self.database, table=self.table_name).items()
+            if column not in partitions_types
+        }
+
+        wr.catalog.delete_table_if_exists(database=self.database, table=self.backup_table_name)
+        wr.catalog.create_parquet_table(
+            database=self.database,
+            table=self.backup_table_name,
+            path=wr.catalog.get_table_location(database=self.database, table=self.table_name),
+            columns_types=columns_types,
+            partitions_types=partitions_types,
+            compression="snappy",
+        )
+        wr.catalog.add_parquet_partitions(
+            database=self.database,
+            table=self.backup_table_name,
+            partitions_values=wr.catalog.get_parquet_partitions(database=self.database, table=self.table_name),
+            compression="snappy",
+        )
+        wr.catalog.delete_table_if_exists(database=self.database, table=self.table_name)
+
+        self.run_query(f"ALTER TABLE {self.database}.{self.iceberg_table_name} RENAME TO {self.table_name}")
+
+    def run(self) -> None:
+        """Function to run the migration
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+
+        if self.is_iceberg_table(self.table_name):
+            self.logger.info(f"Table {self.table_name} is already an Iceberg table - Nothing to migrate.")
+            return
+
+        self.logger.info(f"Migrating {self.table_name} to Iceberg - Location: {self.location}")
+
+        self.create_iceberg_table()
+        self.copy_partitions()
+        self.check_row_counts()
+        self.swap_tables()
+
+        self.logger.info(f"Table {self.table_name} migrated to Iceberg - Hive table kept as {self.backup_table_name}")
@@ -1,9 +1,11 @@
 -- full load
-CREATE table target_database.table_name WITH (
-	format = 'PARQUET',
-	parquet_compression = 'SNAPPY',
-	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['date_partition']
 ) AS
 WITH source AS (
 SELECT DISTINCT
@@ -28,45 +30,45 @@ SELECT DISTINCT
 	coalesce(transaction_count,0) as transaction_count,
 	base_fee_per_gas,
 	date_partition
-FROM source_database.ethereum_blocks
-   WHERE number >= filter_value
+FROM {{source_database}}.ethereum_blocks
+   WHERE number >= {{filter_value}}
 )
 
 SELECT cast(uuid() as varchar) as uuid, * FROM source;
 
 -- incremental load
-INSERT INTO target_database.table_name
-WITH source AS (
-SELECT DISTINCT
-    cast(to_unixtime(cast(timestamp as timestamp)) as bigint) AS timestamp,
-    timestamp AS timestamp_readable,
-	number,
-	hash,
-	parent_hash,
-	nonce,
-	sha3_uncles,
-	logs_bloom,
-	transactions_root,
-	state_root,
-	receipts_root,
-	miner,
-	difficulty,
-	total_difficulty,
-	size,
-	extra_data,
-	gas_limit,
-	gas_used,
-	coalesce(transaction_count,0) as transaction_count,
-	base_fee_per_gas,
-	date_partition
-FROM source_database.ethereum_blocks
-   WHERE number >= filter_value
-)
-
-SELECT cast(uuid() as varchar) as uuid, * FROM source
-WHERE NOT EXISTS (
-	SELECT 1 FROM target_database.table_name as target
-	WHERE target.hash = source.hash
-	AND target.number = source.number
-	AND target.date_partition = source.date_partition
-);
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT DISTINCT
+        cast(to_unixtime(cast(timestamp as timestamp)) as bigint) AS timestamp,
+        timestamp AS timestamp_readable,
+        number,
+        hash,
+        parent_hash,
+        nonce,
+        sha3_uncles,
+        logs_bloom,
+        transactions_root,
+        state_root,
+        receipts_root,
+        miner,
+        difficulty,
+        total_difficulty,
+        size,
+        extra_data,
+        gas_limit,
+        gas_used,
+        coalesce(transaction_count,0) as transaction_count,
+        base_fee_per_gas,
+        date_partition
+    FROM {{source_database}}.ethereum_blocks
+       WHERE number >= {{filter_value}}
+       AND date_partition >= {{min_date_partition}}
+) AS source
+ON target.date_partition >= {{min_date_partition}}
+AND target.hash = source.hash
+AND target.number = source.number
+AND target.date_partition = source.date_partition
+WHEN NOT MATCHED THEN
+    INSERT (uuid, timestamp, timestamp_readable, number, hash, parent_hash, nonce, sha3_uncles, logs_bloom, transactions_root, state_root, receipts_root, miner, difficulty, total_difficulty, size, extra_data, gas_limit, gas_used, transaction_count, base_fee_per_gas, date_partition)
+    VALUES (cast(uuid() as varchar), source.timestamp, source.timestamp_readable, source.number, source.hash, source.parent_hash, source.nonce, source.sha3_uncles, source.logs_bloom, source.transactions_root, source.state_root, source.receipts_root, source.miner, source.difficulty, source.total_difficulty, source.size, source.extra_data, source.gas_limit, source.gas_used, source.transaction_count, source.base_fee_per_gas, source.date_partition);
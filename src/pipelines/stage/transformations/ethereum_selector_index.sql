@@ -0,0 +1,42 @@
+-- full load
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['bucket(64, selector)']
+) AS
+SELECT
+    selector,
+    contracts.hash_partition,
+    array_sort(array_agg(DISTINCT contracts.address)) AS addresses,
+    MAX(contracts.block_timestamp) AS last_block_timestamp
+FROM {{target_database}}.ethereum_contracts AS contracts
+    CROSS JOIN UNNEST(contracts.function_sighashes) AS selectors (selector)
+WHERE contracts.block_timestamp > {{filter_value:timestamp}}
+GROUP BY selector, contracts.hash_partition;
+
+-- incremental load
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT
+        selector,
+        contracts.hash_partition,
+        array_sort(array_agg(DISTINCT contracts.address)) AS addresses,
+        MAX(contracts.block_timestamp) AS last_block_timestamp
+    FROM {{target_database}}.ethereum_contracts AS contracts
+        CROSS JOIN UNNEST(contracts.function_sighashes) AS selectors (selector)
+    WHERE contracts.block_timestamp > {{filter_value:timestamp}}
+    AND contracts.date_partition >= DATE_FORMAT({{filter_value:timestamp}}, '%Y-%m')
+    GROUP BY selector, contracts.hash_partition
+) AS source
+ON target.selector = source.selector
+AND target.hash_partition = source.hash_partition
+WHEN MATCHED THEN
+    UPDATE SET
+        addresses = array_sort(array_distinct(concat(target.addresses, source.addresses))),
+        last_block_timestamp = greatest(target.last_block_timestamp, source.last_block_timestamp)
+WHEN NOT MATCHED THEN
+    INSERT (selector, hash_partition, addresses, last_block_timestamp)
+    VALUES (source.selector, source.hash_partition, source.addresses, source.last_block_timestamp);
@@ -1,9 +1,11 @@
 -- full load
-CREATE table target_database.table_name WITH (
-	format = 'PARQUET',
-	parquet_compression = 'SNAPPY',
-	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['date_partition']
 ) AS
 WITH source AS (
 SELECT DISTINCT
@@ -15,32 +17,32 @@ SELECT DISTINCT
     block_timestamp,
 	substr(address, 3, 2) as hash_partition,
 	date_partition
-FROM source_database.ethereum_tokens
-    WHERE block_timestamp > timestamp'filter_value'
+FROM {{source_database}}.ethereum_tokens
+    WHERE block_timestamp > {{filter_value:timestamp}}
 )
 
 SELECT cast(uuid() as varchar) as uuid, * FROM source;
 
 -- incremental load
-INSERT INTO target_database.table_name
-WITH source AS (
-SELECT DISTINCT
-	address,
-	symbol,
-	name,
-	cast(cast(decimals as double) as bigint) as decimals ,
-	coalesce(try_cast(total_supply as decimal),0) as total_supply,
-	block_timestamp,
-	substr(address, 3, 2) as hash_partition,
-	date_partition
-FROM source_database.ethereum_tokens
-	WHERE block_timestamp > timestamp'filter_value'
-)
-
-SELECT cast(uuid() as varchar) as uuid, * FROM source
-WHERE NOT EXISTS (
-	SELECT 1 FROM target_database.table_name as target
-	WHERE target.address = source.address
-	AND target.block_timestamp = source.block_timestamp
-	AND target.date_partition = source.date_partition
-);
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT DISTINCT
+        address,
+        symbol,
+        name,
+        cast(cast(decimals as double) as bigint) as decimals ,
+        coalesce(try_cast(total_supply as decimal),0) as total_supply,
+        block_timestamp,
+        substr(address, 3, 2) as hash_partition,
+        date_partition
+    FROM {{source_database}}.ethereum_tokens
+        WHERE block_timestamp > {{filter_value:timestamp}}
+        AND date_partition >= {{min_date_partition}}
+) AS source
+ON target.date_partition >= {{min_date_partition}}
+AND target.address = source.address
+AND target.block_timestamp = source.block_timestamp
+AND target.date_partition = source.date_partition
+WHEN NOT MATCHED THEN
+    INSERT (uuid, address, symbol, name, decimals, total_supply, block_timestamp, hash_partition, date_partition)
+    VALUES (cast(uuid() as varchar), source.address, source.symbol, source.name, source.decimals, source.total_supply, source.block_timestamp, source.hash_partition, source.date_partition);
@@ -0,0 +1,61 @@
+-- full load
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['hash_partition']
+) AS
+WITH source AS (
+    SELECT
+        contract_address,
+        COALESCE(CAST(decimals AS BIGINT), 18) as decimals,
+        symbol,
+        standard,
+        last_refreshed,
+        substr(contract_address, 3, 2) as hash_partition,
+        ROW_NUMBER() OVER (
+            PARTITION BY contract_address
+            ORDER BY last_refreshed DESC
+        ) AS rn
+    FROM {{source_database}}.ethereum_tokens_metadata
+        WHERE last_refreshed > {{filter_value:timestamp}}
+)
+
+SELECT contract_address, decimals, symbol, standard, last_refreshed, hash_partition
+FROM source
+WHERE rn = 1;
+
+-- incremental load
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT contract_address, decimals, symbol, standard, last_refreshed, hash_partition
+    FROM (
+        SELECT
+            contract_address,
+            COALESCE(CAST(decimals AS BIGINT), 18) as decimals,
+            symbol,
+            standard,
+            last_refreshed,
+            substr(contract_address, 3, 2) as hash_partition,
+            ROW_NUMBER() OVER (
+                PARTITION BY contract_address
+                ORDER BY last_refreshed DESC
+            ) AS rn
+        FROM {{source_database}}.ethereum_tokens_metadata
+            WHERE last_refreshed > {{filter_value:timestamp}}
+    )
+    WHERE rn = 1
+) AS source
+ON target.contract_address = source.contract_address
+AND target.hash_partition = source.hash_partition
+WHEN MATCHED AND source.last_refreshed > target.last_refreshed THEN
+    UPDATE SET
+        decimals = source.decimals,
+        symbol = source.symbol,
+        standard = source.standard,
+        last_refreshed = source.last_refreshed
+WHEN NOT MATCHED THEN
+    INSERT (contract_address, decimals, symbol, standard, last_refreshed, hash_partition)
+    VALUES (source.contract_address, source.decimals, source.symbol, source.standard, source.last_refreshed, source.hash_partition);
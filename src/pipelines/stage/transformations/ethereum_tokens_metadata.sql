@@ -1,9 +1,11 @@
 -- full load
-CREATE table target_database.table_name WITH (
-	format = 'PARQUET',
-	parquet_compression = 'SNAPPY',
-	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['date_partition']
 ) AS
 WITH source AS (
 SELECT DISTINCT
@@ -15,32 +17,33 @@ SELECT DISTINCT
     last_refreshed,
 	substr(contract_address, 3, 2) as hash_partition,
 	date_partition
-FROM source_database.ethereum_tokens_metadata
-    WHERE created_timestamp > timestamp'filter_value'
+FROM {{source_database}}.ethereum_tokens_metadata
+    WHERE created_timestamp > {{filter_value:timestamp}}
 )
 
 SELECT * FROM source;
 
 -- incremental load
-INSERT INTO target_database.table_name
-WITH source AS (
-SELECT DISTINCT
-    contract_address,
-    COALESCE(CAST(decimals AS BIGINT), 18) as decimals,
-    symbol,
-    standard,
-    created_timestamp,
-    last_refreshed,
-	substr(contract_address, 3, 2) as hash_partition,
-	date_partition
-FROM source_database.ethereum_tokens_metadata
-    WHERE created_timestamp > timestamp'filter_value'
-)
-
-SELECT source.*
-FROM source
-	LEFT JOIN target_database.table_name AS target ON source.contract_address = target.contract_address
-	AND source.date_partition = target.date_partition
-	AND source.hash_partition = target.hash_partition
-	AND source.last_refreshed = target.last_refreshed
-WHERE target.contract_address IS NULL;
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT DISTINCT
+        contract_address,
+        COALESCE(CAST(decimals AS BIGINT), 18) as decimals,
+        symbol,
+        standard,
+        created_timestamp,
+        last_refreshed,
+        substr(contract_address, 3, 2) as hash_partition,
+        date_partition
+    FROM {{source_database}}.ethereum_tokens_metadata
+        WHERE created_timestamp > {{filter_value:timestamp}}
+        AND date_partition >= {{min_date_partition}}
+) AS source
+ON target.date_partition >= {{min_date_partition}}
+AND target.contract_address = source.contract_address
+AND target.hash_partition = source.hash_partition
+AND target.last_refreshed = source.last_refreshed
+AND target.date_partition = source.date_partition
+WHEN NOT MATCHED THEN
+    INSERT (contract_address, decimals, symbol, standard, created_timestamp, last_refreshed, hash_partition, date_partition)
+    VALUES (source.contract_address, source.decimals, source.symbol, source.standard, source.created_timestamp, source.last_refreshed, source.hash_partition, source.date_partition);
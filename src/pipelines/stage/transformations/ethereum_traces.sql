@@ -1,9 +1,11 @@
 -- full load
-CREATE table target_database.table_name WITH (
-	format = 'PARQUET',
-	parquet_compression = 'SNAPPY',
-	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['date_partition']
 ) AS
 WITH source AS (
 SELECT DISTINCT
@@ -29,47 +31,47 @@ SELECT DISTINCT
 	block_hash,
 	trace_id,
 	date_partition
-FROM source_database.ethereum_traces
-    WHERE block_number >= filter_value
+FROM {{source_database}}.ethereum_traces
+    WHERE block_number >= {{filter_value}}
 )
 
 SELECT cast(uuid() as varchar) as uuid, * FROM source;
 
 -- incremental load
-INSERT INTO target_database.table_name
-WITH source AS (
-SELECT DISTINCT
-	transaction_hash,
-	transaction_index,
-	from_address,
-	to_address,
-	value,
-	input,
-	output,
-	trace_type,
-	call_type,
-	reward_type,
-	gas,
-	gas_used,
-	subtraces,
-	trace_address,
-	error,
-	status,
-	cast(to_unixtime(cast(block_timestamp as timestamp)) as bigint) AS block_timestamp,
-	block_timestamp as block_timestamp_readable,
-	block_number,
-	block_hash,
-	trace_id,
-	date_partition
-FROM source_database.ethereum_traces
-	WHERE block_number >= filter_value
-)
-
-SELECT cast(uuid() as varchar) as uuid, * FROM source
-WHERE NOT EXISTS (
-	SELECT 1 FROM target_database.table_name as target
-	WHERE target.transaction_hash = source.transaction_hash
-	AND target.transaction_index = source.transaction_index
-	AND target.block_number = source.block_number
-	AND target.date_partition = source.date_partition
-);
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT DISTINCT
+        transaction_hash,
+        transaction_index,
+        from_address,
+        to_address,
+        value,
+        input,
+        output,
+        trace_type,
+        call_type,
+        reward_type,
+        gas,
+        gas_used,
+        subtraces,
+        trace_address,
+        error,
+        status,
+        cast(to_unixtime(cast(block_timestamp as timestamp)) as bigint) AS block_timestamp,
+        block_timestamp as block_timestamp_readable,
+        block_number,
+        block_hash,
+        trace_id,
+        date_partition
+    FROM {{source_database}}.ethereum_traces
+        WHERE block_number >= {{filter_value}}
+        AND date_partition >= {{min_date_partition}}
+) AS source
+ON target.date_partition >= {{min_date_partition}}
+AND target.transaction_hash = source.transaction_hash
+AND target.transaction_index = source.transaction_index
+AND target.block_number = source.block_number
+AND target.date_partition = source.date_partition
+WHEN NOT MATCHED THEN
+    INSERT (uuid, transaction_hash, transaction_index, from_address, to_address, value, input, output, trace_type, call_type, reward_type, gas, gas_used, subtraces, trace_address, error, status, block_timestamp, block_timestamp_readable, block_number, block_hash, trace_id, date_partition)
+    VALUES (cast(uuid() as varchar), source.transaction_hash, source.transaction_index, source.from_address, source.to_address, source.value, source.input, source.output, source.trace_type, source.call_type, source.reward_type, source.gas, source.gas_used, source.subtraces, source.trace_address, source.error, source.status, source.block_timestamp, source.block_timestamp_readable, source.block_number, source.block_hash, source.trace_id, source.date_partition);
@@ -1,9 +1,11 @@
 -- full load
-CREATE table target_database.table_name WITH (
-	format = 'PARQUET',
-	parquet_compression = 'SNAPPY',
-	partitioned_by = array [ 'date_partition' ],
-	external_location = 'bucket_name/layer/data_source/table_name/'
+CREATE TABLE {{target_database}}.{{table_name}} WITH (
+    format = 'parquet',
+    write_compression = 'SNAPPY',
+    location = '{{bucket_name}}/{{layer}}/{{data_source}}/{{table_name}}/',
+    table_type = 'ICEBERG',
+    is_external = false,
+    partitioning = ARRAY['date_partition']
 ) AS
 WITH source AS (
 SELECT DISTINCT
@@ -30,48 +32,48 @@ SELECT DISTINCT
 	transaction_type,
 	receipt_effective_gas_price,
 	date_partition
-FROM source_database.ethereum_transactions
-    WHERE block_number >= filter_value
+FROM {{source_database}}.ethereum_transactions
+    WHERE block_number >= {{filter_value}}
 )
 
 SELECT cast(uuid() as varchar) as uuid, * FROM source;
 
 -- incremental load
-INSERT INTO target_database.table_name
-WITH source AS (
-SELECT DISTINCT
-	hash,
-	nonce,
-	transaction_index,
-	from_address,
-	to_address,
-	value,
-	gas,
-	gas_price,
-	input,
-	receipt_cumulative_gas_used,
-	receipt_gas_used,
-	receipt_contract_address,
-	receipt_root,
-	receipt_status,
-	cast(to_unixtime(cast(block_timestamp as timestamp)) as bigint) AS block_timestamp,
-	block_timestamp as block_timestamp_readable,
-	block_number,
-	block_hash,
-	max_fee_per_gas,
-	max_priority_fee_per_gas,
-	transaction_type,
-	receipt_effective_gas_price,
-	date_partition
-FROM source_database.ethereum_transactions
-	WHERE block_number >= filter_value
-)
-
-SELECT cast(uuid() as varchar) as uuid, * FROM source
-WHERE NOT EXISTS (
-	SELECT 1 FROM target_database.table_name as target
-	WHERE target.hash = source.hash
-	AND target.transaction_index = source.transaction_index
-	AND target.block_number = source.block_number
-	AND target.date_partition = source.date_partition
-);
+MERGE INTO {{target_database}}.{{table_name}} AS target
+USING (
+    SELECT DISTINCT
+        hash,
+        nonce,
+        transaction_index,
+        from_address,
+        to_address,
+        value,
+        gas,
+        gas_price,
+        input,
+        receipt_cumulative_gas_used,
+        receipt_gas_used,
+        receipt_contract_address,
+        receipt_root,
+        receipt_status,
+        cast(to_unixtime(cast(block_timestamp as timestamp)) as bigint) AS block_timestamp,
+        block_timestamp as block_timestamp_readable,
+        block_number,
+        block_hash,
+        max_fee_per_gas,
+        max_priority_fee_per_gas,
+        transaction_type,
+        receipt_effective_gas_price,
+        date_partition
+    FROM {{source_database}}.ethereum_transactions
+        WHERE block_number >= {{filter_value}}
+        AND date_partition >= {{min_date_partition}}
+) AS source
+ON target.date_partition >= {{min_date_partition}}
+AND target.hash = source.hash
+AND target.transaction_index = source.transaction_index
+AND target.block_number = source.block_number
+AND target.date_partition = source.date_partition
+WHEN NOT MATCHED THEN
+    INSERT (uuid, hash, nonce, transaction_index, from_address, to_address, value, gas, gas_price, input, receipt_cumulative_gas_used, receipt_gas_used, receipt_contract_address, receipt_root, receipt_status, block_timestamp, block_timestamp_readable, block_number, block_hash, max_fee_per_gas, max_priority_fee_per_gas, transaction_type, receipt_effective_gas_price, date_partition)
+    VALUES (cast(uuid() as varchar), source.hash, source.nonce, source.transaction_index, source.from_address, source.to_address, source.value, source.gas, source.gas_price, source.input, source.receipt_cumulative_gas_used, source.receipt_gas_used, source.receipt_contract_address, source.receipt_root, source.receipt_status, source.block_timestamp, source.block_timestamp_readable, source.block_number, source.block_hash, source.max_fee_per_gas, source.max_priority_fee_per_gas, source.transaction_type, source.receipt_effective_gas_price, source.date_partition);
@@ -0,0 +1,81 @@
+import asyncio
+
+import pandas as pd
+
+from src.helpers import abi_cache as abi_cache_module
+from src.helpers.abi_cache import AbiCache, hash_bytecode
+from src.helpers.get_abi_etherscan import EtherscanABI
+
+RUNTIME_CODE = "0x6080604052348015600f57600080fd5b50"
+METADATA_A = "a264697066735822" + "11" * 34 + "64736f6c634300080a0033"
+METADATA_B = "a264697066735822" + "22" * 34 + "64736f6c634300080a0033"
+
+
+def test_hash_bytecode_ignores_the_metadata_trailer():
+    assert hash_bytecode(RUNTIME_CODE + METADATA_A) == hash_bytecode(RUNTIME_CODE + METADATA_B)
+    assert hash_bytecode(RUNTIME_CODE + METADATA_A) != hash_bytecode("0x6080" + METADATA_A)
+    assert hash_bytecode("0x") is None
+
+
+def test_group_by_bytecode_requests_one_address_per_bytecode(tmp_path):
+    abi_cache = AbiCache(local_path=str(tmp_path / "abi_cache.parquet"))
+    abi_cache.bytecode_hash_by_address = {"0xa": "hash_1", "0xb": "hash_1", "0xc": "hash_2"}
+
+    groups = abi_cache.group_by_bytecode(["0xa", "0xb", "0xc", "0xd"])
+
+    assert groups == {"0xa": ["0xa", "0xb"], "0xc": ["0xc"], "0xd": ["0xd"]}
+    assert abi_cache.stats["deduplicated"] == 1
+
+
+class FakeDataLakehouse(object):
+    """Data lakehouse stand-in serving the bytecode of the contracts: 0xa and 0xb are clones, 0xc is unverified."""
+
+    def read_sql_query(self, query, database_name):
+        bytecode_by_address = {"0xa": RUNTIME_CODE + METADATA_A, "0xb": RUNTIME_CODE + METADATA_B, "0xc": "0x60"}
+        addresses = [address for address in bytecode_by_address if f"'{address}'" in query]
+        return pd.DataFrame({"address": addresses, "bytecode": [bytecode_by_address[a] for a in addresses]})
+
+
+def test_abis_are_fetched_on_a_miss_and_saved_once(tmp_path, monkeypatch):
+    uploads = []
+    monkeypatch.setattr(abi_cache_module, "DataLakehouse", FakeDataLakehouse)
+    monkeypatch.setattr(abi_cache_module.wr.s3, "does_object_exist", lambda path: False)
+    monkeypatch.setattr(abi_cache_module.wr.s3, "upload", lambda local_file, path: uploads.append(path))
+
+    fetched_addresses = []
+
+    async def fetch_abis(token_addresses, retries=10):
+        fetched_addresses.extend(token_addresses)
+        return [
+            '[{"name": "transfer"}]' if address == "0xa" else "Contract source code not verified"
+            for address in token_addresses
+        ]
+
+    etherscan_abi = EtherscanABI.__new__(EtherscanABI)
+    etherscan_abi.fetch_abis = fetch_abis
+    etherscan_abi.abi_cache = AbiCache(
+        local_path=str(tmp_path / "abi_cache.parquet"), s3_path="s3://bucket/abi.parquet"
+    )
+    token_list = pd.DataFrame({"token_address": ["0xA", "0xb", "0xc"]})
+
+    abis = asyncio.run(etherscan_abi.get_abis(token_list))
+
+    assert fetched_addresses == ["0xa", "0xc"]  # 0xb shares the bytecode of 0xa
+    assert abis["abi"].tolist() == [
+        '[{"name": "transfer"}]',
+        '[{"name": "transfer"}]',
+        "Contract source code not verified",
+    ]
+    assert uploads == ["s3://bucket/abi.parquet"]
+
+    # The next run loads the saved cache: the verified ABIs are hits, and the unchanged cache is not uploaded again
+    fetched_addresses.clear()
+    etherscan_abi.abi_cache = AbiCache(
+        local_path=str(tmp_path / "abi_cache.parquet"), s3_path="s3://bucket/abi.parquet"
+    )
+
+    abis = asyncio.run(etherscan_abi.get_abis(token_list))
+
+    assert fetched_addresses == ["0xc"]
+    assert abis["abi"].tolist()[:2] == ['[{"name": "transfer"}]', '[{"name": "transfer"}]']
+    assert uploads == ["s3://bucket/abi.parquet"]
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.helpers import athena_multiplexer
+from src.helpers.athena_multiplexer import AthenaQueryMultiplexer
+
+
+class FakeAthena(object):
+    """Athena stand-in: every query runs for two status checks, queries with FAIL in their SQL fail, queries with
+    FULL SCAN in their SQL scan 1 GB by status check and the first two runs of queries with CONFLICT in their SQL fail
+    with an Iceberg commit conflict."""
+
+    def __init__(self):
+        self.queries = {}
+        self.conflicts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # The multiplexer calls Athena from worker threads
+        self.lock = threading.Lock()
+
+    def start_query_execution(self, sql, database, workgroup, wait):
+        with self.lock:
+            query_execution_id = str(len(self.queries))
+            self.queries[query_execution_id] = {"sql": sql, "checks": 0}
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return query_execution_id
+
+    def get_query_execution(self, query_execution_id):
+        with self.lock:
+            return self.check_query_execution(query_execution_id)
+
+    def check_query_execution(self, query_execution_id):
+        query = self.queries[query_execution_id]
+        query["checks"] += 1
+        statistics = {"DataScannedInBytes": query["checks"] * 1024**3 if "FULL SCAN" in query["sql"] else 1024**2}
+
+        if query.get("stopped"):
+            state = "CANCELLED"
+        elif query["checks"] < 2:
+            return {"QueryExecutionId": query_execution_id, "Status": {"State": "RUNNING"}, "Statistics": statistics}
+        elif "CONFLICT" in query["sql"] and self.conflicts.get(query["sql"], 0) < 2:
+            self.conflicts[query["sql"]] = self.conflicts.get(query["sql"], 0) + 1
+            self.in_flight -= 1
+            return {
+                "QueryExecutionId": query_execution_id,
+                "Status": {"State": "FAILED", "StateChangeReason": "ICEBERG_COMMIT_ERROR: Failed to commit"},
+                "Statistics": statistics,
+            }
+        else:
+            state = "FAILED" if "FAIL" in query["sql"] else "SUCCEEDED"
+
+        self.in_flight -= 1
+        return {"QueryExecutionId": query_execution_id, "Status": {"State": state}, "Statistics": statistics}
+
+    def stop_query_execution(self, query_execution_id):
+        self.queries[query_execution_id]["stopped"] = True
+
+
+@pytest.fixture
+def fake_athena(monkeypatch):
+    fake_athena = FakeAthena()
+    monkeypatch.setattr(athena_multiplexer.wr.athena, "start_query_execution", fake_athena.start_query_execution)
+    monkeypatch.setattr(athena_multiplexer.wr.athena, "get_query_execution", fake_athena.get_query_execution)
+    monkeypatch.setattr(athena_multiplexer.wr.athena, "stop_query_execution", fake_athena.stop_query_execution)
+    return fake_athena
+
+
+def test_run_queries_caps_queries_in_flight(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(max_concurrent_queries=3, poll_interval=0.001)
+
+    query_executions = multiplexer.run_queries([(f"SELECT {i}", "db", {}) for i in range(10)])
+
+    # Queries are submitted in any order, but their executions are returned in the order of the queries.
+    assert [
+        fake_athena.queries[query_execution["QueryExecutionId"]]["sql"] for query_execution in query_executions
+    ] == [f"SELECT {i}" for i in range(10)]
+    assert fake_athena.max_in_flight == 3
+
+
+def test_callers_of_every_thread_share_the_cap(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(max_concurrent_queries=3, poll_interval=0.001)
+
+    callers = [
+        threading.Thread(target=multiplexer.run_queries, args=([(f"SELECT {caller}{i}", "db", {}) for i in range(10)],))
+        for caller in range(4)
+    ]
+
+    for caller in callers:
+        caller.start()
+
+    for caller in callers:
+        caller.join()
+
+    assert multiplexer.stats["queries"] == 40
+    assert fake_athena.max_in_flight == 3
+
+
+def test_run_queries_waits_for_every_query_before_failing(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(max_concurrent_queries=2, poll_interval=0.001)
+
+    with pytest.raises(Exception, match="1 of 4 Athena queries failed"):
+        multiplexer.run_queries([(sql, "db", {}) for sql in ("SELECT 1", "FAIL", "SELECT 2", "SELECT 3")])
+
+    assert fake_athena.in_flight == 0
+
+
+def test_submit_retries_throttled_submissions(fake_athena, monkeypatch):
+    attempts = []
+
+    def throttled_start_query_execution(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) < 3:
+            raise Exception("An error occurred (TooManyRequestsException)")
+        return fake_athena.start_query_execution(**kwargs)
+
+    monkeypatch.setattr(athena_multiplexer.wr.athena, "start_query_execution", throttled_start_query_execution)
+    multiplexer = AthenaQueryMultiplexer(poll_interval=0.001)
+
+    assert asyncio.run(multiplexer.submit(sql="SELECT 1", database="db")) == "0"
+    assert multiplexer.stats["throttled"] == 2
+
+
+def test_query_stats_are_recorded_with_their_tags(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(poll_interval=0.001)
+
+    multiplexer.run_queries(
+        [("SELECT 1", "db", {"pipeline": "stage", "table": "ethereum_logs", "chunk": f"{i}..{i}"}) for i in range(2)]
+    )
+
+    # The stats are recorded as the queries finish, in any order
+    assert sorted(query_stats["chunk"] for query_stats in multiplexer.query_stats) == ["0..0", "1..1"]
+    assert multiplexer.query_stats[0]["table"] == "ethereum_logs"
+    assert multiplexer.query_stats[0]["data_scanned_bytes"] == 1024**2
+    assert multiplexer.query_stats[0]["estimated_cost_usd"] == pytest.approx(10 / 1024**2 * 5)
+
+
+def test_scan_budget_warns(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(poll_interval=0.001, scan_budgets_gb={"default": 100, "ethereum_logs": 1})
+
+    multiplexer.run_query(sql="FULL SCAN", database="db", tags={"table": "ethereum_logs"})
+    multiplexer.run_query(sql="FULL SCAN", database="db", tags={"table": "ethereum_blocks"})
+
+    assert [query_stats["over_budget"] for query_stats in multiplexer.query_stats] == [True, False]
+
+
+def test_scan_budget_aborts(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(
+        poll_interval=0.001, scan_budgets_gb={"default": 0.5}, scan_budget_action="abort"
+    )
+
+    with pytest.raises(Exception, match="over its scan budget"):
+        multiplexer.run_query(sql="FULL SCAN", database="db", tags={"table": "ethereum_logs"})
+
+    assert fake_athena.queries["0"]["stopped"]
+    assert multiplexer.query_stats[0]["state"] == "CANCELLED"
+
+
+def test_commit_conflicts_are_retried(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(poll_interval=0.001)
+
+    query_executions = multiplexer.run_queries(
+        [(f"MERGE CONFLICT {i}", "db", {}) for i in range(3)] + [("SELECT 1", "db", {})], max_concurrent_queries=2
+    )
+
+    assert [query_execution["Status"]["State"] for query_execution in query_executions] == ["SUCCEEDED"] * 4
+    assert multiplexer.stats["commit_conflicts"] == 6
+    assert fake_athena.max_in_flight == 2
+
+
+def test_commit_conflicts_fail_after_the_retries(fake_athena):
+    multiplexer = AthenaQueryMultiplexer(poll_interval=0.001, commit_retries=1)
+
+    with pytest.raises(Exception, match="ICEBERG_COMMIT_ERROR"):
+        multiplexer.run_query(sql="MERGE CONFLICT", database="db")
+
+    assert len(fake_athena.queries) == 2
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from src.helpers.change_detection import get_document_changes, hash_nested_values, hash_rows
+
+
+def get_document(contracts):
+    keys = pd.Series([np.array(list(contracts), dtype=object)])
+    values = pd.Series([np.array([value for details in contracts.values() for value in details])])
+
+    return {
+        "walletAddress": "0xwallet",
+        "wallet_last_tx": 1700000000,
+        "features_hash": hash_rows(pd.DataFrame({"wallet_last_tx": [1700000000]}))[0],
+        "contracts": {
+            contract: {"total_balance": details[0], "transactions_count": details[1]}
+            for contract, details in contracts.items()
+        },
+        "contracts_hashes": hash_nested_values(keys=keys, values=values, width=2)[0],
+    }
+
+
+def get_written_hashes(document):
+    return {key: document[key] for key in ("walletAddress", "features_hash", "contracts_hashes")}
+
+
+def test_hashes_only_depend_on_the_values():
+    data = pd.DataFrame({"a": [1.0, 2.0, 1.0], "b": [3, 4, 3]})
+
+    hashes = hash_rows(data)
+
+    assert hashes[0] == hashes[2] != hashes[1]
+    assert hash_rows(data.iloc[[2]]) == [hashes[0]]
+    assert all(isinstance(row_hash, int) for row_hash in hashes)
+
+
+def test_hashes_do_not_depend_on_the_inferred_dtypes():
+    data = pd.DataFrame({"wallet_last_tx": [1700000000, 1700000500], "label": ["a", None]})
+    data_with_other_dtypes = pd.DataFrame(
+        {
+            "wallet_last_tx": pd.Series([1700000000.0, 1700000500.0], dtype="float64"),
+            "label": pd.Series(["a", None], dtype=object),
+        }
+    )
+    data_read_as_objects = data.astype({"wallet_last_tx": "Int64"}).astype(object)
+
+    assert hash_rows(data) == hash_rows(data_with_other_dtypes) == hash_rows(data_read_as_objects)
+
+
+def test_new_documents_are_written_whole():
+    document = get_document({"ETH": [1.0, 2.0]})
+
+    assert get_document_changes(document, None, key_field="walletAddress", nested_field="contracts") is document
+    assert get_document_changes(document, {}, key_field="walletAddress", nested_field="contracts") is document
+
+
+def test_unchanged_documents_are_skipped():
+    document = get_document({"ETH": [1.0, 2.0], "0xtoken": [3.0, 4.0]})
+
+    changes = get_document_changes(
+        document, get_written_hashes(document), key_field="walletAddress", nested_field="contracts"
+    )
+
+    assert changes is None
+
+
+def test_only_the_changed_contracts_are_set():
+    written_document = get_document({"ETH": [1.0, 2.0], "0xtoken": [3.0, 4.0]})
+    document = get_document({"ETH": [1.0, 2.0], "0xtoken": [5.0, 6.0], "0xnew": [7.0, 8.0]})
+
+    changes = get_document_changes(
+        document, get_written_hashes(written_document), key_field="walletAddress", nested_field="contracts"
+    )
+
+    assert changes == {
+        "walletAddress": "0xwallet",
+        "contracts.0xtoken": {"total_balance": 5.0, "transactions_count": 6.0},
+        "contracts_hashes.0xtoken": document["contracts_hashes"]["0xtoken"],
+        "contracts.0xnew": {"total_balance": 7.0, "transactions_count": 8.0},
+        "contracts_hashes.0xnew": document["contracts_hashes"]["0xnew"],
+    }
+
+
+def test_changed_wallet_fields_are_set_without_the_contracts():
+    written_document = get_document({"ETH": [1.0, 2.0]})
+    document = {**get_document({"ETH": [1.0, 2.0]}), "wallet_last_tx": 1700000500, "features_hash": 1}
+
+    changes = get_document_changes(
+        document, get_written_hashes(written_document), key_field="walletAddress", nested_field="contracts"
+    )
+
+    assert changes == {"walletAddress": "0xwallet", "wallet_last_tx": 1700000500, "features_hash": 1}
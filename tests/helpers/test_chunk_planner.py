@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from src.helpers import chunk_planner
+from src.helpers.chunk_planner import ADDRESS_PARTITIONS, ChunkPlanner, pack_partitions
+from src.helpers.watermark_store import SqliteWatermarkStore
+
+
+class FakeBackend(object):
+    """Backend stand-in: the partitions starting with 0 have 100 times more rows than the other ones."""
+
+    def __init__(self):
+        self.scans = 0
+
+    def does_table_exist(self, database, table):
+        return True
+
+    def read_query(self, sql, database, tags=None):
+        self.scans += 1
+        return pd.DataFrame(
+            {
+                "partition_value": ADDRESS_PARTITIONS,
+                "row_count": [10000 if partition[0] == "0" else 100 for partition in ADDRESS_PARTITIONS],
+            }
+        )
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    backend = FakeBackend()
+    watermark_store = SqliteWatermarkStore(path=str(tmp_path / "watermarks.sqlite"))
+    monkeypatch.setattr(chunk_planner, "get_execution_backend", lambda: backend)
+    monkeypatch.setattr(chunk_planner, "get_watermark_store", lambda: watermark_store)
+    return backend
+
+
+def test_pack_partitions_balances_the_chunk_sizes():
+    partition_sizes = {"a": 8, "b": 5, "c": 4, "d": 3, "e": 3, "f": 1}
+
+    chunks = pack_partitions(list(partition_sizes), partition_sizes, number_of_chunks=3)
+
+    assert sorted(partition for chunk in chunks for partition in chunk) == list(partition_sizes)
+    assert [sum(partition_sizes[partition] for partition in chunk) for chunk in chunks] == [8, 8, 8]
+
+
+def test_pack_partitions_without_sizes_splits_evenly():
+    chunks = pack_partitions(ADDRESS_PARTITIONS, {}, number_of_chunks=10)
+
+    assert sorted(len(chunk) for chunk in chunks) == [25] * 4 + [26] * 6
+    assert sorted(partition for chunk in chunks for partition in chunk) == ADDRESS_PARTITIONS
+
+
+def test_chunks_are_balanced_and_reused_across_runs(backend):
+    planner = ChunkPlanner(database="db_analytics_dev", table_name="ethereum_wallet_transactions")
+
+    chunks = planner.get_chunks(number_of_chunks=20)
+    chunk_sizes = [sum(10000 if partition[0] == "0" else 100 for partition in chunk) for chunk in chunks]
+
+    # The 16 heavy partitions are spread over 16 chunks instead of filling the first chunks of an even split
+    assert max(chunk_sizes) <= 1.2 * sum(chunk_sizes) / len(chunk_sizes)
+    assert planner.get_chunks(number_of_chunks=20) == chunks
+    assert ChunkPlanner(database="db_analytics_dev", table_name="ethereum_wallet_transactions").get_chunks(20) == chunks
+    assert backend.scans == 1
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from src.helpers.data_transformations import build_nested_documents, split_nested_arrays
+
+
+def test_build_nested_documents_from_the_arrays_of_the_batch():
+    keys = pd.Series([np.array(["0xa", "ETH"], dtype=object), np.array(["ETH"], dtype=object)])
+    values = pd.Series([np.array([1.0, 2.0, 3.0, 4.0]), np.array([5.0, 6.0])])
+
+    documents = build_nested_documents(keys=keys, values=values, value_names=["total_balance", "transactions_count"])
+
+    assert documents == [
+        {
+            "0xa": {"total_balance": 1.0, "transactions_count": 2.0},
+            "ETH": {"total_balance": 3.0, "transactions_count": 4.0},
+        },
+        {"ETH": {"total_balance": 5.0, "transactions_count": 6.0}},
+    ]
+    assert type(documents[0]["ETH"]["total_balance"]) is float  # python types, encoded as is by the features db
+
+
+def test_build_nested_documents_without_keys():
+    keys = pd.Series([np.array([], dtype=object), np.array([], dtype=object)])
+    values = pd.Series([np.array([]), np.array([])])
+
+    assert build_nested_documents(keys=keys, values=values, value_names=["total_balance"]) == [{}, {}]
+
+
+def test_split_nested_arrays_gives_the_offsets_of_each_row():
+    keys = pd.Series([np.array(["0xa", "ETH"], dtype=object), np.array([], dtype=object), np.array(["ETH"])])
+    values = pd.Series([np.array([1.0, 2.0, 3.0, 4.0]), np.array([]), np.array([5.0, 6.0])])
+
+    flat_keys, flat_values, offsets = split_nested_arrays(keys=keys, values=values, width=2)
+
+    assert flat_keys == ["0xa", "ETH", "ETH"]
+    assert flat_values.tolist() == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    assert offsets == [(0, 2), (2, 2), (2, 3)]
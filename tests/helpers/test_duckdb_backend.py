@@ -0,0 +1,111 @@
+import os
+
+import duckdb
+import pytest
+
+from src.helpers.duckdb_backend import (
+    DuckDBBackend,
+    get_insert_only_merge_query,
+    get_partition_columns,
+    split_table_properties,
+    translate_trino_to_duckdb,
+)
+from src.helpers.sql_templates import get_sql_template
+
+
+def test_translate_trino_to_duckdb():
+    sql = translate_trino_to_duckdb(
+        "SELECT DATE(FROM_UNIXTIME(t.timestamp)) - INTERVAL '1' DAY, to_unixtime(ts), array_join(topics, ','), "
+        "date_diff('day', a, b), cast(uuid() as varchar), date_partition FROM t"
+    )
+
+    assert sql == (
+        "SELECT trino_date(to_timestamp(t.timestamp)) - INTERVAL 1 DAY, epoch(ts), array_to_string(topics, ','), "
+        "date_diff('day', a, b), cast(uuid() as varchar), date_partition FROM t"
+    )
+
+
+def test_split_table_properties():
+    properties, query = split_table_properties(
+        "WITH (format = 'PARQUET', partitioned_by = array [ 'date_partition' ]) AS SELECT 1"
+    )
+
+    assert query == "SELECT 1"
+    assert get_partition_columns(properties) == ["date_partition"]
+    assert get_partition_columns("partitioning = ARRAY['bucket(64, selector)']") == []
+
+
+def test_get_insert_only_merge_query():
+    database, table, query = get_insert_only_merge_query(
+        "MERGE INTO db.t AS target USING (SELECT a, b FROM db.s WHERE f(a, b) > 0) AS source "
+        "ON target.a = source.a WHEN NOT MATCHED THEN INSERT (uuid, a, b) VALUES (cast(uuid() as varchar), source.a, "
+        "source.b)"
+    )
+
+    assert (database, table) == ("db", "t")
+    assert "SELECT cast(uuid() as varchar) AS uuid, source.a AS a, source.b AS b" in query
+    assert "WHERE NOT EXISTS (SELECT 1 FROM db.t AS target WHERE target.a = source.a)" in query
+
+    with pytest.raises(Exception, match="WHEN NOT MATCHED"):
+        get_insert_only_merge_query(
+            "MERGE INTO db.t AS target USING (SELECT a FROM db.s) AS source ON target.a = source.a "
+            "WHEN MATCHED THEN UPDATE SET a = source.a WHEN NOT MATCHED THEN INSERT (a) VALUES (source.a)"
+        )
+
+
+def write_raw_logs(lakehouse_path, date_partition: str, logs: str) -> None:
+    raw_table_path = lakehouse_path / "db_raw_dev" / "ethereum_logs" / f"date_partition={date_partition}"
+    os.makedirs(raw_table_path)
+    duckdb.connect().execute(
+        f"""
+        COPY (
+            SELECT * FROM (VALUES {logs}) AS logs (
+                log_index, transaction_hash, transaction_index, address, data, topics, block_timestamp, block_number,
+                block_hash
+            )
+        ) TO '{raw_table_path / "logs.parquet"}' (FORMAT PARQUET)
+        """
+    )
+
+
+@pytest.fixture
+def backend(tmp_path):
+    write_raw_logs(
+        tmp_path,
+        date_partition="2023-01",
+        logs="""
+        (0, '0xa', 0, '0x1', '0x', ['0xt1', '0xt2'], '2023-01-01 00:00:00', 10, '0xh1'),
+        (1, '0xb', 1, '0x2', '0x', ['0xt3'], '2023-01-02 00:00:00', 11, '0xh2')
+        """,
+    )
+
+    return DuckDBBackend(lakehouse_path=str(tmp_path))
+
+
+def test_stage_sql_runs_over_the_local_lakehouse(backend, tmp_path):
+    sql_template = get_sql_template("src/pipelines/stage/transformations/ethereum_logs.sql")
+    params = dict(
+        filter_value=0,
+        source_database="db_raw_dev",
+        target_database="db_stage_dev",
+        table_name="ethereum_logs",
+        bucket_name="s3://data-lakehouse-dev",
+        layer="stage",
+        data_source="ethereum",
+    )
+
+    assert not backend.does_table_exist("db_stage_dev", "ethereum_logs")
+
+    backend.run_query(sql_template.render("full_load", **params), database="db_stage_dev")
+
+    new_logs = "(0, '0xc', 0, '0x1', '0x', ['0xt4'], '2023-02-01 00:00:00', 12, '0xh3')"
+    write_raw_logs(tmp_path, date_partition="2023-02", logs=new_logs)
+    params.update(filter_value=11, min_date_partition="2023-01")
+    backend.run_query(sql_template.render("incremental_load", **params), database="db_stage_dev")
+
+    logs = backend.read_query("SELECT * FROM db_stage_dev.ethereum_logs ORDER BY block_number", database="db_stage_dev")
+
+    assert backend.get_table_partition_columns("db_stage_dev", "ethereum_logs") == ["date_partition"]
+    assert logs["block_timestamp"].tolist() == [1672531200, 1672617600, 1675209600]
+    assert logs["date_partition"].tolist() == ["2023-01", "2023-01", "2023-02"]
+    assert [query_stats["rows_written"] for query_stats in backend.query_stats] == [2, 1, 0]
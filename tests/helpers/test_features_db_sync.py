@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from src.helpers.features_db_sync import FeaturesDbSync
+
+
+def get_batches(number_of_batches, batch_size=10):
+    for batch_index in range(number_of_batches):
+        yield [{"walletAddress": f"0x{batch_index}{row}"} for row in range(batch_size)], 1000 + batch_index
+
+
+def test_every_batch_is_acknowledged():
+    written = []
+    lock = threading.Lock()
+
+    def write_batch(documents):
+        with lock:
+            written.extend(documents)
+        return len(documents)
+
+    stats = FeaturesDbSync(write_batch=write_batch, max_writers=4, max_queued_batches=2).run(get_batches(50))
+
+    assert len(written) == 500
+    assert stats["acknowledged"] == stats["documents"] == 500
+    assert stats["acknowledged_batches"] == stats["batches"] == 50
+    assert stats["last_timestamp"] == 1049
+
+
+def test_reader_waits_for_the_writers():
+    read_batches = []
+    fourth_batch_read = threading.Event()
+    release_writers = threading.Event()
+
+    def iterate_batches():
+        for batch in get_batches(20):
+            read_batches.append(batch)
+            if len(read_batches) == 4:
+                fourth_batch_read.set()
+            yield batch
+
+    def write_batch(documents):
+        release_writers.wait(timeout=5)
+        return len(documents)
+
+    sync = FeaturesDbSync(write_batch=write_batch, max_writers=1, max_queued_batches=2)
+    sync_thread = threading.Thread(target=sync.run, args=(iterate_batches(),))
+    sync_thread.start()
+
+    # The fourth batch is only read once the third one is queued, so the writer holds the first one, the queue is full
+    # and the reader waits to put the fourth one until the writer is released
+    assert fourth_batch_read.wait(timeout=5)
+    assert sync.batches.full()
+    assert len(read_batches) == 4
+
+    release_writers.set()
+    sync_thread.join(timeout=5)
+    assert not sync_thread.is_alive()
+    assert sync.stats["acknowledged"] == 200
+
+
+def test_writer_error_stops_the_sync_and_is_raised():
+    def write_batch(documents):
+        if documents[0]["walletAddress"] == "0x30":
+            raise Exception("connection reset")
+        return len(documents)
+
+    sync = FeaturesDbSync(write_batch=write_batch, max_writers=2, max_queued_batches=2)
+
+    with pytest.raises(Exception, match="connection reset"):
+        sync.run(get_batches(1000))
+
+    assert sync.stats["batches"] < 1000
+
+
+def test_documents_not_acknowledged_fail_the_sync():
+    sync = FeaturesDbSync(write_batch=lambda documents: len(documents) - 1, max_writers=2)
+
+    with pytest.raises(Exception, match="not acknowledged"):
+        sync.run(get_batches(3))
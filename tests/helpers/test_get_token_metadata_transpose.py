@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from src.helpers.get_token_metadata_transpose import TranposeTokenMetadata, format_utc_timestamp
+
+
+def get_loader(**kwargs):
+    return TranposeTokenMetadata(api_key="key", concurrency=2, requests_per_second=1000, page_size=2, **kwargs)
+
+
+def test_timestamps_are_formatted_as_iso_8601_utc():
+    assert format_utc_timestamp("2023-05-01 10:00:00") == "2023-05-01T10:00:00.000Z"
+    assert format_utc_timestamp("2023-05-01T12:00:00.123+02:00") == "2023-05-01T10:00:00.123Z"
+    assert format_utc_timestamp(pd.Timestamp("2023-05-01 10:00:00.5", tz="UTC")) == "2023-05-01T10:00:00.500Z"
+
+
+def test_cursor_and_window_bounds_share_the_format(monkeypatch):
+    requested_parameters = []
+    pages = [
+        [
+            {"contract_address": "0xa", "last_refreshed": "2023-05-01 10:00:00", "created_timestamp": "2023-01-01"},
+            {"contract_address": "0xb", "last_refreshed": None, "created_timestamp": "2023-05-01T11:00:00Z"},
+        ],
+        [],
+    ]
+
+    loader = get_loader(last_timestamp_inserted="2023-05-01 00:00:00")
+
+    def get_token_metadata(**parameters):
+        requested_parameters.append(parameters)
+        return {"results": pages[len(requested_parameters) - 1]}
+
+    monkeypatch.setattr(loader, "get_token_metadata", get_token_metadata)
+    window_start, window_end = loader.split_time_windows()[-1]
+
+    loader.fetch_window(window_start=window_start, window_end=window_end)
+
+    assert loader.last_timestamp_inserted == "2023-05-01T00:00:00.000Z"
+    assert window_end == "9999-12-31T23:59:59.999Z"
+    assert requested_parameters[0]["cursor_last_refreshed"] == window_start
+    assert requested_parameters[1]["cursor_last_refreshed"] == "2023-05-01T11:00:00.000Z"
+    assert all(bound.endswith("Z") for window in loader.split_time_windows() for bound in window)
+
+
+def test_session_is_closed_when_a_window_fails(monkeypatch):
+    loader = get_loader()
+    closed = []
+    monkeypatch.setattr(loader.session, "close", lambda: closed.append(True))
+    monkeypatch.setattr(loader, "get_token_metadata", lambda **parameters: None)
+
+    with pytest.raises(Exception, match="Failed to fetch token metadata"):
+        loader.run()
+
+    assert closed == [True]
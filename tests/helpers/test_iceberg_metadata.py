@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from src.helpers import iceberg_metadata
+from src.helpers.iceberg_metadata import read_column_upper_bound, read_file_stats, select_partitions_to_compact
+
+
+class FakeQueryCache(object):
+    """Query cache stand-in recording the queries, with the metadata of two address partitions."""
+
+    def __init__(self):
+        self.queries = []
+
+    def read_sql_query(self, sql, database, tags=None):
+        self.queries.append(sql)
+
+        if "$files" in sql:
+            return pd.DataFrame(
+                {"partition_value": ["00", "01"], "data_files": [40, 2], "small_files": [38, 0], "delete_files": [0, 6]}
+            )
+
+        if "GROUP BY" in sql:
+            return pd.DataFrame({"address_partition": ["00", "01"], "upper_bound": [1700000000, 1700000500]})
+
+        return pd.DataFrame({"upper_bound": [1700000500]})
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    query_cache = FakeQueryCache()
+    monkeypatch.setattr(iceberg_metadata, "get_query_cache", lambda: query_cache)
+    return query_cache
+
+
+def test_upper_bound_is_read_from_the_partitions_metadata_table(query_cache):
+    upper_bounds = read_column_upper_bound(
+        database="db_analytics_dev", table_name="rugpull_features", column="last_interaction_timestamp"
+    )
+
+    assert upper_bounds["upper_bound"][0] == 1700000500
+    assert '"db_analytics_dev"."rugpull_features$partitions"' in query_cache.queries[0]
+    assert "MAX(data.last_interaction_timestamp.max)" in query_cache.queries[0]
+
+
+def test_upper_bound_by_partition(query_cache):
+    upper_bounds = read_column_upper_bound(
+        database="db_analytics_dev",
+        table_name="ethereum_wallet_features",
+        column="wallet_last_tx",
+        partition_column="address_partition",
+    )
+
+    assert dict(zip(upper_bounds["address_partition"], upper_bounds["upper_bound"])) == {
+        "00": 1700000000,
+        "01": 1700000500,
+    }
+    assert "GROUP BY partition.address_partition" in query_cache.queries[0]
+
+
+def test_file_stats_are_read_from_the_files_metadata_table(query_cache):
+    file_stats = read_file_stats(
+        database="db_analytics_dev",
+        table_name="ethereum_wallet_features",
+        small_file_bytes=128 * 1024 * 1024,
+        partition_column="address_partition",
+    )
+
+    assert list(file_stats["partition_value"]) == ["00", "01"]
+    assert '"db_analytics_dev"."ethereum_wallet_features$files"' in query_cache.queries[0]
+    assert "'/address_partition=([^/]+)/'" in query_cache.queries[0]
+    assert "file_size_in_bytes < 134217728" in query_cache.queries[0]
+
+
+def test_only_fragmented_partitions_are_compacted_most_fragmented_first():
+    file_stats = pd.DataFrame(
+        {
+            "partition_value": ["00", "01", "02", "03"],
+            "data_files": [4, 40, 2, 0],
+            "small_files": [3, 38, 0, 0],
+            "delete_files": [1, 0, 6, 0],
+        }
+    )
+
+    partitions_to_compact = select_partitions_to_compact(file_stats, min_small_files=5, max_delete_file_ratio=1.0)
+
+    assert list(partitions_to_compact["partition_value"]) == ["01", "02"]
+    assert list(partitions_to_compact["delete_file_ratio"]) == [0.0, 3.0]
@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from src.helpers import memory
+from src.helpers.memory import MemoryGovernor, get_memory_usage_mb, get_process_tree_memory_mb
+
+
+def test_adapt_batch_size_shrinks_when_under_pressure(monkeypatch):
+    memory_governor = MemoryGovernor(memory_budget_mb=1000, soft_limit_ratio=0.8)
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 900)
+
+    assert memory_governor.adapt_batch_size(batch_size=1000, min_batch_size=100) == 500
+    assert memory_governor.adapt_batch_size(batch_size=150, min_batch_size=100) == 100
+
+
+def test_adapt_batch_size_keeps_size_below_soft_limit(monkeypatch):
+    memory_governor = MemoryGovernor(memory_budget_mb=1000, soft_limit_ratio=0.8)
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 100)
+
+    assert memory_governor.adapt_batch_size(batch_size=1000) == 1000
+
+
+def test_adapt_batch_size_uses_last_stage_peak(monkeypatch):
+    memory_governor = MemoryGovernor(memory_budget_mb=1000, soft_limit_ratio=0.8)
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 850)
+
+    with memory_governor.stage("block_range"):
+        pass
+
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 100)
+
+    assert memory_governor.adapt_batch_size(batch_size=1000, stage_name="block_range") == 500
+    assert memory_governor.peak_memory_by_stage["block_range"] == 850
+
+
+def test_read_csv_in_batches_splits_file_when_budget_is_low(tmp_path, monkeypatch):
+    file_path = tmp_path / "blocks.csv"
+    pd.DataFrame({"number": range(100), "hash": [f"0x{i:064x}" for i in range(100)]}).to_csv(file_path, index=False)
+
+    memory_governor = MemoryGovernor(memory_budget_mb=0.01, soft_limit_ratio=1)
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 0)
+
+    batches = list(memory_governor.read_csv_in_batches(str(file_path)))
+
+    assert len(batches) > 1
+    assert sum(batch.shape[0] for batch in batches) == 100
+
+
+def test_read_csv_in_batches_keeps_the_dtypes_of_every_batch(tmp_path, monkeypatch):
+    file_path = tmp_path / "traces.csv"
+    pd.DataFrame(
+        {"gas": [None] * 50 + list(range(50)), "error": [None] * 50 + ["Reverted"] * 50, "value": [10**30] * 100}
+    ).to_csv(file_path, index=False)
+
+    memory_governor = MemoryGovernor(memory_budget_mb=0.01, soft_limit_ratio=1)
+    monkeypatch.setattr(memory_governor, "current_memory_mb", lambda: 0)
+
+    batches = list(
+        memory_governor.read_csv_in_batches(str(file_path), dtype={"gas": "float64", "error": str, "value": str})
+    )
+
+    assert len(batches) > 1
+    assert len({tuple(map(str, batch.dtypes)) for batch in batches}) == 1
+    assert set(pd.concat(batches)["value"]) == {str(10**30)}
+
+
+def test_memory_usage_leaves_out_the_inactive_page_cache(tmp_path, monkeypatch):
+    (tmp_path / "memory.current").write_text(f"{3 * 1024 ** 3}\n")
+    (tmp_path / "memory.stat").write_text(f"anon {1024 ** 3}\nfile {2 * 1024 ** 3}\ninactive_file {1024 ** 3}\n")
+    monkeypatch.setattr(
+        memory,
+        "CGROUP_MEMORY_FILES",
+        [(str(tmp_path / "memory.current"), str(tmp_path / "memory.stat"), "inactive_file")],
+    )
+
+    assert get_memory_usage_mb() == 2048
+
+
+def test_process_tree_memory_includes_the_subprocesses():
+    memory_before = get_process_tree_memory_mb()
+    child = subprocess.Popen([sys.executable, "-c", "import time; data = bytearray(64 * 1024 ** 2); time.sleep(30)"])
+
+    try:
+        memory_with_child = memory_before
+        for _ in range(100):
+            memory_with_child = get_process_tree_memory_mb()
+            if memory_with_child > memory_before + 32:
+                break
+            time.sleep(0.05)
+    finally:
+        child.kill()
+        child.wait()
+
+    assert memory_with_child > memory_before + 32
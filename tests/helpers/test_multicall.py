@@ -0,0 +1,97 @@
+import asyncio
+
+from eth_abi import decode_abi, encode_abi
+
+from src.helpers.multicall import (
+    AGGREGATE3_SELECTOR,
+    TOKEN_METADATA_SELECTORS,
+    MulticallTokenReader,
+    decode_aggregate3,
+    decode_string,
+    decode_uint,
+    encode_aggregate3,
+)
+
+TOKEN_ADDRESS = "0x6B175474E89094C44Da98b954EedeAC495271d0F"
+BYTES32_TOKEN_ADDRESS = "0x9f8F72aA9304c8B593d555F12eF6589cC3A579A2"
+REVERTING_TOKEN_ADDRESS = "0x0000000000000000000000000000000000000001"
+
+
+def encode_bytes32(value: str) -> bytes:
+    return value.encode("utf-8").ljust(32, b"\x00")
+
+
+def test_aggregate3_call_data_round_trips():
+    calls = [(TOKEN_ADDRESS, selector) for selector in TOKEN_METADATA_SELECTORS.values()]
+
+    call_data = encode_aggregate3(calls)
+
+    assert call_data.startswith("0x" + AGGREGATE3_SELECTOR.hex())
+    decoded_calls = decode_abi(["(address,bool,bytes)[]"], bytes.fromhex(call_data[10:]))[0]
+    assert [(target.lower(), allow_failure, data) for target, allow_failure, data in decoded_calls] == [
+        (TOKEN_ADDRESS.lower(), True, selector) for selector in TOKEN_METADATA_SELECTORS.values()
+    ]
+
+
+def test_aggregate3_results_keep_the_reverted_calls():
+    results = [(True, encode_abi(["string"], ["Dai Stablecoin"])), (False, b""), (True, encode_abi(["uint8"], [18]))]
+
+    decoded_results = decode_aggregate3("0x" + encode_abi(["(bool,bytes)[]"], [results]).hex())
+
+    assert [tuple(result) for result in decoded_results] == results
+
+
+def test_decode_string_of_abi_strings_and_bytes32():
+    assert decode_string(encode_abi(["string"], ["Dai Stablecoin"])) == "Dai Stablecoin"
+    assert decode_string(encode_bytes32("MKR")) == "MKR"
+    assert decode_string(encode_bytes32("")) is None
+    assert decode_string(b"") is None
+    assert decode_string(b"\x01" * 40) is None
+
+
+def test_decode_uint():
+    assert decode_uint(encode_abi(["uint8"], [18])) == 18
+    assert decode_uint(encode_abi(["uint256"], [10**30])) == 10**30
+    assert decode_uint(b"") is None
+
+
+def test_read_batch_decodes_every_token_and_leaves_the_reverted_calls_empty():
+    token_results = {
+        TOKEN_ADDRESS: [
+            (True, encode_abi(["string"], ["Dai Stablecoin"])),
+            (True, encode_abi(["string"], ["DAI"])),
+            (True, encode_abi(["uint8"], [18])),
+            (True, encode_abi(["uint256"], [10**27])),
+        ],
+        BYTES32_TOKEN_ADDRESS: [
+            (True, encode_bytes32("Maker")),
+            (True, encode_bytes32("MKR")),
+            (True, encode_abi(["uint8"], [18])),
+            (True, encode_abi(["uint256"], [10**24])),
+        ],
+        REVERTING_TOKEN_ADDRESS: [(False, b"")] * 4,
+    }
+
+    addresses = {token_address.lower(): token_address for token_address in token_results}
+    selectors = list(TOKEN_METADATA_SELECTORS.values())
+
+    async def aggregate(session, calls):
+        decoded_calls = decode_abi(["(address,bool,bytes)[]"], bytes.fromhex(encode_aggregate3(calls)[10:]))[0]
+        results = [
+            token_results[addresses[target.lower()]][selectors.index(call_data)]
+            for target, _, call_data in decoded_calls
+        ]
+        return decode_aggregate3("0x" + encode_abi(["(bool,bytes)[]"], [results]).hex())
+
+    reader = MulticallTokenReader(node_rpc_urls=["http://node"])
+    reader.aggregate = aggregate
+
+    columns = asyncio.run(reader.read_batch(None, asyncio.Semaphore(1), list(token_results)))
+
+    assert columns == {
+        "name": ["Dai Stablecoin", "Maker", None],
+        "symbol": ["DAI", "MKR", None],
+        "decimals": [18, 18, None],
+        "total_supply": [10**27, 10**24, None],
+        "is_read": [True, True, True],
+    }
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from src.helpers import query_cache
+from src.helpers.query_cache import QueryCache, normalize_sql
+
+
+class FakeMultiplexer(object):
+    """Multiplexer stand-in: every query scans 100 bytes, queries run with result reuse are reused."""
+
+    def __init__(self):
+        self.runs = []
+
+    def run_query(self, sql, database, tags=None, result_reuse_max_age_minutes=0):
+        self.runs.append((sql, result_reuse_max_age_minutes))
+        reused = result_reuse_max_age_minutes > 0 and len(self.runs) > 1
+        return {
+            "QueryExecutionId": str(len(self.runs)),
+            "Statistics": {
+                "DataScannedInBytes": 0 if reused else 100,
+                "ResultReuseInformation": {"ReusedPreviousResult": reused},
+            },
+        }
+
+    def get_query_results(self, query_execution):
+        return pd.DataFrame({"last_row_inserted": [int(query_execution["QueryExecutionId"])]})
+
+
+@pytest.fixture
+def multiplexer(monkeypatch):
+    multiplexer = FakeMultiplexer()
+    monkeypatch.setattr(query_cache, "get_execution_backend", lambda: multiplexer)
+    return multiplexer
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT MAX(a)  -- watermark\n FROM db.t ;") == normalize_sql("SELECT MAX(a)\nFROM db.t")
+
+
+def test_memo_hits_until_the_table_is_written(multiplexer):
+    cache = QueryCache(ttl_seconds=60, result_reuse_max_age_minutes=0)
+    sql = "SELECT MAX(block_number) AS last_row_inserted FROM db.ethereum_logs"
+
+    assert cache.read_sql_query(sql, "db")["last_row_inserted"][0] == 1
+    assert cache.read_sql_query(sql + "\n", "db")["last_row_inserted"][0] == 1
+    assert cache.stats["memo_hits"] == 1 and cache.stats["bytes_saved"] == 100
+
+    cache.invalidate("ethereum_logs")
+
+    assert cache.read_sql_query(sql, "db")["last_row_inserted"][0] == 2
+    assert cache.read_sql_query(sql, "db")["last_row_inserted"][0] == 3
+    assert len(multiplexer.runs) == 3
+
+
+def test_result_reuse_is_disabled_for_written_tables(multiplexer):
+    cache = QueryCache(ttl_seconds=0, result_reuse_max_age_minutes=15)
+    sql = "SELECT MAX(block_number) AS last_row_inserted FROM db.ethereum_logs"
+
+    cache.read_sql_query(sql, "db")
+    cache.read_sql_query(sql, "db")
+    assert cache.stats["reuse_hits"] == 1 and cache.stats["bytes_saved"] == 100
+
+    cache.invalidate("ethereum_logs")
+    cache.read_sql_query(sql, "db")
+    assert multiplexer.runs[-1][1] == 0
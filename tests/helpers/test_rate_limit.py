@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from src.helpers.rate_limit import KeyScheduler, TokenBucket
+
+
+def test_token_bucket_allows_burst_up_to_capacity():
+    token_bucket = TokenBucket(rate=1, capacity=3)
+
+    assert [token_bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert token_bucket.try_acquire() > 0
+
+
+def test_token_bucket_acquire_waits_for_refill():
+    token_bucket = TokenBucket(rate=20, capacity=1)
+    token_bucket.acquire()
+
+    start = time.monotonic()
+    token_bucket.acquire()
+
+    assert time.monotonic() - start >= 0.04
+
+
+def test_key_scheduler_spreads_requests_over_keys():
+    key_scheduler = KeyScheduler(api_keys=["a", "b", "c"], rate=1, capacity=1)
+
+    keys = [key_scheduler.try_acquire()[0] for _ in range(3)]
+    key, wait_time = key_scheduler.try_acquire()
+
+    assert sorted(keys) == ["a", "b", "c"]
+    assert key is None and wait_time > 0
+
+
+def test_key_scheduler_skips_keys_in_cooldown():
+    key_scheduler = KeyScheduler(api_keys=["a", "b"], rate=10)
+    key_scheduler.cooldown("a", 60)
+
+    assert asyncio.run(key_scheduler.acquire()) == "b"
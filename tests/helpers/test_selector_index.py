@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.helpers import selector_index
+from src.helpers.selector_index import SelectorIndex
+
+MINT_SELECTOR = "0x40c10f19"
+BURN_SELECTOR = "0x42966c68"
+TOTAL_SUPPLY_SELECTOR = "0x18160ddd"
+
+
+class FakeDataLakehouse(object):
+    """Data lakehouse stand-in serving the shards of the selector index, and recording the queries."""
+
+    def __init__(self):
+        self.queries = []
+        self.shards = [
+            (MINT_SELECTOR, "0a", ["0x0a01", "0x0a02", "0x0a03"]),
+            (MINT_SELECTOR, "0b", ["0x0b01"]),
+            (BURN_SELECTOR, "0a", ["0x0a02", "0x0a03"]),
+            (BURN_SELECTOR, "0c", ["0x0c01"]),
+            (TOTAL_SUPPLY_SELECTOR, "0a", ["0x0a01"]),
+        ]
+
+    def read_sql_query(self, query, database_name):
+        self.queries.append(query)
+        shards = [shard for shard in self.shards if f"'{shard[0]}'" in query]
+        return pd.DataFrame(shards, columns=["selector", "hash_partition", "addresses"])
+
+
+@pytest.fixture
+def data_lakehouse(monkeypatch):
+    data_lakehouse = FakeDataLakehouse()
+    monkeypatch.setattr(selector_index, "DataLakehouse", lambda: data_lakehouse)
+    return data_lakehouse
+
+
+def test_contracts_exposing_all_the_functions(data_lakehouse):
+    index = SelectorIndex(database_name="db_stage")
+
+    assert index.find_contracts([MINT_SELECTOR, BURN_SELECTOR]).tolist() == ["0x0a02", "0x0a03"]
+    assert index.find_contracts(["totalSupply()", MINT_SELECTOR]).tolist() == ["0x0a01"]
+
+
+def test_contracts_exposing_any_of_the_functions(data_lakehouse):
+    index = SelectorIndex(database_name="db_stage")
+
+    contracts = index.find_contracts([MINT_SELECTOR, BURN_SELECTOR], match_all=False)
+
+    assert contracts.tolist() == ["0x0a01", "0x0a02", "0x0a03", "0x0b01", "0x0c01"]
+
+
+def test_selectors_missing_from_the_index(data_lakehouse):
+    index = SelectorIndex(database_name="db_stage")
+
+    assert index.find_contracts(["0xdeadbeef"]).tolist() == []
+    assert index.find_contracts([MINT_SELECTOR, "0xdeadbeef"]).tolist() == []
+    assert index.find_contracts([MINT_SELECTOR, "0xdeadbeef"], match_all=False).tolist() == [
+        "0x0a01",
+        "0x0a02",
+        "0x0a03",
+        "0x0b01",
+    ]
+    assert index.postings["0xdeadbeef"] == {}
+
+
+def test_postings_are_loaded_once_until_the_index_is_refreshed(data_lakehouse):
+    index = SelectorIndex(database_name="db_stage")
+
+    index.find_contracts([MINT_SELECTOR])
+    index.find_contracts([MINT_SELECTOR, BURN_SELECTOR])
+    index.find_contracts([MINT_SELECTOR, BURN_SELECTOR])
+
+    assert len(data_lakehouse.queries) == 2
+    assert f"'{MINT_SELECTOR}'" not in data_lakehouse.queries[1]
+
+    # The stage pipeline rebuilt the index with a new contract
+    data_lakehouse.shards.append((MINT_SELECTOR, "0c", ["0x0c01"]))
+    assert "0x0c01" not in index.find_contracts([MINT_SELECTOR])
+
+    index.refresh()
+
+    assert "0x0c01" in index.find_contracts([MINT_SELECTOR])
+    assert len(data_lakehouse.queries) == 3
+    assert isinstance(index.postings[MINT_SELECTOR]["0c"], np.ndarray)
@@ -0,0 +1,61 @@
+import pytest
+
+from src.helpers.sql_templates import SqlTemplate, get_sql_template_registry
+
+SQL = """CREATE TABLE {{target_database}}.{{table_name}} AS SELECT * FROM {{source_database}}.blocks
+-- incremental load
+INSERT INTO {{target_database}}.{{table_name}}
+SELECT * FROM {{source_database}}.blocks WHERE block_number > {{filter_value}} AND partition IN {{chunk}}
+"""
+
+
+def test_render_sections():
+    template = SqlTemplate(name="blocks.sql", sql=SQL)
+    params = dict(source_database="db_raw", target_database="db_stage", table_name="blocks", filter_value=10)
+
+    assert template.render("full_load", **params).strip() == (
+        "CREATE TABLE db_stage.blocks AS SELECT * FROM db_raw.blocks"
+    )
+    assert "block_number > 10 AND partition IN ('0a', '0b')" in template.render(
+        "incremental_load", chunk=("0a", "0b"), **params
+    )
+
+
+def test_render_validates_parameters():
+    template = SqlTemplate(name="blocks.sql", sql=SQL)
+    params = dict(source_database="db_raw", target_database="db_stage", table_name="blocks", chunk=("0a",))
+
+    with pytest.raises(Exception, match="Missing parameters"):
+        template.render("incremental_load", **params)
+
+    with pytest.raises(Exception, match="Invalid value"):
+        template.render("incremental_load", filter_value="1; DROP TABLE blocks", **params)
+
+
+def test_render_prepared():
+    template = SqlTemplate(name="blocks.sql", sql=SQL)
+    params = dict(source_database="db_raw", target_database="db_stage", table_name="blocks", chunk=("0a",))
+
+    statement_name, statement, values = template.render_prepared("incremental_load", filter_value=10, **params)
+    same_statement_name, _, other_values = template.render_prepared(
+        "incremental_load", filter_value=20, **{**params, "chunk": ("0b",)}
+    )
+
+    assert statement_name.startswith("blocks_incremental_load_")
+    assert statement_name == same_statement_name
+    assert "block_number > ? AND partition IN (?)" in statement
+    assert values == ["10", "'0a'"] and other_values == ["20", "'0b'"]
+
+
+def test_render_prepared_validates_the_chunk():
+    template = SqlTemplate(name="blocks.sql", sql=SQL)
+    params = dict(source_database="db_raw", target_database="db_stage", table_name="blocks", filter_value=10)
+
+    with pytest.raises(Exception, match="Invalid value"):
+        template.render_prepared("incremental_load", chunk=("0a', '0b",), **params)
+
+
+def test_registry_compiles_the_pipelines_sql_files():
+    registry = get_sql_template_registry()
+
+    assert "src/pipelines/stage/transformations/ethereum_blocks.sql" in registry.templates
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from src.helpers.table_scheduler import TableScheduler, get_upstream_tables
+
+DEPENDENCIES = {
+    "ethereum_erc20_transactions": [],
+    "ethereum_normal_transactions": [],
+    "ethereum_internal_transactions": [],
+    "ethereum_wallet_transactions": [
+        "ethereum_erc20_transactions",
+        "ethereum_normal_transactions",
+        "ethereum_internal_transactions",
+    ],
+}
+
+
+def test_get_upstream_tables():
+    dependencies = {"a": [], "b": ["a"], "c": ["b"]}
+
+    assert get_upstream_tables(dependencies, "c") == {"a", "b"}
+    assert get_upstream_tables(dependencies, "a") == set()
+
+
+def test_invalid_dependencies():
+    with pytest.raises(Exception, match="not scheduled"):
+        TableScheduler(dependencies={"a": ["b"]})
+
+    with pytest.raises(Exception, match="depends on itself"):
+        TableScheduler(dependencies={"a": ["b"], "b": ["a"]})
+
+
+def test_independent_tables_run_together_before_their_dependent():
+    barrier = threading.Barrier(3, timeout=5)
+    finished = []
+
+    def run_table(table_name):
+        if table_name != "ethereum_wallet_transactions":
+            barrier.wait()  # fails unless the three independent tables run at the same time
+        finished.append(table_name)
+
+    table_stats = TableScheduler(dependencies=DEPENDENCIES, max_concurrent_tables=4).run(run_table)
+
+    assert finished[-1] == "ethereum_wallet_transactions"
+    assert all(stats["status"] == "succeeded" for stats in table_stats.values())
+    assert table_stats["ethereum_wallet_transactions"]["started_after_seconds"] >= 0
+
+
+def test_tables_depending_on_a_failed_table_are_skipped():
+    finished = []
+
+    def run_table(table_name):
+        if table_name == "ethereum_normal_transactions":
+            raise Exception("query failed")
+        finished.append(table_name)
+
+    scheduler = TableScheduler(dependencies=DEPENDENCIES, max_concurrent_tables=2)
+
+    with pytest.raises(Exception, match="Tables not loaded"):
+        scheduler.run(run_table)
+
+    assert sorted(finished) == ["ethereum_erc20_transactions", "ethereum_internal_transactions"]
+    assert scheduler.table_stats["ethereum_normal_transactions"]["status"] == "failed"
+    assert scheduler.table_stats["ethereum_wallet_transactions"]["status"] == "skipped"
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from src.helpers.token_classifier import (
+    DESTROY_SELECTORS,
+    ERC20_SELECTORS,
+    ERC721_ONLY_SELECTORS,
+    ERC721_SELECTORS,
+    PROXY_SELECTORS,
+    classify_token_selectors,
+)
+
+
+def test_selectors_match_the_known_values():
+    assert ERC20_SELECTORS == ["0x70a08231", "0x18160ddd"]
+    assert ERC721_ONLY_SELECTORS == ["0x6352211e"]
+
+
+def test_classify_token_selectors():
+    erc20 = ",".join(ERC20_SELECTORS + ["0xa9059cbb"])
+    erc721 = ERC20_SELECTORS[:1] + ERC721_ONLY_SELECTORS + ERC721_SELECTORS
+    destroyable_erc20 = ERC20_SELECTORS + DESTROY_SELECTORS[:1]
+    proxy = ERC20_SELECTORS + PROXY_SELECTORS[:1]
+
+    classification = classify_token_selectors(
+        pd.Series([erc20, erc721, destroyable_erc20, proxy, ["0x12345678"], None], index=list("abcdef"))
+    )
+
+    assert classification["type"].tolist() == ["ERC20", "ERC721", "ERC20", "ERC20", "Unknown", "Unknown"]
+    assert classification["is_destroyable"].tolist() == [False, False, True, False, False, False]
+    assert classification["is_ambiguous"].tolist() == [False, False, False, True, False, True]
+    assert classification.index.tolist() == list("abcdef")
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from src.helpers.token_dimension import TokenDimension
+
+
+def test_upsert_keeps_the_most_recently_refreshed_row(tmp_path):
+    token_dimension = TokenDimension(local_path=str(tmp_path / "token_dimension.parquet"))
+
+    token_dimension.upsert(
+        pd.DataFrame(
+            {
+                "contract_address": ["0xAA", "0xaa", "0xbb"],
+                "name": ["Old Token", "New Token", "BB Token"],
+                "decimals": [18, 6, None],
+                "symbol": ["OLD", "NEW", "BB"],
+                "standard": ["ERC-20", "ERC-20", "ERC-721"],
+                "status": ["Active", "Active", "Destroyed"],
+                "last_refreshed": ["2023-01-01", "2023-02-01", "2023-01-01"],
+            }
+        )
+    )
+    token_dimension.upsert(
+        pd.DataFrame(
+            {
+                "contract_address": ["0xaa"],
+                "decimals": [8],
+                "symbol": ["STALE"],
+                "standard": ["ERC-20"],
+                "last_refreshed": ["2022-12-01"],
+            }
+        )
+    )
+    token_dimension.save()
+
+    reloaded = TokenDimension(local_path=str(tmp_path / "token_dimension.parquet"))
+    tokens = reloaded.get_tokens(["0xAA", "0xbb", "0xcc"])
+
+    assert tokens.shape[0] == 2
+    assert tokens.loc["0xaa", "symbol"] == "NEW"
+    assert tokens.loc["0xaa", "name"] == "New Token"
+    assert tokens.loc["0xbb", "status"] == "Destroyed"
+    assert tokens.loc["0xbb", "decimals"] == 18
+    assert reloaded.last_refreshed() == pd.Timestamp("2023-02-01")
+
+
+def test_dimension_saved_without_name_and_status_is_loaded_with_them_empty(tmp_path):
+    local_path = str(tmp_path / "token_dimension.parquet")
+    pd.DataFrame(
+        {
+            "contract_address": ["0xaa"],
+            "decimals": [18],
+            "symbol": ["AA"],
+            "standard": ["ERC-20"],
+            "last_refreshed": [pd.Timestamp("2023-01-01")],
+        }
+    ).to_parquet(local_path, index=False)
+
+    tokens = TokenDimension(local_path=local_path).get_tokens(["0xaa"])
+
+    assert tokens.loc["0xaa", "symbol"] == "AA"
+    assert pd.isna(tokens.loc["0xaa", "name"])
+    assert pd.isna(tokens.loc["0xaa", "status"])
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.helpers.watermark_store import SqliteWatermarkStore, WatermarkStore, get_watermark_key
+
+
+def test_sqlite_watermark_store(tmp_path):
+    watermark_store = SqliteWatermarkStore(path=str(tmp_path / "watermarks.sqlite"))
+    key = get_watermark_key(database="db_stage_dev", table_name="ethereum_blocks")
+
+    assert watermark_store.get(key) is None
+
+    watermark_store.set(key, np.int64(17000000), table_exists=True)
+    watermark_store.set(key, np.int64(17000100), table_exists=True)
+
+    watermark = watermark_store.get(key)
+    assert watermark["watermark"] == 17000100
+    assert watermark["table_exists"] is True
+
+
+def test_sqlite_watermark_store_encodes_timestamps_and_dicts(tmp_path):
+    watermark_store = SqliteWatermarkStore(path=str(tmp_path / "watermarks.sqlite"))
+
+    watermark_store.set("db.ethereum_contracts", pd.Timestamp("2023-05-01 10:00:00"))
+    watermark_store.set(
+        "db.ethereum_wallet_features", {"last_timestamp_inserted": 10, "by_address_partition": {"0a": 10}}
+    )
+
+    assert watermark_store.get("db.ethereum_contracts")["watermark"] == "2023-05-01 10:00:00"
+    assert watermark_store.get("db.ethereum_wallet_features")["watermark"]["by_address_partition"] == {"0a": 10}
+
+
+def test_watermark_stores_implement_get_and_set():
+    class IncompleteWatermarkStore(WatermarkStore):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteWatermarkStore()
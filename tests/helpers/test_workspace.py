@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from src.helpers.workspace import RunWorkspace
+
+
+def test_every_run_gets_its_own_directory(tmp_path):
+    first_workspace = RunWorkspace(run_name="raw", root_dir=str(tmp_path))
+    second_workspace = RunWorkspace(run_name="raw", root_dir=str(tmp_path))
+
+    assert first_workspace.path != second_workspace.path
+    assert os.path.dirname(first_workspace.file("blocks.csv")) == first_workspace.path
+
+
+def test_directory_is_removed_on_success(tmp_path):
+    with RunWorkspace(run_name="raw", root_dir=str(tmp_path)) as workspace:
+        with open(workspace.file("blocks.csv"), "w") as file:
+            file.write("number\n1\n")
+
+    assert not os.path.exists(workspace.path)
+
+
+def test_directory_is_removed_on_exception(tmp_path):
+    with pytest.raises(ValueError):
+        with RunWorkspace(run_name="raw", root_dir=str(tmp_path)) as workspace:
+            os.makedirs(workspace.file("traces"))
+            raise ValueError("node error")
+
+    assert not os.path.exists(workspace.path)
+
+
+def test_clear_keeps_the_directory(tmp_path):
+    workspace = RunWorkspace(run_name="raw", root_dir=str(tmp_path))
+    os.makedirs(workspace.file("traces"))
+    open(workspace.file("blocks.csv"), "w").close()
+
+    workspace.clear()
+
+    assert os.path.isdir(workspace.path)
+    assert os.listdir(workspace.path) == []
@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+
+from src.helpers.watermark_store import get_watermark_key
+from src.pipelines.analytics import analytics_data_ingestion_pipeline
+from src.pipelines.analytics.analytics_data_ingestion_pipeline import AnalyticsPipeline
+
+
+class FakeWatermarkStore(object):
+    """Watermark store stand-in, without any watermark unless one is set."""
+
+    def __init__(self):
+        self.watermarks = {}
+
+    def get(self, key):
+        return self.watermarks.get(key)
+
+    def set(self, key, watermark, table_exists=True):
+        self.watermarks[key] = {"watermark": watermark, "table_exists": table_exists}
+
+
+class FakeQueryCache(object):
+    """Query cache stand-in recording the queries, answering them with its result."""
+
+    def __init__(self):
+        self.queries = []
+        self.result = None
+
+    def read_sql_query(self, sql, database, tags=None):
+        self.queries.append(sql)
+        return self.result
+
+
+@pytest.fixture
+def watermark_store(monkeypatch):
+    watermark_store = FakeWatermarkStore()
+    monkeypatch.setattr(analytics_data_ingestion_pipeline, "get_watermark_store", lambda: watermark_store)
+    return watermark_store
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    query_cache = FakeQueryCache()
+    monkeypatch.setattr(analytics_data_ingestion_pipeline, "get_query_cache", lambda: query_cache)
+    return query_cache
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = []
+    monkeypatch.setattr(
+        analytics_data_ingestion_pipeline, "write_data_into_datalake_using_ctas", lambda **kwargs: writes.append(kwargs)
+    )
+    return writes
+
+
+@pytest.fixture
+def erc20_pipeline(watermark_store):
+    erc20_pipeline = AnalyticsPipeline(table_name="ethereum_erc20_transactions")
+    watermark_store.set(erc20_pipeline.watermark_key, 17000000)
+    return erc20_pipeline
+
+
+def get_stage_watermark_key(table_name: str) -> str:
+    return get_watermark_key(
+        database=analytics_data_ingestion_pipeline.sdl_settings.DATA_LAKE_STAGE_DATABASE, table_name=table_name
+    )
+
+
+def test_watermark_is_committed_from_the_source_watermark(erc20_pipeline, watermark_store, query_cache, writes):
+    watermark_store.set(get_stage_watermark_key("ethereum_token_transfers"), 17000100)
+
+    erc20_pipeline.run()
+
+    assert writes[0]["filter_value"] == 17000001
+    assert query_cache.queries == []  # neither the source nor the analytics table is scanned
+    assert watermark_store.get(erc20_pipeline.watermark_key)["watermark"] == 17000100
+
+
+def test_watermark_is_committed_from_the_source_rows_without_source_watermark(
+    erc20_pipeline, watermark_store, query_cache, writes
+):
+    query_cache.result = pd.DataFrame({"last_block": [17000050]})
+
+    erc20_pipeline.run()
+
+    assert len(query_cache.queries) == 1
+    assert "ethereum_token_transfers" in query_cache.queries[0]
+    assert "block_number >= 17000001" in query_cache.queries[0]
+    assert watermark_store.get(erc20_pipeline.watermark_key)["watermark"] == 17000050
+
+
+def test_watermark_is_kept_without_new_source_rows(erc20_pipeline, watermark_store, query_cache, writes):
+    watermark_store.set(get_stage_watermark_key("ethereum_token_transfers"), 16999000)
+
+    erc20_pipeline.run()
+
+    assert watermark_store.get(erc20_pipeline.watermark_key)["watermark"] == 17000000
+
+
+def test_wallet_transactions_watermark_is_the_last_block_of_its_sources(watermark_store, query_cache):
+    wallet_pipeline = AnalyticsPipeline(table_name="ethereum_wallet_transactions")
+    for source_table, source_last_block in [
+        ("ethereum_erc20_transactions", 17000100),
+        ("ethereum_normal_transactions", 17000300),
+        ("ethereum_internal_transactions", 16999000),
+    ]:
+        watermark_store.set(
+            get_watermark_key(database=wallet_pipeline.target_data_lake_database, table_name=source_table),
+            source_last_block,
+        )
+
+    assert wallet_pipeline.read_last_block_from_sources(last_block=17000001) == 17000300
+    assert query_cache.queries == []
@@ -0,0 +1,138 @@
+import pandas as pd
+import pytest
+
+from src.helpers.sql_templates import get_sql_template
+from src.pipelines.stage import stage_data_ingestion_pipeline
+from src.pipelines.stage.stage_data_ingestion_pipeline import FIRST_DATE_PARTITION, StagePipeline
+
+
+class FakeWatermarkStore(object):
+    """Watermark store stand-in, without any watermark unless one is set."""
+
+    def __init__(self):
+        self.watermarks = {}
+
+    def get(self, key):
+        return self.watermarks.get(key)
+
+    def set(self, key, watermark, table_exists=True):
+        self.watermarks[key] = {"watermark": watermark, "table_exists": table_exists}
+
+
+class FakeBackend(object):
+    """Execution backend stand-in for an existing, empty, non Iceberg stage table."""
+
+    def is_iceberg_table(self, database, table):
+        return False
+
+
+class FakeQueryCache(object):
+    """Query cache stand-in recording the queries, answering them with its result."""
+
+    def __init__(self):
+        self.queries = []
+        self.result = None
+
+    def read_sql_query(self, sql, database, tags=None):
+        self.queries.append(sql)
+        return self.result
+
+
+@pytest.fixture
+def watermark_store(monkeypatch):
+    watermark_store = FakeWatermarkStore()
+    monkeypatch.setattr(stage_data_ingestion_pipeline, "get_watermark_store", lambda: watermark_store)
+    return watermark_store
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    query_cache = FakeQueryCache()
+    monkeypatch.setattr(stage_data_ingestion_pipeline, "get_query_cache", lambda: query_cache)
+    return query_cache
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = []
+    monkeypatch.setattr(
+        stage_data_ingestion_pipeline, "write_data_into_datalake_using_ctas", lambda **kwargs: writes.append(kwargs)
+    )
+    return writes
+
+
+@pytest.fixture
+def stage_pipeline(monkeypatch, watermark_store):
+    monkeypatch.setattr(stage_data_ingestion_pipeline, "get_execution_backend", lambda: FakeBackend())
+
+    stage_pipeline = StagePipeline(table_name="ethereum_blocks")
+    stage_pipeline.table_exists = True
+    monkeypatch.setattr(stage_pipeline, "scan_last_row_from_table", lambda: None)
+    monkeypatch.setattr(stage_pipeline, "scan_last_partition_from_table", lambda: None)
+
+    return stage_pipeline
+
+
+def test_empty_table_merges_from_the_first_partition(stage_pipeline):
+    last_partition = stage_pipeline.get_last_partition_from_table()
+
+    assert last_partition == FIRST_DATE_PARTITION
+
+    sql = get_sql_template("src/pipelines/stage/transformations/ethereum_blocks.sql").render(
+        "incremental_load",
+        filter_value=0,
+        source_database="db_raw_dev",
+        target_database="db_stage_dev",
+        table_name="ethereum_blocks",
+        min_date_partition=last_partition,
+    )
+
+    assert f"date_partition >= '{FIRST_DATE_PARTITION}'" in sql
+    assert FIRST_DATE_PARTITION < pd.Timestamp("1970-01-01").strftime("%Y-%m")
+
+
+def test_unpartitioned_table_has_no_last_partition(stage_pipeline):
+    assert StagePipeline(table_name="ethereum_tokens_dimension").get_last_partition_from_table() is None
+
+
+def test_watermarks_are_committed_from_the_source_rows_of_the_run(stage_pipeline, watermark_store, query_cache, writes):
+    watermark_store.set(stage_pipeline.watermark_key, 17000000)
+    watermark_store.set(stage_pipeline.partition_watermark_key, "2023-04")
+    query_cache.result = pd.DataFrame({"last_row_inserted": [17000100], "last_partition": ["2023-05"]})
+
+    stage_pipeline.run()
+
+    assert writes[0]["filter_value"] == 17000000 and writes[0]["min_date_partition"] == "2023-04"
+    assert len(query_cache.queries) == 1  # the source rows of the run, the stage table is not scanned
+    assert f"FROM {stage_data_ingestion_pipeline.sdl_settings.DATA_LAKE_RAW_DATABASE}.ethereum_blocks" in (
+        query_cache.queries[0]
+    )
+    assert "number >= 17000000 AND date_partition >= '2023-04'" in query_cache.queries[0]
+    assert watermark_store.get(stage_pipeline.watermark_key)["watermark"] == 17000100
+    assert watermark_store.get(stage_pipeline.partition_watermark_key)["watermark"] == "2023-05"
+
+
+def test_watermarks_are_kept_without_new_source_rows(stage_pipeline, watermark_store, query_cache, writes):
+    watermark_store.set(stage_pipeline.watermark_key, 17000000)
+    watermark_store.set(stage_pipeline.partition_watermark_key, "2023-04")
+    query_cache.result = pd.DataFrame({"last_row_inserted": [None], "last_partition": [None]})
+
+    stage_pipeline.run()
+
+    assert watermark_store.get(stage_pipeline.watermark_key)["watermark"] == 17000000
+    assert watermark_store.get(stage_pipeline.partition_watermark_key)["watermark"] == "2023-04"
+
+
+def test_stage_source_watermark_is_read_from_the_watermark_store(watermark_store, query_cache, writes):
+    selector_index_pipeline = StagePipeline(table_name="ethereum_selector_index")
+    contracts_watermark_key = selector_index_pipeline.watermark_key.replace(
+        "ethereum_selector_index", "ethereum_contracts"
+    )
+    watermark_store.set(selector_index_pipeline.watermark_key, "2023-05-01 10:00:00")
+    watermark_store.set(contracts_watermark_key, "2023-05-02 08:00:00")
+
+    selector_index_pipeline.run()
+
+    assert writes[0]["filter_value"] == "2023-05-01 10:00:00"
+    assert query_cache.queries == []
+    assert watermark_store.get(selector_index_pipeline.watermark_key)["watermark"] == "2023-05-02 08:00:00"
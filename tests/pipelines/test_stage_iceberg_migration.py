@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from src.pipelines.stage import stage_iceberg_migration
+from src.pipelines.stage.stage_iceberg_migration import StageIcebergMigration
+
+CONTRACTS_COLUMNS_TYPES = {
+    "address": "string",
+    "bytecode": "string",
+    "function_sighashes": "string",
+    "is_erc20": "boolean",
+    "date_partition": "string",
+}
+
+
+class FakeMultiplexer(object):
+    """Athena multiplexer stand-in recording the queries, with two date partitions in the Hive table."""
+
+    def __init__(self):
+        self.queries = []
+
+    def run_query(self, sql, database, tags=None):
+        self.queries.append(sql)
+
+    def read_query(self, sql, database, tags=None):
+        return pd.DataFrame({"date_partition": ["2023-04", "2023-05"]})
+
+
+@pytest.fixture
+def fake_multiplexer(monkeypatch):
+    fake_multiplexer = FakeMultiplexer()
+    monkeypatch.setattr(stage_iceberg_migration, "get_athena_multiplexer", lambda: fake_multiplexer)
+    return fake_multiplexer
+
+
+@pytest.fixture
+def columns_types(monkeypatch):
+    columns_types = dict(CONTRACTS_COLUMNS_TYPES)
+    monkeypatch.setattr(stage_iceberg_migration.wr.catalog, "get_table_types", lambda database, table: columns_types)
+    return columns_types
+
+
+def test_contracts_function_sighashes_are_converted_to_arrays(fake_multiplexer, columns_types):
+    migration = StageIcebergMigration(table_name="ethereum_contracts")
+
+    migration.create_iceberg_table()
+    migration.copy_partitions()
+
+    converted_column = (
+        "filter(split(function_sighashes, ','), selector -> selector NOT IN ('', 'nan')) AS function_sighashes"
+    )
+    create_query, insert_query = fake_multiplexer.queries[1], fake_multiplexer.queries[2]
+    assert f"SELECT address, bytecode, {converted_column}, is_erc20, date_partition FROM" in create_query
+    assert f"SELECT address, bytecode, {converted_column}, is_erc20, date_partition FROM" in insert_query
+
+
+def test_contracts_function_sighashes_already_arrays_are_copied_as_is(fake_multiplexer, columns_types):
+    columns_types["function_sighashes"] = "array<string>"
+
+    StageIcebergMigration(table_name="ethereum_contracts").create_iceberg_table()
+
+    assert "SELECT address, bytecode, function_sighashes, is_erc20, date_partition FROM" in fake_multiplexer.queries[1]
+
+
+def test_other_tables_are_copied_as_is(fake_multiplexer):
+    StageIcebergMigration(table_name="ethereum_logs").copy_partitions()
+
+    assert "SELECT * FROM" in fake_multiplexer.queries[0]